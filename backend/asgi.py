@@ -4,12 +4,18 @@ from channels.routing import ProtocolTypeRouter, URLRouter
 from django.urls import path
 from dictaphone.audio_data_consumer import AudioDataConsumer
 from django.core.asgi import get_asgi_application
+from django.conf import settings
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
 # Initialize Django ASGI application early to ensure the AppRegistry
 # is populated before importing code that may import ORM models.
 django_asgi_app = get_asgi_application()
 
+if settings.DICTAPHONE_PROFILE == 'local':
+    # the transcription tasks are run in this process, see backend/local_worker.py
+    from backend.local_worker import start_local_worker
+    start_local_worker()
+
 application = ProtocolTypeRouter({
     # Django's ASGI application to handle traditional HTTP requests
     "http": django_asgi_app,
@@ -0,0 +1,55 @@
+"""
+Celery worker running in the server process, for the 'local' profile (DICTAPHONE_PROFILE=local, see backend/settings.py).
+
+The profile runs without network services: the broker is kombu's in-memory transport and the results are kept in
+Celery's in-memory cache backend, both only visible within the process. So the worker consumes the tasks in the
+server process, with a pool of threads (a prefork pool would keep the results in the memory of its child processes).
+The tasks go through the same states as with a worker process and Redis: PENDING while queued, STARTED, ABORTED when
+cancelled, and SUCCESS or FAILURE when ready, so the task monitor and the cancellation of the consumer are unchanged.
+"""
+import logging
+import socket
+import threading
+
+from django.conf import settings
+
+from .celery import app
+
+logger = logging.getLogger("backend.local_worker")
+
+_worker = None
+_worker_thread = None
+_worker_lock = threading.Lock()
+
+def start_local_worker(concurrency: int | None = None):
+    """Starts the worker once per process, like a worker started with --concurrency."""
+    global _worker, _worker_thread
+    with _worker_lock:
+        if _worker is not None:
+            return _worker
+        # the threads of the pool look up the app of a task as the default app
+        app.set_default()
+        concurrency = concurrency or settings.LOCAL_WORKER_CONCURRENCY
+        _worker = app.WorkController(
+            pool_cls="threads",
+            concurrency=concurrency,
+            hostname=f"local@{socket.gethostname()}",
+            without_heartbeat=True,
+            without_mingle=True,
+            without_gossip=True,
+        )
+        _worker_thread = threading.Thread(target=_worker.start, name="local-celery-worker", daemon=True)
+        _worker_thread.start()
+        logger.info(f"Started the in-process Celery worker with {concurrency} threads")
+        return _worker
+
+def stop_local_worker(timeout: float = 10.0):
+    """Stops the worker after the running tasks have finished."""
+    global _worker, _worker_thread
+    with _worker_lock:
+        if _worker is None:
+            return
+        _worker.stop()
+        _worker_thread.join(timeout)
+        _worker = None
+        _worker_thread = None
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 from pathlib import Path
 from dotenv import load_dotenv
 load_dotenv()
+import json
 import os
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -24,7 +25,54 @@ SECRET_KEY = os.environ.get('SECRET_KEY')
 DEBUG = os.environ.get('DEBUG') == 'True'
 DJANGO_LOG_HANDLER = os.environ.get('DJANGO_LOG_HANDLER', 'console')
 DJANGO_LOG_FILE = os.environ.get('DJANGO_LOG_FILE', '/var/log/django/app.log')
-MEMORY_IN_GIGS = os.environ.get('MEMORY_IN_GIGS', '16')
+# Memory in GB for transcriptions without a GPU, the memory of the machine is used if it is not set
+MEMORY_IN_GIGS = os.environ.get('MEMORY_IN_GIGS')
+# Storage layout for new recordings: 'title' names directories and files after the title,
+# 'id' names them after the recording ID and keeps the title in metadata.json (constant-time rename)
+RECORDING_STORAGE_LAYOUT = os.environ.get('RECORDING_STORAGE_LAYOUT', 'title')
+# Rate for reclaiming the space of deleted recordings in the background, limits the I/O load on the storage
+TRASH_RECLAIM_BYTES_PER_SECOND = int(os.environ.get('TRASH_RECLAIM_BYTES_PER_SECOND', 256 * 1024 * 1024))
+# Archival of finalized recordings to lossless FLAC (requires the soundfile package)
+# Recordings are archived when the WAV file has not been modified for ARCHIVE_AFTER_SECONDS
+ARCHIVE_FLAC_ENABLED = os.environ.get('ARCHIVE_FLAC_ENABLED') == 'True'
+ARCHIVE_AFTER_SECONDS = int(os.environ.get('ARCHIVE_AFTER_SECONDS', 7 * 24 * 3600))
+ARCHIVE_WORKERS = int(os.environ.get('ARCHIVE_WORKERS', 1))
+# Watcher that keeps the in-memory recordings up to date with the recordings directory:
+# 'auto' (inotify, or polling if inotify is not available), 'inotify', 'poll' or 'off'
+RECORDING_WATCHER = os.environ.get('RECORDING_WATCHER', 'auto')
+RECORDING_WATCHER_POLL_SECONDS = float(os.environ.get('RECORDING_WATCHER_POLL_SECONDS', 5))
+# Journal of the received chunks of a recording, for resuming the recording with only the missing chunks after a crash
+CHUNK_JOURNAL_ENABLED = os.environ.get('CHUNK_JOURNAL_ENABLED', 'True') == 'True'
+# The state of a recording interrupted by a client disconnect is kept for resuming it for at most this many seconds,
+# the chunk journal of an expired recording is kept on the storage. The received chunks of a recording in the redis
+# state backend expire after the same time
+INTERRUPTED_RECORDING_TTL_SECONDS = float(os.environ.get('INTERRUPTED_RECORDING_TTL_SECONDS', 3600))
+# State shared by the server processes ingesting recordings: 'memory' for a single process, 'redis' for several
+# processes, e.g. on several nodes behind a load balancer, with the recordings on shared storage
+RECORDING_STATE_BACKEND = os.environ.get('RECORDING_STATE_BACKEND', 'memory')
+RECORDING_STATE_REDIS_URL = os.environ.get('RECORDING_STATE_REDIS_URL', 'redis://localhost:6379/2')
+# A connection owns a recording it receives chunks for by a lease, renewed while chunks are received
+RECORDING_LEASE_SECONDS = float(os.environ.get('RECORDING_LEASE_SECONDS', 30))
+# Sharding of the recordings over several worker processes, set by backend/workers.py for every worker process
+SHARD_COUNT = int(os.environ.get('SHARD_COUNT', 1))
+SHARD_INDEX = int(os.environ.get('SHARD_INDEX', 0))
+# Maximum time in seconds to wait for the shard of a recording to hand it off when it is resumed in another worker
+SHARD_HANDOFF_TIMEOUT = float(os.environ.get('SHARD_HANDOFF_TIMEOUT', 5))
+# 'default' uses Redis for the channel layer and the Celery broker, 'local' runs without network services, see below
+DICTAPHONE_PROFILE = os.environ.get('DICTAPHONE_PROFILE', 'default')
+LOCAL_WORKER_CONCURRENCY = int(os.environ.get('LOCAL_WORKER_CONCURRENCY', 1))
+# Transcriber run by the transcription tasks: 'aau-whisper', 'simulator', which takes the time of the model for the
+# duration of the recording and writes generated transcriptions, or the dotted path of a TranscriberBackend class,
+# see dictaphone/transcriber_util.py
+TRANSCRIBER_BACKEND = os.environ.get('TRANSCRIBER_BACKEND', 'aau-whisper')
+# The simulator sleeps ('sleep') or keeps the CPU cores of the transcriber busy ('cpu') for the transcription time
+TRANSCRIBER_SIMULATOR_MODE = os.environ.get('TRANSCRIBER_SIMULATOR_MODE', 'sleep')
+# Seconds of processing per second of audio by model, e.g. '{"large-v3": 2.5}', overriding the defaults of the simulator
+TRANSCRIBER_SIMULATOR_REALTIME_FACTORS = json.loads(os.environ.get('TRANSCRIBER_SIMULATOR_REALTIME_FACTORS', '{}'))
+# Capture of the WebSocket sessions into trace files for replaying them offline, see dictaphone/session_trace_util.py
+# Capture can also be switched on at runtime by creating the file 'capture_enabled' in SESSION_CAPTURE_DIR
+SESSION_CAPTURE_ENABLED = os.environ.get('SESSION_CAPTURE_ENABLED') == 'True'
+SESSION_CAPTURE_DIR = os.environ.get('SESSION_CAPTURE_DIR', str(BASE_DIR / 'session_traces'))
 
 ALLOWED_HOSTS = ['*']
 
@@ -167,6 +215,19 @@ CHANNEL_LAYERS = {
     },
 }
 
+# The 'local' profile runs without Redis, e.g. for benchmarks and CI on a single machine: the channel layer is in
+# memory, and the Celery tasks are run by a pool of LOCAL_WORKER_CONCURRENCY threads in the server process, see
+# backend/local_worker.py. It supports a single server process.
+if DICTAPHONE_PROFILE == 'local':
+    CELERY_BROKER_URL = 'memory://'
+    CELERY_RESULT_BACKEND = 'cache+memory://'
+    CELERY_BROKER_TRANSPORT_OPTIONS = {'polling_interval': 0.1}
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        },
+    }
+
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
@@ -16,10 +16,14 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, re_path
-from dictaphone.views import serve_file, index
+from dictaphone.views import serve_file, serve_waveform, export_recordings, metrics, index
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('export/', export_recordings, name='export_recordings'), # pattern for bulk export of recordings
+    path('metrics', metrics, name='metrics'), # Prometheus metrics
+    re_path(r'^waveform/.*media/RECORDINGS/(?P<path>.*)$', serve_waveform, name='serve_media_waveform'), # pattern for waveform peaks
+    re_path(r'^waveform/work/(?P<path>.*)$', serve_waveform, name='serve_work_waveform'), # pattern for waveform peaks
     re_path(r'^.*media/RECORDINGS/(?P<path>.*)$', serve_file, name='serve_media_file'), # pattern for download
     re_path(r'^work/(?P<path>.*)$', serve_file, name='serve_work_file'), # pattern for download
     re_path(r'^.*$', index, name='index'),  # Catch-all pattern to serve the React app
@@ -0,0 +1,98 @@
+"""
+Runs the ASGI application in several daphne worker processes that share one listening socket.
+
+Each worker is a shard of the recordings, see dictaphone/shard_util.py, and gets its shard index and the number of
+shards in the SHARD_INDEX and SHARD_COUNT environment variables. The workers share the recording state through Redis
+(RECORDING_STATE_BACKEND=redis). A worker that exits is restarted, after a delay if it exits right after starting.
+
+Usage:
+    python -m backend.workers --workers 4 -b 0.0.0.0 -p 8000
+"""
+import argparse
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+logger = logging.getLogger("backend.workers")
+
+# a worker that exits within this many seconds after starting is restarted after RESTART_DELAY seconds
+MIN_UPTIME = 5.0
+RESTART_DELAY = 2.0
+
+def create_listening_socket(host: str, port: int) -> socket.socket:
+    # the workers adopt the socket with daphne's --fd option, which supports IPv4 sockets
+    sock = socket.create_server((host, port), backlog=1024)
+    sock.set_inheritable(True)
+    return sock
+
+def start_worker(sock: socket.socket, shard_index: int, shard_count: int, daphne_args: list[str]) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "SHARD_INDEX": str(shard_index),
+        "SHARD_COUNT": str(shard_count),
+    }
+    command = [sys.executable, "-m", "daphne", "--fd", str(sock.fileno()), *daphne_args, "backend.asgi:application"]
+    logger.info(f"Starting worker {shard_index}: {' '.join(command)}")
+    return subprocess.Popen(command, env=env, pass_fds=(sock.fileno(),))
+
+def stop_workers(workers: dict, timeout: float = 10.0):
+    for process, _ in workers.values():
+        if process.poll() is None:
+            process.terminate()
+    deadline = time.monotonic() + timeout
+    for process, _ in workers.values():
+        try:
+            process.wait(max(0.0, deadline - time.monotonic()))
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the server in several worker processes sharing one port.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="number of worker processes")
+    parser.add_argument("-b", "--bind", default="127.0.0.1", help="the IPv4 address to listen on")
+    parser.add_argument("-p", "--port", type=int, default=8000, help="the port to listen on")
+    args, daphne_args = parser.parse_known_args()
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(asctime)s %(name)s %(message)s")
+
+    if args.workers > 1 and os.environ.get("DICTAPHONE_PROFILE") == "local":
+        parser.error("DICTAPHONE_PROFILE=local supports a single server process, use --workers 1")
+    if args.workers > 1:
+        # the workers must share the recording IDs, the received chunks and the leases of the recordings
+        backend = os.environ.setdefault("RECORDING_STATE_BACKEND", "redis")
+        if backend != "redis":
+            parser.error(f"RECORDING_STATE_BACKEND={backend} cannot be shared by several worker processes, use redis")
+
+    sock = create_listening_socket(args.bind, args.port)
+    logger.info(f"Listening on {args.bind}:{args.port} with {args.workers} workers")
+    workers = {index: (start_worker(sock, index, args.workers, daphne_args), time.monotonic())
+               for index in range(args.workers)}
+
+    stopping = False
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    try:
+        while not stopping:
+            time.sleep(0.5)
+            for index, (process, start_time) in list(workers.items()):
+                if process.poll() is None or stopping:
+                    continue
+                logger.warning(f"Worker {index} exited with code {process.returncode}, restarting")
+                if time.monotonic() - start_time < MIN_UPTIME:
+                    time.sleep(RESTART_DELAY)
+                workers[index] = (start_worker(sock, index, args.workers, daphne_args), time.monotonic())
+    finally:
+        logger.info("Stopping workers")
+        stop_workers(workers)
+        sock.close()
+
+if __name__ == "__main__":
+    main()
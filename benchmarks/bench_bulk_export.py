@@ -0,0 +1,70 @@
+"""
+Benchmark for the streaming bulk export of recordings as a zip file.
+
+Compares the throughput of export_util.iter_recordings_zip with reading the same files from disk,
+and reports the peak traced memory of the export.
+
+Usage:
+    python -m benchmarks.bench_bulk_export --recordings 4 --size-mb 500
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from dictaphone.export_util import iter_recordings_zip, iter_file_blocks
+
+def create_recording(base_path: str, recording_id: int, size_mb: int) -> str:
+    """Creates a recording directory with a WAV file of noise-like audio and a text transcription."""
+    title = f"Recording_{recording_id}"
+    recording_path = os.path.join(base_path, f"{recording_id}_{title}")
+    os.makedirs(os.path.join(recording_path, "TRANSCRIPTIONS"))
+    wav_path = os.path.join(recording_path, f"{title}.wav")
+    block = random.Random(recording_id).randbytes(1024 * 1024)
+    with open(wav_path, 'wb') as f:
+        for _ in range(size_mb):
+            f.write(block)
+    with open(os.path.join(recording_path, "TRANSCRIPTIONS", f"{title}.txt"), 'w') as f:
+        f.write("[SPEAKER_00]: This is a transcription of the recording.\n" * 20000)
+    return wav_path
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the streaming bulk export of recordings.")
+    parser.add_argument("--recordings", type=int, default=4, help="number of recordings to export")
+    parser.add_argument("--size-mb", type=int, default=500, help="size of each WAV file in MB")
+    parser.add_argument("--directory", default=None, help="directory for the temporary recordings")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(dir=args.directory)
+    try:
+        print(f"Creating {args.recordings} recordings of {args.size_mb} MB...")
+        wav_paths = [create_recording(work_dir, recording_id, args.size_mb) for recording_id in range(1, args.recordings + 1)]
+        total_size = sum(os.path.getsize(wav_path) for wav_path in wav_paths)
+
+        start = time.perf_counter()
+        for wav_path in wav_paths:
+            for _ in iter_file_blocks(wav_path):
+                pass
+        elapsed = time.perf_counter() - start
+        print(f"{'read files':<12} {elapsed:8.2f} s {total_size / elapsed / 1024 ** 2:10.1f} MB/s")
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        zip_size = 0
+        for block in iter_recordings_zip(wav_paths):
+            zip_size += len(block)
+        cpu_time = time.process_time() - cpu_start
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{'zip export':<12} {elapsed:8.2f} s {total_size / elapsed / 1024 ** 2:10.1f} MB/s {cpu_time:8.2f} s CPU "
+              f"{peak / 1024 ** 2:8.1f} MB peak traced memory, zip size {zip_size / 1024 ** 2:.1f} MB")
+    finally:
+        shutil.rmtree(work_dir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark for archiving recordings as FLAC.
+
+Builds a long recording from the PCM data of the test recording and reports the compression ratio,
+the CPU cost of encoding and the throughput of decoding the archived form back to the original WAV file.
+
+Usage:
+    python -m benchmarks.bench_flac_archive --minutes 60
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import zlib
+from pathlib import Path
+
+from dictaphone.archive_util import encode_wav_to_flac, iter_restored_wav, read_wav_layout
+
+REFERENCE_FILE = Path(__file__).parent.parent / "dictaphone" / "resources" / "test_chunks" / "recording.wav"
+
+def create_long_recording(wav_path: str, minutes: float) -> float:
+    """Writes a WAV file with the test recording repeated for the given duration, returns the duration in seconds."""
+    with open(REFERENCE_FILE, 'rb') as f:
+        channels, sample_rate, bits_per_sample, data_offset = read_wav_layout(f)
+        f.seek(0)
+        header = f.read(data_offset)
+        pcm = f.read()
+    bytes_per_second = sample_rate * channels * bits_per_sample // 8
+    target_size = int(minutes * 60 * bytes_per_second)
+    with open(wav_path, 'wb') as f:
+        f.write(header)
+        written = 0
+        while written < target_size:
+            data = pcm[:target_size - written]
+            f.write(data)
+            written += len(data)
+    return target_size / bytes_per_second
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark FLAC archival of recordings.")
+    parser.add_argument("--minutes", type=float, default=60, help="duration of the benchmark recording in minutes")
+    parser.add_argument("--directory", default=None, help="directory for the temporary files")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(dir=args.directory)
+    try:
+        wav_path = os.path.join(work_dir, "recording.wav")
+        flac_path = os.path.join(work_dir, "recording.flac")
+        duration = create_long_recording(wav_path, args.minutes)
+        with open(wav_path, 'rb') as f:
+            original_crc32 = zlib.crc32(f.read())
+
+        start = time.perf_counter()
+        manifest = encode_wav_to_flac(wav_path, flac_path)
+        encode_wall = time.perf_counter() - start
+
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        restored_crc32 = 0
+        restored_size = 0
+        for block in iter_restored_wav(flac_path, manifest):
+            restored_crc32 = zlib.crc32(block, restored_crc32)
+            restored_size += len(block)
+        decode_wall = time.perf_counter() - start
+        decode_cpu = time.process_time() - cpu_start
+        assert restored_crc32 == original_crc32, "restored WAV file differs from the original"
+
+        print(f"Recording:          {duration / 60:.1f} minutes, {manifest['original_size'] / 1024 ** 2:.1f} MB WAV")
+        print(f"Archived:           {manifest['archived_size'] / 1024 ** 2:.1f} MB FLAC, compression ratio {manifest['compression_ratio']:.2f}")
+        print(f"Encode + verify:    {encode_wall:.2f} s wall, {manifest['encode_cpu_seconds']:.2f} s CPU encoding, "
+              f"{duration / encode_wall:.0f}x realtime")
+        print(f"Decode:             {decode_wall:.2f} s wall, {decode_cpu:.2f} s CPU, "
+              f"{restored_size / decode_wall / 1024 ** 2:.1f} MB/s, {duration / decode_wall:.0f}x realtime")
+    finally:
+        shutil.rmtree(work_dir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,491 @@
+"""
+Load test of the recording ingest, simulating concurrent recorders.
+
+Every simulated recorder streams a recording made of the PCM chunks in dictaphone/resources/test_chunks (3 seconds of
+48 kHz stereo audio each), paced at --speed times realtime, and can reorder, lose and reconnect:
+- --reorder: probability that a chunk is sent after the next chunk,
+- --loss: probability that a chunk is not sent, the server requests it again,
+- --reconnect: probability after each chunk that the connection is closed, and the recording resumed on a new one.
+After the recording is stopped the recording file is compared with the chunks that were recorded, and deleted.
+
+The recorders connect with channels.testing.WebsocketCommunicator to backend.asgi:application in this process
+(--transport communicator), or over real sockets (--transport socket) to a server started by the benchmark with
+--workers worker processes, see backend/workers.py, or to a running server (--connect host:port).
+Reported: ack latency percentiles, throughput, peak RSS of the server processes and the data integrity results.
+--json writes the results to a file, e.g. to compare the results of two versions.
+
+Requires the server settings in the environment (SECRET_KEY etc.) and Redis for the channel layer, or the local profile
+(DICTAPHONE_PROFILE=local) with --transport communicator or --workers 1.
+
+Usage:
+    python -m benchmarks.bench_ingest_load --clients 200 --chunks 20 --speed 1
+    python -m benchmarks.bench_ingest_load --clients 50 --speed 20 --reorder 0.05 --loss 0.02 --reconnect 0.01 --transport communicator
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import struct
+import subprocess
+import sys
+import threading
+import time
+import zlib
+from pathlib import Path
+
+from benchmarks.websocket_client import WebSocketClient
+
+TEST_CHUNKS_DIR = Path(__file__).resolve().parent.parent / "dictaphone" / "resources" / "test_chunks"
+WEBSOCKET_PATH = "/ws/dictaphone/data/"
+# 48 kHz, 2 channels, 16 bit
+BYTES_PER_SECOND = 48000 * 2 * 2
+# time to wait for a reply of the server
+REPLY_TIMEOUT = 30.0
+# the server waits for the background finalization of an interrupted recording before it is resumed, with several
+# server processes the recording can still be finalized in another process, resuming it is then retried
+RESUME_ATTEMPTS = 10
+RESUME_RETRY_DELAY = 0.5
+
+def load_payloads() -> list[bytes]:
+    payloads = []
+    for index in range(5):
+        with open(TEST_CHUNKS_DIR / f"chunk_1_{index}.raw", "rb") as f:
+            payloads.append(f.read())
+    return payloads
+
+def chunk_payload(payloads: list[bytes], index: int) -> bytes:
+    # the first payload starts with the WAV header, the others are repeated for longer recordings
+    return payloads[0] if index == 0 else payloads[1 + (index - 1) % (len(payloads) - 1)]
+
+class CommunicatorTransport:
+    """A connection to the ASGI application in this process."""
+    def __init__(self, communicator):
+        self.communicator = communicator
+
+    @classmethod
+    async def connect(cls) -> "CommunicatorTransport":
+        from channels.testing import WebsocketCommunicator
+        from backend.asgi import application
+        communicator = WebsocketCommunicator(application, WEBSOCKET_PATH)
+        connected, _ = await communicator.connect()
+        if not connected:
+            raise ConnectionError("The application did not accept the connection")
+        return cls(communicator)
+
+    async def send_json(self, message: dict):
+        await self.communicator.send_json_to(message)
+
+    async def send_bytes(self, data: bytes):
+        await self.communicator.send_to(bytes_data=data)
+
+    async def receive_json(self) -> dict | None:
+        # the communicator stops the application when it times out, the reader is cancelled instead
+        try:
+            return await self.communicator.receive_json_from(timeout=3600)
+        except AssertionError:
+            # a close message
+            return None
+
+    async def close(self):
+        await self.communicator.disconnect()
+
+class SocketTransport:
+    """A WebSocket connection to a server process."""
+    def __init__(self, client: WebSocketClient):
+        self.client = client
+
+    @classmethod
+    async def connect(cls, host: str, port: int) -> "SocketTransport":
+        return cls(await WebSocketClient.connect(host, port, WEBSOCKET_PATH))
+
+    async def send_json(self, message: dict):
+        await self.client.send_json(message)
+
+    async def send_bytes(self, data: bytes):
+        await self.client.send_bytes(data)
+
+    async def receive_json(self) -> dict | None:
+        try:
+            return await self.client.receive_json()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return None
+
+    async def close(self):
+        await self.client.close()
+
+class LoadStats:
+    """The results of the simulated recorders."""
+    def __init__(self):
+        self.ack_latencies = []
+        # the audio of the verified recordings
+        self.recorded_chunks = 0
+        self.recorded_bytes = 0
+        self.resent_chunks = 0
+        self.reconnects = 0
+        self.verified = 0
+        self.data_loss = 0
+        self.integrity_ok = 0
+        self.integrity_failed = 0
+        self.integrity_unchecked = 0
+        self.errors = []
+
+class SimulatedRecorder:
+    def __init__(self, connect, payloads: list[bytes], chunks: int, chunk_interval: float, rng: random.Random,
+                 reorder: float, loss: float, reconnect: float, stats: LoadStats):
+        """
+        Args:
+            connect: Coroutine function that opens a transport.
+            payloads: The test chunks, see load_payloads.
+            chunks: The number of chunks of the recording.
+            chunk_interval: The time in seconds between two chunks.
+            rng: The random generator of the faults.
+            reorder: The probability that a chunk is sent after the next chunk.
+            loss: The probability that a chunk is not sent.
+            reconnect: The probability after a chunk that the recorder reconnects.
+            stats: The results, updated by the recorder.
+        """
+        self.connect = connect
+        self.payloads = payloads
+        self.chunks = chunks
+        self.chunk_interval = chunk_interval
+        self.rng = rng
+        self.reorder = reorder
+        self.loss = loss
+        self.reconnect_probability = reconnect
+        self.stats = stats
+        self.transport = None
+        self.reader = None
+        self.replies = None
+        self.recording_id = None
+        self.send_times = {}
+        self.acked = set()
+
+    async def open(self):
+        self.transport = await self.connect()
+        self.replies = asyncio.Queue()
+        self.reader = asyncio.create_task(self.read_messages())
+
+    async def close(self):
+        if self.reader is not None:
+            self.reader.cancel()
+            self.reader = None
+        if self.transport is not None:
+            await self.transport.close()
+            self.transport = None
+
+    async def read_messages(self):
+        while True:
+            message = await self.transport.receive_json()
+            if message is None:
+                return
+            message_type = message.get("message_type")
+            if message_type == "ack_chunk":
+                index = message["chunk_index"]
+                if index not in self.acked:
+                    self.acked.add(index)
+                    if index in self.send_times:
+                        self.stats.ack_latencies.append(time.perf_counter() - self.send_times[index])
+            elif message_type == "request_chunk":
+                if message.get("recording_id", self.recording_id) == self.recording_id:
+                    self.stats.resent_chunks += 1
+                    await self.send_chunk(message["chunk_index"])
+            elif message_type in ("ack_start_recording", "ack_resume_recording", "recording_complete", "delete_complete"):
+                self.replies.put_nowait(message)
+
+    async def wait_for_reply(self, message_type: str) -> dict:
+        while True:
+            message = await asyncio.wait_for(self.replies.get(), REPLY_TIMEOUT)
+            if message["message_type"] == message_type:
+                return message
+
+    async def send_chunk(self, index: int):
+        self.send_times[index] = time.perf_counter()
+        await self.transport.send_bytes(struct.pack(">II", self.recording_id, index) + chunk_payload(self.payloads, index))
+
+    def get_send_order(self) -> list[int]:
+        order = list(range(self.chunks))
+        position = 0
+        while position < len(order) - 1:
+            if self.rng.random() < self.reorder:
+                order[position], order[position + 1] = order[position + 1], order[position]
+                position += 1
+            position += 1
+        return order
+
+    async def reconnect(self):
+        """Closes the connection, and resumes the recording on a new connection."""
+        self.stats.reconnects += 1
+        await self.close()
+        await self.open()
+        for _ in range(RESUME_ATTEMPTS):
+            await self.transport.send_json({"type": "control_message", "message": "resume_recording",
+                                            "parameter": {"recordingId": self.recording_id}})
+            reply = await self.wait_for_reply("ack_resume_recording")
+            if reply["success"]:
+                break
+            await asyncio.sleep(RESUME_RETRY_DELAY)
+        else:
+            raise RuntimeError(f"Could not resume recording {self.recording_id}")
+        # chunks that were not received before the disconnect, a chunk that was received but not acknowledged is
+        # sent again and dropped by the server
+        self.acked.update(range(reply["high_water_mark"]))
+        for index in sorted(set(reply["missing_chunks"]) | {index for index in self.send_times
+                                                            if index >= reply["high_water_mark"] and index not in self.acked}):
+            await self.send_chunk(index)
+
+    async def run(self):
+        await self.open()
+        try:
+            await self.transport.send_json({"type": "control_message", "message": "start_recording", "parameter": "Load test"})
+            self.recording_id = (await self.wait_for_reply("ack_start_recording"))["recording_id"]
+            start = time.perf_counter()
+            for position, index in enumerate(self.get_send_order()):
+                # paced like a recorder, independent of the ack latency
+                await asyncio.sleep(max(0.0, start + position * self.chunk_interval - time.perf_counter()))
+                if self.rng.random() >= self.loss:
+                    await self.send_chunk(index)
+                if self.rng.random() < self.reconnect_probability:
+                    await self.reconnect()
+            await self.transport.send_json({"type": "control_message", "message": "stop_recording",
+                                            "parameter": {"recordingId": self.recording_id, "totalChunks": self.chunks}})
+            completion = await self.wait_for_reply("recording_complete")
+            if completion["completion_status"] == 1:
+                self.stats.verified += 1
+                self.stats.recorded_chunks += self.chunks
+                self.stats.recorded_bytes += sum(len(chunk_payload(self.payloads, index)) for index in range(self.chunks))
+            else:
+                self.stats.data_loss += 1
+            self.check_integrity(completion["path"])
+            await self.transport.send_json({"type": "control_message", "message": "delete_recording",
+                                            "parameter": {"recordingId": self.recording_id}})
+            await self.wait_for_reply("delete_complete")
+        finally:
+            await self.close()
+
+    def check_integrity(self, path: str):
+        """Compares the recording file with the recorded chunks, if the file is on this machine."""
+        expected_crc32 = 0
+        for index in range(self.chunks):
+            expected_crc32 = zlib.crc32(chunk_payload(self.payloads, index), expected_crc32)
+        try:
+            with open(path, "rb") as f:
+                crc32 = 0
+                while block := f.read(1024 * 1024):
+                    crc32 = zlib.crc32(block, crc32)
+        except OSError:
+            self.stats.integrity_unchecked += 1
+            return
+        if crc32 == expected_crc32:
+            self.stats.integrity_ok += 1
+        else:
+            self.stats.integrity_failed += 1
+
+async def run_load(connect, clients: int, chunks: int, speed: float, reorder: float = 0.0, loss: float = 0.0,
+                   reconnect: float = 0.0, seed: int = 42) -> LoadStats:
+    """
+    Streams recordings from concurrent simulated recorders.
+
+    Args:
+        connect: Coroutine function that opens a transport, e.g. CommunicatorTransport.connect.
+        clients: The number of recorders.
+        chunks: The number of chunks of each recording.
+        speed: The pace of the recorders, 1 is realtime.
+        reorder: The probability that a chunk is sent after the next chunk.
+        loss: The probability that a chunk is not sent.
+        reconnect: The probability after a chunk that a recorder reconnects.
+        seed: The seed of the faults.
+
+    Returns:
+        The results of the recorders.
+    """
+    payloads = load_payloads()
+    chunk_interval = len(payloads[1]) / BYTES_PER_SECOND / speed
+    stats = LoadStats()
+    async def run_recorder(number):
+        # the recorders start spread over one chunk interval
+        await asyncio.sleep(chunk_interval * number / clients)
+        recorder = SimulatedRecorder(connect, payloads, chunks, chunk_interval, random.Random(seed + number),
+                                     reorder, loss, reconnect, stats)
+        try:
+            await recorder.run()
+        except Exception as e:
+            stats.errors.append(f"recorder {number}: {type(e).__name__}: {e}")
+    await asyncio.gather(*(run_recorder(number) for number in range(clients)))
+    return stats
+
+def get_process_tree(pid: int) -> list[int]:
+    """Returns the process and its descendants, from /proc."""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    # the command name in parentheses can contain spaces
+                    parent = int(f.read().rsplit(")", 1)[1].split()[1])
+                children.setdefault(parent, []).append(int(entry))
+            except (OSError, IndexError, ValueError):
+                pass
+    tree = [pid]
+    for process in tree:
+        tree.extend(children.get(process, []))
+    return tree
+
+def get_rss(pids: list[int]) -> int:
+    """Returns the resident memory in bytes of the processes."""
+    rss = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        rss += int(line.split()[1]) * 1024
+        except OSError:
+            pass
+    return rss
+
+class RssSampler:
+    """Samples the resident memory of a process tree in a thread, and keeps the peak."""
+    def __init__(self, pid: int, interval: float = 0.5):
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.peak = max(self.peak, get_rss(get_process_tree(self.pid)))
+            self.stopped.wait(self.interval)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+def wait_for_port(host: str, port: int, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise TimeoutError(f"The server did not start listening on {host}:{port}")
+
+def percentile(values: list[float], fraction: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else float("nan")
+
+def summarize(stats: LoadStats, elapsed: float, peak_rss: int, args) -> dict:
+    latencies = sorted(latency * 1000 for latency in stats.ack_latencies)
+    return {
+        "clients": args.clients,
+        "chunks": args.chunks,
+        "speed": args.speed,
+        "transport": args.transport,
+        "elapsed_seconds": round(elapsed, 3),
+        "ack_latency_ms": {
+            "p50": round(percentile(latencies, 0.50), 2),
+            "p95": round(percentile(latencies, 0.95), 2),
+            "p99": round(percentile(latencies, 0.99), 2),
+            "max": round(latencies[-1], 2) if latencies else float("nan"),
+            "mean": round(statistics.fmean(latencies), 2) if latencies else float("nan"),
+        },
+        "throughput": {
+            "chunks_per_second": round(stats.recorded_chunks / elapsed, 2),
+            "megabytes_per_second": round(stats.recorded_bytes / elapsed / 1024 ** 2, 2),
+            "audio_seconds_per_second": round(stats.recorded_bytes / BYTES_PER_SECOND / elapsed, 2),
+        },
+        "peak_rss_megabytes": round(peak_rss / 1024 ** 2, 1),
+        "resent_chunks": stats.resent_chunks,
+        "reconnects": stats.reconnects,
+        "recordings": {
+            "verified": stats.verified,
+            "data_loss": stats.data_loss,
+            "integrity_ok": stats.integrity_ok,
+            "integrity_failed": stats.integrity_failed,
+            "integrity_unchecked": stats.integrity_unchecked,
+        },
+        "errors": stats.errors,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test of the recording ingest with simulated recorders.")
+    parser.add_argument("--clients", type=int, default=100, help="number of concurrent recorders")
+    parser.add_argument("--chunks", type=int, default=20, help="chunks of 3 seconds per recording")
+    parser.add_argument("--speed", type=float, default=1.0, help="pace of the recorders, 1 is realtime")
+    parser.add_argument("--reorder", type=float, default=0.0, help="probability that a chunk is sent after the next")
+    parser.add_argument("--loss", type=float, default=0.0, help="probability that a chunk is not sent")
+    parser.add_argument("--reconnect", type=float, default=0.0, help="probability of a reconnect after a chunk")
+    parser.add_argument("--seed", type=int, default=42, help="seed of the faults")
+    parser.add_argument("--transport", choices=["socket", "communicator"], default="socket")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes of the server started for --transport socket")
+    parser.add_argument("--port", type=int, default=8765, help="port of the server started for --transport socket")
+    parser.add_argument("--connect", default=None, help="host:port of a running server, instead of starting one")
+    parser.add_argument("--json", default=None, help="file to write the results to")
+    args = parser.parse_args()
+
+    server = None
+    if args.transport == "communicator":
+        import django
+        os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+        django.setup()
+        connect = CommunicatorTransport.connect
+        server_pid = os.getpid()
+    else:
+        if args.connect is not None:
+            host, port = args.connect.rsplit(":", 1)
+            port = int(port)
+            server_pid = None
+        else:
+            host, port = "127.0.0.1", args.port
+            env = dict(os.environ)
+            if args.workers > 1:
+                env["RECORDING_STATE_BACKEND"] = "redis"
+            server = subprocess.Popen([sys.executable, "-m", "backend.workers", "--workers", str(args.workers), "-p", str(port)],
+                                      env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            server_pid = server.pid
+            wait_for_port(host, port, 30)
+        connect = lambda: SocketTransport.connect(host, port)
+
+    try:
+        sampler = RssSampler(server_pid) if server_pid is not None else None
+        start = time.perf_counter()
+        if sampler is not None:
+            with sampler:
+                stats = asyncio.run(run_load(connect, args.clients, args.chunks, args.speed, args.reorder, args.loss,
+                                             args.reconnect, args.seed))
+        else:
+            stats = asyncio.run(run_load(connect, args.clients, args.chunks, args.speed, args.reorder, args.loss,
+                                         args.reconnect, args.seed))
+        elapsed = time.perf_counter() - start
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    results = summarize(stats, elapsed, sampler.peak if sampler is not None else 0, args)
+    latency = results["ack_latency_ms"]
+    throughput = results["throughput"]
+    recordings = results["recordings"]
+    print(f"{args.clients} recorders, {args.chunks} chunks each at {args.speed}x realtime in {elapsed:.1f} s")
+    print(f"ack latency  p50 {latency['p50']:.1f} ms  p95 {latency['p95']:.1f} ms  p99 {latency['p99']:.1f} ms  max {latency['max']:.1f} ms")
+    print(f"throughput   {throughput['chunks_per_second']:.1f} chunks/s  {throughput['megabytes_per_second']:.1f} MB/s  "
+          f"{throughput['audio_seconds_per_second']:.1f} s of audio/s")
+    print(f"server RSS   {results['peak_rss_megabytes']:.1f} MB peak")
+    print(f"faults       {results['resent_chunks']} chunks resent, {results['reconnects']} reconnects")
+    print(f"recordings   {recordings['verified']} verified, {recordings['data_loss']} data loss, integrity "
+          f"{recordings['integrity_ok']} ok, {recordings['integrity_failed']} failed, {recordings['integrity_unchecked']} unchecked")
+    for error in results["errors"]:
+        print(f"error        {error}")
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
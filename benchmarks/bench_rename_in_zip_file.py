@@ -0,0 +1,91 @@
+"""
+Benchmark for renaming members of a large transcription zip file.
+
+Compares the raw-copy rename in data_rename_util.rename_in_zip_file with the previous approach, which
+decompressed and recompressed every member.
+
+Usage:
+    python -m benchmarks.bench_rename_in_zip_file --size-mb 600
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+import zipfile
+
+from dictaphone.data_rename_util import rename_in_zip_file
+
+# output formats of the transcriber
+EXTENSIONS = ["txt", "srt", "vtt", "tsv", "json", "dote.json"]
+
+def create_transcription_zip(zip_path: str, title: str, size_mb: int):
+    """Creates a zip file with transcript-like text members, size_mb is the uncompressed size."""
+    rng = random.Random(42)
+    letters = "abcdefghijklmnopqrstuvwxyzæøå"
+    words = ["".join(rng.choice(letters) for _ in range(rng.randint(2, 12))) for _ in range(20000)]
+    lines = []
+    for i in range(40000):
+        lines.append(f"{i // 3600:02d}:{i // 60 % 60:02d}:{i % 60:02d} SPEAKER_{rng.randint(0, 4)}: "
+                     + " ".join(rng.choice(words) for _ in range(rng.randint(5, 20))) + "\n")
+    block = "".join(lines).encode()
+    member_size = size_mb * 1024 * 1024 // len(EXTENSIONS)
+    with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        for extension in EXTENSIONS:
+            with zf.open(f"files/{title}.{extension}", 'w', force_zip64=True) as member:
+                written = 0
+                while written < member_size:
+                    data = block[:member_size - written]
+                    member.write(data)
+                    written += len(data)
+
+def recompress_rename(old_title: str, new_title: str, zip_path: str):
+    """The previous rename implementation, every member is read into memory and compressed again."""
+    temp_zip_path = zip_path + ".tmp"
+    with zipfile.ZipFile(zip_path, 'r') as in_zip, zipfile.ZipFile(temp_zip_path, 'w') as out_zip:
+        for info in in_zip.infolist():
+            old_name = info.filename
+            head, tail = old_name.rsplit('/', 1)
+            info.filename = f"{head}/{tail.replace(old_title, new_title)}"
+            out_zip.writestr(info, in_zip.read(old_name))
+    os.replace(temp_zip_path, zip_path)
+
+def measure(name: str, rename, zip_path: str, old_title: str, new_title: str, zip_size: int):
+    tracemalloc.start()
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    rename(old_title, new_title, zip_path)
+    cpu_time = time.process_time() - cpu_start
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    with zipfile.ZipFile(zip_path, 'r') as zf:
+        assert all(new_title in name_in_zip for name_in_zip in zf.namelist())
+    print(f"{name:<12} {elapsed:8.2f} s wall {cpu_time:8.2f} s CPU {zip_size / elapsed / 1024 ** 2:10.1f} MB/s "
+          f"{peak / 1024 ** 2:10.1f} MB peak traced memory")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark renaming members of a large zip file.")
+    parser.add_argument("--size-mb", type=int, default=600, help="uncompressed size of the zip members in MB")
+    parser.add_argument("--directory", default=None, help="directory for the temporary zip files")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(dir=args.directory)
+    try:
+        zip_path = os.path.join(work_dir, "files.zip")
+        print(f"Creating zip file with {args.size_mb} MB of transcription text...")
+        create_transcription_zip(zip_path, "Recording_1", args.size_mb)
+        zip_size = os.path.getsize(zip_path)
+        print(f"Zip file size: {zip_size / 1024 ** 2:.1f} MB")
+
+        baseline_path = os.path.join(work_dir, "baseline.zip")
+        shutil.copy(zip_path, baseline_path)
+        measure("recompress", recompress_rename, baseline_path, "Recording_1", "Meeting_1", zip_size)
+        measure("raw copy", rename_in_zip_file, zip_path, "Recording_1", "Meeting_1", zip_size)
+    finally:
+        shutil.rmtree(work_dir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Replays captured WebSocket sessions against the AudioDataConsumer in this process, see dictaphone/session_trace_util.py.
+
+A session is captured on the server with SESSION_CAPTURE_ENABLED=True, or by creating the file 'capture_enabled' in
+SESSION_CAPTURE_DIR while the server runs. Each trace is replayed --repeat times, at full speed by default (--speed 0)
+or with the timing of the captured session (--speed 1). Reported: the replay time and the messages sent to the client
+that differ from the captured session, e.g. a recording that is verified in the replay but had DATA_LOSS in the field.
+--extract-chunks saves the audio chunks of the traces as test data, like dictaphone/resources/test_chunks.
+
+Requires the server settings in the environment (SECRET_KEY etc.) and Redis for the channel layer, or the local profile
+(DICTAPHONE_PROFILE=local). The recordings of the replay are created in the recordings directory of the server settings.
+
+Usage:
+    python -m benchmarks.bench_session_replay session_traces/session_20260101_120000_1a2b3c4d.trace --repeat 5
+    python -m benchmarks.bench_session_replay session_traces/*.trace --speed 1
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay captured WebSocket sessions against the consumer.")
+    parser.add_argument("traces", nargs="+", help="trace files of captured sessions")
+    parser.add_argument("--speed", type=float, default=0, help="speed-up of the captured timing, 0 for full speed")
+    parser.add_argument("--repeat", type=int, default=1, help="number of replays of each trace")
+    parser.add_argument("--settle-timeout", type=float, default=20.0,
+                        help="seconds to wait for the messages of the captured session at the end of a replay")
+    parser.add_argument("--extract-chunks", metavar="DIR", help="save the audio chunks of the traces to DIR and exit")
+    args = parser.parse_args()
+
+    import django
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+    django.setup()
+    from dictaphone.session_trace_util import replay_session, extract_chunks
+
+    if args.extract_chunks:
+        for path in args.traces:
+            print(f"{path}: {extract_chunks(path, args.extract_chunks)} chunks saved to {args.extract_chunks}")
+        return
+
+    all_match = True
+    for path in args.traces:
+        times = []
+        for _ in range(args.repeat):
+            result = asyncio.run(replay_session(path, speed=args.speed, settle_timeout=args.settle_timeout))
+            times.append(result.elapsed)
+            missing, unexpected = result.get_differences()
+            for message in missing:
+                print(f"  missing in replay:   {message}")
+            for message in unexpected:
+                print(f"  unexpected in replay: {message}")
+            all_match = all_match and result.matches
+        print(f"{path}: {result.inbound_frames} frames  replay median {statistics.median(times) * 1000:.1f} ms  "
+              f"min {min(times) * 1000:.1f} ms  {'matches' if result.matches else 'differs'}")
+    sys.exit(0 if all_match else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Load benchmark for the sharded server, see backend/workers.py.
+
+Starts the server with each number of worker processes, and streams recordings from an increasing number of
+concurrent recorders. Every recorder sends a chunk every --interval seconds, like the browser client, and the
+chunk receive-to-ack latency is measured. The capacity of a configuration is the highest number of recorders
+with a p95 ack latency below --slo-ms and all recordings verified. Recordings are deleted after they are stopped.
+
+Requires a Redis server for the channel layer and the shared recording state, and the server settings in the
+environment (SECRET_KEY etc.).
+
+Usage:
+    python -m benchmarks.bench_sharded_ingest --workers 1,2,4 --recorders 25,50,100,200
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import struct
+import subprocess
+import sys
+import time
+
+from benchmarks.bench_ingest_load import load_payloads, chunk_payload, wait_for_port
+from benchmarks.websocket_client import WebSocketClient
+
+async def run_recorder(host: str, port: int, payloads: list[bytes], chunks: int, interval: float, latencies: list[float]) -> bool:
+    """Streams one recording, returns true if it was verified."""
+    client = await WebSocketClient.connect(host, port, "/ws/dictaphone/data/")
+    try:
+        await client.send_json({"type": "control_message", "message": "start_recording", "parameter": "Load test"})
+        while True:
+            message = await client.receive_json()
+            if message is not None and message.get("message_type") == "ack_start_recording":
+                break
+        recording_id = message["recording_id"]
+        send_times = {}
+        completed = asyncio.get_running_loop().create_future()
+
+        async def read_messages():
+            while True:
+                message = await client.receive_json()
+                if message is None:
+                    return
+                message_type = message.get("message_type")
+                if message_type == "ack_chunk" and message.get("chunk_index") in send_times:
+                    latencies.append(time.perf_counter() - send_times.pop(message["chunk_index"]))
+                elif message_type == "request_chunk":
+                    index = message["chunk_index"]
+                    await client.send_bytes(struct.pack(">II", recording_id, index) + chunk_payload(payloads, index))
+                elif message_type == "recording_complete" and not completed.done():
+                    completed.set_result(message["completion_status"] == 1)
+
+        reader = asyncio.create_task(read_messages())
+        start = time.perf_counter()
+        for index in range(chunks):
+            # paced like a recorder, independent of the ack latency
+            await asyncio.sleep(max(0.0, start + index * interval - time.perf_counter()))
+            send_times[index] = time.perf_counter()
+            await client.send_bytes(struct.pack(">II", recording_id, index) + chunk_payload(payloads, index))
+        await client.send_json({"type": "control_message", "message": "stop_recording",
+                                "parameter": {"recordingId": recording_id, "totalChunks": chunks}})
+        try:
+            verified = await asyncio.wait_for(completed, timeout=30)
+        except asyncio.TimeoutError:
+            verified = False
+        await client.send_json({"type": "control_message", "message": "delete_recording",
+                                "parameter": {"recordingId": recording_id}})
+        await asyncio.sleep(0.5)
+        reader.cancel()
+        return verified
+    finally:
+        await client.close()
+
+async def run_load(host: str, port: int, recorders: int, chunks: int, interval: float) -> tuple[list[float], int]:
+    payloads = load_payloads()
+    latencies = []
+    # the recorders start spread over one chunk interval
+    async def start_recorder(number):
+        await asyncio.sleep(interval * number / recorders)
+        return await run_recorder(host, port, payloads, chunks, interval, latencies)
+    results = await asyncio.gather(*(start_recorder(number) for number in range(recorders)), return_exceptions=True)
+    return latencies, sum(1 for result in results if result is True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark concurrent recorders against the sharded server.")
+    parser.add_argument("--workers", default="1,2,4", help="comma separated numbers of worker processes")
+    parser.add_argument("--recorders", default="25,50,100,200", help="comma separated numbers of concurrent recorders")
+    parser.add_argument("--chunks", type=int, default=20, help="chunks per recording")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between the chunks of a recorder")
+    parser.add_argument("--slo-ms", type=float, default=250, help="p95 ack latency of a supported load")
+    parser.add_argument("--port", type=int, default=8765, help="port of the server")
+    args = parser.parse_args()
+    host = "127.0.0.1"
+
+    env = {**os.environ, "RECORDING_STATE_BACKEND": "redis"}
+    for workers in [int(value) for value in args.workers.split(",")]:
+        server = subprocess.Popen([sys.executable, "-m", "backend.workers", "--workers", str(workers), "-p", str(args.port)],
+                                  env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_for_port(host, args.port, 30)
+            capacity = 0
+            for recorders in [int(value) for value in args.recorders.split(",")]:
+                latencies, verified = asyncio.run(run_load(host, args.port, recorders, args.chunks, args.interval))
+                latencies.sort()
+                p50 = statistics.median(latencies) * 1000 if latencies else float("nan")
+                p95 = latencies[int(len(latencies) * 0.95) - 1] * 1000 if latencies else float("nan")
+                print(f"workers {workers:2d}  recorders {recorders:4d}  verified {verified:4d}  "
+                      f"ack p50 {p50:8.1f} ms  p95 {p95:8.1f} ms")
+                if verified < recorders or not p95 < args.slo_ms:
+                    break
+                capacity = recorders
+            print(f"workers {workers:2d}  capacity {capacity} recorders (p95 < {args.slo_ms:.0f} ms)")
+        finally:
+            server.terminate()
+            server.wait()
+
+if __name__ == "__main__":
+    main()
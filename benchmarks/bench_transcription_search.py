@@ -0,0 +1,84 @@
+"""
+Benchmark for searching the transcription index.
+
+Indexes synthetic SRT transcriptions of a number of hours of recordings, one recording per hour, and measures
+the query latency of transcription_index_util.TranscriptionIndex.search for rare, common and prefix queries.
+
+Usage:
+    python -m benchmarks.bench_transcription_search --hours 2000
+"""
+import argparse
+import itertools
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+from dictaphone.transcription_index_util import TranscriptionIndex, INDEX_FILE_NAME
+
+# about 150 spoken words per minute, in cues of about 4 seconds
+CUES_PER_HOUR = 900
+WORDS_PER_CUE = 10
+
+def format_timestamp(seconds: float) -> str:
+    return f"{int(seconds) // 3600:02d}:{int(seconds) // 60 % 60:02d}:{int(seconds) % 60:02d},{int(seconds * 1000) % 1000:03d}"
+
+def create_srt(file_path: str, rng: random.Random, words: list[str], cum_weights: list[float]):
+    cues = []
+    for cue in range(CUES_PER_HOUR):
+        start = cue * 4.0
+        text = " ".join(rng.choices(words, cum_weights=cum_weights, k=WORDS_PER_CUE))
+        cues.append(f"{cue + 1}\n{format_timestamp(start)} --> {format_timestamp(start + 4.0)}\n[SPEAKER_0{cue % 3}]: {text}\n")
+    with open(file_path, 'w') as f:
+        f.write("\n".join(cues))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark searching the transcription index.")
+    parser.add_argument("--hours", type=int, default=2000, help="hours of transcriptions to index")
+    parser.add_argument("--directory", default=None, help="directory for the temporary index")
+    parser.add_argument("--repeat", type=int, default=50, help="number of times each query is run")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    letters = "abcdefghijklmnopqrstuvwxyzæøå"
+    words = ["".join(rng.choice(letters) for _ in range(rng.randint(2, 10))) for _ in range(50000)]
+    # word frequencies of natural language roughly follow Zipf's law
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(words))))
+
+    work_dir = tempfile.mkdtemp(dir=args.directory)
+    try:
+        transcription_dir = os.path.join(work_dir, "TRANSCRIPTIONS")
+        os.makedirs(transcription_dir)
+        index = TranscriptionIndex(os.path.join(work_dir, INDEX_FILE_NAME))
+        print(f"Indexing {args.hours} hours of transcriptions ({args.hours * CUES_PER_HOUR} segments)...")
+        elapsed = 0.0
+        for recording_id in range(1, args.hours + 1):
+            create_srt(os.path.join(transcription_dir, "Recording.srt"), rng, words, cum_weights)
+            start = time.perf_counter()
+            index.index_recording(recording_id, f"Recording_{recording_id}", transcription_dir)
+            elapsed += time.perf_counter() - start
+        print(f"Indexed in {elapsed:.1f} s ({args.hours / elapsed:.1f} hours/s), "
+              f"index size {os.path.getsize(os.path.join(work_dir, INDEX_FILE_NAME)) / 1024 ** 2:.1f} MB")
+
+        queries = {
+            "rare word": words[-1],
+            "two words": f"{words[100]} {words[200]}",
+            "common word": words[0],
+            "prefix": words[5000][:3] + "*",
+        }
+        for name, query in queries.items():
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                hits = index.search(query, 50)
+                timings.append((time.perf_counter() - start) * 1000)
+            timings.sort()
+            print(f"{name:<12} {len(hits):4d} hits  median {statistics.median(timings):8.2f} ms  "
+                  f"p95 {timings[int(len(timings) * 0.95) - 1]:8.2f} ms")
+    finally:
+        shutil.rmtree(work_dir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+A minimal WebSocket client (RFC 6455) on asyncio streams, for the benchmarks that run against a server process.
+"""
+import asyncio
+import base64
+import json
+import os
+import struct
+
+class WebSocketClient:
+    """A minimal WebSocket client (RFC 6455) on asyncio streams, for text and binary messages."""
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(cls, host: str, port: int, path: str) -> "WebSocketClient":
+        reader, writer = await asyncio.open_connection(host, port)
+        key = base64.b64encode(os.urandom(16)).decode()
+        writer.write((f"GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                      f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\nOrigin: http://{host}:{port}\r\n\r\n").encode())
+        response = await reader.readuntil(b"\r\n\r\n")
+        if not response.startswith(b"HTTP/1.1 101"):
+            writer.close()
+            raise ConnectionError(f"WebSocket handshake failed: {response.splitlines()[0].decode()}")
+        return cls(reader, writer)
+
+    async def send_frame(self, opcode: int, payload: bytes):
+        # client frames are masked, a zero mask leaves the payload as it is
+        length = len(payload)
+        if length < 126:
+            header = struct.pack(">BB", 0x80 | opcode, 0x80 | length)
+        elif length < 1 << 16:
+            header = struct.pack(">BBH", 0x80 | opcode, 0x80 | 126, length)
+        else:
+            header = struct.pack(">BBQ", 0x80 | opcode, 0x80 | 127, length)
+        self.writer.write(header + b"\x00\x00\x00\x00" + payload)
+        await self.writer.drain()
+
+    async def send_json(self, message: dict):
+        await self.send_frame(0x1, json.dumps(message).encode())
+
+    async def send_bytes(self, data: bytes):
+        await self.send_frame(0x2, data)
+
+    async def receive_json(self) -> dict | None:
+        """Returns the next text message, or None when the connection is closed."""
+        while True:
+            first, second = await self.reader.readexactly(2)
+            length = second & 0x7F
+            if length == 126:
+                length = struct.unpack(">H", await self.reader.readexactly(2))[0]
+            elif length == 127:
+                length = struct.unpack(">Q", await self.reader.readexactly(8))[0]
+            payload = await self.reader.readexactly(length)
+            opcode = first & 0x0F
+            if opcode == 0x1:
+                return json.loads(payload)
+            if opcode == 0x8:
+                return None
+            if opcode == 0x9:
+                await self.send_frame(0xA, payload)
+
+    async def close(self):
+        try:
+            await self.send_frame(0x8, struct.pack(">H", 1000))
+        except ConnectionError:
+            pass
+        self.writer.close()
@@ -0,0 +1,254 @@
+import asyncio
+import base64
+import concurrent.futures
+import contextlib
+import datetime
+import logging
+import multiprocessing
+import os
+import struct
+import time
+import zlib
+
+from django.conf import settings
+
+from .recording_metadata_util import read_metadata, update_metadata
+
+logger = logging.getLogger(__name__)
+
+# Key of the archive manifest in the metadata file of a recording
+ARCHIVE_MANIFEST_KEY = "archive"
+# Number of audio frames encoded or decoded at a time
+BLOCK_FRAMES = 48000 * 10
+
+_archive_pool = None
+# WAV files being archived by this process
+_archiving_paths = set()
+
+def read_wav_layout(f) -> tuple[int, int, int, int]:
+    """
+    Reads the RIFF chunks of a WAV file up to the start of the audio data.
+
+    The recorder writes a streaming header where the RIFF and data sizes are not set, so the data
+    is assumed to continue to the end of the file.
+
+    Args:
+        f: The WAV file, opened for binary reading and positioned at the start.
+
+    Returns:
+        A tuple with the number of channels, the sample rate, the bits per sample and the offset of the audio data.
+
+    Raises:
+        ValueError: If the file is not a 16-bit PCM WAV file.
+    """
+    riff_header = f.read(12)
+    if len(riff_header) < 12 or riff_header[:4] != b"RIFF" or riff_header[8:12] != b"WAVE":
+        raise ValueError("Not a WAV file.")
+    audio_format = None
+    while True:
+        chunk_header = f.read(8)
+        if len(chunk_header) < 8:
+            raise ValueError("No data chunk in WAV file.")
+        chunk_id, chunk_size = struct.unpack("<4sI", chunk_header)
+        if chunk_id == b"fmt ":
+            fmt = f.read(chunk_size + chunk_size % 2)
+            audio_format, channels, sample_rate, _, _, bits_per_sample = struct.unpack("<HHIIHH", fmt[:16])
+        elif chunk_id == b"data":
+            break
+        else:
+            f.seek(chunk_size + chunk_size % 2, os.SEEK_CUR)
+    if audio_format != 1 or bits_per_sample != 16:
+        raise ValueError(f"Unsupported WAV format: format {audio_format}, {bits_per_sample} bits per sample.")
+    return channels, sample_rate, bits_per_sample, f.tell()
+
+def encode_wav_to_flac(wav_path: str, flac_path: str) -> dict:
+    """
+    Encodes a 16-bit PCM WAV file to FLAC, and verifies that the WAV file can be restored exactly.
+
+    The WAV header and any bytes after the last complete audio frame are kept in the returned manifest,
+    so the original file can be restored byte for byte. Runs in a worker process of the archive pool.
+
+    Args:
+        wav_path: The path to the WAV file.
+        flac_path: The path to the FLAC file to write.
+
+    Returns:
+        The archive manifest, with the data needed to restore the WAV file and the archival statistics.
+
+    Raises:
+        ValueError: If the WAV file format is not supported or the FLAC file does not restore the WAV file.
+    """
+    import numpy as np
+    import soundfile as sf
+
+    cpu_start = time.process_time()
+    temp_flac_path = flac_path + ".tmp"
+    original_crc32 = 0
+    with open(wav_path, 'rb') as f:
+        channels, sample_rate, bits_per_sample, data_offset = read_wav_layout(f)
+        f.seek(0)
+        wav_header = f.read(data_offset)
+        original_crc32 = zlib.crc32(wav_header)
+        frame_size = channels * bits_per_sample // 8
+        trailing_bytes = b""
+        with sf.SoundFile(temp_flac_path, 'w', samplerate=sample_rate, channels=channels, format='FLAC', subtype='PCM_16') as out:
+            while True:
+                block = f.read(BLOCK_FRAMES * frame_size)
+                if not block:
+                    break
+                original_crc32 = zlib.crc32(block, original_crc32)
+                complete_length = len(block) - len(block) % frame_size
+                trailing_bytes = block[complete_length:]
+                out.write(np.frombuffer(block, dtype='<i2', count=complete_length // 2).reshape(-1, channels))
+    original_size = os.path.getsize(wav_path)
+    encode_cpu_seconds = time.process_time() - cpu_start
+
+    manifest = {
+        'file': os.path.basename(flac_path),
+        'original_file': os.path.basename(wav_path),
+        'original_size': original_size,
+        'original_crc32': original_crc32,
+        'wav_header': base64.b64encode(wav_header).decode('ascii'),
+        'trailing_bytes': base64.b64encode(trailing_bytes).decode('ascii'),
+    }
+
+    # verify that the archived form restores the original file before the WAV file is removed
+    restored_crc32 = 0
+    for block in iter_restored_wav(temp_flac_path, manifest):
+        restored_crc32 = zlib.crc32(block, restored_crc32)
+    if restored_crc32 != original_crc32:
+        os.remove(temp_flac_path)
+        raise ValueError(f"FLAC verification failed for '{wav_path}'.")
+    os.replace(temp_flac_path, flac_path)
+
+    archived_size = os.path.getsize(flac_path)
+    manifest.update({
+        'archived_size': archived_size,
+        'compression_ratio': round(original_size / archived_size, 3) if archived_size else None,
+        'encode_cpu_seconds': round(encode_cpu_seconds, 3),
+        'archived_time': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    })
+    return manifest
+
+def iter_restored_wav(flac_path: str, manifest: dict):
+    """
+    Decodes an archived recording and yields the bytes of the original WAV file.
+
+    Args:
+        flac_path: The path to the FLAC file.
+        manifest: The archive manifest of the recording.
+
+    Yields:
+        Consecutive blocks of the original WAV file.
+    """
+    import soundfile as sf
+
+    yield base64.b64decode(manifest['wav_header'])
+    with sf.SoundFile(flac_path, 'r') as f:
+        while True:
+            frames = f.read(BLOCK_FRAMES, dtype='int16')
+            if len(frames) == 0:
+                break
+            yield frames.astype('<i2', copy=False).tobytes()
+    trailing_bytes = base64.b64decode(manifest['trailing_bytes'])
+    if trailing_bytes:
+        yield trailing_bytes
+
+def get_archive_manifest(recording_path: str) -> dict | None:
+    """Returns the archive manifest of a recording, or None if the recording is not archived."""
+    return read_metadata(recording_path).get(ARCHIVE_MANIFEST_KEY)
+
+def resolve_audio_path(wav_path: str) -> str | None:
+    """
+    Returns the path of the audio file of a recording: the WAV file, or the FLAC file if the recording is archived.
+    Returns None if neither exists.
+    """
+    if os.path.isfile(wav_path):
+        return wav_path
+    manifest = get_archive_manifest(os.path.dirname(wav_path))
+    if manifest is not None:
+        flac_path = os.path.join(os.path.dirname(wav_path), manifest['file'])
+        if os.path.isfile(flac_path):
+            return flac_path
+    return None
+
+def get_audio_file_size(wav_path: str) -> int | None:
+    """Returns the size of the WAV file of a recording, also if the recording is archived."""
+    if os.path.isfile(wav_path):
+        return os.path.getsize(wav_path)
+    manifest = get_archive_manifest(os.path.dirname(wav_path))
+    if manifest is not None:
+        return manifest['original_size']
+    return None
+
+def get_archive_pool() -> concurrent.futures.ProcessPoolExecutor:
+    """Returns the process pool used for encoding archived recordings, it is started the first time it is used."""
+    global _archive_pool
+    if _archive_pool is None:
+        # spawn, forking a server process with running threads is not safe
+        _archive_pool = concurrent.futures.ProcessPoolExecutor(max_workers=settings.ARCHIVE_WORKERS,
+                                                               mp_context=multiprocessing.get_context("spawn"))
+    return _archive_pool
+
+def is_archive_candidate(wav_path: str, idle_seconds: float) -> bool:
+    """Checks if a recording has an unarchived WAV file that has not been modified for idle_seconds."""
+    try:
+        return time.time() - os.path.getmtime(wav_path) >= idle_seconds
+    except OSError:
+        return False
+
+def is_unmodified(file_path: str, file_stat: os.stat_result) -> bool:
+    """Checks if a file still exists with the size and modification time of an earlier stat."""
+    try:
+        current_stat = os.stat(file_path)
+    except OSError:
+        return False
+    return (current_stat.st_size, current_stat.st_mtime_ns) == (file_stat.st_size, file_stat.st_mtime_ns)
+
+async def archive_recording(recording_path: str, wav_path: str, lock: asyncio.Lock | None = None,
+                            can_remove_wav=None) -> dict | None:
+    """
+    Archives a recording as FLAC in the archive process pool, and removes the WAV file when the FLAC file is verified.
+
+    The recording can be changed by another connection while it is encoded, e.g. resumed. The WAV file is only removed
+    if it has not been modified since the encode started, otherwise the FLAC file is discarded.
+
+    Args:
+        recording_path: The path to the recording directory.
+        wav_path: The path to the WAV file.
+        lock: The lock of the recording, held while the recording is archived.
+        can_remove_wav: A function checked before the WAV file is removed, e.g. that the recording is not resumed.
+
+    Returns:
+        The archive manifest, or None if the recording could not be archived.
+    """
+    if wav_path in _archiving_paths:
+        return None
+    flac_path = os.path.splitext(wav_path)[0] + ".flac"
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    _archiving_paths.add(wav_path)
+    # a rename or delete of the recording in this connection waits for the archival
+    async with lock or contextlib.nullcontext():
+        try:
+            wav_stat = os.stat(wav_path)
+            manifest = await loop.run_in_executor(get_archive_pool(), encode_wav_to_flac, wav_path, flac_path)
+        except (OSError, ValueError, ImportError) as e:
+            logger.error(f"Could not archive recording '{wav_path}': {e}")
+            return None
+        finally:
+            _archiving_paths.discard(wav_path)
+        if not is_unmodified(wav_path, wav_stat) or (can_remove_wav is not None and not can_remove_wav()):
+            logger.info(f"Recording '{wav_path}' was changed while it was archived, keeping the WAV file.")
+            try:
+                os.remove(flac_path)
+            except OSError:
+                pass
+            return None
+        # the manifest is written before the WAV file is removed, so an interrupted archival leaves a readable recording
+        update_metadata(recording_path, **{ARCHIVE_MANIFEST_KEY: manifest})
+        os.remove(wav_path)
+    logger.info(f"Archived '{wav_path}' as FLAC: {manifest['original_size']} -> {manifest['archived_size']} bytes, "
+                f"compression ratio {manifest['compression_ratio']}, {manifest['encode_cpu_seconds']} s CPU, "
+                f"{time.perf_counter() - start:.2f} s wall.")
+    return manifest
@@ -1,7 +1,10 @@
 import json
-import shutil
+import sqlite3
 import struct
+import zlib
 import asyncio
+import time
+import uuid
 from pathlib import Path
 
 from channels.generic.websocket import AsyncWebsocketConsumer
@@ -14,6 +17,22 @@ from enum import Enum
 from .tasks import transcription_task
 from .model_memory_util import calculate_available_memory
 from .data_rename_util import safe_rename, proces_transcription_data_for_title_rename
+from .recording_metadata_util import read_metadata, update_metadata, TITLE_LAYOUT, ID_LAYOUT
+from .trash_util import move_to_trash, get_trash_collector, empty_leftover_trash
+from .archive_util import archive_recording, get_archive_manifest, get_audio_file_size, resolve_audio_path, is_archive_candidate, ARCHIVE_MANIFEST_KEY
+from .waveform_util import WaveformBuilder, resume_waveform, WAVEFORM_DIR_NAME
+from .transcription_index_util import get_transcription_index, MAX_SEARCH_RESULTS
+from .recording_library_util import get_recording_library, RecordingBusyError
+from .chunk_journal_util import ChunkJournal, recover_journal, remove_journal
+from .recording_events_util import (append_event, read_recording_state, has_event_log, get_event_log_path,
+                                    LEGACY_COMPLETION_LOG_FILE_NAME, FINALIZED, TRANSCRIPTION_STARTED,
+                                    TRANSCRIPTION_ENDED, TRANSCRIPTION_CANCELLED, RENAMED)
+from .recording_state_util import get_recording_state_backend, InMemoryRecordingStateBackend, NODE_ID
+from .shard_util import allocate_local_recording_id, ensure_shard_listener, is_local_recording, is_sharded, request_handoff
+from .session_trace_util import open_session_trace
+from . import metrics_util
+from .audio_quality_util import (compute_chunk_quality, get_audio_data_offset, new_quality_stats, add_quality_stats,
+                                 summarize_quality, QUALITY_EVENT_INTERVAL)
 
 logger = logging.getLogger(__name__)
 
@@ -24,6 +43,34 @@ class RecordingStatus(Enum):
     DATA_LOSS = 3                # For when finalization fails due to missing data, e.g. a chunk is missing
     INTERRUPTED_NOT_VERIFIED = 4 # Recording was stopped because of server disconnect, and could not be finalized
 
+# In-memory state of recordings that were interrupted by a client disconnect, keyed by recording ID.
+# Every connection has its own AudioChunkManager, so the state is kept here for a new connection to resume the recording.
+# The state expires after INTERRUPTED_RECORDING_TTL_SECONDS, see keep_interrupted_recording.
+interrupted_recordings: dict[int, dict] = {}
+
+# Binary chunk headers, big-endian unsigned ints.
+# Basic header: recording_id, chunk_index
+# Extended header: recording_id with the extended header flag set, chunk_index, payload length, CRC32 of the payload
+CHUNK_HEADER_FORMAT = ">II"
+EXTENDED_CHUNK_HEADER_FORMAT = ">IIII"
+EXTENDED_CHUNK_HEADER_FLAG = 0x80000000
+
+# Finalization waits at most FINALIZE_TIMEOUT seconds for missing chunks.
+# Missing chunks are requested again after FINALIZE_RESEND_INITIAL_DELAY seconds, doubling the delay each time.
+FINALIZE_TIMEOUT = 10.0
+FINALIZE_RESEND_INITIAL_DELAY = 0.5
+
+# Background finalizations of recordings interrupted by a client disconnect, keyed by recording ID. A client that
+# reconnects and resumes the recording waits at most RESUME_FINALIZE_WAIT_TIMEOUT seconds for the finalization.
+finalizing_recordings: dict[int, asyncio.Task] = {}
+RESUME_FINALIZE_WAIT_TIMEOUT = FINALIZE_TIMEOUT
+
+# Number of recordings per page of the paged initialization, newest recordings first
+DEFAULT_RECORDINGS_PAGE_SIZE = 50
+MAX_RECORDINGS_PAGE_SIZE = 500
+# Number of hits of a transcription search without a limit, at most MAX_SEARCH_RESULTS
+DEFAULT_SEARCH_LIMIT = 50
+
 
 class AudioChunkManager:
     def __init__(self, consumer, load_data_from_server=True):
@@ -31,13 +78,32 @@ class AudioChunkManager:
         self.active_recording_id = 0 # first recording will have ID = 1
         self.mic_boost_level = 1
         self.recordings = {}
-        self.lock = asyncio.Lock() # Lock for async operations
+        # The registry lock guards the membership of self.recordings and the allocation of recording IDs, and is only
+        # held briefly. The chunk and assembly state of a recording is guarded by its own lock, see get_recording_lock,
+        # so a slow operation on one recording does not hold up chunks of other recordings.
+        # The registry lock may be acquired while a recording lock is held, never the other way around.
+        # The wait and hold times of the locks are exposed as metrics.
+        self.registry_lock = metrics_util.InstrumentedLock(metrics_util.CHUNK_MANAGER_LOCK_WAIT.labels("registry"),
+                                                           metrics_util.CHUNK_MANAGER_LOCK_HOLD.labels("registry"))
+        self.recording_locks = {}
+        # identifies the connection in the ownership leases of the recordings, see recording_state_util
+        self.owner_id = f"{NODE_ID}:{uuid.uuid4().hex[:8]}"
         if load_data_from_server:
             # not running in test mode
+            self.state_backend = get_recording_state_backend()
             self.recording_base_path = get_recording_base_path()
-            self.initialize_recording_data(load_all_recordings_status(self.recording_base_path), load_settings(self.recording_base_path))
+            # reclaim the space of recordings deleted before a server restart, once per process
+            empty_leftover_trash(self.recording_base_path)
+            # the recordings are scanned once per process and kept up to date by a watcher, so connecting
+            # does not scan the recordings directory
+            self.library = get_recording_library(self.recording_base_path, load_all_recordings_status, load_recording_status)
+            statuses, self.library_version = self.library.get_snapshot()
+            self.initialize_recording_data(statuses, load_settings(self.recording_base_path))
         else:
             # running integration test
+            self.state_backend = InMemoryRecordingStateBackend()
+            self.library = None
+            self.library_version = None
             recording_path: str = os.path.join(settings.MEDIA_ROOT, 'RECORDINGS/')
             os.makedirs(recording_path, exist_ok=True)
             self.recording_base_path = recording_path
@@ -53,26 +119,99 @@ class AudioChunkManager:
         max_recording_id = 0
         for recording in data:
             recording_id = recording['recording_id']
-            self.recordings[recording_id] = {
-                'id': recording_id,
-                'title': recording['title'],
-                'status': recording['status'],
-                'recording_file_path': recording['file_path'],
-                'recording_path': recording['recording_path'],
-                'transcription_start_time': recording['transcription_start_time'],
-                'file_size': recording['file_size'],
-                'results': recording['results'] if recording['results'] is not None else []
-            }
+            self.recordings[recording_id] = get_recording_from_status(recording)
             if recording_id > max_recording_id:
                 max_recording_id = recording_id
         self.active_recording_id = max_recording_id
 
+    async def apply_library_changes(self, changed: list[dict], deleted: list[int], version: int) -> tuple[list[int], list[int]]:
+        """
+        Applies changes of the recordings on disk, reported by the recording library, to the recordings of this connection.
+        The active recording is changed by this connection only, and is skipped.
+        In-memory state of a recording, e.g. the received chunks of an interrupted recording, is kept.
+        :param changed: the status of the changed recordings, see load_recording_status
+        :param deleted: the IDs of the deleted recordings
+        :param version: the version of the recording library with the changes
+        :return: the IDs of the changed and of the deleted recordings of this connection
+        """
+        async with self.registry_lock:
+            self.library_version = max(self.library_version, version)
+            changed_ids = []
+            deleted_ids = []
+            for status in changed:
+                recording_id = status['recording_id']
+                if self.is_active_recording(recording_id):
+                    continue
+                if recording_id in self.recordings:
+                    self.recordings[recording_id].update(get_recording_from_status(status))
+                else:
+                    self.recordings[recording_id] = get_recording_from_status(status)
+                changed_ids.append(recording_id)
+            for recording_id in deleted:
+                if recording_id in self.recordings and not self.is_active_recording(recording_id):
+                    release_chunk_data(self.recordings.pop(recording_id))
+                    interrupted_recordings.pop(recording_id, None)
+                    deleted_ids.append(recording_id)
+            return changed_ids, deleted_ids
+
+    async def get_recordings_page(self, epoch=None, version=None, cursor=None, page_size=DEFAULT_RECORDINGS_PAGE_SIZE) -> dict:
+        """
+        Returns a page of the recordings changed since a version of the recording library, or of all recordings
+        if the version is unknown (e.g. after a server restart) or there is no recording library.
+        :param epoch: the epoch of the version last seen by the client
+        :param version: the version last seen by the client, None for all recordings
+        :param cursor: the next_cursor of the previous page, None for the first page
+        :param page_size: the maximum number of recordings in the page
+        :return: the recordings in the page, newest first, the IDs of recordings deleted since the version
+                 (first page only), the number of recordings in all pages, the cursor of the next page or None,
+                 the current epoch and version and if the pages are a delta
+        """
+        changed_ids = None
+        deleted_ids = []
+        if self.library is not None:
+            # changes of the library that are not yet applied to this connection are sent to the client when they are
+            _, changed_ids, deleted_ids = self.library.get_changes(epoch, version)
+        async with self.registry_lock:
+            recording_ids = sorted(self.recordings if changed_ids is None else changed_ids & self.recordings.keys(), reverse=True)
+            total = len(recording_ids)
+            if cursor is not None:
+                recording_ids = [recording_id for recording_id in recording_ids if recording_id < cursor]
+            page_size = max(1, min(page_size, MAX_RECORDINGS_PAGE_SIZE))
+            page_ids = recording_ids[:page_size]
+            return {
+                'recordings': [get_client_recording(self.recordings[recording_id]) for recording_id in page_ids],
+                'deleted': deleted_ids if cursor is None else [],
+                'total': total,
+                'next_cursor': page_ids[-1] if len(recording_ids) > page_size else None,
+                'epoch': self.library.epoch if self.library is not None else None,
+                'version': self.library_version,
+                'delta': changed_ids is not None
+            }
+
+    async def refresh_library(self, *recording_paths):
+        """
+        Reloads recording directories changed by this connection in the recording library, so other connections
+        are updated right away instead of when the watcher reports the change.
+        :param recording_paths: the paths to the changed recording directories
+        """
+        if self.library is None:
+            return
+        dir_names = {os.path.basename(os.path.normpath(recording_path)) for recording_path in recording_paths if recording_path}
+        await asyncio.to_thread(self.library.refresh, dir_names)
+
     async def start_new_recording(self, title) -> int:
-        async with self.lock:
-            self.active_recording_id = self.active_recording_id + 1
+        async with self.registry_lock:
+            # a resumed recording can have a lower ID than the highest ID in use
+            # the ID is allocated by the state backend, so it is unique across the server processes, and belongs to
+            # the shard of this process when the server is sharded
+            self.active_recording_id = await allocate_local_recording_id(
+                self.state_backend, max(self.active_recording_id, max(self.recordings, default=0)))
             logger.info(f"Starting new recording, ID = {self.active_recording_id}")
             if self.active_recording_id in self.recordings:
                 raise ValueError("Error when creating new recording, ID is already used!")
+            lease_token = await self.state_backend.acquire_lease(self.active_recording_id, self.owner_id, settings.RECORDING_LEASE_SECONDS)
+            if lease_token is None:
+                raise ValueError(f"Error when creating new recording, recording ID {self.active_recording_id} is owned by another connection!")
 
             # setup metadata structure for the recording
             self.recordings[self.active_recording_id] = {
@@ -80,51 +219,231 @@ class AudioChunkManager:
                 'title': title,
                 'status': 'active',
                 'flushed_index': None, # how much of the file has been assembled
-                'chunks': {}
+                'file_crc32': 0, # running CRC32 of the assembled file
+                'chunks': {},
+                'lease_token': lease_token,
+                'lease_renewal_time': time.monotonic()
             }
-            recording_dir_name = self.get_dirname(title)
-            recording_path: str = self.recording_base_path + recording_dir_name
-            os.makedirs(recording_path, exist_ok=True)
-            recording_file_path: str = os.path.join(recording_path, validate_linux_filename(title) + ".wav")
+            if settings.RECORDING_STORAGE_LAYOUT == ID_LAYOUT:
+                # directory and file are named after the recording ID, the title is kept in the metadata file
+                recording_path: str = self.recording_base_path + str(self.active_recording_id)
+                os.makedirs(recording_path, exist_ok=True)
+                recording_file_path: str = os.path.join(recording_path, str(self.active_recording_id) + ".wav")
+                update_metadata(recording_path, title=validate_linux_filename(title))
+                self.recordings[self.active_recording_id]['title'] = validate_linux_filename(title)
+            else:
+                recording_dir_name = self.get_dirname(title)
+                recording_path: str = self.recording_base_path + recording_dir_name
+                os.makedirs(recording_path, exist_ok=True)
+                recording_file_path: str = os.path.join(recording_path, validate_linux_filename(title) + ".wav")
+            self.recordings[self.active_recording_id]['layout'] = settings.RECORDING_STORAGE_LAYOUT
             self.recordings[self.active_recording_id]['recording_path'] = recording_path
             self.recordings[self.active_recording_id]['recording_file_path'] = recording_file_path
 
             return self.active_recording_id
 
-    async def finalize_active_recording(self, total_chunks=None) -> bool:
-        number_of_chunks = total_chunks
-        ask_for_resend = True
-        if number_of_chunks is None:
-            # finalizing interrupted (disconnected) recording, number of chunks is what we have
-            number_of_chunks = len(self.recordings[self.active_recording_id]['chunks'])
-            # don't ask for resend since the connection is lost
-            ask_for_resend = False
-
-        async with self.lock:
-            logger.info(f"Finalizing recording, ID = {self.active_recording_id}")
-            recording_valid = True
-
-            # check if all chunks a saved and flushed
-            for x in range(number_of_chunks):
-                #logger.info(f"checking index = {x}")
-                if x not in self.recordings[self.active_recording_id]['chunks']:
-                    if ask_for_resend:
-                        logger.info(f"Requesting resend for chunk with index = {x}")
-                        await self.consumer.send_to_client({
-                            'message_type': 'request_chunk',
-                            'chunk_index': x
-                        })
-                    recording_valid = False
-
-            if recording_valid:
-                if total_chunks is None:
-                    # finishing interrupted recording
-                    self.recordings[self.active_recording_id]['status'] = RecordingStatus.INTERRUPTED_VERIFIED
-                else:
-                    self.recordings[self.active_recording_id]['status'] = RecordingStatus.VERIFIED
+    async def resume_recording(self, recording_id) -> dict | None:
+        """
+        Reattaches an interrupted recording to this manager, so the client can continue sending chunks.
+        The connection acquires the lease of the recording first, a recording owned by another connection cannot be
+        resumed. With a shared state backend the recording can have been interrupted in another server process, the
+        received chunks are then rebuilt from the chunk journal of the recording on the shared storage.
+        :param recording_id: the recording id
+        :return: the high-water mark (number of contiguous chunks received) and the indexes of missing chunks
+        received after the high-water mark, or None if the recording cannot be resumed
+        """
+        async with self.registry_lock:
+            logger.info(f"Resuming recording, ID = {recording_id}")
+            if self.is_active_recording(recording_id):
+                logger.warning(f"Cannot resume recording, recording ID: {recording_id} is active")
+                return None
+            lease_token = await self.state_backend.acquire_lease(recording_id, self.owner_id, settings.RECORDING_LEASE_SECONDS)
+            if lease_token is None:
+                logger.warning(f"Cannot resume recording, recording ID: {recording_id} is owned by another connection")
+                return None
+            recording = interrupted_recordings.get(recording_id)
+            if recording is not None and self.state_backend.shared and recording.get('lease_token') != lease_token - 1:
+                # the recording has been resumed in another server process since it was interrupted here
+                logger.info(f"Discarding stale interrupted recording state for ID: {recording_id}")
+                del interrupted_recordings[recording_id]
+                discard_chunk_data(recording)
+                recording = None
+            if recording is None and self.state_backend.shared and recording_id in self.recordings:
+                recording = await asyncio.to_thread(rebuild_recording_from_journal, self.recordings[recording_id])
+            if recording is None:
+                logger.warning(f"Cannot resume recording, no interrupted recording state for ID: {recording_id}")
+                await self.state_backend.release_lease(recording_id, self.owner_id)
+                return None
+            if recording_id in self.recordings and self.recordings[recording_id]['recording_path'] != recording['recording_path']:
+                logger.warning(f"Cannot resume recording, the interrupted recording state does not match recording ID: {recording_id}")
+                await self.state_backend.release_lease(recording_id, self.owner_id)
+                return None
+
+            interrupted_recordings.pop(recording_id, None)
+            recording['status'] = 'active'
+            recording['lease_token'] = lease_token
+            recording['lease_renewal_time'] = time.monotonic()
+            self.recordings[recording_id] = recording
+            self.active_recording_id = recording_id
+
+            high_water_mark = 0 if recording['flushed_index'] is None else recording['flushed_index'] + 1
+            # chunks received by another server process can be missing from the journal, e.g. if it is disabled
+            received_chunks = await self.state_backend.get_received_chunks(recording_id)
+            highest_index = max(max(recording['chunks'], default=-1), max(received_chunks, default=-1) + 1)
+            missing_chunks = [x for x in range(high_water_mark, highest_index) if x not in recording['chunks']]
+            return {
+                'high_water_mark': high_water_mark,
+                'missing_chunks': missing_chunks
+            }
+
+    def detach_interrupted_recording(self, recording_id):
+        """
+        Keeps the state of an interrupted recording after the connection is closed, so it can be resumed.
+        The chunk journal is closed and kept on the storage, it is opened again when the resumed recording receives
+        chunks, see journal_chunk.
+        :param recording_id: the recording id
+        """
+        if recording_id in self.recordings and 'chunks' in self.recordings[recording_id]:
+            logger.info(f"Keeping state of interrupted recording for resume, ID = {recording_id}")
+            recording = self.recordings[recording_id]
+            journal = recording.pop('journal', None)
+            if journal is not None:
+                # the records of chunks written after the resume continue at the end of the recording file
+                recording['file_size'] = journal.file_size
+                journal.close()
+            keep_interrupted_recording(recording_id, recording)
+
+    async def release_recording(self, recording_id):
+        """
+        Releases the lease of a recording that no longer receives chunks in this connection, so it can be resumed by
+        another connection, also in another server process.
+        :param recording_id: the recording id
+        """
+        try:
+            await self.state_backend.release_lease(recording_id, self.owner_id)
+        except Exception as e:
+            # the lease expires
+            logger.error(f"Error releasing the lease of recording {recording_id}: {e}")
+
+    async def release_received_chunks(self, recording_id):
+        """
+        Drops the received chunks of a recording that is finalized and does not accept more chunks, and removes its
+        chunk journal, see release_chunk_data.
+        :param recording_id: the recording id
+        """
+        release_chunk_data(self.recordings[recording_id])
+        try:
+            await self.state_backend.clear_received_chunks(recording_id)
+        except Exception as e:
+            # the received chunks expire with the state of the recording
+            logger.error(f"Error clearing the received chunks of recording {recording_id}: {e}")
+
+    async def renew_lease(self, recording_id):
+        """
+        Renews the lease of a recording that receives chunks, at most every third of the lease time.
+        :param recording_id: the recording id
+        :raises ValueError: if the lease has expired and the recording is owned by another connection
+        """
+        recording = self.recordings[recording_id]
+        if time.monotonic() - recording.get('lease_renewal_time', 0) < settings.RECORDING_LEASE_SECONDS / 3:
+            return
+        if not await self.state_backend.renew_lease(recording_id, self.owner_id, settings.RECORDING_LEASE_SECONDS):
+            # e.g. after a long network partition, the lease of the recording expired
+            lease_token = await self.state_backend.acquire_lease(recording_id, self.owner_id, settings.RECORDING_LEASE_SECONDS)
+            if lease_token != recording.get('lease_token', 0) + 1:
+                # another connection has owned the recording since, the chunk state of this connection is stale
+                if lease_token is not None:
+                    await self.state_backend.release_lease(recording_id, self.owner_id)
+                raise ValueError(f"Error adding chunk, recording ID {recording_id} is owned by another connection!")
+            recording['lease_token'] = lease_token
+        recording['lease_renewal_time'] = time.monotonic()
+
+    async def finalize_active_recording(self, total_chunks=None, timeout=FINALIZE_TIMEOUT) -> bool:
+        """
+        Verifies that all chunks of the active recording have been received, see finalize_recording.
+        """
+        return await self.finalize_recording(self.active_recording_id, total_chunks, timeout)
+
+    async def finalize_recording(self, recording_id, total_chunks=None, timeout=FINALIZE_TIMEOUT) -> bool:
+        """
+        Verifies that all chunks of a recording have been received.
+        When the total number of chunks is known, missing chunks are requested from the client and the method waits
+        until add_chunk has received them all, or until the timeout. Requests for chunks that are still missing are
+        repeated with exponential backoff.
+        Other recordings receive chunks and are finalized independently.
+        :param recording_id: the recording id
+        :param total_chunks: the total number of chunks in the recording, None when finalizing an interrupted recording
+        :param timeout: the maximum time in seconds to wait for missing chunks
+        :return: returns true if the recording is complete, and false otherwise
+        """
+        recording = self.recordings[recording_id]
+        recording_lock = self.get_recording_lock(recording_id)
+        async with recording_lock:
+            logger.info(f"Finalizing recording, ID = {recording_id}")
+            if total_chunks is None:
+                # finalizing interrupted (disconnected) recording, number of chunks is what we have
+                # don't ask for resend since the connection is lost
+                recording['total_chunks'] = len(recording['chunks'])
+                if self.get_missing_chunks(recording_id):
+                    return False
+                recording['status'] = RecordingStatus.INTERRUPTED_VERIFIED
                 return True
-            else:
+
+            recording['total_chunks'] = total_chunks
+            missing_chunks = self.get_missing_chunks(recording_id)
+            if missing_chunks:
+                # resolved by add_chunk when the last missing chunk is received
+                completion_future = asyncio.get_running_loop().create_future()
+                recording['completion_future'] = completion_future
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        resend_delay = FINALIZE_RESEND_INITIAL_DELAY
+        while missing_chunks:
+            for x in missing_chunks:
+                logger.info(f"Requesting resend for chunk with index = {x}")
+                metrics_util.CHUNK_RESEND_REQUESTS.labels("finalize").inc()
+                await self.consumer.send_to_client({
+                    'message_type': 'request_chunk',
+                    'recording_id': recording_id,
+                    'chunk_index': x
+                })
+            remaining = deadline - loop.time()
+            try:
+                await asyncio.wait_for(asyncio.shield(completion_future), timeout=min(resend_delay, remaining))
+            except asyncio.TimeoutError:
+                resend_delay *= 2
+            if loop.time() >= deadline:
+                break
+            async with recording_lock:
+                missing_chunks = self.get_missing_chunks(recording_id)
+
+        async with recording_lock:
+            recording.pop('completion_future', None)
+            if self.get_missing_chunks(recording_id):
                 return False
+            recording['status'] = RecordingStatus.VERIFIED
+            return True
+
+    def get_recording_lock(self, recording_id) -> asyncio.Lock:
+        """
+        :param recording_id: the recording id
+        :return: the lock guarding the chunk and assembly state of the recording, it is created on first use
+        """
+        recording_lock = self.recording_locks.get(recording_id)
+        if recording_lock is None:
+            recording_lock = metrics_util.InstrumentedLock(metrics_util.CHUNK_MANAGER_LOCK_WAIT.labels("recording"),
+                                                           metrics_util.CHUNK_MANAGER_LOCK_HOLD.labels("recording"))
+            self.recording_locks[recording_id] = recording_lock
+        return recording_lock
+
+    def get_missing_chunks(self, recording_id) -> list[int]:
+        """
+        :param recording_id: the recording id
+        :return: the indexes of the chunks that have not been received, up to the total number of chunks
+        """
+        recording = self.recordings[recording_id]
+        return [x for x in range(recording['total_chunks']) if x not in recording['chunks']]
 
     async def add_chunk(self, recording_id, chunk_index, data) -> bool:
         """
@@ -133,7 +452,7 @@ class AudioChunkManager:
         :param recording_id: the recording id
         :return: returns true if a chunk was processed and false if the chunk has already been processed
         """
-        async with self.lock:
+        async with self.get_recording_lock(recording_id):
             logger.info(f"Adding chunk, recording_id = {recording_id} chunk_index = {chunk_index}")
             # validate recording_id and chunk_index
             if recording_id not in self.recordings:
@@ -148,6 +467,14 @@ class AudioChunkManager:
                 # chunk already processed
                 logger.info(f"Chunk is already processed, chunk_index = {index}")
                 return False
+            await self.renew_lease(recording_id)
+
+            # quality statistics of the chunk, the first chunk starts with the WAV header
+            try:
+                chunk_quality = compute_chunk_quality(data, get_audio_data_offset(data) if index == 0 else 0)
+                self.add_chunk_quality(self.recordings[recording_id], chunk_quality)
+            except ValueError as e:
+                logger.error(f"Error computing quality statistics, recording_id = {recording_id} chunk_index = {index}: {e}")
 
             new_chunk = {
                 'index': index,
@@ -158,145 +485,327 @@ class AudioChunkManager:
 
             # save chunk
             self.recordings[recording_id]['chunks'][index] = new_chunk
+            metrics_util.BUFFERED_CHUNK_BYTES.inc(len(data))
+            await self.state_backend.add_received_chunk(recording_id, index)
 
             # run file assembly code
-            await self.assemble_audio_file()
+            await self.assemble_audio_file(recording_id)
+            if not new_chunk['flushed']:
+                # received out of order, the data is kept in the journal until it is written to the file
+                self.journal_chunk(self.recordings[recording_id], index, data, False)
+            if self.recordings[recording_id].get('journal') is not None:
+                self.recordings[recording_id]['journal'].schedule_commit()
+
+            # wake up a pending finalization if this was the last missing chunk
+            completion_future = self.recordings[recording_id].get('completion_future')
+            if completion_future is not None and not completion_future.done() and not self.get_missing_chunks(recording_id):
+                completion_future.set_result(True)
             return True
 
     """
     Assemble as much of the file as possible.
     Work from flushed_index up to in-order chunks that are ready to be assembled
     """
-    async def assemble_audio_file(self):
-        if self.recordings[self.active_recording_id]['flushed_index'] is None:
+    async def assemble_audio_file(self, recording_id):
+        if self.recordings[recording_id]['flushed_index'] is None:
             # nothing has been written
-            if 0 in self.recordings[self.active_recording_id]['chunks']:
+            if 0 in self.recordings[recording_id]['chunks']:
                 # we have received the first chunk
                 logger.info("Writing the first chunk.")
                 # save data to file
-                with open(self.recordings[self.active_recording_id]['recording_file_path'], "wb") as f:
-                    f.write(self.recordings[self.active_recording_id]['chunks'][0]['data'])
+                with open(self.recordings[recording_id]['recording_file_path'], "wb") as f:
+                    f.write(self.recordings[recording_id]['chunks'][0]['data'])
+                self.recordings[recording_id]['file_crc32'] = zlib.crc32(self.recordings[recording_id]['chunks'][0]['data'])
+                self.journal_chunk(self.recordings[recording_id], 0, self.recordings[recording_id]['chunks'][0]['data'], True)
+                self.update_waveform(self.recordings[recording_id], self.recordings[recording_id]['chunks'][0]['data'])
+                metrics_util.AUDIO_BYTES_WRITTEN.inc(len(self.recordings[recording_id]['chunks'][0]['data']))
+                metrics_util.BUFFERED_CHUNK_BYTES.dec(len(self.recordings[recording_id]['chunks'][0]['data']))
                 # remove data from memory
-                self.recordings[self.active_recording_id]['chunks'][0]['flushed'] = True
-                self.recordings[self.active_recording_id]['chunks'][0]['data'] = {}
+                self.recordings[recording_id]['chunks'][0]['flushed'] = True
+                self.recordings[recording_id]['chunks'][0]['data'] = {}
                 # update flushed index
-                self.recordings[self.active_recording_id]['flushed_index'] = 0
+                self.recordings[recording_id]['flushed_index'] = 0
             else:
                 # first chunk not received, cannot write anything, ask for re-send of first chunk
                 logger.info("Requesting re-send of first chunk.")
+                metrics_util.CHUNK_RESEND_REQUESTS.labels("out_of_order").inc()
                 await self.consumer.send_to_client({
                     'message_type': 'request_chunk',
+                    'recording_id': recording_id,
                     'chunk_index': 0
                 })
                 return
-        while self.recordings[self.active_recording_id]['flushed_index'] + 1 < len(self.recordings[self.active_recording_id]['chunks']):
-            next_in_order_chunk = self.recordings[self.active_recording_id]['flushed_index'] + 1
+        while self.recordings[recording_id]['flushed_index'] + 1 < len(self.recordings[recording_id]['chunks']):
+            next_in_order_chunk = self.recordings[recording_id]['flushed_index'] + 1
             # check if the next in-order chunk is available
-            if next_in_order_chunk in self.recordings[self.active_recording_id]['chunks']:
+            if next_in_order_chunk in self.recordings[recording_id]['chunks']:
                 logger.info(f"Writing chunk with index = {next_in_order_chunk}")
-                data_to_write = self.recordings[self.active_recording_id]['chunks'][next_in_order_chunk]['data']
+                data_to_write = self.recordings[recording_id]['chunks'][next_in_order_chunk]['data']
 
                 # write the audio data to file
-                with open(self.recordings[self.active_recording_id]['recording_file_path'], "ab") as f:
+                with open(self.recordings[recording_id]['recording_file_path'], "ab") as f:
                     f.write(data_to_write)
+                self.recordings[recording_id]['file_crc32'] = zlib.crc32(data_to_write, self.recordings[recording_id]['file_crc32'])
+                self.journal_chunk(self.recordings[recording_id], next_in_order_chunk, data_to_write, True)
+                self.update_waveform(self.recordings[recording_id], data_to_write)
+                metrics_util.AUDIO_BYTES_WRITTEN.inc(len(data_to_write))
+                metrics_util.BUFFERED_CHUNK_BYTES.dec(len(data_to_write))
 
                 # remove data from memory
-                self.recordings[self.active_recording_id]['chunks'][next_in_order_chunk]['flushed'] = True
-                self.recordings[self.active_recording_id]['chunks'][next_in_order_chunk]['data'] = {}
+                self.recordings[recording_id]['chunks'][next_in_order_chunk]['flushed'] = True
+                self.recordings[recording_id]['chunks'][next_in_order_chunk]['data'] = {}
                 # update flushed index
-                self.recordings[self.active_recording_id]['flushed_index'] = next_in_order_chunk
+                self.recordings[recording_id]['flushed_index'] = next_in_order_chunk
             else:
                 # if not, request re-send and break from the while loop, we cannot write anymore chunks
                 logger.info(f"Requesting re-send for chunk with index = {next_in_order_chunk}")
+                metrics_util.CHUNK_RESEND_REQUESTS.labels("out_of_order").inc()
                 await self.consumer.send_to_client({
                     'message_type': 'request_chunk',
+                    'recording_id': recording_id,
                     'chunk_index': next_in_order_chunk
                 })
                 break
 
+    def journal_chunk(self, recording: dict, chunk_index: int, data: bytes, written: bool):
+        """
+        Appends a received chunk to the chunk journal of the recording, see chunk_journal_util.
+        :param recording: the recording
+        :param chunk_index: the chunk index
+        :param data: the chunk data
+        :param written: true if the chunk has been written to the recording file, false if it is held in memory
+        """
+        if 'journal' not in recording:
+            recording['journal'] = None
+            if settings.CHUNK_JOURNAL_ENABLED:
+                try:
+                    recording['journal'] = ChunkJournal(recording['recording_file_path'], recording.get('file_size') or 0)
+                except OSError as e:
+                    logger.error(f"Error creating chunk journal for recording {recording['id']}: {e}")
+        if recording['journal'] is None:
+            return
+        try:
+            if written:
+                recording['journal'].append_written(chunk_index, data, recording['file_crc32'])
+            else:
+                recording['journal'].append_buffered(chunk_index, data)
+        except OSError as e:
+            # an incomplete journal cannot be used for recovery
+            logger.error(f"Error appending to chunk journal for recording {recording['id']}: {e}")
+            recording['journal'].remove()
+            recording['journal'] = None
+
+    def add_chunk_quality(self, recording: dict, chunk_quality: dict):
+        """
+        Adds the quality statistics of a chunk to the statistics of the recording, and to the statistics
+        since the last live quality event.
+        :param recording: the recording
+        :param chunk_quality: the quality statistics of the chunk
+        """
+        add_quality_stats(recording.setdefault('quality', new_quality_stats()), chunk_quality)
+        add_quality_stats(recording.setdefault('quality_window', new_quality_stats()), chunk_quality)
+
+    def pop_quality_event(self, recording_id) -> dict | None:
+        """
+        Returns a summary of the quality statistics received since the last live quality event of a recording,
+        at most once every QUALITY_EVENT_INTERVAL seconds.
+        :param recording_id: the recording id
+        :return: the quality summary, or None if no event is due
+        """
+        recording = self.recordings.get(recording_id)
+        if recording is None or not recording.get('quality_window', {}).get('samples'):
+            return None
+        now = asyncio.get_running_loop().time()
+        if now - recording.get('quality_event_time', float('-inf')) < QUALITY_EVENT_INTERVAL:
+            return None
+        recording['quality_event_time'] = now
+        quality_window = recording.pop('quality_window')
+        return summarize_quality(quality_window)
+
+    def get_quality_summary(self, recording_id) -> dict | None:
+        """
+        :param recording_id: the recording id
+        :return: the quality summary of the chunks received for the recording, or None if no chunks were received
+        """
+        quality = self.recordings[recording_id].get('quality')
+        return summarize_quality(quality) if quality is not None else None
+
+    def save_quality_summary(self, recording_id):
+        """
+        Writes the quality summary of a recording to the metadata file of the recording.
+        :param recording_id: the recording id
+        """
+        quality_summary = self.get_quality_summary(recording_id)
+        if quality_summary is None:
+            return
+        try:
+            update_metadata(os.path.dirname(self.recordings[recording_id]['recording_file_path']), quality=quality_summary)
+        except OSError as e:
+            logger.error(f"Error saving quality summary for recording {recording_id}: {e}")
+
+    def update_waveform(self, recording: dict, data: bytes):
+        """
+        Adds audio data that was written to the WAV file to the waveform peaks of the recording.
+        :param recording: the recording
+        :param data: the audio data, the data of the first chunk starts with the WAV header
+        """
+        if 'waveform' not in recording:
+            recording['waveform'] = WaveformBuilder(os.path.join(os.path.dirname(recording['recording_file_path']), WAVEFORM_DIR_NAME))
+        if recording['waveform'] is None:
+            return
+        try:
+            recording['waveform'].append(data)
+        except (OSError, ValueError) as e:
+            # the peaks are built from the audio file when they are requested
+            logger.error(f"Error updating waveform peaks for recording {recording['id']}: {e}")
+            recording['waveform'] = None
+
+    def finish_waveform(self, recording_id):
+        """
+        Writes the last incomplete waveform peaks of a recording, when the recording is finalized.
+        :param recording_id: the recording id
+        """
+        waveform = self.recordings[recording_id].get('waveform')
+        if waveform is None:
+            return
+        try:
+            waveform.finish()
+        except OSError as e:
+            logger.error(f"Error finishing waveform peaks for recording {recording_id}: {e}")
+            self.recordings[recording_id]['waveform'] = None
+
     async def rename_title(self, recording_id, new_title) -> bool:
         """
         :param recording_id: the recording id
         :param new_title: the new title for the recording
         :return: returns true if the renaming was successful, and false otherwise
         """
-        async with self.lock:
-            logger.info(f"Renaming title, recording_id = {recording_id} new title = {new_title}")
-            try:
-                sanitized_title = validate_linux_filename(new_title).replace(" ", "_")
-                old_title = self.recordings[recording_id]['title'].replace(" ", "_")
-                # 1) validate the new title name
-                if not self.validate_title(sanitized_title):
-                    return False
-                if sanitized_title == old_title:
-                    # trying to rename to existing title
-                    logger.info("Trying to rename title to existing title.")
-                    self.recordings[recording_id]['title'] = sanitized_title
-                    return True
-
-                # 2) rename the .wav file
-                new_recording_file_path = os.path.join(self.recordings[recording_id]['recording_path'], sanitized_title + ".wav")
-                try:
-                    safe_rename(self.recordings[recording_id]['recording_file_path'], new_recording_file_path)
-                except (ValueError, OSError) as e:
-                    logger.error(f"Error renaming title, aborting. Error: {e}")
-                    return False
-
-                # 3) rename files and data in the transcriptions directory
-                transcriptions_dir = os.path.join(self.recordings[recording_id]['recording_path'], 'TRANSCRIPTIONS/')
-                proces_transcription_data_for_title_rename(old_title, sanitized_title, transcriptions_dir)
+        async with self.get_recording_lock(recording_id):
+            # the files are renamed in a worker thread, so chunks of other recordings are received meanwhile
+            return await asyncio.to_thread(self._rename_title, recording_id, new_title)
 
-                # 4) rename the top level folder
-                new_recording_dir_name = (str(recording_id) + "_" + sanitized_title)
-                new_recording_path: str = self.recording_base_path + new_recording_dir_name
+    def _rename_title(self, recording_id, new_title) -> bool:
+        logger.info(f"Renaming title, recording_id = {recording_id} new title = {new_title}")
+        try:
+            sanitized_title = validate_linux_filename(new_title).replace(" ", "_")
+            old_title = self.recordings[recording_id]['title'].replace(" ", "_")
+            # 1) validate the new title name
+            if not self.validate_title(sanitized_title):
+                return False
+            if sanitized_title == old_title:
+                # trying to rename to existing title
+                logger.info("Trying to rename title to existing title.")
+                self.recordings[recording_id]['title'] = sanitized_title
+                return True
+            if self.recordings[recording_id].get('layout', TITLE_LAYOUT) == ID_LAYOUT:
+                # the title is only stored in the metadata file, no files are renamed
                 try:
-                    safe_rename(self.recordings[recording_id]['recording_path'], new_recording_path)
-                except (ValueError, OSError) as e:
+                    update_metadata(self.recordings[recording_id]['recording_path'], title=sanitized_title)
+                except OSError as e:
                     logger.error(f"Error renaming title, aborting. Error: {e}")
                     return False
-                # rename wav path in recordings data structure after folder rename
-                new_recording_file_path = os.path.join(new_recording_path, sanitized_title + ".wav")
-
-                # 5) update the title, recording_path and recording_file_path in the recordings data structure
                 self.recordings[recording_id]['title'] = sanitized_title
-                self.recordings[recording_id]['recording_path'] = new_recording_path
-                self.recordings[recording_id]['recording_file_path'] = new_recording_file_path
-
+                self.log_rename(recording_id, old_title, sanitized_title)
                 return True
-            except Exception as e:
-                logger.error(f"Error while renaming title: {e}")
+
+            # 2) rename the .wav file, or the .flac file if the recording is archived
+            new_recording_file_path = os.path.join(self.recordings[recording_id]['recording_path'], sanitized_title + ".wav")
+            archive_manifest = None
+            if not os.path.exists(self.recordings[recording_id]['recording_file_path']):
+                archive_manifest = get_archive_manifest(self.recordings[recording_id]['recording_path'])
+            try:
+                if archive_manifest is not None:
+                    safe_rename(os.path.join(self.recordings[recording_id]['recording_path'], archive_manifest['file']),
+                                os.path.join(self.recordings[recording_id]['recording_path'], sanitized_title + ".flac"))
+                    archive_manifest['file'] = sanitized_title + ".flac"
+                    archive_manifest['original_file'] = sanitized_title + ".wav"
+                    update_metadata(self.recordings[recording_id]['recording_path'], **{ARCHIVE_MANIFEST_KEY: archive_manifest})
+                else:
+                    safe_rename(self.recordings[recording_id]['recording_file_path'], new_recording_file_path)
+            except (ValueError, OSError) as e:
+                logger.error(f"Error renaming title, aborting. Error: {e}")
                 return False
 
+            # 3) rename files and data in the transcriptions directory
+            transcriptions_dir = os.path.join(self.recordings[recording_id]['recording_path'], 'TRANSCRIPTIONS/')
+            proces_transcription_data_for_title_rename(old_title, sanitized_title, transcriptions_dir)
+
+            # 4) rename the top level folder
+            new_recording_dir_name = (str(recording_id) + "_" + sanitized_title)
+            new_recording_path: str = self.recording_base_path + new_recording_dir_name
+            try:
+                safe_rename(self.recordings[recording_id]['recording_path'], new_recording_path)
+            except (ValueError, OSError) as e:
+                logger.error(f"Error renaming title, aborting. Error: {e}")
+                return False
+            # rename wav path in recordings data structure after folder rename
+            new_recording_file_path = os.path.join(new_recording_path, sanitized_title + ".wav")
+
+            # 5) update the title, recording_path and recording_file_path in the recordings data structure
+            self.recordings[recording_id]['title'] = sanitized_title
+            self.recordings[recording_id]['recording_path'] = new_recording_path
+            self.recordings[recording_id]['recording_file_path'] = new_recording_file_path
+            if self.recordings[recording_id].get('waveform') is not None:
+                self.recordings[recording_id]['waveform'].waveform_path = os.path.join(new_recording_path, WAVEFORM_DIR_NAME)
+            self.log_rename(recording_id, old_title, sanitized_title)
+
+            return True
+        except Exception as e:
+            logger.error(f"Error while renaming title: {e}")
+            return False
+
+    def log_rename(self, recording_id, old_title, new_title):
+        """
+        Logs a rename in the event log of the recording, if the recording has been finalized.
+        :param recording_id: the recording id
+        :param old_title: the title before the rename
+        :param new_title: the title after the rename
+        """
+        recording_path = self.recordings[recording_id]['recording_path']
+        if not has_event_log(recording_path):
+            return
+        try:
+            append_event(recording_path, RENAMED, old_title=old_title, new_title=new_title)
+        except OSError as e:
+            logger.error(f"Error logging rename of recording {recording_id}: {e}")
+
     async def delete_recording(self, recording_id) -> bool:
         """
         :param recording_id: the recording id
         :return: returns true if the delete operation was successful, and false otherwise
         """
-        path_str = self.recordings[recording_id]['recording_path']
-        target_path = Path(path_str)
-        # 1) check if the path exists
-        if not target_path.exists():
-            logger.error(f"Error attempting to delete recording directory for recording ID: {recording_id}, path '{target_path}' does not exist.")
-            return False
+        # waits for operations on the recording, e.g. a rename, to finish
+        async with self.get_recording_lock(recording_id):
+            path_str = self.recordings[recording_id]['recording_path']
+            target_path = Path(path_str)
+            # 1) check if the path exists
+            if not target_path.exists():
+                logger.error(f"Error attempting to delete recording directory for recording ID: {recording_id}, path '{target_path}' does not exist.")
+                return False
 
-        # 2) check if the path is a directory
-        if not target_path.is_dir():
-            logger.error(f"Error attempting to delete recording directory for recording ID: {recording_id}, path '{target_path}' is not a directory.")
-            return False
+            # 2) check if the path is a directory
+            if not target_path.is_dir():
+                logger.error(f"Error attempting to delete recording directory for recording ID: {recording_id}, path '{target_path}' is not a directory.")
+                return False
 
-        # 3) attempt to delete
-        try:
-            shutil.rmtree(target_path)
-            logger.info(f"Successfully deleted target path '{target_path}' - recording ID: {recording_id}.")
-            # clean recording data from memory
-            if recording_id in self.recordings:
-                del self.recordings[recording_id]
-            else:
-                logger.error(f"Error cleaning up recording data from memory, Recording ID {recording_id} not found.")
-            return True
-        except OSError as e:
-            logger.error(f"Error attempting to delete recording directory for recording ID: {recording_id}, target path: '{target_path}', error: '{e.strerror}'.")
-            return False
+            # 3) attempt to delete, the directory is moved to the trash and its space is reclaimed in the background
+            try:
+                trash_path = move_to_trash(path_str, self.recording_base_path)
+                get_trash_collector().schedule(trash_path)
+                logger.info(f"Successfully deleted target path '{target_path}' - recording ID: {recording_id}.")
+                # clean recording data from memory
+                async with self.registry_lock:
+                    interrupted_recordings.pop(recording_id, None)
+                    self.recording_locks.pop(recording_id, None)
+                    await self.state_backend.delete_recording(recording_id)
+                    if recording_id in self.recordings:
+                        release_chunk_data(self.recordings.pop(recording_id))
+                    else:
+                        logger.error(f"Error cleaning up recording data from memory, Recording ID {recording_id} not found.")
+                return True
+            except OSError as e:
+                logger.error(f"Error attempting to delete recording directory for recording ID: {recording_id}, target path: '{target_path}', error: '{e.strerror}'.")
+                return False
 
     async def save_mic_boost(self, mic_boost_level):
         """
@@ -319,18 +828,112 @@ class AudioChunkManager:
             json.dump(settings, f, indent=4)
             logger.info("Settings file updated.")
 
+    def get_transcription_dir_path(self, recording_id) -> str:
+        return os.path.join(os.path.dirname(self.recordings[recording_id]['recording_file_path']), 'TRANSCRIPTIONS')
+
+    async def index_transcriptions(self, recording_id):
+        """
+        Indexes the transcriptions of a recording for search, e.g. when a transcription has completed.
+        :param recording_id: the recording id
+        """
+        if recording_id not in self.recordings:
+            return
+        title = self.recordings[recording_id]['title']
+        transcription_dir = self.get_transcription_dir_path(recording_id)
+        def index():
+            get_transcription_index(self.recording_base_path).index_recording(recording_id, title, transcription_dir)
+        try:
+            await asyncio.to_thread(index)
+        except (OSError, sqlite3.Error) as e:
+            logger.error(f"Error indexing transcriptions of recording {recording_id}: {e}")
+
+    async def remove_transcriptions_from_index(self, recording_id):
+        """
+        Removes the transcriptions of a deleted recording from the search index.
+        :param recording_id: the recording id
+        """
+        def remove():
+            get_transcription_index(self.recording_base_path).remove_recording(recording_id)
+        try:
+            await asyncio.to_thread(remove)
+        except (OSError, sqlite3.Error) as e:
+            logger.error(f"Error removing transcriptions of recording {recording_id} from the index: {e}")
+
+    async def search_transcriptions(self, query: str, limit: int) -> dict | None:
+        """
+        Searches the transcriptions of all recordings. The first search in this process brings the index up to date
+        with the recordings on disk, later changes are indexed when they happen, e.g. when a recording is finalized.
+        :param query: the words to search for
+        :param limit: the maximum number of hits
+        :return: the hits with the recording id, title, file name, start and end time and a snippet, and whether
+        older matches were not ranked, see TranscriptionIndex.search_results, or None on error
+        """
+        recordings = {recording_id: (recording['title'], self.get_transcription_dir_path(recording_id))
+                      for recording_id, recording in self.recordings.items() if recording['status'] != 'active'}
+        active_recording_ids = set(self.get_active_recording_ids())
+        def search():
+            transcription_index = get_transcription_index(self.recording_base_path)
+            if not transcription_index.synced:
+                transcription_index.sync(recordings, active_recording_ids)
+                transcription_index.synced = True
+            return transcription_index.search_results(query, limit)
+        try:
+            return await asyncio.to_thread(search)
+        except (OSError, sqlite3.Error) as e:
+            logger.error(f"Error searching transcriptions: {e}")
+            return None
+
     def get_file_path(self, recording_id) -> str:
         return self.recordings[recording_id]['recording_file_path']
 
     def get_recording_dir_path(self, recording_id) -> str:
         return self.recordings[recording_id]['recording_path']
 
+    def get_file_crc32(self, recording_id) -> int | None:
+        return self.recordings[recording_id].get('file_crc32')
+
     def get_file_size(self, recording_id) -> int:
-        return os.path.getsize(self.recordings[recording_id]['recording_file_path'])
+        return get_audio_file_size(self.recordings[recording_id]['recording_file_path'])
+
+    def get_archive_candidates(self, idle_seconds: float) -> list[int]:
+        """
+        :param idle_seconds: the time since the WAV file was last modified, for a recording to be archived
+        :return: the IDs of finalized recordings with a WAV file that has not been modified for idle_seconds
+        """
+        candidates = []
+        for recording_id, recording in self.recordings.items():
+            if recording['status'] == 'active' or recording_id in interrupted_recordings:
+                # active and resumable recordings can still be written to
+                continue
+            if recording.get('transcription_start_time') is not None:
+                continue
+            if is_archive_candidate(recording['recording_file_path'], idle_seconds):
+                candidates.append(recording_id)
+        return candidates
+
+    def can_remove_wav(self, recording_id, wav_path: str) -> bool:
+        """
+        :param recording_id: the recording id
+        :param wav_path: the path to the WAV file when the recording was selected for archival
+        :return: true if the recording has not been renamed, deleted or resumed since it was selected for archival
+        """
+        recording = self.recordings.get(recording_id)
+        if recording is None or recording['recording_file_path'] != wav_path:
+            return False
+        if recording['status'] == 'active' or recording_id in interrupted_recordings:
+            return False
+        # the recording can be resumed in a connection of another server process
+        return not is_leased_recording(recording_id)
 
     def get_active_recording_id(self) -> int:
         return self.active_recording_id
 
+    def get_active_recording_ids(self) -> list[int]:
+        """
+        :return: the IDs of all recordings that are receiving chunks, several streams can be recorded at the same time
+        """
+        return [recording_id for recording_id, recording in self.recordings.items() if recording['status'] == 'active']
+
     def is_active_recording(self, recording_id) -> bool:
         return recording_id in self.recordings and self.recordings[recording_id]['status'] == 'active'
 
@@ -372,10 +975,163 @@ class AudioChunkManager:
             return False
 
     async def get_recording_data(self) -> [dict]:
-        async with self.lock:
+        async with self.registry_lock:
             return self.recordings
 
 
+def release_chunk_data(recording: dict):
+    """
+    Drops the data of received chunks that were not written to the recording file, e.g. when the recording was
+    finalized with missing chunks and no more chunks are accepted, and removes the chunk journal of the recording.
+    """
+    journal = recording.get('journal')
+    discard_chunk_data(recording)
+    if journal is not None:
+        journal.remove()
+    elif 'journal' not in recording and recording.get('recording_file_path'):
+        # the journal of a resumed recording is opened when the recording receives chunks
+        remove_journal(recording['recording_file_path'])
+
+def discard_chunk_data(recording: dict):
+    """
+    Drops the data of received chunks that were not written to the recording file and closes the chunk journal,
+    e.g. when the state of an interrupted recording is stale. The journal is kept on the storage.
+    """
+    for chunk in recording.get('chunks', {}).values():
+        if not chunk['flushed'] and chunk['data']:
+            metrics_util.BUFFERED_CHUNK_BYTES.dec(len(chunk['data']))
+            chunk['data'] = {}
+    if recording.get('journal') is not None:
+        recording['journal'].close()
+        recording['journal'] = None
+
+def rebuild_recording_from_journal(recording: dict) -> dict | None:
+    """
+    Rebuilds the received chunks of a recording from its chunk journal, see chunk_journal_util.
+    :param recording: the recording data, see get_recording_from_status
+    :return: a copy of the recording data with the received chunks, or None if the recording has no journal
+    """
+    if recording['status'] == RecordingStatus.VERIFIED or not os.path.isfile(recording['recording_file_path']):
+        return None
+    recovered = recover_journal(recording['recording_file_path'])
+    if recovered is None:
+        return None
+    now = datetime.datetime.now()
+    chunks = {}
+    if recovered['flushed_index'] is not None:
+        for index in range(recovered['flushed_index'] + 1):
+            chunks[index] = {'index': index, 'timestamp': now, 'flushed': True, 'data': {}}
+    for index, data in recovered['buffered'].items():
+        chunks[index] = {'index': index, 'timestamp': now, 'flushed': False, 'data': data}
+        metrics_util.BUFFERED_CHUNK_BYTES.inc(len(data))
+    logger.info(f"Rebuilt {len(chunks)} chunks of recording {recording['id']} from the chunk journal.")
+    try:
+        # the peaks on disk were written by the server process that received the recording before
+        waveform = resume_waveform(recording['recording_file_path'])
+    except (OSError, ValueError) as e:
+        logger.error(f"Error rebuilding waveform peaks for recording {recording['id']}: {e}")
+        waveform = None
+    return {
+        **recording,
+        'file_size': recovered['file_size'],
+        'flushed_index': recovered['flushed_index'],
+        'file_crc32': recovered['file_crc32'],
+        'chunks': chunks,
+        'waveform': waveform
+    }
+
+def keep_interrupted_recording(recording_id: int, recording: dict):
+    """
+    Keeps the state of an interrupted recording for resuming it, and drops the state of interrupted recordings that
+    have not been resumed for INTERRUPTED_RECORDING_TTL_SECONDS.
+    """
+    now = time.monotonic()
+    for expired_id in [x for x, state in interrupted_recordings.items()
+                       if now - state.get('interrupted_time', now) >= settings.INTERRUPTED_RECORDING_TTL_SECONDS]:
+        logger.info(f"State of interrupted recording {expired_id} has expired.")
+        discard_chunk_data(interrupted_recordings.pop(expired_id))
+    recording['interrupted_time'] = now
+    interrupted_recordings[recording_id] = recording
+
+def track_finalization(recording_id: int, task: asyncio.Task):
+    """Keeps the background finalization of an interrupted recording until it is done, see handle_resume."""
+    finalizing_recordings[recording_id] = task
+    def forget(done_task):
+        if finalizing_recordings.get(recording_id) is done_task:
+            del finalizing_recordings[recording_id]
+    task.add_done_callback(forget)
+
+def release_interrupted_recording(recording_id: int) -> bool:
+    """
+    Drops the state of an interrupted recording that is resumed in another worker process, see shard_util.
+    :param recording_id: the recording id
+    :return: true if there was state of the recording
+    """
+    recording = interrupted_recordings.pop(recording_id, None)
+    if recording is None:
+        return False
+    logger.info(f"Handing off interrupted recording {recording_id} to another shard.")
+    discard_chunk_data(recording)
+    return True
+
+def recover_interrupted_recording(status: dict) -> dict:
+    """
+    Rebuilds the received chunks of a recording that was interrupted by a server crash from its chunk journal, and
+    keeps them as an interrupted recording, so the client can resume the recording and resend only the missing chunks.
+    :param status: the status of the recording, see load_recording_status
+    :return: the status, with the size of the recovered recording file
+    """
+    recording = rebuild_recording_from_journal(get_recording_from_status(status))
+    if recording is None:
+        return status
+    keep_interrupted_recording(status['recording_id'], recording)
+    return {**status, 'file_size': recording['file_size']}
+
+def parse_int_parameter(value, default: int) -> int | None:
+    """
+    Parses an integer parameter of a control message.
+    :param value: the parameter, None if it is missing
+    :param default: the value of a missing parameter
+    :return: the value, or None if the parameter is not a number
+    """
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except (ValueError, TypeError, OverflowError):
+        return None
+
+def get_page_size_parameter(param_object: dict) -> int:
+    """Returns the pageSize parameter of a control message, DEFAULT_RECORDINGS_PAGE_SIZE if it is missing or not a number."""
+    page_size = parse_int_parameter(param_object.get("pageSize"), DEFAULT_RECORDINGS_PAGE_SIZE)
+    return page_size if page_size is not None else DEFAULT_RECORDINGS_PAGE_SIZE
+
+def get_recording_from_status(status: dict) -> dict:
+    """Converts a recording status, see load_recording_status, to the recording data of AudioChunkManager."""
+    return {
+        'id': status['recording_id'],
+        'title': status['title'],
+        'status': status['status'],
+        'recording_file_path': status['file_path'],
+        'recording_path': status['recording_path'],
+        'layout': status['layout'],
+        'transcription_start_time': status['transcription_start_time'],
+        'file_size': status['file_size'],
+        'results': status['results'] if status['results'] is not None else []
+    }
+
+def get_client_recording(recording: dict) -> dict:
+    """Returns the data of a recording that is sent to the client, RecordingStatus is not serializable by json.dumps."""
+    return {
+        'recording_id': recording['id'],
+        'title': recording['title'],
+        'status': RecordingStatus(recording['status']).value,
+        'recording_file_path': recording['recording_file_path'],
+        "transcription_start_time": recording['transcription_start_time'],
+        'file_size': recording['file_size'],
+        'results': recording['results']
+    }
+
 def load_settings(base_recordings_path: str) -> dict:
     """
     Creates settings.json with default content if it doesn't exist.
@@ -401,7 +1157,7 @@ def load_settings(base_recordings_path: str) -> dict:
 def load_all_recordings_status(base_recordings_path: str) -> list[dict]:
     """
     Scans the base recordings directory to find all recordings and their
-    finalization status from 'completion_log.txt' files.
+    finalization status from their event logs, see recording_events_util.
     Args:
         base_recordings_path: The root directory where all recording subdirectories are stored
     Returns:
@@ -413,88 +1169,135 @@ def load_all_recordings_status(base_recordings_path: str) -> list[dict]:
     logger.info(f"Scanning for recordings in: {base_recordings_path}")
     all_statuses = []
 
+    # with a shared state backend, recordings can be receiving chunks in other server processes, they are recovered
+    # when they are resumed
+    clean_up = not get_recording_state_backend().shared
     try:
         # Iterate through all items in the base path to find directories
         for item_name in os.listdir(base_recordings_path):
-            recording_dir = os.path.join(base_recordings_path, item_name)
-            if not os.path.isdir(recording_dir):
-                continue
-
-            # Extract the title from the directory name (e.g., "1_My_Title" -> "My_Title")
-            parts = item_name.split('_', 1)
-            if len(parts) > 1:
-                title = parts[1]
-            else:
-                logger.warning("Malformed directory name, skipping.")
+            try:
+                status = load_recording_status(base_recordings_path, item_name, clean_up=clean_up)
+            except RecordingBusyError:
+                # loaded when the recording is finalized
                 continue
-            log_path = os.path.join(recording_dir, "completion_log.txt")
-            wav_path = os.path.join(recording_dir, title + ".wav")
-            # get transcription file links
-            transcription_dir = os.path.join(recording_dir, "TRANSCRIPTIONS")
-            results = None
-            if os.path.isdir(transcription_dir):
-                #logger.info("Loading transcription file links.")
-                results = prepare_results(transcription_dir)
-
-            # Handle case where there is both a log and a wav file
-            if os.path.isfile(log_path) and os.path.isfile(wav_path):
-                try:
-                    with open(log_path, "r") as f:
-                        lines = f.readlines()
-                        if len(lines) < 2:
-                            logger.warning(f"Malformed completion log (too short): {log_path}")
-                            continue
-                        log_data = {}
-                        for line in lines:
-                            if ":" in line:
-                                key, value = line.split(":", 1)
-                                log_data[key.strip()] = value.strip()
-                        recording_id = int(log_data["Recording ID"])
-                        status_name = log_data["Status"]
-                        status = RecordingStatus[status_name]  # Convert string back to enum
-                        # if there is transcription start time and not transcription end time, then add start time
-                        # this signals to client that there is an active transcription
-                        transcription_start_time = None
-                        if "Transcription start time" in log_data and "Transcription end time" not in log_data:
-                            transcription_start_time = log_data["Transcription start time"]
-                        all_statuses.append({"recording_id": recording_id,
-                                             "recording_path": recording_dir,
-                                             "file_path": wav_path,
-                                             "status": status,
-                                             "title": title,
-                                             "transcription_start_time": transcription_start_time,
-                                             "file_size": os.path.getsize(wav_path),
-                                             "results": results})
-                except (IndexError, TypeError, ValueError, KeyError) as e:
-                    logger.error(f"Could not parse completion log {log_path}: {e}")
-            elif os.path.isfile(wav_path):
-                try:
-                    # If the server disconnected during recording, then only the wav file is present
-                    logger.info("Loading recording state for file with no completion log file")
-                    recording_id = int(parts[0])
-                    all_statuses.append({"recording_id": recording_id,
-                                         "recording_path": recording_dir,
-                                         "file_path": wav_path,
-                                         "status": RecordingStatus.INTERRUPTED_NOT_VERIFIED,
-                                         "title": title,
-                                         "transcription_start_time": None,
-                                         "file_size": None,
-                                         "results": results})
-                except (IndexError, TypeError, ValueError) as e:
-                    logger.error(f"Could not parse recording ID from directory {recording_dir}: {e}")
-            elif os.path.isfile(log_path):
-                # handle case with only log file, exceptional error, cleanup directory
-                os.remove(log_path)
-                logger.error("The recording directory only has a log file, recording was interrupted before any data was written, cleaning.")
-                clean_dir(recording_dir)
-            else:
-                # handle case with empty directory, exceptional error, cleanup directory
-                logger.error("The recording directory is empty, cleaning.")
-                clean_dir(recording_dir)
+            if status is not None:
+                all_statuses.append(status)
     except FileNotFoundError:
         logger.error(f"Recordings directory not found: {base_recordings_path}")
     return all_statuses
 
+def load_recording_status(base_recordings_path: str, item_name: str, clean_up: bool = False) -> dict | None:
+    """
+    Loads the status of one recording directory, see load_all_recordings_status.
+    Args:
+        base_recordings_path: The root directory where all recording subdirectories are stored
+        item_name: The name of the recording directory
+        clean_up: If true, directories without audio data are removed, and interrupted recordings are recovered from
+                  their chunk journals. Only for a scan at startup, when no recording can have been started or
+                  receive chunks yet.
+    Returns:
+        The status of the recording, or None if the directory is not a recording
+    Raises:
+        RecordingBusyError: If clean_up is false and the recording is receiving chunks in a connection of this or
+                            another server process, see RecordingLibrary.refresh.
+    """
+    recording_dir = os.path.join(base_recordings_path, item_name)
+    if not os.path.isdir(recording_dir) or item_name.startswith('.'):
+        # skip files and hidden directories, e.g. the trash
+        return None
+
+    # Extract the title from the directory name (e.g., "1_My_Title" -> "My_Title")
+    # or from the metadata file if the directory is named after the recording ID (e.g. "1")
+    parts = item_name.split('_', 1)
+    metadata = read_metadata(recording_dir) if item_name.isdigit() else {}
+    if 'title' in metadata:
+        title = metadata['title']
+        file_stem = item_name
+        layout = ID_LAYOUT
+    elif len(parts) > 1:
+        title = parts[1]
+        file_stem = title
+        layout = TITLE_LAYOUT
+    else:
+        logger.warning("Malformed directory name, skipping.")
+        return None
+    wav_path = os.path.join(recording_dir, file_stem + ".wav")
+    # get transcription file links
+    transcription_dir = os.path.join(recording_dir, "TRANSCRIPTIONS")
+    results = None
+    if os.path.isdir(transcription_dir):
+        #logger.info("Loading transcription file links.")
+        results = prepare_results(transcription_dir)
+
+    # the wav file can be archived as a flac file
+    audio_exists = resolve_audio_path(wav_path) is not None
+    # the state of a finalized recording, from the event log (or the completion log of an older version)
+    recording_state = read_recording_state(recording_dir)
+
+    # Handle case where the recording is finalized and there is a wav file
+    if recording_state is not None and audio_exists:
+        try:
+            status = RecordingStatus[recording_state['status']]  # Convert string back to enum
+            if not clean_up and is_leased_recording(recording_state['recording_id']):
+                # a resumed recording, its status changes when it is finalized again
+                raise RecordingBusyError(f"Recording {recording_state['recording_id']} is receiving chunks")
+            recording_status = {"recording_id": recording_state['recording_id'],
+                                "recording_path": recording_dir,
+                                "layout": layout,
+                                "file_path": wav_path,
+                                "status": status,
+                                "title": title,
+                                # signals to the client that there is an active transcription
+                                "transcription_start_time": recording_state['transcription_start_time'],
+                                "file_size": get_audio_file_size(wav_path),
+                                "results": results}
+            return recover_interrupted_recording(recording_status) if clean_up else recording_status
+        except KeyError as e:
+            logger.error(f"Unknown recording status in the event log of {recording_dir}: {e}")
+    elif audio_exists:
+        try:
+            recording_id = int(parts[0])
+            if not clean_up and is_leased_recording(recording_id):
+                # the wav file of a recording that is receiving chunks is also present, it is not interrupted
+                raise RecordingBusyError(f"Recording {recording_id} is receiving chunks")
+            # If the server disconnected during recording, then only the wav file is present
+            logger.info("Loading recording state for file with no completion log file")
+            recording_status = {"recording_id": recording_id,
+                                "recording_path": recording_dir,
+                                "layout": layout,
+                                "file_path": wav_path,
+                                "status": RecordingStatus.INTERRUPTED_NOT_VERIFIED,
+                                "title": title,
+                                "transcription_start_time": None,
+                                "file_size": None,
+                                "results": results}
+            return recover_interrupted_recording(recording_status) if clean_up else recording_status
+        except (IndexError, TypeError, ValueError) as e:
+            logger.error(f"Could not parse recording ID from directory {recording_dir}: {e}")
+    elif not clean_up:
+        # the directory can be a recording that has just been started
+        return None
+    elif has_event_log(recording_dir):
+        # handle case with only log file, exceptional error, cleanup directory
+        for log_path in (get_event_log_path(recording_dir), os.path.join(recording_dir, LEGACY_COMPLETION_LOG_FILE_NAME)):
+            if os.path.isfile(log_path):
+                os.remove(log_path)
+        logger.error("The recording directory only has a log file, recording was interrupted before any data was written, cleaning.")
+        clean_dir(recording_dir)
+    else:
+        # handle case with empty directory, exceptional error, cleanup directory
+        logger.error("The recording directory is empty, cleaning.")
+        clean_dir(recording_dir)
+    return None
+
+def is_leased_recording(recording_id: int) -> bool:
+    """Returns true if a recording is receiving chunks in a connection of this or another server process."""
+    try:
+        return get_recording_state_backend().is_leased(recording_id)
+    except Exception as e:
+        logger.error(f"Error reading the lease of recording {recording_id}: {e}")
+        return False
+
 def clean_dir(path):
     try:
         # handle case with empty directory, exceptional error, cleanup directory
@@ -510,47 +1313,81 @@ class AudioDataConsumer(AsyncWebsocketConsumer):
         self.active_tasks = {} # {task_id: {details}}
         self.monitor_task = None
         self.transcription_group_name = "transcription_monitor_group"
+        self.library_listener = None
+        # the trace of the frames of the session when session capture is enabled, see session_trace_util
+        self.session_trace = None
 
     async def connect(self):
         await self.accept()
+        metrics_util.ACTIVE_CONNECTIONS.inc()
+        self.session_trace = open_session_trace(self.scope.get("path", ""))
+        # handoffs of recordings to other shards, when the server runs several worker processes
+        ensure_shard_listener(self.channel_layer, release_interrupted_recording)
         # The group is used to be able to get transcription_completed messages across client re-connects
         # The group_add operation is idempotent
         await self.channel_layer.group_add(
             self.transcription_group_name,
             self.channel_name
         )
+        if self.chunk_manager.library is not None:
+            # changes of the recordings on disk are reported from the watcher thread
+            loop = asyncio.get_running_loop()
+            def listener(changed, deleted, version):
+                asyncio.run_coroutine_threadsafe(self.send_library_changes(changed, deleted, version), loop)
+            self.library_listener = listener
+            self.chunk_manager.library.add_listener(listener)
+            # changes made after the recordings of this connection were loaded, before the listener was added
+            await self.send_library_changes(*self.chunk_manager.library.get_changed_statuses(self.chunk_manager.library_version))
 
     async def disconnect(self, close_code):
         # this is called if the client disconnects, e.g. if the client browser window is closed or refreshed
         logger.info("Client disconnected.")
-        if self.chunk_manager.is_active_recording(self.chunk_manager.get_active_recording_id()):
-            # try to finalize the active recording
+        metrics_util.ACTIVE_CONNECTIONS.dec()
+        active_recording_ids = self.chunk_manager.get_active_recording_ids()
+        for recording_id in active_recording_ids:
+            # try to finalize the active recordings
             # the recording state will be RecordingStatus.INTERRUPTED_VERIFIED or RecordingStatus.DATA_LOSS
-            logger.info(f"Disconnect - try to finalize active recording, id: {self.chunk_manager.get_active_recording_id().__str__()}")
-            asyncio.create_task(self._handle_finalize_recording())
-        else:
+            logger.info(f"Disconnect - try to finalize active recording, id: {recording_id}")
+            track_finalization(recording_id, asyncio.create_task(self._handle_finalize_recording(recording_id=recording_id)))
+        if not active_recording_ids:
             logger.info("Disconnect - no active recording to finalize.")
         # remove the channel from the group to prevent sending messages to a closed connection
         await self.channel_layer.group_discard(
             self.transcription_group_name, self.channel_name
         )
+        if self.library_listener is not None:
+            self.chunk_manager.library.remove_listener(self.library_listener)
+            self.library_listener = None
+        if self.session_trace is not None:
+            self.session_trace.close(close_code)
+            self.session_trace = None
+
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        if self.session_trace is not None:
+            self.session_trace.write_outbound(text_data, bytes_data)
+        await super().send(text_data=text_data, bytes_data=bytes_data, close=close)
 
     async def receive(self, text_data=None, bytes_data=None):
         """
         control messages:
         start_recording
         stop_recording
+        resume_recording
         initialize
+        get_recordings_page
         start_transcription
         cancel_transcription
         rename_recording
         delete_recording
         save_mic_boost_level
+        search_transcriptions
 
         :param text_data: control messages from the client
         :param bytes_data: binary audio data from the client
         :return:
         """
+        if self.session_trace is not None:
+            self.session_trace.write_inbound(text_data, bytes_data)
         if text_data is not None:
             data = json.loads(text_data)
             if data.get("type") == "control_message":
@@ -565,29 +1402,54 @@ class AudioDataConsumer(AsyncWebsocketConsumer):
                         'recording_id': recording_id
                     }))
                 elif data.get("message") == "stop_recording":
-                    total_chunks = data.get("parameter")
-                    logger.info(f"Received stop_recording. Total number of chunks in recording: {total_chunks}")
+                    # the parameter is the total number of chunks of the active recording, or an object naming the
+                    # recording when several recordings are streamed on the connection
+                    param = data.get("parameter")
+                    if isinstance(param, dict):
+                        total_chunks = param.get("totalChunks")
+                        recording_id = param.get("recordingId")
+                    else:
+                        total_chunks = param
+                        recording_id = None
+                    logger.info(f"Received stop_recording, recording ID: {recording_id}. Total number of chunks in recording: {total_chunks}")
                     # Offload the finalization logic to a non-blocking background task
-                    asyncio.create_task(self._handle_finalize_recording(total_chunks))
+                    asyncio.create_task(self._handle_finalize_recording(total_chunks, recording_id))
+                elif data.get("message") == "resume_recording":
+                    param_object = data.get("parameter")
+                    recording_id = param_object.get("recordingId")
+                    logger.info(f"Received resume_recording control message, recording ID: {recording_id}")
+                    await self.handle_resume(recording_id)
+                elif data.get("message") == "initialize" and data.get("parameter") is not None:
+                    # paged initialization, only the recordings changed since the version last seen by the client
+                    param_object = data.get("parameter")
+                    logger.info(f"Received initialize control message, version: {param_object.get('version')}")
+                    page = await self.chunk_manager.get_recordings_page(param_object.get("epoch"), param_object.get("version"),
+                                                                        page_size=get_page_size_parameter(param_object))
+                    await self.send(text_data=json.dumps({
+                        'message_type': 'initialization_data',
+                        **page,
+                        'available_memory': await asyncio.to_thread(calculate_available_memory),
+                        'mic_boost_level': self.chunk_manager.get_mic_boost_level()
+                    }))
+                elif data.get("message") == "get_recordings_page":
+                    param_object = data.get("parameter")
+                    page = await self.chunk_manager.get_recordings_page(param_object.get("epoch"), param_object.get("version"),
+                                                                        param_object.get("cursor"),
+                                                                        get_page_size_parameter(param_object))
+                    await self.send(text_data=json.dumps({
+                        'message_type': 'recordings_page',
+                        **page
+                    }))
                 elif data.get("message") == "initialize":
                     logger.info("Received initialize control message.")
                     recording_data = await self.chunk_manager.get_recording_data()
-                    # RecordingStatus is not serializable by json.dumps
                     client_data = {}
                     for item in recording_data.values():
-                        client_data[item['id']] = {
-                            'recording_id': item['id'],
-                            'title': item['title'],
-                            'status': RecordingStatus(item['status']).value,
-                            'recording_file_path': item['recording_file_path'],
-                            "transcription_start_time": item['transcription_start_time'],
-                            'file_size': item['file_size'],
-                            'results': item['results']
-                        }
+                        client_data[item['id']] = get_client_recording(item)
                     await self.send(text_data=json.dumps({
                         'message_type': 'initialization_data',
                         'recordings': list(client_data.values()),
-                        'available_memory': calculate_available_memory(),
+                        'available_memory': await asyncio.to_thread(calculate_available_memory),
                         'mic_boost_level': self.chunk_manager.get_mic_boost_level()
                     }))
                 elif data.get("message") == "start_transcription":
@@ -619,6 +1481,12 @@ class AudioDataConsumer(AsyncWebsocketConsumer):
                     logger.info(f"Deleting recording with recording ID: {recording_id}")
                     # start server task and send back status, success/failed
                     await self.handle_delete(recording_id)
+                elif data.get("message") == "search_transcriptions":
+                    param_object = data.get("parameter")
+                    query = param_object.get("query", "")
+                    limit = param_object.get("limit")
+                    logger.info(f"Received search_transcriptions control message, query: {query}")
+                    await self.handle_search(query, limit)
                 elif data.get("message") == "save_mic_boost_level":
                     logger.info("Received save_mic_boost_level control message.")
                     param_object = data.get("parameter")
@@ -630,32 +1498,53 @@ class AudioDataConsumer(AsyncWebsocketConsumer):
                     logger.info("Unknown control message")
         elif bytes_data is not None:
             # handle binary audio chunks
-            # bytes_data contains the full binary message received, the first 8 bytes contains the header
-            header = bytes_data[:8]
-            recording_id, chunk_index = struct.unpack(">II", header)  # Big-endian unsigned ints
-            audio_data = bytes_data[8:]  # contains the audio chunk
-            #save_audio_data_for_test(bytes_data, recording_id, chunk_index, True)
-            #save_audio_data_for_test(audio_data, recording_id, chunk_index, False)
+            receive_time = time.perf_counter()
+            # bytes_data contains the full binary message received, the header is followed by the audio chunk
+            try:
+                recording_id, chunk_index, audio_data = parse_chunk_header(bytes_data)
+            except ValueError as e:
+                logger.error(f"Error when parsing chunk header: {e}")
+                return
             logger.info(f"Byte data received - header data - Rec. ID = {recording_id} chunk_index = {chunk_index}")
+            if audio_data is None:
+                # the chunk is corrupted or truncated, request it again
+                logger.warning(f"Integrity check failed for chunk with Rec. ID = {recording_id} chunk_index = {chunk_index}, requesting resend.")
+                metrics_util.CHUNK_RESEND_REQUESTS.labels("integrity").inc()
+                await self.send_to_client({
+                    'message_type': 'request_chunk',
+                    'recording_id': recording_id,
+                    'chunk_index': chunk_index
+                })
+                return
             chunk_added = False
             try:
                 chunk_added = await self.chunk_manager.add_chunk(recording_id, chunk_index, audio_data)
             except ValueError as e:
                 logger.error(f"Error when adding chunk with Rec. ID = {recording_id} chunk_index = {chunk_index}", e)
             if chunk_added:
-                await self.send(text_data=json.dumps({
+                ack = {
                     'message_type': 'ack_chunk',
+                    'recording_id': recording_id,
                     'chunk_index': chunk_index
-                }))
-
-    async def _handle_finalize_recording(self, total_chunks=None):
+                }
+                # live quality event, throttled to one every QUALITY_EVENT_INTERVAL seconds
+                quality = self.chunk_manager.pop_quality_event(recording_id)
+                if quality is not None:
+                    ack['quality'] = quality
+                await self.send(text_data=json.dumps(ack))
+                metrics_util.CHUNK_ACK_LATENCY.observe(time.perf_counter() - receive_time)
+
+    async def _handle_finalize_recording(self, total_chunks=None, recording_id=None):
         """
         This method runs in the background to check for recording completeness
         without blocking the main receive loop.
+        The recording is the active recording unless recording_id is given.
         """
-        recording_id = self.chunk_manager.get_active_recording_id()
-        recording_finalized = False
-        number_of_retries = 10
+        if recording_id is None:
+            recording_id = self.chunk_manager.get_active_recording_id()
+        elif not self.chunk_manager.is_active_recording(recording_id):
+            logger.warning(f"Cannot finalize recording, recording ID: {recording_id} is not active")
+            return
         success_status: RecordingStatus = RecordingStatus.VERIFIED
         send_info_to_client = True
 
@@ -663,13 +1552,12 @@ class AudioDataConsumer(AsyncWebsocketConsumer):
             # if we are verifying an interrupted recording (client disconnect)
             # don't expect additional chunks
             # don't send info to client and modify success flag
-            number_of_retries = 1
             send_info_to_client = False
             success_status = RecordingStatus.INTERRUPTED_VERIFIED
 
-        # method for writing completion log file
+        # method for logging the finalization in the event log of the recording
         def write_completion_log(status: RecordingStatus):
-            """Writes a completion log file for the recording."""
+            """Appends the finalized event to the event log of the recording."""
             try:
                 # We get the full .wav file path to derive the recording's directory.
                 wav_path = self.chunk_manager.get_file_path(recording_id)
@@ -678,33 +1566,20 @@ class AudioDataConsumer(AsyncWebsocketConsumer):
                     return
 
                 recording_dir = os.path.dirname(wav_path)
-                log_path = os.path.join(recording_dir, "completion_log.txt")
-                timestamp_finalized = datetime.datetime.now(datetime.timezone.utc).isoformat()
-
                 os.makedirs(recording_dir, exist_ok=True)
-                with open(log_path, "w") as f:
-                    f.write(f"Recording ID: {recording_id}\n")
-                    f.write(f"Status: {status.name}\n")
-                    f.write(f"Completion time: {timestamp_finalized}\n")
+                append_event(recording_dir, FINALIZED, recording_id=recording_id, status=status.name,
+                             file_crc32=self.chunk_manager.get_file_crc32(recording_id))
                 logger.info(f"Wrote completion log for recording {recording_id} with status {status.name}")
             except Exception as e:
                 logger.error(f"Failed to write completion log for recording {recording_id}: {e}")
 
-        # try to verify file, and request resends if needed
-        # try a number of times, and send an error message if not successful
-        for i in range(number_of_retries):
-            if total_chunks is not None:
-                recording_finalized = await self.chunk_manager.finalize_active_recording(int(total_chunks))
-            else:
-                recording_finalized = await self.chunk_manager.finalize_active_recording()
-            if recording_finalized:
-                logger.info("Recording has been finalized.")
-                break
-            else:
-                if total_chunks is not None:
-                    # only sleep for normal finalization (not when handling interrupted recordings)
-                    logger.info("Recording has not been finalized, sleeping for one second.")
-                    await asyncio.sleep(1)
+        # verify the file, missing chunks are requested and awaited until the finalization timeout
+        if total_chunks is not None:
+            recording_finalized = await self.chunk_manager.finalize_recording(recording_id, int(total_chunks))
+        else:
+            recording_finalized = await self.chunk_manager.finalize_recording(recording_id)
+        self.chunk_manager.finish_waveform(recording_id)
+        await asyncio.to_thread(self.chunk_manager.save_quality_summary, recording_id)
         if recording_finalized:
             # write a log file indicating successful verification
             await asyncio.to_thread(write_completion_log, success_status)
@@ -722,6 +1597,33 @@ class AudioDataConsumer(AsyncWebsocketConsumer):
             if send_info_to_client:
                 logger.info("Sending file info to client.")
                 await self.send_finalization_data(recording_id, RecordingStatus.DATA_LOSS)
+        if total_chunks is None:
+            # the client can reconnect and resume the interrupted recording
+            self.chunk_manager.detach_interrupted_recording(recording_id)
+        else:
+            # chunks after a missing chunk are never written, the recording does not accept more chunks and is not resumed
+            await self.chunk_manager.release_received_chunks(recording_id)
+        await self.chunk_manager.release_recording(recording_id)
+        # the recording library reports a recording when its lease is released
+        await self.chunk_manager.refresh_library(self.chunk_manager.get_recording_dir_path(recording_id))
+        # a resumed recording can have transcriptions, active recordings are skipped when the index is synced
+        await self.chunk_manager.index_transcriptions(recording_id)
+        if settings.ARCHIVE_FLAC_ENABLED:
+            # archival stage, runs in the background after the finalization
+            asyncio.create_task(self.archive_idle_recordings())
+
+    async def archive_idle_recordings(self):
+        """Archives finalized recordings that have been idle for ARCHIVE_AFTER_SECONDS as FLAC."""
+        transcribing = {task_info['recording_id'] for task_info in self.active_tasks.values()}
+        for recording_id in self.chunk_manager.get_archive_candidates(settings.ARCHIVE_AFTER_SECONDS):
+            if recording_id in transcribing:
+                continue
+            logger.info(f"Archiving recording ID: {recording_id}")
+            wav_path = self.chunk_manager.get_file_path(recording_id)
+            await archive_recording(self.chunk_manager.get_recording_dir_path(recording_id), wav_path,
+                                    self.chunk_manager.get_recording_lock(recording_id),
+                                    lambda recording_id=recording_id, wav_path=wav_path:
+                                    self.chunk_manager.can_remove_wav(recording_id, wav_path))
 
     async def send_finalization_data(self, recording_id, status: RecordingStatus):
         path = self.chunk_manager.get_file_path(recording_id)
@@ -731,15 +1633,35 @@ class AudioDataConsumer(AsyncWebsocketConsumer):
             'recording_id': recording_id,
             'completion_status': status.value,
             'path': path,
-            'size': size
+            'size': size,
+            'quality': self.chunk_manager.get_quality_summary(recording_id)
         }))
 
+    async def send_library_changes(self, changed: list[dict], deleted: list[int], version: int):
+        """Updates the recordings of this connection with changes of the recordings on disk, and sends them to the client."""
+        changed_ids, deleted_ids = await self.chunk_manager.apply_library_changes(changed, deleted, version)
+        if not changed_ids and not deleted_ids:
+            return
+        recording_data = await self.chunk_manager.get_recording_data()
+        await self.send_to_client({
+            'message_type': 'recordings_changed',
+            'recordings': [get_client_recording(recording_data[recording_id]) for recording_id in changed_ids],
+            'deleted': deleted_ids,
+            'epoch': self.chunk_manager.library.epoch,
+            'version': version
+        })
+
     async def send_to_client(self, json_object):
         await self.send(text_data=json.dumps(json_object))
 
     async def handle_rename(self, recording_id, new_title):
         logger.info(f"Starting title rename task for recording {recording_id} and new title {new_title}")
+        old_recording_path = self.chunk_manager.get_recording_dir_path(recording_id)
         rename_successful = await self.chunk_manager.rename_title(recording_id, new_title)
+        if rename_successful:
+            # the title and the transcription file names have changed
+            await self.chunk_manager.index_transcriptions(recording_id)
+            await self.chunk_manager.refresh_library(old_recording_path, self.chunk_manager.get_recording_dir_path(recording_id))
         await self.send(text_data=json.dumps({
             "message_type": "rename_complete",
             "success": rename_successful,
@@ -749,9 +1671,53 @@ class AudioDataConsumer(AsyncWebsocketConsumer):
             "results": prepare_results(os.path.join(self.chunk_manager.get_recording_dir_path(recording_id), 'TRANSCRIPTIONS/'))
         }))
 
+    async def handle_search(self, query, limit):
+        limit = parse_int_parameter(limit, DEFAULT_SEARCH_LIMIT)
+        if limit is None:
+            logger.warning("Cannot search transcriptions, the limit is not a number")
+            results = None
+        else:
+            results = await self.chunk_manager.search_transcriptions(str(query), min(max(limit, 1), MAX_SEARCH_RESULTS))
+        await self.send(text_data=json.dumps({
+            "message_type": "search_results",
+            "success": results is not None,
+            "query": query,
+            "hits": results['hits'] if results is not None else [],
+            "truncated": results['truncated'] if results is not None else False
+        }))
+
+    async def handle_resume(self, recording_id):
+        logger.info(f"Starting resume task for recording ID: {recording_id}")
+        if is_sharded() and not is_local_recording(recording_id):
+            # the client has reconnected to another worker process than the shard of the recording
+            await request_handoff(self.channel_layer, recording_id, settings.SHARD_HANDOFF_TIMEOUT)
+        finalization = finalizing_recordings.get(recording_id)
+        if finalization is not None:
+            # the client reconnected before the recording was finalized after the disconnect
+            logger.info(f"Waiting for the finalization of interrupted recording ID: {recording_id}")
+            try:
+                await asyncio.wait_for(asyncio.shield(finalization), RESUME_FINALIZE_WAIT_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning(f"Finalization of interrupted recording ID: {recording_id} did not complete in time")
+            except Exception as e:
+                logger.error(f"Finalization of interrupted recording ID: {recording_id} failed: {e}")
+        resume_state = await self.chunk_manager.resume_recording(recording_id)
+        response = {
+            "message_type": "ack_resume_recording",
+            "success": resume_state is not None,
+            "recording_id": recording_id,
+        }
+        if resume_state is not None:
+            response.update(resume_state)
+        await self.send(text_data=json.dumps(response))
+
     async def handle_delete(self, recording_id):
         logger.info(f"Starting delete task for recording ID: {recording_id}")
+        recording_path = self.chunk_manager.get_recording_dir_path(recording_id)
         delete_successful = await self.chunk_manager.delete_recording(recording_id)
+        if delete_successful:
+            await self.chunk_manager.remove_transcriptions_from_index(recording_id)
+            await self.chunk_manager.refresh_library(recording_path)
         await self.send(text_data=json.dumps({
             "message_type": "delete_complete",
             "success": delete_successful,
@@ -771,27 +1737,35 @@ class AudioDataConsumer(AsyncWebsocketConsumer):
         recording_dir_path = self.chunk_manager.get_recording_dir_path(recording_id)
         recording_file_path = self.chunk_manager.get_file_path(recording_id)
         # Get the file size
-        size = None
-        try:
-            size = os.path.getsize(recording_file_path)
-        except FileNotFoundError:
+        size = get_audio_file_size(recording_file_path)
+        if size is None:
             logger.error(f"Error when starting transcription, nu such file path, recording ID: {recording_id}")
+        # recordings with quality warnings are transcribed, the client is warned when the recording is finalized
+        quality_warnings = read_metadata(recording_dir_path).get('quality', {}).get('warnings', [])
+        if quality_warnings:
+            logger.warning(f"Starting transcription of recording {recording_id} with audio quality warnings: {quality_warnings}")
         cleaned_model_name = clean_model_name(model)
         task = transcription_task.delay(recording_dir_path, recording_file_path, cleaned_model_name, language)
         # Store the task ID to monitor it
         task_id = task.id
         self.active_tasks[task_id] = {
             "recording_id": recording_id,
-            "transcription_dir": os.path.join(recording_dir_path, "TRANSCRIPTIONS")
+            "transcription_dir": os.path.join(recording_dir_path, "TRANSCRIPTIONS"),
+            "model": cleaned_model_name,
+            "submit_time": time.time(),
+            "start_time": None  # set when the task monitor sees that a worker has started the task
         }
+        metrics_util.TRANSCRIPTION_QUEUE_DEPTH.inc()
         logger.info(f"Started transcription task {task_id} for recording {recording_id}")
         self.log_transcription_start(recording_id)
+        await self.chunk_manager.refresh_library(recording_dir_path)
         # Send the task_id back to the client
         await self.send(text_data=json.dumps({
             "message_type": "transcription_started",
             "task_id": task_id,
             "recording_id": recording_id,
-            "file_size": size
+            "file_size": size,
+            "quality_warnings": quality_warnings
         }))
 
     async def cancel_transcription_task(self, task_id:str):
@@ -803,8 +1777,12 @@ class AudioDataConsumer(AsyncWebsocketConsumer):
         task_result.abort()  # Abort the task
         # remove from active_tasks
         task_info = self.active_tasks.pop(task_id)
+        if task_info['start_time'] is None:
+            metrics_util.TRANSCRIPTION_QUEUE_DEPTH.dec()
+        metrics_util.TRANSCRIPTION_CANCELLATIONS.labels(task_info['model']).inc()
         # update completion log
         self.log_transcription_cancelled(task_info['recording_id'])
+        await self.chunk_manager.refresh_library(os.path.dirname(task_info['transcription_dir']))
 
     async def _task_monitor(self, active_tasks: dict):
         try:
@@ -820,7 +1798,10 @@ class AudioDataConsumer(AsyncWebsocketConsumer):
                         try:
                             task_info = active_tasks.pop(task_id)
                             logger.info(f"Task {task_id} for recording {task_info['recording_id']} finished with state: {result.state}")
+                            observe_transcription_finished(task_info, result)
                             self.log_transcription_end(task_info['recording_id'])
+                            await self.chunk_manager.index_transcriptions(task_info['recording_id'])
+                            await self.chunk_manager.refresh_library(os.path.dirname(task_info['transcription_dir']))
                             await self.channel_layer.group_send(
                                 self.transcription_group_name,
                                 {
@@ -836,6 +1817,9 @@ class AudioDataConsumer(AsyncWebsocketConsumer):
                             pass
                     else:
                         logger.info(f"Transcription task {task_id} not ready yet.")
+                        task_info = active_tasks.get(task_id)
+                        if task_info is not None and task_info['start_time'] is None and result.state == 'STARTED':
+                            observe_transcription_started(task_info, result.info)
         finally:
             # This ensures the monitor task reference is cleared, so a new one can be started later.
             logger.info("Transcription task monitor has shut down.")
@@ -855,90 +1839,93 @@ class AudioDataConsumer(AsyncWebsocketConsumer):
         }))
 
     def log_transcription_start(self, recording_id: int):
-        """Logs the start time of a transcription, clearing previous timestamps.
+        """Logs the start of a transcription in the event log of the recording, replacing a previous transcription.
         Args:
             recording_id: The ID of the recording.
         """
-        try:
-            wav_path = self.chunk_manager.get_file_path(recording_id)
-            if not wav_path:
-                logger.error(f"Cannot log transcription start for {recording_id}: path is unknown.")
-                return
-
-            log_path = os.path.join(os.path.dirname(wav_path), "completion_log.txt")
-            if not os.path.exists(log_path):
-                logger.warning(f"Completion log for recording {recording_id} not found. Cannot log transcription start.")
-                return
-
-            with open(log_path, "r") as f:
-                lines = f.readlines()
-
-            timestamp = datetime.datetime.now(datetime.timezone.utc).isoformat()
-            start_key = "Transcription start time:"
-            end_key = "Transcription end time:"
-
-            # Remove any previous start/end time to handle re-transcription
-            filtered_lines = [line for line in lines if not line.strip().startswith((start_key, end_key))]
-            filtered_lines.append(f"{start_key} {timestamp}\n")
-
-            with open(log_path, "w") as f:
-                f.writelines(filtered_lines)
-        except Exception as e:
-            logger.error(f"Failed to log transcription start for {recording_id}: {e}")
+        self.log_transcription_event(recording_id, TRANSCRIPTION_STARTED)
 
     def log_transcription_cancelled(self, recording_id: int):
-        """Clear transcription timestamps from the completion log
+        """Logs the cancellation of a transcription in the event log of the recording.
         Args:
             recording_id: The ID of the recording.
         """
-        try:
-            wav_path = self.chunk_manager.get_file_path(recording_id)
-            if not wav_path:
-                logger.error(f"Cannot update completion log for {recording_id}: path is unknown.")
-                return
-
-            log_path = os.path.join(os.path.dirname(wav_path), "completion_log.txt")
-            if not os.path.exists(log_path):
-                logger.warning(f"Completion log for recording {recording_id} not found. Cannot update completion log.")
-                return
-
-            with open(log_path, "r") as f:
-                lines = f.readlines()
-
-            start_key = "Transcription start time:"
-            end_key = "Transcription end time:"
-
-            # Remove any previous start/end time to handle re-transcription
-            filtered_lines = [line for line in lines if not line.strip().startswith((start_key, end_key))]
-
-            with open(log_path, "w") as f:
-                f.writelines(filtered_lines)
-        except Exception as e:
-            logger.error(f"Failed to update completion log for {recording_id}: {e}")
+        self.log_transcription_event(recording_id, TRANSCRIPTION_CANCELLED)
 
     def log_transcription_end(self, recording_id: int):
-        """Logs the end time of a transcription.
+        """Logs the end of a transcription in the event log of the recording.
         Args:
             recording_id: The ID of the recording.
         """
+        self.log_transcription_event(recording_id, TRANSCRIPTION_ENDED)
+
+    def log_transcription_event(self, recording_id: int, event: str):
         try:
             wav_path = self.chunk_manager.get_file_path(recording_id)
             if not wav_path:
-                logger.error(f"Cannot log transcription end for {recording_id}: path is unknown.")
+                logger.error(f"Cannot log {event} for {recording_id}: path is unknown.")
                 return
-
-            log_path = os.path.join(os.path.dirname(wav_path), "completion_log.txt")
-            if not os.path.exists(log_path):
-                logger.warning(f"Completion log for recording {recording_id} not found. Cannot log transcription end.")
+            recording_dir = os.path.dirname(wav_path)
+            if not has_event_log(recording_dir):
+                logger.warning(f"Event log for recording {recording_id} not found. Cannot log {event}.")
                 return
+            append_event(recording_dir, event)
+        except Exception as e:
+            logger.error(f"Failed to log {event} for {recording_id}: {e}")
 
-            timestamp = datetime.datetime.now(datetime.timezone.utc).isoformat()
 
-            with open(log_path, "a") as f:
-                f.write(f"Transcription end time: {timestamp}\n")
-        except Exception as e:
-            logger.error(f"Failed to log transcription end for {recording_id}: {e}")
+def observe_transcription_started(task_info: dict, task_meta):
+    """Records the wait time of a transcription task that a worker has started, see transcription_task."""
+    start_time = task_meta.get('start_time') if isinstance(task_meta, dict) else None
+    task_info['start_time'] = start_time if start_time is not None else time.time()
+    metrics_util.TRANSCRIPTION_QUEUE_DEPTH.dec()
+    metrics_util.TRANSCRIPTION_WAIT_TIME.labels(task_info['model']).observe(max(0.0, task_info['start_time'] - task_info['submit_time']))
 
+def observe_transcription_finished(task_info: dict, result):
+    """
+    Records the run time of a finished transcription task. The start of a task is seen by the task monitor, a task
+    that finished before it was seen started is only counted.
+    """
+    metrics_util.TRANSCRIPTIONS_FINISHED.labels(task_info['model'], result.state).inc()
+    if task_info['start_time'] is None:
+        metrics_util.TRANSCRIPTION_QUEUE_DEPTH.dec()
+        return
+    end_time = time.time()
+    if isinstance(result.date_done, datetime.datetime):
+        # the date is in UTC, it can be without time zone
+        end_time = result.date_done.replace(tzinfo=result.date_done.tzinfo or datetime.timezone.utc).timestamp()
+    metrics_util.TRANSCRIPTION_RUN_TIME.labels(task_info['model']).observe(max(0.0, end_time - task_info['start_time']))
+
+def parse_chunk_header(bytes_data: bytes) -> tuple[int, int, bytes | None]:
+    """
+    Strips the header from a binary chunk message and verifies the payload if the header is extended.
+
+    Args:
+        bytes_data: The full binary message received from the client.
+
+    Returns:
+        A tuple with the recording ID, the chunk index and the audio data. The audio data is None if the
+        payload length or CRC32 in an extended header does not match the received payload.
+
+    Raises:
+        ValueError: If the message is too short to contain a header.
+    """
+    basic_header_size = struct.calcsize(CHUNK_HEADER_FORMAT)
+    if len(bytes_data) < basic_header_size:
+        raise ValueError(f"Binary message too short for a chunk header: {len(bytes_data)} bytes")
+    recording_id, chunk_index = struct.unpack_from(CHUNK_HEADER_FORMAT, bytes_data)
+    if not recording_id & EXTENDED_CHUNK_HEADER_FLAG:
+        return recording_id, chunk_index, bytes_data[basic_header_size:]
+
+    extended_header_size = struct.calcsize(EXTENDED_CHUNK_HEADER_FORMAT)
+    if len(bytes_data) < extended_header_size:
+        raise ValueError(f"Binary message too short for an extended chunk header: {len(bytes_data)} bytes")
+    _, _, payload_length, crc32 = struct.unpack_from(EXTENDED_CHUNK_HEADER_FORMAT, bytes_data)
+    recording_id &= ~EXTENDED_CHUNK_HEADER_FLAG
+    audio_data = bytes_data[extended_header_size:]
+    if len(audio_data) != payload_length or zlib.crc32(audio_data) != crc32:
+        return recording_id, chunk_index, None
+    return recording_id, chunk_index, audio_data
 
 def prepare_results(transcription_dir: str) -> list[dict]:
     results = []
@@ -0,0 +1,113 @@
+import io
+import math
+
+import numpy as np
+
+from .archive_util import read_wav_layout
+
+# Quality statistics are computed on 16-bit PCM samples
+FULL_SCALE = 32768
+# Samples at or beyond this magnitude are counted as clipped
+CLIP_LEVEL = 32767
+# A window of samples is silent if no sample reaches this magnitude (about -50 dBFS)
+SILENCE_LEVEL = 104
+# 10 ms of 48 kHz stereo audio
+SILENCE_WINDOW_SAMPLES = 960
+# Lowest level reported in dBFS, e.g. for a silent recording
+MIN_DBFS = -100.0
+# Live quality events are sent to the client at most once per interval, in seconds
+QUALITY_EVENT_INTERVAL = 2.0
+
+# Thresholds for the warnings reported with the quality summary
+SILENT_RATIO_WARNING = 0.98
+QUIET_RMS_DBFS_WARNING = -40.0
+CLIP_RATIO_WARNING = 0.0005
+
+def new_quality_stats() -> dict:
+    """Returns empty quality statistics, which chunk statistics can be added to."""
+    return {
+        'samples': 0,
+        'sum_squares': 0,
+        'peak': 0,
+        'clipped_samples': 0,
+        'silent_windows': 0,
+        'windows': 0
+    }
+
+def get_audio_data_offset(data: bytes) -> int:
+    """Returns the offset of the audio samples in a chunk, the first chunk of a recording starts with the WAV header."""
+    if data[:4] != b"RIFF":
+        return 0
+    with io.BytesIO(data) as f:
+        return read_wav_layout(f)[3]
+
+def compute_chunk_quality(data: bytes, offset: int = 0) -> dict:
+    """
+    Computes the quality statistics of a chunk of 16-bit PCM audio.
+
+    The samples are read directly from the chunk buffer, without copying the audio data.
+
+    Args:
+        data: The audio chunk.
+        offset: The offset of the first sample in the chunk.
+
+    Returns:
+        The quality statistics of the chunk, see new_quality_stats.
+    """
+    stats = new_quality_stats()
+    number_of_samples = (len(data) - offset) // 2
+    if number_of_samples <= 0:
+        return stats
+    samples = np.frombuffer(data, dtype='<i2', count=number_of_samples, offset=offset)
+    windows = number_of_samples // SILENCE_WINDOW_SAMPLES
+    stats['samples'] = number_of_samples
+    stats['sum_squares'] = int(np.einsum('i,i->', samples, samples, dtype=np.int64))
+    stats['peak'] = max(int(samples.max()), -int(samples.min()))
+    stats['clipped_samples'] = int(np.count_nonzero(samples >= CLIP_LEVEL) + np.count_nonzero(samples <= -CLIP_LEVEL))
+    if windows > 0:
+        window_samples = samples[:windows * SILENCE_WINDOW_SAMPLES].reshape(windows, SILENCE_WINDOW_SAMPLES)
+        silent = (window_samples.max(axis=1) < SILENCE_LEVEL) & (window_samples.min(axis=1) > -SILENCE_LEVEL)
+        stats['silent_windows'] = int(np.count_nonzero(silent))
+        stats['windows'] = windows
+    return stats
+
+def add_quality_stats(total: dict, stats: dict):
+    """Adds the quality statistics of a chunk to the statistics of a recording."""
+    for key in ('samples', 'sum_squares', 'clipped_samples', 'silent_windows', 'windows'):
+        total[key] += stats[key]
+    total['peak'] = max(total['peak'], stats['peak'])
+
+def to_dbfs(level: float) -> float:
+    if level <= 0:
+        return MIN_DBFS
+    return round(max(MIN_DBFS, 20 * math.log10(level / FULL_SCALE)), 1)
+
+def summarize_quality(stats: dict) -> dict:
+    """
+    Summarizes quality statistics for the client and the metadata file of a recording.
+
+    Args:
+        stats: The quality statistics of a chunk or a recording.
+
+    Returns:
+        The RMS and peak level in dBFS, the number and ratio of clipped samples, the ratio of silent
+        10 ms windows and a list of warnings ("silent", "quiet" or "clipping").
+    """
+    rms_dbfs = to_dbfs(math.sqrt(stats['sum_squares'] / stats['samples'])) if stats['samples'] else MIN_DBFS
+    clip_ratio = stats['clipped_samples'] / stats['samples'] if stats['samples'] else 0.0
+    silence_ratio = stats['silent_windows'] / stats['windows'] if stats['windows'] else 1.0
+    warnings = []
+    if silence_ratio >= SILENT_RATIO_WARNING:
+        warnings.append("silent")
+    elif rms_dbfs < QUIET_RMS_DBFS_WARNING:
+        warnings.append("quiet")
+    if clip_ratio > CLIP_RATIO_WARNING:
+        warnings.append("clipping")
+    return {
+        'rms_dbfs': rms_dbfs,
+        'peak_dbfs': to_dbfs(stats['peak']),
+        'clipped_samples': stats['clipped_samples'],
+        'clip_ratio': round(clip_ratio, 6),
+        'silence_ratio': round(silence_ratio, 4),
+        'warnings': warnings
+    }
@@ -0,0 +1,292 @@
+import asyncio
+import logging
+import os
+import struct
+import threading
+import weakref
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# Append-only journal of the chunks received for a recording, kept in the recording directory while the recording
+# can still receive chunks. After a server crash it tells exactly which chunks are durable, so the client only has to
+# resend the missing chunks when the recording is resumed.
+# A record is written before the chunk is acknowledged, so it survives a crash of the server process. The journals are
+# synced to the storage in the background, in batches (group commit), to also survive a crash of the machine.
+#
+# Each record is a header followed by a CRC32 of the header:
+#   kind, chunk index, offset, length, CRC32 of the chunk data, CRC32 of the recording file up to the end of the chunk
+# A WRITTEN record is appended when a chunk has been written to the recording file, at the offset.
+# A BUFFERED record is appended for a chunk that is received out of order and is held in memory, the chunk data
+# follows the record (the offset is not used).
+# The records of a torn write at the end of the journal fail the CRC checks and are truncated on recovery.
+JOURNAL_FILE_NAME = ".chunk_journal"
+RECORD_FORMAT = ">BIQIII"
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+RECORD_CRC_FORMAT = ">I"
+RECORD_CRC_SIZE = struct.calcsize(RECORD_CRC_FORMAT)
+WRITTEN = 1
+BUFFERED = 2
+
+def get_journal_path(recording_path: str) -> str:
+    return os.path.join(recording_path, JOURNAL_FILE_NAME)
+
+def remove_journal(recording_file_path: str):
+    """Removes the journal of a recording, if any."""
+    try:
+        os.remove(get_journal_path(os.path.dirname(recording_file_path)))
+    except FileNotFoundError:
+        pass
+
+def pack_record(kind: int, chunk_index: int, offset: int, length: int, data_crc32: int, file_crc32: int) -> bytes:
+    record = struct.pack(RECORD_FORMAT, kind, chunk_index, offset, length, data_crc32, file_crc32)
+    return record + struct.pack(RECORD_CRC_FORMAT, zlib.crc32(record))
+
+# fdatasync also writes the file size, but not e.g. the modification time, which is not needed for recovery
+sync_data = getattr(os, "fdatasync", os.fsync)
+
+def sync_path(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        sync_data(fd)
+    finally:
+        os.close(fd)
+
+class ChunkJournal:
+    """
+    The journal of a recording that is receiving chunks.
+    Records are appended by the writer, and synced together with the recording file by the GroupCommitter.
+    """
+    def __init__(self, recording_file_path: str, file_size: int = 0):
+        """
+        Args:
+            recording_file_path: The path to the WAV file of the recording, the journal is kept next to it.
+            file_size: The size of the recording file, e.g. of a recording recovered from the journal.
+        """
+        self.recording_file_path = recording_file_path
+        self.path = get_journal_path(os.path.dirname(recording_file_path))
+        self.fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        # the file descriptor is not closed while it is synced by the committer thread
+        self.fd_lock = threading.Lock()
+        self.file_size = file_size
+        self.appended = 0
+        self.committed = 0
+        self.committed_file_size = file_size
+        self.error = None
+
+    def append_written(self, chunk_index: int, data: bytes, file_crc32: int):
+        """
+        Appends the record of a chunk that has been written to the end of the recording file.
+
+        Args:
+            chunk_index: The index of the chunk.
+            data: The chunk data.
+            file_crc32: The CRC32 of the recording file including the chunk.
+        """
+        os.write(self.fd, pack_record(WRITTEN, chunk_index, self.file_size, len(data), zlib.crc32(data), file_crc32))
+        self.file_size += len(data)
+        self.appended += 1
+
+    def append_buffered(self, chunk_index: int, data: bytes):
+        """
+        Appends the record and the data of a chunk that is held in memory until the chunks before it are received.
+
+        Args:
+            chunk_index: The index of the chunk.
+            data: The chunk data.
+        """
+        os.write(self.fd, pack_record(BUFFERED, chunk_index, 0, len(data), zlib.crc32(data), 0) + data)
+        self.appended += 1
+
+    def sync(self, sync_recording_file: bool):
+        with self.fd_lock:
+            if self.fd is None:
+                return
+            # the recording file first, so a durable WRITTEN record is never ahead of the audio data
+            if sync_recording_file:
+                sync_path(self.recording_file_path)
+            sync_data(self.fd)
+
+    def schedule_commit(self):
+        """Syncs the records appended so far, and the recording data they refer to, in the next batch."""
+        if self.error is None:
+            get_group_committer().schedule(self)
+
+    async def commit(self):
+        """
+        Waits until all records appended so far, and the recording data they refer to, are synced.
+        Raises OSError if the journal could not be synced.
+        """
+        await get_group_committer().commit(self)
+
+    def close(self):
+        with self.fd_lock:
+            if self.fd is not None:
+                os.close(self.fd)
+                self.fd = None
+
+    def remove(self):
+        """Closes and removes the journal, e.g. when the recording is finalized."""
+        self.close()
+        remove_journal(self.recording_file_path)
+
+class GroupCommitter:
+    """
+    Makes the journals of all recordings durable in batches. The journals committed while a batch is synced are
+    synced together in the next batch (group commit), so parallel recordings share one hand-off to a worker thread
+    and there is at most one sync of a journal in flight.
+    """
+    def __init__(self):
+        self.pending = set()
+        self.batch_future = None
+        self.task = None
+
+    def schedule(self, journal: ChunkJournal) -> asyncio.Future:
+        """Adds the journal to the next batch, and returns the future of the batch."""
+        if self.batch_future is None:
+            self.batch_future = asyncio.get_running_loop().create_future()
+        self.pending.add(journal)
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+        return self.batch_future
+
+    async def commit(self, journal: ChunkJournal):
+        target = journal.appended
+        while journal.committed < target:
+            if journal.error is not None:
+                raise journal.error
+            await asyncio.shield(self.schedule(journal))
+
+    async def _run(self):
+        try:
+            while self.pending:
+                batch = {journal: (journal.appended, journal.file_size) for journal in self.pending}
+                batch_future = self.batch_future
+                self.pending = set()
+                self.batch_future = None
+                errors = await asyncio.to_thread(sync_journals, batch)
+                for journal, (appended, file_size) in batch.items():
+                    if journal in errors:
+                        journal.error = errors[journal]
+                    else:
+                        journal.committed = max(journal.committed, appended)
+                        journal.committed_file_size = file_size
+                batch_future.set_result(None)
+        finally:
+            self.task = None
+
+def sync_journals(batch: dict) -> dict:
+    """
+    Syncs a batch of journals, and the recording files with chunks written since the last sync.
+
+    Args:
+        batch: The appended record count and the recording file size to sync, by journal.
+
+    Returns:
+        The errors by journal, for the journals that could not be synced.
+    """
+    errors = {}
+    for journal, (appended, file_size) in batch.items():
+        try:
+            journal.sync(file_size != journal.committed_file_size)
+        except OSError as e:
+            logger.error(f"Could not sync chunk journal '{journal.path}': {e}")
+            errors[journal] = e
+    return errors
+
+# a committer per event loop, the futures of a batch belong to the loop
+_group_committers = weakref.WeakKeyDictionary()
+
+def get_group_committer() -> GroupCommitter:
+    loop = asyncio.get_running_loop()
+    committer = _group_committers.get(loop)
+    if committer is None:
+        committer = GroupCommitter()
+        _group_committers[loop] = committer
+    return committer
+
+def read_journal(journal_path: str) -> tuple[list[tuple], dict[int, bytes], int]:
+    """
+    Reads the journal of a recording in one sequential pass, up to the first torn or corrupted record.
+
+    Args:
+        journal_path: The path to the journal.
+
+    Returns:
+        The WRITTEN records as (chunk index, offset, length, file CRC32) in the order they were written, the data of the
+        BUFFERED chunks by chunk index, and the length of the valid part of the journal.
+    """
+    written = []
+    buffered = {}
+    valid_length = 0
+    with open(journal_path, "rb") as f:
+        while True:
+            header = f.read(RECORD_SIZE + RECORD_CRC_SIZE)
+            if len(header) < RECORD_SIZE + RECORD_CRC_SIZE:
+                break
+            record, (record_crc32,) = header[:RECORD_SIZE], struct.unpack(RECORD_CRC_FORMAT, header[RECORD_SIZE:])
+            if zlib.crc32(record) != record_crc32:
+                break
+            kind, chunk_index, offset, length, data_crc32, file_crc32 = struct.unpack(RECORD_FORMAT, record)
+            if kind == WRITTEN:
+                written.append((chunk_index, offset, length, file_crc32))
+            elif kind == BUFFERED:
+                data = f.read(length)
+                if len(data) < length or zlib.crc32(data) != data_crc32:
+                    break
+                buffered[chunk_index] = data
+            else:
+                break
+            valid_length = f.tell()
+    return written, buffered, valid_length
+
+def recover_journal(recording_file_path: str) -> dict | None:
+    """
+    Rebuilds the received chunks of a recording from its journal, e.g. after a server crash.
+    A torn tail of the journal is truncated, and the recording file is truncated to the end of the last written chunk.
+
+    Args:
+        recording_file_path: The path to the WAV file of the recording.
+
+    Returns:
+        None if the recording has no journal, otherwise a dictionary with
+        - 'flushed_index': The index of the last chunk written to the recording file, or None.
+        - 'file_size': The size of the recording file.
+        - 'file_crc32': The CRC32 of the recording file.
+        - 'buffered': The data of the chunks received after a missing chunk, by chunk index.
+    """
+    journal_path = get_journal_path(os.path.dirname(recording_file_path))
+    if not os.path.isfile(journal_path):
+        return None
+    try:
+        written, buffered, valid_length = read_journal(journal_path)
+        if valid_length < os.path.getsize(journal_path):
+            logger.warning(f"Truncating torn tail of chunk journal '{journal_path}' at {valid_length} bytes.")
+            os.truncate(journal_path, valid_length)
+        recording_file_size = os.path.getsize(recording_file_path) if os.path.isfile(recording_file_path) else 0
+        # the written chunks are contiguous from chunk 0, and their data must be in the recording file
+        flushed_index = None
+        file_size = 0
+        file_crc32 = 0
+        for chunk_index, offset, length, chunk_file_crc32 in written:
+            expected_index = 0 if flushed_index is None else flushed_index + 1
+            if chunk_index != expected_index or offset != file_size or offset + length > recording_file_size:
+                logger.warning(f"Chunk journal '{journal_path}' does not match the recording file after chunk {flushed_index}.")
+                break
+            flushed_index = chunk_index
+            file_size = offset + length
+            file_crc32 = chunk_file_crc32
+        if recording_file_size > file_size:
+            logger.warning(f"Truncating recording file '{recording_file_path}' from {recording_file_size} to {file_size} bytes.")
+            os.truncate(recording_file_path, file_size)
+        if flushed_index is not None:
+            buffered = {chunk_index: data for chunk_index, data in buffered.items() if chunk_index > flushed_index}
+        return {
+            'flushed_index': flushed_index,
+            'file_size': file_size,
+            'file_crc32': file_crc32,
+            'buffered': buffered
+        }
+    except OSError as e:
+        logger.error(f"Could not recover chunk journal '{journal_path}': {e}")
+        return None
@@ -1,5 +1,6 @@
 import logging
 from pathlib import Path
+import struct
 import zipfile
 import os
 import shutil
@@ -7,6 +8,30 @@ import tempfile
 
 logger = logging.getLogger(__name__)
 
+# Zip records, see the zip file format specification (APPNOTE.TXT): local file header (section 4.3.7), central
+# directory file header (4.3.12), zip64 end of central directory record and locator (4.3.14, 4.3.15) and end of
+# central directory record (4.3.16). The renamed zip file is written from these records and the documented
+# attributes of zipfile.ZipInfo, so it does not depend on the internals of the zipfile module.
+ZIP_LOCAL_FILE_HEADER_FORMAT = "<4s2B4HL2L2H"
+ZIP_LOCAL_FILE_HEADER_SIGNATURE = b"PK\x03\x04"
+ZIP_CENTRAL_DIRECTORY_FORMAT = "<4s4B4HL2L5H2L"
+ZIP_CENTRAL_DIRECTORY_SIGNATURE = b"PK\x01\x02"
+ZIP64_END_OF_CENTRAL_DIRECTORY_FORMAT = "<4sQ2H2L4Q"
+ZIP64_END_OF_CENTRAL_DIRECTORY_SIGNATURE = b"PK\x06\x06"
+ZIP64_END_OF_CENTRAL_DIRECTORY_LOCATOR_FORMAT = "<4sLQL"
+ZIP64_END_OF_CENTRAL_DIRECTORY_LOCATOR_SIGNATURE = b"PK\x06\x07"
+ZIP_END_OF_CENTRAL_DIRECTORY_FORMAT = "<4s4H2LH"
+ZIP_END_OF_CENTRAL_DIRECTORY_SIGNATURE = b"PK\x05\x06"
+ZIP_DATA_DESCRIPTOR_FLAG = 0x08
+ZIP_UTF8_FLAG = 0x800
+ZIP64_EXTRA_FIELD_ID = 0x0001
+ZIP64_VERSION = 45
+# Sizes, offsets and counts from these limits are stored in zip64 fields
+ZIP64_LIMIT = zipfile.ZIP64_LIMIT
+ZIP_MAX_ENTRIES = 0xFFFF
+# Block size used when copying compressed member data between zip files
+ZIP_COPY_BLOCK_SIZE = 1024 * 1024
+
 def safe_rename(old_name: str, new_name: str):
     source = Path(old_name)
     destination = Path(new_name)
@@ -43,6 +68,20 @@ def rename_files(old_title: str, new_title: str, dir_path: str):
                 logger.warning(f"Failed to rename '{path.name}': {e}")
 
 def rename_in_zip_file(old_title: str, new_title: str, zip_path: str):
+    """
+    Renames the members of a zip file that contain the old title.
+
+    The compressed data of each member is copied unchanged, only the local file headers and the
+    central directory are written with the new names. This keeps CPU and memory use constant per byte,
+    since no member is decompressed and compressed again.
+    The members are read with zipfile, the renamed zip file is written by copy_raw_zip_member and
+    write_zip_central_directory.
+
+    Args:
+        old_title: The existing title string to be replaced in member file names.
+        new_title: The new title string to substitute.
+        zip_path: The path to the zip file to process.
+    """
     source_path = Path(zip_path)
 
     if not source_path.exists():
@@ -52,10 +91,12 @@ def rename_in_zip_file(old_title: str, new_title: str, zip_path: str):
     temp_zip_path = source_path.with_name(f"{source_path.name}.tmp")
 
     try:
-        with zipfile.ZipFile(source_path, 'r') as in_zip, \
-                zipfile.ZipFile(temp_zip_path, 'w') as out_zip:
-
-            for info in in_zip.infolist():
+        with zipfile.ZipFile(source_path, 'r') as in_zip:
+            infos = in_zip.infolist()
+            comment = in_zip.comment
+        with open(source_path, 'rb') as source, open(temp_zip_path, 'wb') as target:
+            central_directory = []
+            for info in infos:
                 old_name = info.filename
                 # Only rename the filename component, preserving directory structure
                 if '/' in old_name:
@@ -66,10 +107,10 @@ def rename_in_zip_file(old_title: str, new_title: str, zip_path: str):
                     new_name = old_name.replace(old_title, new_title)
 
                 if old_name != new_name:
-                    info.filename = new_name
                     logger.info(f"Renamed inside zip: '{old_name}' -> '{new_name}'")
 
-                out_zip.writestr(info, in_zip.read(old_name))
+                central_directory.append(copy_raw_zip_member(source, info, target, new_name))
+            write_zip_central_directory(target, central_directory, comment)
 
         temp_zip_path.replace(source_path)
         logger.info(f"Successfully updated zip file: {zip_path}")
@@ -79,6 +120,127 @@ def rename_in_zip_file(old_title: str, new_title: str, zip_path: str):
         if temp_zip_path.exists():
             temp_zip_path.unlink()
 
+def copy_raw_zip_member(source, info: zipfile.ZipInfo, target, new_name: str) -> bytes:
+    """
+    Copies the compressed data of a zip member to another zip file without decompressing it.
+
+    A new local file header is written with the new name. The CRC and sizes from the central directory are
+    written in the local file header, so a data descriptor in the source member is not needed in the copy.
+
+    Args:
+        source: The zip file to copy from, opened for binary reading.
+        info: The member to copy, from the central directory of the source.
+        target: The zip file to copy to, opened for binary writing at the position of the new member.
+        new_name: The name of the member in the target.
+
+    Returns:
+        The central directory file header of the copied member, see write_zip_central_directory.
+
+    Raises:
+        zipfile.BadZipFile: If the local file header of the member is malformed.
+    """
+    # locate the compressed data after the local file header of the source member
+    source.seek(info.header_offset)
+    local_header = source.read(struct.calcsize(ZIP_LOCAL_FILE_HEADER_FORMAT))
+    if len(local_header) != struct.calcsize(ZIP_LOCAL_FILE_HEADER_FORMAT):
+        raise zipfile.BadZipFile(f"Truncated local file header for member '{info.filename}'")
+    fields = struct.unpack(ZIP_LOCAL_FILE_HEADER_FORMAT, local_header)
+    if fields[0] != ZIP_LOCAL_FILE_HEADER_SIGNATURE:
+        raise zipfile.BadZipFile(f"Bad local file header signature for member '{info.filename}'")
+    name_length, extra_length = fields[10], fields[11]
+    source.seek(name_length + extra_length, os.SEEK_CUR)
+
+    # the zipfile module also writes names that are not ASCII as UTF-8 with the UTF-8 flag
+    flag_bits = info.flag_bits & ~(ZIP_DATA_DESCRIPTOR_FLAG | ZIP_UTF8_FLAG)
+    try:
+        encoded_name = new_name.encode("ascii")
+    except UnicodeEncodeError:
+        encoded_name = new_name.encode("utf-8")
+        flag_bits |= ZIP_UTF8_FLAG
+    dos_date = (info.date_time[0] - 1980) << 9 | info.date_time[1] << 5 | info.date_time[2]
+    dos_time = info.date_time[3] << 11 | info.date_time[4] << 5 | info.date_time[5] // 2
+    header_offset = target.tell()
+    extra = strip_zip64_extra(info.extra)
+    extract_version = info.extract_version
+
+    # write the new local file header, with the CRC and sizes known from the central directory
+    local_zip64 = info.file_size >= ZIP64_LIMIT or info.compress_size >= ZIP64_LIMIT
+    if local_zip64:
+        local_extra = struct.pack("<HHQQ", ZIP64_EXTRA_FIELD_ID, 16, info.file_size, info.compress_size) + extra
+        extract_version = max(extract_version, ZIP64_VERSION)
+        file_size = compress_size = 0xFFFFFFFF
+    else:
+        local_extra = extra
+        file_size, compress_size = info.file_size, info.compress_size
+    target.write(struct.pack(ZIP_LOCAL_FILE_HEADER_FORMAT, ZIP_LOCAL_FILE_HEADER_SIGNATURE, extract_version,
+                             info.reserved, flag_bits, info.compress_type, dos_time, dos_date, info.CRC,
+                             compress_size, file_size, len(encoded_name), len(local_extra)))
+    target.write(encoded_name + local_extra)
+
+    # stream the compressed data unchanged
+    remaining = info.compress_size
+    while remaining > 0:
+        block = source.read(min(ZIP_COPY_BLOCK_SIZE, remaining))
+        if not block:
+            raise zipfile.BadZipFile(f"Truncated data for member '{info.filename}'")
+        target.write(block)
+        remaining -= len(block)
+
+    # the central directory has zip64 fields for the values from the limit, in this order
+    zip64_values = [value for value in (info.file_size, info.compress_size, header_offset) if value >= ZIP64_LIMIT]
+    if zip64_values:
+        extra = struct.pack(f"<HH{len(zip64_values)}Q", ZIP64_EXTRA_FIELD_ID, 8 * len(zip64_values), *zip64_values) + extra
+        extract_version = max(extract_version, ZIP64_VERSION)
+    file_size, compress_size, header_offset = (0xFFFFFFFF if value >= ZIP64_LIMIT else value
+                                               for value in (info.file_size, info.compress_size, header_offset))
+    comment = info.comment
+    return struct.pack(ZIP_CENTRAL_DIRECTORY_FORMAT, ZIP_CENTRAL_DIRECTORY_SIGNATURE, max(info.create_version, extract_version),
+                       info.create_system, extract_version, info.reserved, flag_bits, info.compress_type, dos_time,
+                       dos_date, info.CRC, compress_size, file_size, len(encoded_name), len(extra), len(comment),
+                       0, info.internal_attr, info.external_attr, header_offset) + encoded_name + extra + comment
+
+def write_zip_central_directory(target, central_directory: list[bytes], comment: bytes = b""):
+    """
+    Writes the central directory and the end of central directory record of a zip file, with the zip64 records
+    if the number of members, the size or the offset of the central directory exceed the limits of the record.
+
+    Args:
+        target: The zip file, opened for binary writing after the last member.
+        central_directory: The central directory file headers of the members, see copy_raw_zip_member.
+        comment: The comment of the zip file.
+    """
+    start = target.tell()
+    for header in central_directory:
+        target.write(header)
+    size = target.tell() - start
+    count = len(central_directory)
+    if count >= ZIP_MAX_ENTRIES or size >= ZIP64_LIMIT or start >= ZIP64_LIMIT:
+        zip64_offset = target.tell()
+        target.write(struct.pack(ZIP64_END_OF_CENTRAL_DIRECTORY_FORMAT, ZIP64_END_OF_CENTRAL_DIRECTORY_SIGNATURE,
+                                 struct.calcsize(ZIP64_END_OF_CENTRAL_DIRECTORY_FORMAT) - 12, ZIP64_VERSION,
+                                 ZIP64_VERSION, 0, 0, count, count, size, start))
+        target.write(struct.pack(ZIP64_END_OF_CENTRAL_DIRECTORY_LOCATOR_FORMAT,
+                                 ZIP64_END_OF_CENTRAL_DIRECTORY_LOCATOR_SIGNATURE, 0, zip64_offset, 1))
+        count, size, start = ZIP_MAX_ENTRIES, 0xFFFFFFFF, 0xFFFFFFFF
+    comment = comment[:0xFFFF]
+    target.write(struct.pack(ZIP_END_OF_CENTRAL_DIRECTORY_FORMAT, ZIP_END_OF_CENTRAL_DIRECTORY_SIGNATURE, 0, 0,
+                             count, count, size, start, len(comment)) + comment)
+
+def strip_zip64_extra(extra: bytes) -> bytes:
+    """
+    Removes the zip64 extended information field from zip extra data.
+    A new zip64 field is added when the member is written, if it is needed.
+    """
+    stripped = b""
+    position = 0
+    while position + 4 <= len(extra):
+        field_id, field_length = struct.unpack("<HH", extra[position:position + 4])
+        field_end = position + 4 + field_length
+        if field_id != ZIP64_EXTRA_FIELD_ID:
+            stripped += extra[position:field_end]
+        position = field_end
+    return stripped
+
 def replace_title_in_log(old_title: str, new_title: str, file_path: str) -> None:
     """
     Reads a log file and replaces a specific title with a new one.
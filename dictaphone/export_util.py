@@ -0,0 +1,131 @@
+import datetime
+import logging
+import os
+import zipfile
+
+from asgiref.sync import sync_to_async
+
+from .archive_util import get_archive_manifest, iter_restored_wav
+from .recording_metadata_util import read_metadata, is_id_layout_directory, get_download_name
+
+logger = logging.getLogger(__name__)
+
+# Block size used when copying files into the zip stream
+EXPORT_BLOCK_SIZE = 1024 * 1024
+# Files with these extensions are already compressed or do not compress, they are stored without compression
+STORED_EXTENSIONS = (".wav", ".flac", ".zip")
+
+class ZipStreamBuffer:
+    """
+    A write-only file object for zipfile that collects the written bytes until they are taken.
+
+    The buffer is not seekable, so zipfile writes the sizes and CRC of each member in a data descriptor
+    after the member data, and the zip file can be sent while it is written.
+    """
+    def __init__(self):
+        self.blocks = []
+
+    def write(self, data) -> int:
+        self.blocks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self.blocks)
+        self.blocks = []
+        return data
+
+def get_export_dir_name(recording_path: str) -> str:
+    """Returns the directory name of a recording in the export, recordings with the id layout are named after the title."""
+    dir_name = os.path.basename(os.path.normpath(recording_path))
+    if is_id_layout_directory(recording_path):
+        return f"{dir_name}_{read_metadata(recording_path)['title']}"
+    return dir_name
+
+def iter_recording_files(wav_path: str):
+    """
+    Lists the files of a recording to export: the WAV file and the files in the TRANSCRIPTIONS directory.
+
+    Yields:
+        Tuples with the name of the file in the export, relative to the recording directory, the size of the
+        file and a function that returns an iterator over the blocks of the file.
+    """
+    recording_path = os.path.dirname(wav_path)
+    if os.path.isfile(wav_path):
+        yield get_download_name(wav_path), os.path.getsize(wav_path), lambda: iter_file_blocks(wav_path)
+    else:
+        # an archived recording is exported as the original wav file
+        manifest = get_archive_manifest(recording_path)
+        if manifest is not None and manifest['original_file'] == os.path.basename(wav_path):
+            flac_path = os.path.join(recording_path, manifest['file'])
+            yield get_download_name(wav_path), manifest['original_size'], lambda: iter_restored_wav(flac_path, manifest)
+        else:
+            logger.warning(f"No audio file to export for '{wav_path}'.")
+    transcription_dir = os.path.join(recording_path, 'TRANSCRIPTIONS')
+    if os.path.isdir(transcription_dir):
+        for file_name in sorted(os.listdir(transcription_dir)):
+            file_path = os.path.join(transcription_dir, file_name)
+            if os.path.isfile(file_path):
+                yield (f"TRANSCRIPTIONS/{get_download_name(file_path)}", os.path.getsize(file_path),
+                       lambda file_path=file_path: iter_file_blocks(file_path))
+
+def iter_file_blocks(file_path: str):
+    with open(file_path, 'rb') as f:
+        while block := f.read(EXPORT_BLOCK_SIZE):
+            yield block
+
+async def aiter_blocks(blocks):
+    """
+    Yields the blocks of a synchronous iterator from an async iterator, each block is produced in a worker thread.
+
+    A StreamingHttpResponse reads a synchronous iterator to the end before it sends the response under ASGI, so a
+    streamed file is held in memory. With an async iterator each block is sent before the next block is produced.
+
+    Args:
+        blocks: An iterator over the blocks, e.g. of a file. None is not a valid block.
+
+    Yields:
+        The blocks of the iterator.
+    """
+    blocks = iter(blocks)
+    try:
+        while (block := await sync_to_async(next, thread_sensitive=False)(blocks, None)) is not None:
+            yield block
+    finally:
+        # closes the files of a generator when the client disconnects before the end
+        if hasattr(blocks, 'close'):
+            await sync_to_async(blocks.close, thread_sensitive=False)()
+
+def iter_recordings_zip(wav_paths: list[str]):
+    """
+    Writes a zip file with the audio and transcriptions of recordings, and yields it while it is written.
+
+    Audio is stored without compression and text files are deflated. Only one block of a file is held in memory
+    at a time, and nothing is written to disk.
+
+    Args:
+        wav_paths: The paths to the WAV files of the recordings, the recordings may be archived.
+
+    Yields:
+        Consecutive blocks of the zip file.
+    """
+    buffer = ZipStreamBuffer()
+    with zipfile.ZipFile(buffer, 'w') as zf:
+        for wav_path in wav_paths:
+            dir_name = get_export_dir_name(os.path.dirname(wav_path))
+            for name, size, read_blocks in iter_recording_files(wav_path):
+                info = zipfile.ZipInfo(f"{dir_name}/{name}", datetime.datetime.now().timetuple()[:6])
+                if name.lower().endswith(STORED_EXTENSIONS):
+                    info.compress_type = zipfile.ZIP_STORED
+                else:
+                    info.compress_type = zipfile.ZIP_DEFLATED
+                # the expected size decides if zip64 extensions are needed for the member
+                info.file_size = size
+                with zf.open(info, 'w') as member:
+                    for block in read_blocks():
+                        member.write(block)
+                        yield buffer.take()
+                yield buffer.take()
+    yield buffer.take()
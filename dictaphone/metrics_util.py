@@ -0,0 +1,221 @@
+import asyncio
+import bisect
+import math
+import threading
+import time
+
+# Metrics of this server process in the Prometheus text exposition format, served by views.metrics.
+# Recording a value is a dictionary lookup at most and a few additions, so it is cheap enough for the chunk path.
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Buckets in seconds for operations on the chunk path, and for transcriptions
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+TRANSCRIPTION_BUCKETS = (1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1200.0, 1800.0, 3600.0, 7200.0, 14400.0)
+
+# The metrics served by views.metrics, a metric is added when it is created
+_registry = []
+
+def format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+def escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label_value(str(value))}"' for name, value in labels.items()) + "}"
+
+class Metric:
+    """
+    Base class of the metric types. A metric with label names has a child per combination of label values,
+    see labels, a metric without labels is its own only child.
+    """
+    type_name = None
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), registry: list | None = None):
+        """
+        Args:
+            name: The name of the metric.
+            documentation: The help text of the metric.
+            labelnames: The names of the labels of the metric.
+            registry: The list of metrics rendered together, see render_metrics, the metrics of the process by default.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.children = {}
+        if not self.labelnames:
+            self.children[()] = self._new_child()
+        (_registry if registry is None else registry).append(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """Returns the child of the metric for the label values, in the order of the label names."""
+        values = tuple(str(value) for value in values)
+        child = self.children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"Metric {self.name} has the labels {self.labelnames}, got the values {values}")
+            with self.lock:
+                child = self.children.setdefault(values, self._new_child())
+        return child
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for values, child in sorted(self.children.copy().items()):
+            lines.extend(child.render(self.name, dict(zip(self.labelnames, values))))
+        return lines
+
+class _ValueChild:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        with self.lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        self.value = float(value)
+
+    def render(self, name: str, labels: dict) -> list[str]:
+        return [f"{name}{format_labels(labels)} {format_value(self.value)}"]
+
+class _HistogramChild:
+    def __init__(self, upper_bounds: tuple):
+        self.lock = threading.Lock()
+        self.upper_bounds = upper_bounds
+        self.bucket_counts = [0] * (len(upper_bounds) + 1)  # the last bucket is +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.upper_bounds, value)
+        with self.lock:
+            self.bucket_counts[index] += 1
+            self.sum += value
+
+    def render(self, name: str, labels: dict) -> list[str]:
+        with self.lock:
+            bucket_counts = list(self.bucket_counts)
+            total = self.sum
+        lines = []
+        cumulative_count = 0
+        for upper_bound, count in zip(self.upper_bounds + (math.inf,), bucket_counts):
+            cumulative_count += count
+            lines.append(f"{name}_bucket{format_labels({**labels, 'le': format_value(upper_bound)})} {cumulative_count}")
+        lines.append(f"{name}_sum{format_labels(labels)} {format_value(total)}")
+        lines.append(f"{name}_count{format_labels(labels)} {cumulative_count}")
+        return lines
+
+class Counter(Metric):
+    """A value that only increases, e.g. the number of bytes written."""
+    type_name = "counter"
+
+    def _new_child(self):
+        return _ValueChild()
+
+    def inc(self, amount: float = 1.0):
+        self.children[()].inc(amount)
+
+class Gauge(Metric):
+    """A value that increases and decreases, e.g. the number of active connections."""
+    type_name = "gauge"
+
+    def _new_child(self):
+        return _ValueChild()
+
+    def inc(self, amount: float = 1.0):
+        self.children[()].inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self.children[()].dec(amount)
+
+    def set(self, value: float):
+        self.children[()].set(value)
+
+class Histogram(Metric):
+    """Counts observed values, e.g. latencies, in cumulative buckets with the sum and count of the values."""
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS,
+                 registry: list | None = None):
+        self.upper_bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.upper_bounds)
+
+    def observe(self, value: float):
+        self.children[()].observe(value)
+
+def render_metrics(registry: list | None = None) -> str:
+    """Returns all metrics of a registry, the metrics of the process by default, in the Prometheus text exposition format."""
+    lines = []
+    for metric in list(_registry if registry is None else registry):
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+class InstrumentedLock(asyncio.Lock):
+    """An asyncio lock that records how long it is waited for and how long it is held."""
+    def __init__(self, wait_histogram, hold_histogram):
+        """
+        Args:
+            wait_histogram: The histogram, or the child of a histogram with labels, for the wait times.
+            hold_histogram: The histogram, or the child of a histogram with labels, for the hold times.
+        """
+        super().__init__()
+        self.wait_histogram = wait_histogram
+        self.hold_histogram = hold_histogram
+        self.acquired_time = None
+
+    async def acquire(self):
+        start = time.perf_counter()
+        await super().acquire()
+        self.acquired_time = time.perf_counter()
+        self.wait_histogram.observe(self.acquired_time - start)
+        return True
+
+    def release(self):
+        self.hold_histogram.observe(time.perf_counter() - self.acquired_time)
+        super().release()
+
+# Ingest
+CHUNK_ACK_LATENCY = Histogram("dictaphone_chunk_ack_latency_seconds",
+                              "Time from receiving an audio chunk to sending its acknowledgement.")
+CHUNK_MANAGER_LOCK_WAIT = Histogram("dictaphone_chunk_manager_lock_wait_seconds",
+                                    "Time waited for a lock of AudioChunkManager, by lock (registry or recording).",
+                                    ("lock",))
+CHUNK_MANAGER_LOCK_HOLD = Histogram("dictaphone_chunk_manager_lock_hold_seconds",
+                                    "Time a lock of AudioChunkManager was held, by lock (registry or recording).",
+                                    ("lock",))
+AUDIO_BYTES_WRITTEN = Counter("dictaphone_audio_bytes_written_total", "Audio bytes written to recording files.")
+CHUNK_RESEND_REQUESTS = Counter("dictaphone_chunk_resend_requests_total",
+                                "Chunks requested again from the client, by reason (integrity, out_of_order or finalize).",
+                                ("reason",))
+BUFFERED_CHUNK_BYTES = Gauge("dictaphone_buffered_chunk_bytes",
+                             "Bytes of received chunks held in memory until the chunks before them are received.")
+ACTIVE_CONNECTIONS = Gauge("dictaphone_active_connections", "Open WebSocket connections.")
+
+# Transcription, observed by the server from the state of the Celery tasks
+TRANSCRIPTION_QUEUE_DEPTH = Gauge("dictaphone_transcription_queue_depth", "Transcription tasks waiting for a worker.")
+TRANSCRIPTION_WAIT_TIME = Histogram("dictaphone_transcription_wait_seconds",
+                                    "Time a transcription task waited for a worker, by model.",
+                                    ("model",), TRANSCRIPTION_BUCKETS)
+TRANSCRIPTION_RUN_TIME = Histogram("dictaphone_transcription_run_seconds",
+                                   "Time a transcription task ran, by model.",
+                                   ("model",), TRANSCRIPTION_BUCKETS)
+TRANSCRIPTIONS_FINISHED = Counter("dictaphone_transcriptions_finished_total",
+                                  "Finished transcription tasks, by model and Celery state.", ("model", "state"))
+TRANSCRIPTION_CANCELLATIONS = Counter("dictaphone_transcription_cancellations_total",
+                                      "Cancelled transcription tasks, by model.", ("model",))
@@ -1,34 +1,120 @@
 from django.conf import settings
+import importlib
 import logging
-import torch
+import os
+import sys
+import threading
+import time
 
 logger = logging.getLogger(__name__)
 
-def calculate_available_memory() -> float:
+# The result of the hardware probe is reused for this many seconds
+HARDWARE_PROBE_TTL = 300.0
+# Memory used when the probe fails
+DEFAULT_MEMORY_GB = 16.0
+# The NVIDIA kernel driver lists the GPUs here, so GPUs are detected without importing torch or running nvidia-smi
+NVIDIA_GPUS_PATH = "/proc/driver/nvidia/gpus"
+MEMINFO_PATH = "/proc/meminfo"
+# Memory limit of the container, e.g. of a Docker or Kubernetes job (cgroup v2)
+CGROUP_MEMORY_MAX_PATH = "/sys/fs/cgroup/memory.max"
+
+def has_nvidia_gpu() -> bool:
+    """Returns true if the NVIDIA driver reports a GPU."""
+    try:
+        return len(os.listdir(NVIDIA_GPUS_PATH)) > 0
+    except OSError:
+        return False
+
+def get_gpu_memory() -> float | None:
+    """
+    Returns the total memory in GB of the CUDA-enabled GPUs, or None if there is no GPU or torch is not installed.
+    torch is only imported when the driver reports a GPU, or if it is already imported, e.g. in a transcription worker.
+    """
+    if 'torch' not in sys.modules and not has_nvidia_gpu():
+        return None
+    try:
+        torch = importlib.import_module('torch')
+    except ImportError:
+        logger.warning("Found an NVIDIA GPU, but torch is not installed.")
+        return None
+    if not torch.cuda.is_available():
+        return None
+    gpu_memory = 0.0
+    device_count = torch.cuda.device_count()
+    logger.info(f"Found {device_count} CUDA-enabled GPU(s).")
+    for i in range(device_count):
+        # Total memory
+        total_mem_gb = torch.cuda.get_device_properties(i).total_memory / (1024**3)
+        logger.info(f"Total VRAM on device: {total_mem_gb:.2f} GB")
+        gpu_memory += total_mem_gb
+    return gpu_memory
+
+def get_machine_memory() -> float | None:
+    """Returns the total memory of the machine in GB from /proc/meminfo, limited by the memory limit of the container."""
+    memory_bytes = None
+    try:
+        with open(MEMINFO_PATH, 'r') as f:
+            for line in f:
+                if line.startswith("MemTotal:"):
+                    memory_bytes = int(line.split()[1]) * 1024
+                    break
+    except (OSError, ValueError, IndexError):
+        return None
+    try:
+        with open(CGROUP_MEMORY_MAX_PATH, 'r') as f:
+            limit = f.read().strip()
+        if limit.isdigit() and memory_bytes is not None:
+            memory_bytes = min(memory_bytes, int(limit))
+    except OSError:
+        pass
+    return memory_bytes / (1024**3) if memory_bytes is not None else None
+
+def probe_available_memory() -> float:
     """
     Method for calculating the available memory for working with transcriptions.
     Returns:
         The available memory in GB on the device that will be used for loading and working with whisper models.
     """
     try:
-        if torch.cuda.is_available():
-            gpu_memory = 0.0
-            device_count = torch.cuda.device_count()
-            logger.info(f"Found {device_count} CUDA-enabled GPU(s).")
-
-            for i in range(device_count):
-                # Total memory
-                total_mem_gb = torch.cuda.get_device_properties(i).total_memory / (1024**3)
-                logger.info(f"Total VRAM on device: {total_mem_gb:.2f} GB")
-                gpu_memory += total_mem_gb
-
+        gpu_memory = get_gpu_memory()
+        if gpu_memory is not None:
             logger.info(f"Available GPU memory: {gpu_memory:.2f} GB")
             return gpu_memory
-        else:
-            # use the number of machine RAM if there is no GPU available
+        # use the machine RAM if there is no GPU available, MEMORY_IN_GIGS overrides the memory of the machine
+        if settings.MEMORY_IN_GIGS:
             machine_memory = float(settings.MEMORY_IN_GIGS)
-            logger.info("Available memory: " + str(machine_memory) + " GB")
-            return machine_memory
+        else:
+            machine_memory = get_machine_memory()
+            if machine_memory is None:
+                logger.warning(f"Could not read the machine memory - using default value, {DEFAULT_MEMORY_GB}GB.")
+                machine_memory = DEFAULT_MEMORY_GB
+        logger.info(f"Available memory: {machine_memory:.2f} GB")
+        return machine_memory
     except Exception as e:
-        logger.error("Error calculating available memory - using default value, 16GB.")
-        return 16.0
+        logger.error(f"Error calculating available memory - using default value, {DEFAULT_MEMORY_GB}GB. Error: {e}")
+        return DEFAULT_MEMORY_GB
+
+class HardwareProbe:
+    """Caches the result of the hardware probe, it is probed again when it is older than the TTL."""
+    def __init__(self, ttl: float = HARDWARE_PROBE_TTL, probe=probe_available_memory):
+        self.ttl = ttl
+        self.probe = probe
+        self.lock = threading.Lock()
+        self.available_memory = None
+        self.probe_time = None
+
+    def get_available_memory(self) -> float:
+        with self.lock:
+            if self.probe_time is None or time.monotonic() - self.probe_time >= self.ttl:
+                self.available_memory = self.probe()
+                self.probe_time = time.monotonic()
+            return self.available_memory
+
+_hardware_probe = HardwareProbe()
+
+def calculate_available_memory() -> float:
+    """
+    Returns the available memory in GB for working with transcriptions, see probe_available_memory.
+    The probe is cached for HARDWARE_PROBE_TTL seconds.
+    """
+    return _hardware_probe.get_available_memory()
@@ -0,0 +1,241 @@
+import datetime
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Event log of a recording, one JSON object per line, e.g.
+#   {"event": "finalized", "time": "2025-01-01T12:00:00+00:00", "recording_id": 1, "status": "VERIFIED", "file_crc32": 123}
+#   {"event": "transcription_started", "time": "2025-01-01T12:01:00+00:00"}
+# Events are only appended, the current state of the recording is the state after the last event of each kind, see
+# read_recording_state. When the log grows beyond EVENT_LOG_COMPACTION_SIZE it is replaced atomically by a log with
+# only the events that make up the current state.
+EVENT_LOG_FILE_NAME = "events.jsonl"
+# Written by older versions, read and migrated to the event log on the first new event
+LEGACY_COMPLETION_LOG_FILE_NAME = "completion_log.txt"
+
+FINALIZED = "finalized"
+TRANSCRIPTION_STARTED = "transcription_started"
+TRANSCRIPTION_ENDED = "transcription_ended"
+TRANSCRIPTION_CANCELLED = "transcription_cancelled"
+RENAMED = "renamed"
+TRANSCRIPTION_EVENTS = (TRANSCRIPTION_STARTED, TRANSCRIPTION_ENDED, TRANSCRIPTION_CANCELLED)
+
+EVENT_LOG_COMPACTION_SIZE = 64 * 1024
+# The log is read backwards in blocks of this size, the current state is usually in the last block
+TAIL_BLOCK_SIZE = 4096
+
+# Appends and compactions of the event logs of this process, compaction must not lose an appended event
+_event_log_lock = threading.Lock()
+
+def get_event_log_path(recording_path: str) -> str:
+    return os.path.join(recording_path, EVENT_LOG_FILE_NAME)
+
+def has_event_log(recording_path: str) -> bool:
+    """Returns true if the recording has an event log, or a completion log written by an older version."""
+    return (os.path.isfile(get_event_log_path(recording_path))
+            or os.path.isfile(os.path.join(recording_path, LEGACY_COMPLETION_LOG_FILE_NAME)))
+
+def new_event(event: str, **fields) -> dict:
+    return {"event": event, "time": datetime.datetime.now(datetime.timezone.utc).isoformat(), **fields}
+
+def append_event(recording_path: str, event: str, **fields):
+    """
+    Appends an event to the event log of a recording. The event is written with one write to a file opened for
+    appending, so a concurrent reader sees the whole line or nothing of it.
+
+    Args:
+        recording_path: The directory of the recording.
+        event: The event type, e.g. FINALIZED.
+        **fields: The data of the event.
+    """
+    line = json.dumps(new_event(event, **fields)) + "\n"
+    log_path = get_event_log_path(recording_path)
+    with _event_log_lock:
+        if not os.path.isfile(log_path):
+            migrate_completion_log(recording_path)
+        fd = os.open(log_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, line.encode("utf-8"))
+            size = os.fstat(fd).st_size
+        finally:
+            os.close(fd)
+        if size > EVENT_LOG_COMPACTION_SIZE:
+            compact_event_log(recording_path)
+
+def read_events(log_path: str) -> list[dict]:
+    """Reads all events of an event log, lines that cannot be parsed, e.g. a torn last line, are skipped."""
+    events = []
+    with open(log_path, "rb") as f:
+        for line in f:
+            event = parse_event(line)
+            if event is not None:
+                events.append(event)
+    return events
+
+def parse_event(line: bytes) -> dict | None:
+    try:
+        event = json.loads(line)
+    except (UnicodeDecodeError, ValueError):
+        return None
+    return event if isinstance(event, dict) and "event" in event else None
+
+def iter_events_reversed(log_path: str):
+    """Yields the events of an event log from the last to the first, reading the file backwards in blocks."""
+    with open(log_path, "rb") as f:
+        position = f.seek(0, os.SEEK_END)
+        remainder = b""
+        while position > 0:
+            block_size = min(TAIL_BLOCK_SIZE, position)
+            position -= block_size
+            f.seek(position)
+            lines = (f.read(block_size) + remainder).split(b"\n")
+            # the first line can continue in the previous block
+            remainder = lines.pop(0)
+            for line in reversed(lines):
+                event = parse_event(line)
+                if event is not None:
+                    yield event
+        event = parse_event(remainder)
+        if event is not None:
+            yield event
+
+def get_current_events(events_reversed) -> dict[str, dict]:
+    """
+    Returns the last event of each kind that makes up the current state, from events in reverse order:
+    FINALIZED, the last transcription event and RENAMED. Stops reading when the finalization and the transcription
+    state are known.
+    """
+    current = {}
+    for event in events_reversed:
+        kind = "transcription" if event["event"] in TRANSCRIPTION_EVENTS else event["event"]
+        if kind in (FINALIZED, "transcription", RENAMED) and kind not in current:
+            current[kind] = event
+        if FINALIZED in current and "transcription" in current:
+            break
+    return current
+
+def read_recording_state(recording_path: str) -> dict | None:
+    """
+    Builds the current state of a recording from the end of its event log, or from a completion log written by an
+    older version.
+
+    Args:
+        recording_path: The directory of the recording.
+
+    Returns:
+        None if the recording has not been finalized, otherwise a dictionary with
+        - 'recording_id': The recording id.
+        - 'status': The name of the RecordingStatus of the finalization.
+        - 'completion_time': The time of the finalization.
+        - 'file_crc32': The CRC32 of the recording file, or None.
+        - 'transcription_start_time': The start time of a running transcription, or None.
+        - 'transcription_end_time': The end time of the last transcription, or None.
+    """
+    log_path = get_event_log_path(recording_path)
+    if not os.path.isfile(log_path):
+        return read_completion_log(os.path.join(recording_path, LEGACY_COMPLETION_LOG_FILE_NAME))
+    try:
+        current = get_current_events(iter_events_reversed(log_path))
+        finalized = current.get(FINALIZED)
+        if finalized is None:
+            return None
+        transcription = current.get("transcription", {})
+        return {
+            'recording_id': int(finalized["recording_id"]),
+            'status': finalized["status"],
+            'completion_time': finalized.get("time"),
+            'file_crc32': finalized.get("file_crc32"),
+            'transcription_start_time': transcription.get("time") if transcription.get("event") == TRANSCRIPTION_STARTED else None,
+            'transcription_end_time': transcription.get("time") if transcription.get("event") == TRANSCRIPTION_ENDED else None
+        }
+    except (OSError, KeyError, TypeError, ValueError) as e:
+        logger.error(f"Could not read event log {log_path}: {e}")
+        return None
+
+def read_completion_log(log_path: str) -> dict | None:
+    """
+    Reads the state of a recording from a completion log written by an older version, lines of "key: value".
+
+    Args:
+        log_path: The path to the completion log.
+
+    Returns:
+        The state of the recording, see read_recording_state, or None if there is no valid completion log.
+    """
+    if not os.path.isfile(log_path):
+        return None
+    try:
+        with open(log_path, "r") as f:
+            lines = f.readlines()
+        if len(lines) < 2:
+            logger.warning(f"Malformed completion log (too short): {log_path}")
+            return None
+        log_data = {}
+        for line in lines:
+            if ":" in line:
+                key, value = line.split(":", 1)
+                log_data[key.strip()] = value.strip()
+        # if there is transcription start time and not transcription end time, then the transcription is running
+        transcription_start_time = None
+        if "Transcription start time" in log_data and "Transcription end time" not in log_data:
+            transcription_start_time = log_data["Transcription start time"]
+        return {
+            'recording_id': int(log_data["Recording ID"]),
+            'status': log_data["Status"],
+            'completion_time': log_data.get("Completion time"),
+            'file_crc32': int(log_data["File CRC32"], 16) if "File CRC32" in log_data else None,
+            'transcription_start_time': transcription_start_time,
+            'transcription_end_time': log_data.get("Transcription end time")
+        }
+    except (OSError, IndexError, TypeError, ValueError, KeyError) as e:
+        logger.error(f"Could not parse completion log {log_path}: {e}")
+        return None
+
+def write_events_atomically(log_path: str, events: list[dict]):
+    """Replaces an event log with the events, a reader sees either the old or the new log."""
+    temp_path = os.path.join(os.path.dirname(log_path), "." + os.path.basename(log_path) + ".tmp")
+    with open(temp_path, "w") as f:
+        for event in events:
+            f.write(json.dumps(event) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, log_path)
+
+def compact_event_log(recording_path: str):
+    """
+    Replaces the event log of a recording by a log with only the events that make up the current state.
+    Called by append_event with the lock held.
+    """
+    log_path = get_event_log_path(recording_path)
+    try:
+        current = get_current_events(reversed(read_events(log_path)))
+        events = sorted(current.values(), key=lambda event: event.get("time") or "")
+        write_events_atomically(log_path, events)
+        logger.info(f"Compacted event log {log_path} to {len(events)} events.")
+    except OSError as e:
+        logger.error(f"Could not compact event log {log_path}: {e}")
+
+def migrate_completion_log(recording_path: str):
+    """
+    Converts a completion log written by an older version to an event log, and removes the completion log.
+    Called by append_event with the lock held.
+    """
+    log_path = os.path.join(recording_path, LEGACY_COMPLETION_LOG_FILE_NAME)
+    state = read_completion_log(log_path)
+    if state is None:
+        return
+    events = [{"event": FINALIZED, "time": state['completion_time'], "recording_id": state['recording_id'],
+               "status": state['status'], "file_crc32": state['file_crc32']}]
+    if state['transcription_start_time'] is not None:
+        events.append({"event": TRANSCRIPTION_STARTED, "time": state['transcription_start_time']})
+    elif state['transcription_end_time'] is not None:
+        events.append({"event": TRANSCRIPTION_ENDED, "time": state['transcription_end_time']})
+    try:
+        write_events_atomically(get_event_log_path(recording_path), events)
+        os.remove(log_path)
+        logger.info(f"Migrated completion log {log_path} to an event log.")
+    except OSError as e:
+        logger.error(f"Could not migrate completion log {log_path}: {e}")
@@ -0,0 +1,404 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import threading
+import time
+import uuid
+from typing import Callable
+
+from django.conf import settings
+
+from .recording_events_util import EVENT_LOG_FILE_NAME, LEGACY_COMPLETION_LOG_FILE_NAME
+
+logger = logging.getLogger(__name__)
+
+# Changes are collected until no new change has been seen for this many seconds, at most MAX_DELAY seconds
+DEBOUNCE_DELAY = 0.5
+MAX_DELAY = 2.0
+
+# inotify constants, see inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+INOTIFY_EVENT_HEADER = struct.Struct("iIII")
+
+# Number of deletions remembered for delta syncs, clients that synced before the oldest one get a full sync
+MAX_DELETIONS = 10000
+
+TRANSCRIPTIONS_DIR_NAME = "TRANSCRIPTIONS"
+
+class RecordingBusyError(Exception):
+    """
+    Raised by the loader of a recording directory that is being written, e.g. a recording that is receiving chunks,
+    so its incomplete state is not reported. The directory is loaded again when it changes.
+    """
+
+class RecordingLibrary:
+    """
+    In-memory model of the recordings in a recordings base directory, shared by all connections of the process.
+
+    The recordings are scanned once, after that a watcher thread reloads only the recording directories that
+    change, both by this server and by other tools using the directory. Listeners are called with the changed
+    and deleted recordings.
+
+    Every change increments a version counter, and the version of the last change of every recording is kept,
+    so a client that has seen a version only needs the recordings changed or deleted since. The versions restart
+    with the process, the epoch identifies them.
+    """
+    def __init__(self, base_path: str, load_all: Callable[[str], list[dict]], load_one: Callable[[str, str], dict | None]):
+        """
+        Args:
+            base_path: The recordings base directory.
+            load_all: Loads the status of all recordings in the base directory.
+            load_one: Loads the status of one recording directory, given the base directory and the directory name,
+                      raises RecordingBusyError if the directory is being written.
+        """
+        self.base_path = base_path
+        self.load_one = load_one
+        self.lock = threading.Lock()
+        self.listeners = []
+        self.statuses = {}  # recording ID -> status
+        self.dir_names = {}  # recording directory name -> recording ID
+        self.epoch = uuid.uuid4().hex
+        self.version = 0
+        self.versions = {}  # recording ID -> version of the last change
+        self.deletions = {}  # recording ID -> version of the deletion, oldest first
+        self.oldest_delta_version = 0  # deletions before this version are forgotten
+        for status in load_all(base_path):
+            self._set_status(status)
+        self.watcher = None
+
+    def _set_status(self, status: dict):
+        self.statuses[status['recording_id']] = status
+        self.dir_names[os.path.basename(os.path.normpath(status['recording_path']))] = status['recording_id']
+
+    def get_statuses(self) -> list[dict]:
+        """Returns the status of all recordings, the statuses must not be modified."""
+        with self.lock:
+            return list(self.statuses.values())
+
+    def get_changes(self, epoch: str | None, version: int | None) -> tuple[int, set[int] | None, list[int]]:
+        """
+        Returns the changes since a version.
+
+        Args:
+            epoch: The epoch of the library when the client saw the version.
+            version: The last version seen by the client.
+
+        Returns:
+            The current version, the IDs of the recordings changed since the version and the IDs of the recordings
+            deleted since the version. The changed IDs are None if the version is unknown and a full sync is needed.
+        """
+        with self.lock:
+            if epoch != self.epoch or version is None or not self.oldest_delta_version <= version <= self.version:
+                return self.version, None, []
+            changed = {recording_id for recording_id, changed_version in self.versions.items() if changed_version > version}
+            deleted = [recording_id for recording_id, deleted_version in self.deletions.items() if deleted_version > version]
+            return self.version, changed, deleted
+
+    def get_snapshot(self) -> tuple[list[dict], int]:
+        """Returns the status of all recordings and the current version, the statuses must not be modified."""
+        with self.lock:
+            return list(self.statuses.values()), self.version
+
+    def get_changed_statuses(self, version: int) -> tuple[list[dict], list[int], int]:
+        """Returns the statuses of the recordings changed since a version, the IDs of the deleted recordings and the current version."""
+        with self.lock:
+            changed = [self.statuses[recording_id] for recording_id, changed_version in self.versions.items() if changed_version > version]
+            deleted = [recording_id for recording_id, deleted_version in self.deletions.items() if deleted_version > version]
+            return changed, deleted, self.version
+
+    def add_listener(self, listener: Callable[[list[dict], list[int], int], None]):
+        """
+        Adds a listener for changes. It is called from the watcher thread with the statuses of changed recordings,
+        the IDs of deleted recordings and the version of the change.
+        """
+        with self.lock:
+            self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        with self.lock:
+            if listener in self.listeners:
+                self.listeners.remove(listener)
+
+    def refresh(self, dir_names):
+        """
+        Reloads recording directories and notifies the listeners of the changes.
+
+        Args:
+            dir_names: The names of the recording directories that may have changed, added or removed.
+        """
+        changed = []
+        deleted = []
+        with self.lock:
+            affected_ids = set()
+            for dir_name in dir_names:
+                if dir_name.startswith('.'):
+                    continue
+                try:
+                    status = self.load_one(self.base_path, dir_name)
+                except OSError as e:
+                    # e.g. the directory was removed while it was read, a new event follows
+                    logger.warning(f"Could not load recording directory '{dir_name}': {e}")
+                    continue
+                except RecordingBusyError:
+                    # the last reported status is kept until the directory is written completely
+                    continue
+                previous_id = self.dir_names.pop(dir_name, None)
+                if previous_id is not None:
+                    affected_ids.add(previous_id)
+                if status is not None:
+                    if status != self.statuses.get(status['recording_id']):
+                        changed.append(status)
+                    self._set_status(status)
+                    affected_ids.discard(status['recording_id'])
+            # a recording is deleted when no directory has its ID anymore, e.g. not when it was renamed
+            remaining_ids = set(self.dir_names.values())
+            for recording_id in affected_ids - remaining_ids:
+                self.statuses.pop(recording_id, None)
+                deleted.append(recording_id)
+            if changed or deleted:
+                self._add_version(changed, deleted)
+            version = self.version
+            listeners = list(self.listeners)
+        if changed or deleted:
+            logger.info(f"Recording library changed to version {version}: {len(changed)} changed, {len(deleted)} deleted.")
+            for listener in listeners:
+                try:
+                    listener(changed, deleted, version)
+                except Exception as e:
+                    logger.error(f"Error notifying recording library listener: {e}")
+
+    def _add_version(self, changed: list[dict], deleted: list[int]):
+        self.version += 1
+        for status in changed:
+            self.versions[status['recording_id']] = self.version
+            self.deletions.pop(status['recording_id'], None)
+        for recording_id in deleted:
+            self.versions.pop(recording_id, None)
+            self.deletions[recording_id] = self.version
+        while len(self.deletions) > MAX_DELETIONS:
+            # dicts keep the insertion order, the first deletion is the oldest
+            oldest_id = next(iter(self.deletions))
+            self.oldest_delta_version = self.deletions.pop(oldest_id)
+
+    def refresh_all(self):
+        """Reloads every recording directory, e.g. when the watcher may have missed changes."""
+        try:
+            dir_names = set(os.listdir(self.base_path))
+        except OSError as e:
+            logger.error(f"Could not list recordings directory '{self.base_path}': {e}")
+            return
+        with self.lock:
+            dir_names |= set(self.dir_names)
+        self.refresh(dir_names)
+
+class InotifyWatcher:
+    """
+    Watches the recordings base directory, the recording directories and their TRANSCRIPTIONS directories with inotify.
+    Changes to the audio data of a WAV file are ignored, the event log is written when a recording is finalized.
+    """
+    def __init__(self, library: RecordingLibrary):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.inotify_add_watch = libc.inotify_add_watch
+        self.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.library = library
+        # the watcher thread is woken up by writing to the pipe when it is stopped
+        self.stop_read_fd, self.stop_write_fd = os.pipe()
+        self.watches = {}  # watch descriptor -> (directory name, or None for the base directory; is a TRANSCRIPTIONS directory)
+        self._add_watch(library.base_path, None, False)
+        for dir_name in os.listdir(library.base_path):
+            self._watch_recording_dir(dir_name)
+        self.thread = threading.Thread(target=self._run, name="recording-library-inotify", daemon=True)
+        self.thread.start()
+
+    def _add_watch(self, path: str, dir_name: str | None, is_transcription_dir: bool):
+        wd = self.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            if path == self.library.base_path:
+                raise OSError(error, f"inotify_add_watch failed for '{path}'")
+            # e.g. the directory was removed, or the watch limit is reached
+            logger.warning(f"Could not watch '{path}': {os.strerror(error)}")
+            return
+        self.watches[wd] = (dir_name, is_transcription_dir)
+
+    def _watch_recording_dir(self, dir_name: str):
+        recording_path = os.path.join(self.library.base_path, dir_name)
+        if dir_name.startswith('.') or not os.path.isdir(recording_path):
+            return
+        self._add_watch(recording_path, dir_name, False)
+        transcription_dir = os.path.join(recording_path, TRANSCRIPTIONS_DIR_NAME)
+        if os.path.isdir(transcription_dir):
+            self._add_watch(transcription_dir, dir_name, True)
+
+    def _read_events(self) -> set[str] | None:
+        """Reads the pending events, returns the names of the changed recording directories or None on overflow."""
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return changed
+            position = 0
+            while position < len(data):
+                wd, mask, _, name_length = INOTIFY_EVENT_HEADER.unpack_from(data, position)
+                position += INOTIFY_EVENT_HEADER.size
+                name = os.fsdecode(data[position:position + name_length].rstrip(b"\0"))
+                position += name_length
+                if mask & IN_Q_OVERFLOW:
+                    return None
+                if wd not in self.watches:
+                    continue
+                dir_name, is_transcription_dir = self.watches[wd]
+                if mask & IN_IGNORED:
+                    del self.watches[wd]
+                    continue
+                if dir_name is None:
+                    # an entry in the base directory
+                    changed.add(name)
+                    if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                        self._watch_recording_dir(name)
+                    continue
+                if name.startswith('.') or (mask == IN_CLOSE_WRITE and name.lower().endswith(".wav")):
+                    # temporary files, and audio data appended to a recording
+                    continue
+                changed.add(dir_name)
+                if not is_transcription_dir and name == TRANSCRIPTIONS_DIR_NAME and mask & (IN_CREATE | IN_MOVED_TO):
+                    self._add_watch(os.path.join(self.library.base_path, dir_name, name), dir_name, True)
+
+    def _run(self):
+        pending = set()
+        first_change_time = None
+        while True:
+            timeout = None if not pending else DEBOUNCE_DELAY
+            readable, _, _ = select.select([self.fd, self.stop_read_fd], [], [], timeout)
+            if self.stop_read_fd in readable:
+                break
+            if readable:
+                changed = self._read_events()
+                if changed is None:
+                    logger.warning("The inotify event queue overflowed, reloading all recordings.")
+                    pending.clear()
+                    first_change_time = None
+                    self._rewatch()
+                    self.library.refresh_all()
+                    continue
+                if changed:
+                    pending |= changed
+                    first_change_time = first_change_time or time.monotonic()
+                if pending and time.monotonic() - first_change_time < MAX_DELAY:
+                    continue
+            if pending:
+                self.library.refresh(pending)
+                pending = set()
+                first_change_time = None
+
+        for fd in (self.fd, self.stop_read_fd, self.stop_write_fd):
+            os.close(fd)
+
+    def _rewatch(self):
+        for dir_name in os.listdir(self.library.base_path):
+            self._watch_recording_dir(dir_name)
+
+    def stop(self):
+        os.write(self.stop_write_fd, b"\0")
+        self.thread.join()
+
+class PollingWatcher:
+    """
+    Polls the recordings base directory for changes, for file systems without inotify, e.g. network mounts
+    where changes made by other machines are not reported.
+    Every recording directory is checked with a few stat calls per poll, in the watcher thread.
+    """
+    def __init__(self, library: RecordingLibrary, interval: float):
+        self.library = library
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.signatures = self._scan()
+        self.thread = threading.Thread(target=self._run, name="recording-library-poll", daemon=True)
+        self.thread.start()
+
+    def _scan(self) -> dict[str, tuple]:
+        signatures = {}
+        with os.scandir(self.library.base_path) as entries:
+            for entry in entries:
+                if entry.name.startswith('.') or not entry.is_dir():
+                    continue
+                signature = [entry.stat().st_mtime_ns]
+                for name in (TRANSCRIPTIONS_DIR_NAME, EVENT_LOG_FILE_NAME, LEGACY_COMPLETION_LOG_FILE_NAME):
+                    try:
+                        stat = os.stat(os.path.join(entry.path, name))
+                        signature.append((stat.st_mtime_ns, stat.st_size))
+                    except OSError:
+                        signature.append(None)
+                signatures[entry.name] = tuple(signature)
+        return signatures
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                signatures = self._scan()
+            except OSError as e:
+                logger.error(f"Could not poll recordings directory '{self.library.base_path}': {e}")
+                continue
+            changed = {name for name in signatures.keys() | self.signatures.keys()
+                       if signatures.get(name) != self.signatures.get(name)}
+            self.signatures = signatures
+            if changed:
+                self.library.refresh(changed)
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+def start_watcher(library: RecordingLibrary, mode: str, poll_interval: float):
+    """
+    Starts the watcher of a recording library.
+
+    Args:
+        library: The recording library.
+        mode: "inotify", "poll", "auto" (inotify if it is available, otherwise polling) or "off".
+        poll_interval: The polling interval in seconds.
+    """
+    if mode == "off":
+        return None
+    if mode in ("auto", "inotify"):
+        try:
+            return InotifyWatcher(library)
+        except (OSError, AttributeError) as e:
+            # AttributeError: the C library has no inotify functions, e.g. not on Linux
+            if mode == "inotify":
+                raise
+            logger.warning(f"inotify is not available, polling the recordings directory instead: {e}")
+    return PollingWatcher(library, poll_interval)
+
+_recording_libraries = {}
+_recording_libraries_lock = threading.Lock()
+
+def get_recording_library(base_path: str, load_all, load_one) -> RecordingLibrary:
+    """
+    Returns the recording library of a recordings base directory. The first time, the recordings are scanned and
+    the watcher configured by RECORDING_WATCHER is started.
+    """
+    with _recording_libraries_lock:
+        if base_path not in _recording_libraries:
+            library = RecordingLibrary(base_path, load_all, load_one)
+            library.watcher = start_watcher(library, settings.RECORDING_WATCHER, settings.RECORDING_WATCHER_POLL_SECONDS)
+            _recording_libraries[base_path] = library
+        return _recording_libraries[base_path]
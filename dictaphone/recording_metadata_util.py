@@ -0,0 +1,110 @@
+import json
+import logging
+import os
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+METADATA_FILE_NAME = "metadata.json"
+
+# Storage layouts for recording directories
+# title: directory "<id>_<title>" with "<title>.wav", a rename renames the directory and all files
+# id:    directory "<id>" with "<id>.wav", the title is only stored in the metadata file
+TITLE_LAYOUT = "title"
+ID_LAYOUT = "id"
+
+def read_metadata(recording_path: str) -> dict:
+    """
+    Reads the metadata file of a recording.
+
+    Args:
+        recording_path: The path to the recording directory.
+
+    Returns:
+        The metadata as a dictionary, or an empty dictionary if there is no readable metadata file.
+    """
+    metadata_path = os.path.join(recording_path, METADATA_FILE_NAME)
+    if not os.path.isfile(metadata_path):
+        return {}
+    try:
+        with open(metadata_path, 'r') as f:
+            metadata = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logger.error(f"Could not read metadata file '{metadata_path}': {e}")
+        return {}
+    if not isinstance(metadata, dict):
+        logger.error(f"Malformed metadata file '{metadata_path}'.")
+        return {}
+    return metadata
+
+def write_metadata(recording_path: str, metadata: dict) -> None:
+    """
+    Writes the metadata file of a recording atomically.
+
+    The metadata is written to a temporary file in the recording directory, which then replaces the metadata file,
+    so readers see either the old or the new metadata, also if the server stops during the write.
+
+    Args:
+        recording_path: The path to the recording directory.
+        metadata: The metadata to write.
+    """
+    metadata_path = os.path.join(recording_path, METADATA_FILE_NAME)
+    temp_fd, temp_path = tempfile.mkstemp(dir=recording_path, prefix=".metadata_", suffix=".tmp")
+    try:
+        with os.fdopen(temp_fd, 'w') as temp_file:
+            json.dump(metadata, temp_file, indent=4)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        os.replace(temp_path, metadata_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def update_metadata(recording_path: str, **values) -> dict:
+    """
+    Updates keys in the metadata file of a recording, preserving the other keys.
+
+    Args:
+        recording_path: The path to the recording directory.
+        **values: The keys and values to update.
+
+    Returns:
+        The updated metadata.
+    """
+    metadata = read_metadata(recording_path)
+    metadata.update(values)
+    write_metadata(recording_path, metadata)
+    return metadata
+
+def is_id_layout_directory(recording_path: str) -> bool:
+    """
+    Checks if a recording directory uses the id layout: the directory name is the recording ID and the
+    title is stored in the metadata file.
+    """
+    return os.path.basename(os.path.normpath(recording_path)).isdigit() and 'title' in read_metadata(recording_path)
+
+def get_download_name(file_path: str) -> str:
+    """
+    Returns the file name to use when downloading a file from a recording directory.
+
+    Files in a recording directory with the id layout are named after the recording ID. The recording ID prefix is
+    replaced with the title from the metadata file, so the user downloads e.g. "Meeting.wav" instead of "12.wav".
+
+    Args:
+        file_path: The path to a file in a recording directory or its TRANSCRIPTIONS directory.
+
+    Returns:
+        The file name for the download.
+    """
+    file_name = os.path.basename(file_path)
+    recording_path = os.path.dirname(file_path)
+    if os.path.basename(recording_path) == 'TRANSCRIPTIONS':
+        recording_path = os.path.dirname(recording_path)
+    recording_id = os.path.basename(recording_path)
+    if not recording_id.isdigit() or not file_name.startswith(recording_id) or file_name[len(recording_id):][:1].isdigit():
+        return file_name
+    title = read_metadata(recording_path).get('title')
+    if not title:
+        return file_name
+    return title + file_name[len(recording_id):]
@@ -0,0 +1,251 @@
+import asyncio
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+import weakref
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# State of the recordings that is shared by the server processes ingesting recordings, see RecordingStateBackend.
+# The in-memory backend is for a single server process, the Redis backend lets several server processes, e.g. on
+# several nodes behind a load balancer, ingest recordings on shared storage.
+
+MEMORY_BACKEND = "memory"
+REDIS_BACKEND = "redis"
+
+# Identifies this server process in the owners of leases
+NODE_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+class RecordingStateBackend:
+    """
+    Recording state shared by the server processes:
+    - allocation of recording IDs, unique across the processes,
+    - the indexes of the received chunks of a recording,
+    - ownership leases, a recording receives chunks in the connection that holds its lease. Every acquisition of a
+      lease returns a new, higher fencing token, so the owner of state kept from an earlier lease can tell if
+      another owner has held the lease since.
+    """
+    # true if the state is shared with other processes
+    shared = False
+
+    async def allocate_recording_id(self, min_id: int) -> int:
+        """Returns a new recording ID, higher than min_id and than every ID allocated before."""
+        raise NotImplementedError
+
+    async def add_received_chunk(self, recording_id: int, chunk_index: int):
+        raise NotImplementedError
+
+    async def get_received_chunks(self, recording_id: int) -> set[int]:
+        raise NotImplementedError
+
+    async def clear_received_chunks(self, recording_id: int):
+        """Removes the received chunks of a recording, e.g. when it is finalized and does not accept more chunks."""
+        raise NotImplementedError
+
+    async def acquire_lease(self, recording_id: int, owner: str, ttl: float) -> int | None:
+        """
+        Acquires the lease of a recording for ttl seconds, if it is not held by another owner.
+        Returns the fencing token of the lease, or None if the lease is held by another owner.
+        """
+        raise NotImplementedError
+
+    async def renew_lease(self, recording_id: int, owner: str, ttl: float) -> bool:
+        """Extends the lease of a recording by ttl seconds, returns false if the owner does not hold the lease."""
+        raise NotImplementedError
+
+    async def release_lease(self, recording_id: int, owner: str):
+        raise NotImplementedError
+
+    def is_leased(self, recording_id: int) -> bool:
+        """
+        Returns true if the lease of a recording is held, i.e. the recording is receiving chunks in some connection.
+        Not a coroutine, for threads without an event loop, e.g. the watcher of the recording library.
+        """
+        raise NotImplementedError
+
+    async def delete_recording(self, recording_id: int):
+        """Removes the received chunks and the lease of a recording, e.g. when it is deleted."""
+        raise NotImplementedError
+
+class InMemoryRecordingStateBackend(RecordingStateBackend):
+    """Recording state in the memory of one server process."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.last_recording_id = 0
+        self.received_chunks = {}
+        self.leases = {}  # recording ID: (owner, expiry time)
+        self.fencing_tokens = {}
+
+    async def allocate_recording_id(self, min_id: int) -> int:
+        with self.lock:
+            self.last_recording_id = max(self.last_recording_id, min_id) + 1
+            return self.last_recording_id
+
+    async def add_received_chunk(self, recording_id: int, chunk_index: int):
+        with self.lock:
+            self.received_chunks.setdefault(recording_id, set()).add(chunk_index)
+
+    async def get_received_chunks(self, recording_id: int) -> set[int]:
+        with self.lock:
+            return set(self.received_chunks.get(recording_id, ()))
+
+    async def clear_received_chunks(self, recording_id: int):
+        with self.lock:
+            self.received_chunks.pop(recording_id, None)
+
+    async def acquire_lease(self, recording_id: int, owner: str, ttl: float) -> int | None:
+        with self.lock:
+            lease = self.leases.get(recording_id)
+            if lease is not None and lease[0] != owner and lease[1] > time.monotonic():
+                return None
+            self.leases[recording_id] = (owner, time.monotonic() + ttl)
+            self.fencing_tokens[recording_id] = self.fencing_tokens.get(recording_id, 0) + 1
+            return self.fencing_tokens[recording_id]
+
+    async def renew_lease(self, recording_id: int, owner: str, ttl: float) -> bool:
+        with self.lock:
+            lease = self.leases.get(recording_id)
+            if lease is None or lease[0] != owner:
+                return False
+            self.leases[recording_id] = (owner, time.monotonic() + ttl)
+            return True
+
+    async def release_lease(self, recording_id: int, owner: str):
+        with self.lock:
+            lease = self.leases.get(recording_id)
+            if lease is not None and lease[0] == owner:
+                del self.leases[recording_id]
+
+    def is_leased(self, recording_id: int) -> bool:
+        with self.lock:
+            lease = self.leases.get(recording_id)
+            return lease is not None and lease[1] > time.monotonic()
+
+    async def delete_recording(self, recording_id: int):
+        with self.lock:
+            self.received_chunks.pop(recording_id, None)
+            self.leases.pop(recording_id, None)
+
+# Lua scripts, so the read and the update of a key are atomic
+ALLOCATE_ID_SCRIPT = """
+local recording_id = math.max(tonumber(redis.call('GET', KEYS[1]) or '0'), tonumber(ARGV[1])) + 1
+redis.call('SET', KEYS[1], recording_id)
+return recording_id
+"""
+ACQUIRE_LEASE_SCRIPT = """
+local owner = redis.call('GET', KEYS[1])
+if owner and owner ~= ARGV[1] then
+    return nil
+end
+redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+local token = redis.call('INCR', KEYS[2])
+redis.call('PEXPIRE', KEYS[2], ARGV[3])
+redis.call('PEXPIRE', KEYS[3], ARGV[3])
+return token
+"""
+RENEW_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('PEXPIRE', KEYS[2], ARGV[3])
+    redis.call('PEXPIRE', KEYS[3], ARGV[3])
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+class RedisRecordingStateBackend(RecordingStateBackend):
+    """
+    Recording state in Redis, shared by the server processes using the same Redis database and key prefix.
+    Keys: <prefix>recording_id, <prefix>chunks:<id> (set of chunk indexes), <prefix>lease:<id> (owner, expires with
+    the lease) and <prefix>fencing:<id> (the fencing token of the last acquired lease).
+    The chunks and fencing keys of a recording expire state_ttl seconds after the lease was last acquired or renewed,
+    or a chunk was added, so the keys of recordings that are never finalized or deleted do not accumulate.
+    """
+    shared = True
+
+    def __init__(self, url: str, prefix: str = "dictaphone:", state_ttl: float = 3600):
+        self.url = url
+        self.prefix = prefix
+        self.state_ttl = state_ttl
+        # the connections of a client belong to the event loop the client is used in
+        self.clients = weakref.WeakKeyDictionary()
+        self.sync_client = None
+
+    def get_client(self):
+        import redis.asyncio
+        loop = asyncio.get_running_loop()
+        client = self.clients.get(loop)
+        if client is None:
+            client = redis.asyncio.Redis.from_url(self.url, decode_responses=True)
+            self.clients[loop] = client
+        return client
+
+    async def allocate_recording_id(self, min_id: int) -> int:
+        return int(await self.get_client().eval(ALLOCATE_ID_SCRIPT, 1, self.prefix + "recording_id", min_id))
+
+    def get_state_ttl_ms(self, ttl: float) -> int:
+        # the state outlives the lease, so it can be read when the recording is resumed
+        return int(max(ttl, self.state_ttl) * 1000)
+
+    async def add_received_chunk(self, recording_id: int, chunk_index: int):
+        key = f"{self.prefix}chunks:{recording_id}"
+        async with self.get_client().pipeline(transaction=False) as pipe:
+            await pipe.sadd(key, chunk_index).pexpire(key, self.get_state_ttl_ms(0)).execute()
+
+    async def get_received_chunks(self, recording_id: int) -> set[int]:
+        return {int(index) for index in await self.get_client().smembers(f"{self.prefix}chunks:{recording_id}")}
+
+    async def clear_received_chunks(self, recording_id: int):
+        await self.get_client().delete(f"{self.prefix}chunks:{recording_id}")
+
+    async def acquire_lease(self, recording_id: int, owner: str, ttl: float) -> int | None:
+        token = await self.get_client().eval(ACQUIRE_LEASE_SCRIPT, 3, f"{self.prefix}lease:{recording_id}",
+                                             f"{self.prefix}fencing:{recording_id}", f"{self.prefix}chunks:{recording_id}",
+                                             owner, int(ttl * 1000), self.get_state_ttl_ms(ttl))
+        return int(token) if token is not None else None
+
+    async def renew_lease(self, recording_id: int, owner: str, ttl: float) -> bool:
+        return bool(await self.get_client().eval(RENEW_LEASE_SCRIPT, 3, f"{self.prefix}lease:{recording_id}",
+                                                 f"{self.prefix}fencing:{recording_id}", f"{self.prefix}chunks:{recording_id}",
+                                                 owner, int(ttl * 1000), self.get_state_ttl_ms(ttl)))
+
+    async def release_lease(self, recording_id: int, owner: str):
+        await self.get_client().eval(RELEASE_LEASE_SCRIPT, 1, f"{self.prefix}lease:{recording_id}", owner)
+
+    def is_leased(self, recording_id: int) -> bool:
+        if self.sync_client is None:
+            import redis
+            self.sync_client = redis.Redis.from_url(self.url, decode_responses=True)
+        return bool(self.sync_client.exists(f"{self.prefix}lease:{recording_id}"))
+
+    async def delete_recording(self, recording_id: int):
+        await self.get_client().delete(f"{self.prefix}chunks:{recording_id}", f"{self.prefix}lease:{recording_id}")
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def create_recording_state_backend(name: str) -> RecordingStateBackend:
+    if name == REDIS_BACKEND:
+        return RedisRecordingStateBackend(settings.RECORDING_STATE_REDIS_URL,
+                                          state_ttl=settings.INTERRUPTED_RECORDING_TTL_SECONDS)
+    if name != MEMORY_BACKEND:
+        logger.error(f"Unknown recording state backend '{name}', using the in-memory backend.")
+    return InMemoryRecordingStateBackend()
+
+def get_recording_state_backend() -> RecordingStateBackend:
+    """Returns the recording state backend of this process, selected by the RECORDING_STATE_BACKEND setting."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = create_recording_state_backend(settings.RECORDING_STATE_BACKEND)
+        return _backend
@@ -0,0 +1,361 @@
+import asyncio
+import datetime
+import json
+import logging
+import os
+import struct
+import time
+import uuid
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Capture of the WebSocket sessions of the AudioDataConsumer, for reproducing a problem seen in the field offline.
+# Every frame received from and sent to the client is appended to a trace file with the time since the session started.
+# Capture is switched on for new sessions by the SESSION_CAPTURE_ENABLED setting, or at runtime by creating the file
+# SESSION_CAPTURE_FLAG_FILE_NAME in SESSION_CAPTURE_DIR (and off again by removing it). A session that is not captured
+# has no trace writer, so the cost of capture being off is one stat of the flag file per connection.
+#
+# The trace file starts with a header: magic, version, wall clock time of the start of the session.
+# Each frame is a record header followed by the payload:
+#   kind, nanoseconds since the start of the session, length of the payload
+# The payload of text frames is UTF-8, of CONNECT the path of the WebSocket and of DISCONNECT the close code.
+# A record that was cut off by a crash of the server is ignored by the reader.
+TRACE_MAGIC = b"DTRC"
+TRACE_VERSION = 1
+TRACE_HEADER_FORMAT = ">4sBd"
+TRACE_HEADER_SIZE = struct.calcsize(TRACE_HEADER_FORMAT)
+RECORD_FORMAT = ">BQI"
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+TRACE_FILE_SUFFIX = ".trace"
+SESSION_CAPTURE_FLAG_FILE_NAME = "capture_enabled"
+
+CONNECT = 1
+RECEIVE_TEXT = 2
+RECEIVE_BYTES = 3
+SEND_TEXT = 4
+SEND_BYTES = 5
+DISCONNECT = 6
+INBOUND_KINDS = (RECEIVE_TEXT, RECEIVE_BYTES)
+OUTBOUND_KINDS = (SEND_TEXT, SEND_BYTES)
+
+# the fields of the messages sent to the client that are compared by the replayer, the other fields depend on the
+# state of the server, e.g. the paths and the recordings of the library
+COMPARED_MESSAGE_FIELDS = ("message_type", "recording_id", "chunk_index", "completion_status", "success",
+                           "missing_chunks", "high_water_mark")
+
+# binary chunk header, see parse_chunk_header in audio_data_consumer
+CHUNK_RECORDING_ID_FORMAT = ">I"
+CHUNK_HEADER_FLAG = 0x80000000
+
+# a writer buffers the frames in memory, an audio chunk is about half a megabyte
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+
+class SessionTraceWriter:
+    """Appends the frames of one WebSocket session to a trace file."""
+    def __init__(self, path: str, ws_path: str = ""):
+        """
+        Args:
+            path: The path to the trace file, it is created.
+            ws_path: The path of the WebSocket, recorded in the CONNECT record.
+        """
+        self.path = path
+        self.file = open(path, "wb", buffering=WRITE_BUFFER_SIZE)
+        self.start_time = time.monotonic_ns()
+        self.file.write(struct.pack(TRACE_HEADER_FORMAT, TRACE_MAGIC, TRACE_VERSION, time.time()))
+        self.write(CONNECT, ws_path.encode("utf-8"))
+
+    def write(self, kind: int, payload: bytes):
+        if self.file is None:
+            return
+        try:
+            self.file.write(struct.pack(RECORD_FORMAT, kind, time.monotonic_ns() - self.start_time, len(payload)))
+            self.file.write(payload)
+        except OSError as e:
+            # capture must never break the session, stop capturing it
+            logger.error(f"Error when writing the session trace {self.path}, capture stopped: {e}")
+            self.close()
+
+    def write_inbound(self, text_data: str | None = None, bytes_data: bytes | None = None):
+        if text_data is not None:
+            self.write(RECEIVE_TEXT, text_data.encode("utf-8"))
+        elif bytes_data is not None:
+            self.write(RECEIVE_BYTES, bytes_data)
+
+    def write_outbound(self, text_data: str | None = None, bytes_data: bytes | None = None):
+        if text_data is not None:
+            self.write(SEND_TEXT, text_data.encode("utf-8"))
+        elif bytes_data is not None:
+            self.write(SEND_BYTES, bytes_data)
+
+    def close(self, close_code=None):
+        if self.file is None:
+            return
+        if close_code is not None:
+            self.write(DISCONNECT, str(close_code).encode("utf-8"))
+        try:
+            self.file.close()
+        except OSError as e:
+            logger.error(f"Error when closing the session trace {self.path}: {e}")
+        self.file = None
+        logger.info(f"Session trace written to {self.path}")
+
+
+def is_capture_enabled() -> bool:
+    if settings.SESSION_CAPTURE_ENABLED:
+        return True
+    return os.path.exists(os.path.join(settings.SESSION_CAPTURE_DIR, SESSION_CAPTURE_FLAG_FILE_NAME))
+
+def set_capture_enabled(enabled: bool):
+    """Switches capture on or off for new sessions of all the server processes sharing SESSION_CAPTURE_DIR."""
+    flag_path = os.path.join(settings.SESSION_CAPTURE_DIR, SESSION_CAPTURE_FLAG_FILE_NAME)
+    if enabled:
+        os.makedirs(settings.SESSION_CAPTURE_DIR, exist_ok=True)
+        with open(flag_path, "w"):
+            pass
+    elif os.path.exists(flag_path):
+        os.remove(flag_path)
+
+def open_session_trace(ws_path: str = "") -> SessionTraceWriter | None:
+    """
+    Starts the trace of a new session if capture is enabled.
+
+    Returns:
+        The writer of the trace, or None if capture is off or the trace file could not be created.
+    """
+    if not is_capture_enabled():
+        return None
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    path = os.path.join(settings.SESSION_CAPTURE_DIR, f"session_{timestamp}_{uuid.uuid4().hex[:8]}{TRACE_FILE_SUFFIX}")
+    try:
+        os.makedirs(settings.SESSION_CAPTURE_DIR, exist_ok=True)
+        return SessionTraceWriter(path, ws_path)
+    except OSError as e:
+        logger.error(f"Error when creating the session trace {path}: {e}")
+        return None
+
+def read_session_trace(path: str) -> tuple[float, list[tuple[int, float, bytes]]]:
+    """
+    Reads a trace file.
+
+    Returns:
+        The wall clock time of the start of the session, and the records: kind, seconds since the start, payload.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < TRACE_HEADER_SIZE:
+        raise ValueError(f"Not a session trace: {path}")
+    magic, version, start_time = struct.unpack_from(TRACE_HEADER_FORMAT, data)
+    if magic != TRACE_MAGIC or version != TRACE_VERSION:
+        raise ValueError(f"Not a session trace of version {TRACE_VERSION}: {path}")
+    records = []
+    offset = TRACE_HEADER_SIZE
+    while offset + RECORD_SIZE <= len(data):
+        kind, time_ns, length = struct.unpack_from(RECORD_FORMAT, data, offset)
+        offset += RECORD_SIZE
+        if offset + length > len(data):
+            logger.warning(f"The last record of the session trace {path} is incomplete, it is ignored.")
+            break
+        records.append((kind, time_ns / 1e9, data[offset:offset + length]))
+        offset += length
+    return start_time, records
+
+
+def get_recording_id_of_chunk(bytes_data: bytes) -> int | None:
+    if len(bytes_data) < 4:
+        return None
+    return struct.unpack_from(CHUNK_RECORDING_ID_FORMAT, bytes_data)[0] & ~CHUNK_HEADER_FLAG
+
+def remap_chunk(bytes_data: bytes, recording_ids: dict[int, int]) -> bytes:
+    recording_id = get_recording_id_of_chunk(bytes_data)
+    if recording_id not in recording_ids:
+        return bytes_data
+    flag = struct.unpack_from(CHUNK_RECORDING_ID_FORMAT, bytes_data)[0] & CHUNK_HEADER_FLAG
+    return struct.pack(CHUNK_RECORDING_ID_FORMAT, recording_ids[recording_id] | flag) + bytes_data[4:]
+
+def remap_control_message(text_data: str, recording_ids: dict[int, int]) -> str:
+    try:
+        data = json.loads(text_data)
+    except ValueError:
+        return text_data
+    parameter = data.get("parameter") if isinstance(data, dict) else None
+    if isinstance(parameter, dict) and parameter.get("recordingId") in recording_ids:
+        parameter["recordingId"] = recording_ids[parameter["recordingId"]]
+        return json.dumps(data)
+    return text_data
+
+def normalize_message(payload: bytes, recording_ids: dict[int, int] | None = None) -> tuple:
+    """
+    The fields of a message sent to the client that are compared by the replayer.
+
+    Args:
+        payload: The text frame.
+        recording_ids: Maps the recording IDs of the replayed session to the IDs of the captured session.
+    """
+    try:
+        message = json.loads(payload)
+    except ValueError:
+        return ("invalid",)
+    if not isinstance(message, dict):
+        return ("invalid",)
+    fields = []
+    for name in COMPARED_MESSAGE_FIELDS:
+        value = message.get(name)
+        if name == "recording_id" and recording_ids:
+            value = recording_ids.get(value, value)
+        if isinstance(value, list):
+            value = tuple(value)
+        fields.append(value)
+    return tuple(fields)
+
+
+class ReplayResult:
+    """The outcome of a replayed session."""
+    def __init__(self, inbound_frames: int, elapsed: float, captured_messages: list[tuple], replayed_messages: list[tuple]):
+        self.inbound_frames = inbound_frames
+        self.elapsed = elapsed
+        self.captured_messages = captured_messages
+        self.replayed_messages = replayed_messages
+
+    def get_differences(self) -> tuple[list[tuple], list[tuple]]:
+        """
+        Compares the messages sent to the client, regardless of the order, which depends on the timing of the
+        background tasks of the consumer.
+
+        Returns:
+            The captured messages missing from the replay, and the replayed messages that were not captured.
+        """
+        remaining = list(self.replayed_messages)
+        missing = []
+        for message in self.captured_messages:
+            if message in remaining:
+                remaining.remove(message)
+            else:
+                missing.append(message)
+        return missing, remaining
+
+    @property
+    def matches(self) -> bool:
+        missing, unexpected = self.get_differences()
+        return not missing and not unexpected
+
+
+async def replay_session(path: str, application=None, speed: float = 1.0, settle_timeout: float = 20.0) -> ReplayResult:
+    """
+    Replays a captured session against the AudioDataConsumer, sending the frames received from the client in the
+    same order. The recording IDs of the captured session are mapped to the recordings started in the replay.
+
+    Args:
+        path: The path to the trace file.
+        application: The ASGI application, by default the application of the server.
+        speed: The frames are sent with the timing of the session, sped up by this factor. With 0 they are sent
+            without waiting, at full speed.
+        settle_timeout: The maximum time in seconds to wait for the messages the captured session sent before the
+            client disconnected, e.g. for a recording to be finalized.
+
+    Returns:
+        The outcome of the replay.
+    """
+    from channels.testing import WebsocketCommunicator
+    if application is None:
+        from backend.asgi import application
+
+    _, records = read_session_trace(path)
+    ws_path = next((payload.decode("utf-8") for kind, _, payload in records if kind == CONNECT), "/ws/dictaphone/data/")
+    captured = [(kind, payload) for kind, _, payload in records if kind in OUTBOUND_KINDS]
+    captured_messages = [normalize_message(payload) for kind, payload in captured if kind == SEND_TEXT]
+    # the recordings started in the captured session, in order
+    captured_recording_ids = [message[1] for message in captured_messages if message[0] == "ack_start_recording"]
+
+    communicator = WebsocketCommunicator(application, ws_path)
+    connected, _ = await communicator.connect()
+    if not connected:
+        raise ValueError(f"The replay of {path} could not connect to {ws_path}")
+    replayed = []
+    received = asyncio.Event()
+
+    async def read_messages():
+        while True:
+            # a timeout of receive_output cancels the application, the reader is cancelled instead
+            message = await communicator.receive_output(timeout=3600)
+            if message.get("type") == "websocket.send":
+                replayed.append(message)
+                received.set()
+
+    async def wait_for_messages(predicate, timeout):
+        deadline = time.monotonic() + timeout
+        while not predicate():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            received.clear()
+            try:
+                await asyncio.wait_for(received.wait(), remaining)
+            except asyncio.TimeoutError:
+                return False
+        return True
+
+    def replayed_text_messages():
+        return [normalize_message(message["text"].encode("utf-8")) for message in replayed if message.get("text") is not None]
+
+    reader = asyncio.create_task(read_messages())
+    recording_ids = {}
+    starts = 0
+    inbound_frames = 0
+    start = time.monotonic()
+    try:
+        for kind, offset, payload in records:
+            if kind not in INBOUND_KINDS:
+                continue
+            if speed > 0:
+                await asyncio.sleep(max(0.0, start + offset / speed - time.monotonic()))
+            inbound_frames += 1
+            if kind == RECEIVE_BYTES:
+                await communicator.send_to(bytes_data=remap_chunk(payload, recording_ids))
+                continue
+            text_data = remap_control_message(payload.decode("utf-8"), recording_ids)
+            await communicator.send_to(text_data=text_data)
+            if json.loads(text_data).get("message") == "start_recording" and starts < len(captured_recording_ids):
+                # the chunks of the recording refer to the ID the server allocated
+                acks_before = sum(1 for message in replayed_text_messages() if message[0] == "ack_start_recording")
+                def acked():
+                    return sum(1 for message in replayed_text_messages() if message[0] == "ack_start_recording") > acks_before
+                if await wait_for_messages(acked, settle_timeout):
+                    acks = [message for message in replayed_text_messages() if message[0] == "ack_start_recording"]
+                    recording_ids[captured_recording_ids[starts]] = acks[-1][1]
+                starts += 1
+        await wait_for_messages(lambda: len(replayed) >= len(captured), settle_timeout)
+    finally:
+        reader.cancel()
+        await communicator.disconnect()
+    elapsed = time.monotonic() - start
+
+    captured_ids = {replayed_id: captured_id for captured_id, replayed_id in recording_ids.items()}
+    replayed_messages = [normalize_message(message["text"].encode("utf-8"), captured_ids)
+                         for message in replayed if message.get("text") is not None]
+    return ReplayResult(inbound_frames, elapsed, captured_messages, replayed_messages)
+
+def extract_chunks(path: str, directory: str) -> int:
+    """
+    Saves the audio chunks received in a captured session as test data, see save_audio_data_for_test.
+
+    Returns:
+        The number of chunks saved.
+    """
+    from .audio_data_consumer import parse_chunk_header, save_audio_data_for_test
+    _, records = read_session_trace(path)
+    count = 0
+    for kind, _, payload in records:
+        if kind != RECEIVE_BYTES:
+            continue
+        try:
+            recording_id, chunk_index, audio_data = parse_chunk_header(payload)
+        except ValueError:
+            continue
+        save_audio_data_for_test(payload, recording_id, chunk_index, True, directory)
+        if audio_data is not None:
+            save_audio_data_for_test(audio_data, recording_id, chunk_index, False, directory)
+        count += 1
+    return count
@@ -0,0 +1,145 @@
+import asyncio
+import bisect
+import hashlib
+import logging
+import weakref
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Sharding of the recordings over several ASGI worker processes, see backend/workers.py.
+# Every worker is a shard, and a recording belongs to the shard its ID is mapped to by consistent hashing, so the
+# mapping of most recordings is kept when the number of workers changes. A worker only allocates IDs of recordings
+# that belong to it, so the chunks of a new recording are handled by the shard of the recording.
+# A client that reconnects is accepted by any worker. Resuming a recording of another shard hands the recording off:
+# the shard of the recording drops its state of the recording and closes its chunk journal, and the recording is
+# rebuilt from the shared storage by the worker of the new connection.
+
+# Points of each shard on the hash ring, more points spread the recordings more evenly
+SHARD_RING_REPLICAS = 64
+# Allocation gives up when this many IDs in a row belong to other shards
+MAX_ALLOCATION_ATTEMPTS = 1000
+
+def hash_key(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+class ConsistentHashRing:
+    """Maps keys to shards, adding a shard only moves the keys of the new shard."""
+    def __init__(self, shard_count: int, replicas: int = SHARD_RING_REPLICAS):
+        points = sorted((hash_key(f"shard-{shard}-{replica}"), shard)
+                        for shard in range(shard_count) for replica in range(replicas))
+        self.hashes = [point[0] for point in points]
+        self.shards = [point[1] for point in points]
+
+    def get_shard(self, key) -> int:
+        position = bisect.bisect(self.hashes, hash_key(str(key))) % len(self.hashes)
+        return self.shards[position]
+
+_rings = {}
+
+def get_shard_ring(shard_count: int) -> ConsistentHashRing:
+    ring = _rings.get(shard_count)
+    if ring is None:
+        ring = ConsistentHashRing(shard_count)
+        _rings[shard_count] = ring
+    return ring
+
+def is_sharded() -> bool:
+    return settings.SHARD_COUNT > 1
+
+def get_recording_shard(recording_id: int) -> int:
+    """Returns the index of the shard a recording belongs to."""
+    if not is_sharded():
+        return 0
+    return get_shard_ring(settings.SHARD_COUNT).get_shard(recording_id)
+
+def is_local_recording(recording_id: int) -> bool:
+    """Returns true if the recording belongs to the shard of this worker process."""
+    return get_recording_shard(recording_id) == settings.SHARD_INDEX
+
+def get_shard_channel(shard_index: int) -> str:
+    """The channel layer channel of a shard, the messages to the shard are received by one of its listeners."""
+    return f"dictaphone.shard.{shard_index}"
+
+async def allocate_local_recording_id(backend, min_id: int) -> int:
+    """
+    Allocates a new recording ID that belongs to the shard of this worker process.
+    The IDs that belong to other shards are skipped, so IDs are not contiguous when the server is sharded.
+
+    Args:
+        backend: The recording state backend, see recording_state_util.
+        min_id: The allocated ID is higher than min_id.
+
+    Returns:
+        The recording ID.
+    """
+    recording_id = await backend.allocate_recording_id(min_id)
+    for _ in range(MAX_ALLOCATION_ATTEMPTS):
+        if is_local_recording(recording_id):
+            return recording_id
+        recording_id = await backend.allocate_recording_id(recording_id)
+    raise ValueError(f"Could not allocate a recording ID for shard {settings.SHARD_INDEX}!")
+
+async def request_handoff(channel_layer, recording_id: int, timeout: float) -> bool:
+    """
+    Asks the shard of a recording to hand the recording off to this worker process, and waits for the reply.
+
+    Args:
+        channel_layer: The channel layer.
+        recording_id: The recording ID.
+        timeout: The maximum time in seconds to wait for the reply.
+
+    Returns:
+        True if the shard had state of the recording and has dropped it, false if it had no state or did not reply.
+    """
+    reply_channel = await channel_layer.new_channel()
+    await channel_layer.send(get_shard_channel(get_recording_shard(recording_id)), {
+        "type": "shard.handoff",
+        "recording_id": recording_id,
+        "reply_channel": reply_channel
+    })
+    try:
+        reply = await asyncio.wait_for(channel_layer.receive(reply_channel), timeout)
+    except asyncio.TimeoutError:
+        logger.warning(f"No handoff reply for recording {recording_id} from shard {get_recording_shard(recording_id)}.")
+        return False
+    return bool(reply.get("released"))
+
+async def run_shard_listener(channel_layer, shard_index: int, handoff_handler):
+    """
+    Receives the messages to a shard and replies to them.
+
+    Args:
+        channel_layer: The channel layer.
+        shard_index: The index of the shard.
+        handoff_handler: Called with the recording ID of a handoff, returns true if state of the recording was dropped.
+    """
+    channel = get_shard_channel(shard_index)
+    while True:
+        message = await channel_layer.receive(channel)
+        if message.get("type") != "shard.handoff":
+            logger.warning(f"Unknown message on shard channel {channel}: {message.get('type')}")
+            continue
+        try:
+            released = handoff_handler(message["recording_id"])
+        except Exception as e:
+            logger.error(f"Error handing off recording {message.get('recording_id')}: {e}")
+            released = False
+        await channel_layer.send(message["reply_channel"], {
+            "type": "shard.handoff_done",
+            "recording_id": message["recording_id"],
+            "released": released
+        })
+
+# a listener per event loop of the worker process
+_listeners = weakref.WeakKeyDictionary()
+
+def ensure_shard_listener(channel_layer, handoff_handler):
+    """Starts the listener of the shard of this worker process, if the server is sharded and it is not running."""
+    if not is_sharded() or channel_layer is None:
+        return
+    loop = asyncio.get_running_loop()
+    task = _listeners.get(loop)
+    if task is None or task.done():
+        _listeners[loop] = loop.create_task(run_shard_listener(channel_layer, settings.SHARD_INDEX, handoff_handler))
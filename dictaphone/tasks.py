@@ -2,39 +2,42 @@ from celery import shared_task
 from celery.contrib.abortable import AbortableTask
 import subprocess
 import os
+import tempfile
 import time
 import logging
 from pathlib import Path
+from .archive_util import resolve_audio_path
+from .transcriber_util import get_transcriber_backend
 
 logger = logging.getLogger(__name__)
 
 @shared_task(bind=True, base=AbortableTask)
 def transcription_task(self, recording_directory, recording_file_path, model_size, language):
     logger.info("Starting the transcription task now...")
+    # a task cancelled while it was queued is not started, writing the STARTED state would overwrite ABORTED
+    if self.is_aborted():
+        logger.info("Task was aborted before it was started.")
+        return "TASK ABORTED"
+    # the server measures the time the task waited for a worker from the start time
+    self.update_state(state='STARTED', meta={'start_time': time.time()})
+    # an archived recording is transcribed from the flac file, the transcriber decodes it
+    recording_file_path = resolve_audio_path(recording_file_path) or recording_file_path
     logger.info(f"Transcribing file: {recording_file_path}")
     output_dir_path: str = os.path.join(recording_directory, 'TRANSCRIPTIONS/')
     os.makedirs(output_dir_path, exist_ok=True)
     transcriber_output_file: str = os.path.join(output_dir_path, "transcriber_output.txt")
     process = None  # Initialize the process variable
+    stdout_file = stderr_file = None
 
     try:
-        # Prepare the command based on the language
-        if language == 'auto':
-            command = [
-                'python', 'dictaphone/aau-whisper/app.py', '--job_name', 'files',
-                '-o', output_dir_path, '-m', model_size, '--input', recording_file_path,
-                '--merge_speakers', '--threads', '4', '--transcriber_gui'
-            ]
-        else:
-            command = [
-                'python', 'dictaphone/aau-whisper/app.py', '--job_name', 'files',
-                '-o', output_dir_path, '-m', model_size, '--language', language,
-                '--input', recording_file_path, '--merge_speakers', '--threads', '4',
-                '--transcriber_gui'
-            ]
+        # the command of the transcriber selected by the TRANSCRIBER_BACKEND setting
+        command = get_transcriber_backend().build_command(recording_file_path, output_dir_path, model_size, language)
 
-        # Start the subprocess
-        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        # Start the subprocess, the output is collected in temporary files, a pipe that is not read while the
+        # process runs blocks the process when the pipe buffer is full
+        stdout_file = tempfile.TemporaryFile(mode='w+')
+        stderr_file = tempfile.TemporaryFile(mode='w+')
+        process = subprocess.Popen(command, stdout=stdout_file, stderr=stderr_file, text=True)
 
         # Periodically check if the task is aborted
         while process.poll() is None:  # While the process is still running
@@ -47,8 +50,9 @@ def transcription_task(self, recording_directory, recording_file_path, model_siz
             time.sleep(2)  # Add a 2-second delay to reduce CPU usage
 
         # Capture the output and error after the process completes
-        output, error = process.communicate()
-        write_transcriber_output(error, output, transcriber_output_file, recording_directory, model_size)
+        process.wait()
+        write_transcriber_output(read_output(stderr_file), read_output(stdout_file), transcriber_output_file,
+                                 recording_directory, model_size)
     except subprocess.CalledProcessError as e:
         write_transcriber_output(e.stderr, e.stdout, transcriber_output_file, recording_directory, model_size)
 
@@ -57,9 +61,16 @@ def transcription_task(self, recording_directory, recording_file_path, model_siz
         if process and process.poll() is None:
             process.terminate()
             process.wait()
+        for output_file in (stdout_file, stderr_file):
+            if output_file is not None:
+                output_file.close()
 
     return "Task completed"
 
+def read_output(output_file) -> str:
+    output_file.seek(0)
+    return output_file.read()
+
 def write_transcriber_output(error, output, transcriber_output_file, directory: str, model: str, ):
     # create a list of input files
     path = Path(directory)
@@ -71,7 +82,7 @@ def write_transcriber_output(error, output, transcriber_output_file, directory:
         logger.error(f"Error when writing transcription output: '{directory}' is not a directory.")
         return []
     # Iterate through the directory and filter for files
-    input_file_list = [item.name for item in path.iterdir() if item.is_file() and item.name.lower().endswith(".wav")]
+    input_file_list = [item.name for item in path.iterdir() if item.is_file() and item.name.lower().endswith((".wav", ".flac"))]
     output_header = f"Model: {model}, Input files:\n"
     for file_name in input_file_list:
         output_header = output_header + f"{file_name}\n"
@@ -0,0 +1,92 @@
+import asyncio
+import concurrent.futures
+import importlib.util
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+from .archive_util import encode_wav_to_flac, iter_restored_wav, resolve_audio_path, get_audio_file_size, archive_recording, get_archive_manifest
+
+REFERENCE_FILE = Path(__file__).parent / "resources" / "test_chunks" / "recording.wav"
+
+@unittest.skipUnless(importlib.util.find_spec("soundfile"), "soundfile is not installed")
+class TestArchiveUtil(unittest.TestCase):
+    def setUp(self):
+        # Create a temporary recording directory with a copy of the test recording
+        self.test_dir = tempfile.TemporaryDirectory()
+        self.recording_path = Path(self.test_dir.name) / "1_Meeting"
+        self.recording_path.mkdir()
+        self.wav_path = self.recording_path / "Meeting.wav"
+        self.flac_path = self.recording_path / "Meeting.flac"
+        shutil.copy(REFERENCE_FILE, self.wav_path)
+
+    def tearDown(self):
+        self.test_dir.cleanup()
+
+    def test_encode_and_restore(self):
+        """Test that the archived form restores the original WAV file byte for byte."""
+        manifest = encode_wav_to_flac(str(self.wav_path), str(self.flac_path))
+        self.assertEqual(manifest['original_size'], REFERENCE_FILE.stat().st_size)
+        self.assertEqual(manifest['archived_size'], self.flac_path.stat().st_size)
+        self.assertGreater(manifest['compression_ratio'], 1.0)
+        restored = b"".join(iter_restored_wav(str(self.flac_path), manifest))
+        self.assertEqual(restored, REFERENCE_FILE.read_bytes())
+
+    def test_encode_keeps_incomplete_frame(self):
+        """Test that bytes after the last complete audio frame are restored."""
+        with open(self.wav_path, 'ab') as f:
+            f.write(b"\x01\x02\x03")
+        manifest = encode_wav_to_flac(str(self.wav_path), str(self.flac_path))
+        restored = b"".join(iter_restored_wav(str(self.flac_path), manifest))
+        self.assertEqual(restored, self.wav_path.read_bytes())
+
+    def test_encode_rejects_non_wav(self):
+        """Test that files that are not 16-bit PCM WAV files are not archived."""
+        self.wav_path.write_bytes(b"not a wav file")
+        with self.assertRaises(ValueError):
+            encode_wav_to_flac(str(self.wav_path), str(self.flac_path))
+        self.assertFalse(self.flac_path.exists())
+
+    def test_archive_recording(self):
+        """Test that archiving replaces the WAV file with the FLAC file and writes the manifest."""
+        manifest = asyncio.run(archive_recording(str(self.recording_path), str(self.wav_path)))
+        self.assertIsNotNone(manifest)
+        self.assertFalse(self.wav_path.exists())
+        self.assertEqual(get_archive_manifest(str(self.recording_path))['file'], "Meeting.flac")
+        self.assertEqual(resolve_audio_path(str(self.wav_path)), str(self.flac_path))
+        self.assertEqual(get_audio_file_size(str(self.wav_path)), REFERENCE_FILE.stat().st_size)
+
+    def test_archive_keeps_changed_recording(self):
+        """Test that the WAV file is kept if the recording is written to or resumed while it is encoded."""
+        from . import archive_util
+
+        def encode_and_append(wav_path, flac_path):
+            manifest = encode_wav_to_flac(wav_path, flac_path)
+            with open(wav_path, 'ab') as f:
+                f.write(bytes(4))
+            return manifest
+
+        with mock.patch.object(archive_util, 'get_archive_pool', concurrent.futures.ThreadPoolExecutor), \
+                mock.patch.object(archive_util, 'encode_wav_to_flac', encode_and_append):
+            self.assertIsNone(asyncio.run(archive_recording(str(self.recording_path), str(self.wav_path))))
+        self.assertEqual(self.wav_path.stat().st_size, REFERENCE_FILE.stat().st_size + 4)
+        self.assertFalse(self.flac_path.exists())
+        self.assertIsNone(get_archive_manifest(str(self.recording_path)))
+
+        self.assertIsNone(asyncio.run(archive_recording(str(self.recording_path), str(self.wav_path),
+                                                        can_remove_wav=lambda: False)))
+        self.assertTrue(self.wav_path.exists())
+        self.assertFalse(self.flac_path.exists())
+
+    def test_load_archived_recording(self):
+        """Test that an archived recording without a WAV file is loaded, and not cleaned up."""
+        from dictaphone.audio_data_consumer import load_all_recordings_status, RecordingStatus
+        (self.recording_path / "completion_log.txt").write_text("Recording ID: 1\nStatus: VERIFIED\n")
+        asyncio.run(archive_recording(str(self.recording_path), str(self.wav_path)))
+        statuses = load_all_recordings_status(self.test_dir.name)
+        self.assertEqual(len(statuses), 1)
+        self.assertEqual(statuses[0]['status'], RecordingStatus.VERIFIED)
+        self.assertEqual(statuses[0]['file_path'], str(self.wav_path))
+        self.assertEqual(statuses[0]['file_size'], REFERENCE_FILE.stat().st_size)
+        self.assertTrue((self.recording_path / "completion_log.txt").exists())
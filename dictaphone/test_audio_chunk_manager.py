@@ -1,8 +1,11 @@
 import os
+import shutil
+import tempfile
 import unittest
 from pathlib import Path
 import asyncio
 import functools
+import importlib.util
 
 def async_test(coro):
     """A decorator to run async test methods with the standard unittest runner."""
@@ -24,7 +27,10 @@ class TestAudioChunkManager(unittest.TestCase):
         current_path = Path(os.path.dirname(os.path.realpath(__file__)))
         self.chunks_dir = current_path / "resources/test_chunks"
         self.reference_file = current_path / "resources/test_chunks/recording.wav"
-        self.output_file = current_path / "resources/test_chunks/output.wav"
+        # the output is written to a temporary directory, the manager also writes the waveform peaks next to it
+        self.output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_dir, ignore_errors=True)
+        self.output_file = Path(self.output_dir) / "output.wav"
         self.consumer = DummyConsumer()
         from dictaphone.audio_data_consumer import AudioChunkManager
         self.manager = AudioChunkManager(self.consumer, load_data_from_server=False)
@@ -106,6 +112,538 @@ class TestAudioChunkManager(unittest.TestCase):
             await self.manager.add_chunk(self.recording_id, idx, data)
         self.compare_output_to_reference()
 
+    @async_test
+    async def test_finalize_waits_for_late_chunk(self):
+        print("Running test: test_finalize_waits_for_late_chunk()")
+        from dictaphone.audio_data_consumer import RecordingStatus
+        # 6) Stop the recording with chunk 2 missing, finalization completes when chunk 2 arrives
+        for idx in [0, 1, 3, 4]:
+            await self.manager.add_chunk(self.recording_id, idx, self.load_chunk(idx))
+        self.consumer.sent_messages.clear()
+        finalize_task = asyncio.create_task(self.manager.finalize_active_recording(5))
+        await asyncio.sleep(0.1)
+        self.assertEqual(self.consumer.sent_messages, [{'message_type': 'request_chunk', 'recording_id': self.recording_id, 'chunk_index': 2}])
+        self.assertFalse(finalize_task.done())
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        await self.manager.add_chunk(self.recording_id, 2, self.load_chunk(2))
+        self.assertTrue(await finalize_task)
+        # finalization is woken up by add_chunk, not by polling
+        self.assertLess(loop.time() - start, 0.1)
+        self.assertEqual(self.manager.get_recording_status(self.recording_id), RecordingStatus.VERIFIED)
+        self.compare_output_to_reference()
+
+    @async_test
+    async def test_finalize_timeout_with_backoff(self):
+        print("Running test: test_finalize_timeout_with_backoff()")
+        # 7) Chunk 2 never arrives, it is requested again with exponential backoff until the timeout
+        for idx in [0, 1, 3, 4]:
+            await self.manager.add_chunk(self.recording_id, idx, self.load_chunk(idx))
+        self.consumer.sent_messages.clear()
+        # resend requests at 0, 0.5 and 1.5 seconds, timeout at 2 seconds
+        self.assertFalse(await self.manager.finalize_active_recording(5, timeout=2.0))
+        self.assertEqual(len(self.consumer.sent_messages), 3)
+        self.assertTrue(all(msg['chunk_index'] == 2 for msg in self.consumer.sent_messages))
+        self.assertEqual(self.manager.get_recording_status(self.recording_id), 'active')
+
+    @async_test
+    async def test_rename_title_id_layout(self):
+        print("Running test: test_rename_title_id_layout()")
+        # 8) In the id layout a rename only rewrites the metadata file, and the title is loaded from the metadata file
+        from dictaphone.audio_data_consumer import load_all_recordings_status, RecordingStatus
+        from dictaphone.recording_metadata_util import write_metadata, read_metadata, ID_LAYOUT
+        base_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, base_path)
+        recording_path = os.path.join(base_path, "7")
+        os.makedirs(os.path.join(recording_path, "TRANSCRIPTIONS"))
+        shutil.copy(self.reference_file, os.path.join(recording_path, "7.wav"))
+        Path(recording_path, "TRANSCRIPTIONS", "7.txt").write_text("transcription")
+        Path(recording_path, "completion_log.txt").write_text("Recording ID: 7\nStatus: VERIFIED\n")
+        write_metadata(recording_path, {'title': "Meeting"})
+        self.manager.recording_base_path = base_path + "/"
+        self.manager.recordings[7] = {
+            'id': 7,
+            'title': "Meeting",
+            'status': RecordingStatus.VERIFIED,
+            'layout': ID_LAYOUT,
+            'recording_path': recording_path,
+            'recording_file_path': os.path.join(recording_path, "7.wav")
+        }
+
+        self.assertTrue(await self.manager.rename_title(7, "Board meeting"))
+        self.assertEqual(read_metadata(recording_path)['title'], "Board_meeting")
+        # the completion log of an older version is migrated to the event log when the rename is logged
+        self.assertEqual(sorted(os.listdir(recording_path)), ["7.wav", "TRANSCRIPTIONS", "events.jsonl", "metadata.json"])
+        self.assertEqual(os.listdir(os.path.join(recording_path, "TRANSCRIPTIONS")), ["7.txt"])
+        self.assertEqual(self.manager.get_file_path(7), os.path.join(recording_path, "7.wav"))
+
+        statuses = load_all_recordings_status(base_path)
+        self.assertEqual(len(statuses), 1)
+        self.assertEqual(statuses[0]['recording_id'], 7)
+        self.assertEqual(statuses[0]['title'], "Board_meeting")
+        self.assertEqual(statuses[0]['layout'], ID_LAYOUT)
+        self.assertEqual(statuses[0]['file_path'], os.path.join(recording_path, "7.wav"))
+
+    @async_test
+    async def test_delete_recording_moves_to_trash(self):
+        print("Running test: test_delete_recording_moves_to_trash()")
+        # 9) Delete moves the recording directory to the trash, the space is reclaimed in the background
+        from dictaphone.audio_data_consumer import load_all_recordings_status, RecordingStatus
+        from dictaphone.trash_util import get_trash_collector, TRASH_DIR_NAME
+        base_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, base_path)
+        recording_path = os.path.join(base_path, "8_Meeting")
+        os.makedirs(recording_path)
+        shutil.copy(self.reference_file, os.path.join(recording_path, "Meeting.wav"))
+        self.manager.recording_base_path = base_path + "/"
+        self.manager.recordings[8] = {
+            'id': 8,
+            'title': "Meeting",
+            'status': RecordingStatus.VERIFIED,
+            'recording_path': recording_path,
+            'recording_file_path': os.path.join(recording_path, "Meeting.wav")
+        }
+
+        self.assertTrue(await self.manager.delete_recording(8))
+        self.assertNotIn(8, self.manager.recordings)
+        self.assertFalse(os.path.exists(recording_path))
+        # the trash is not loaded as a recording
+        self.assertEqual(load_all_recordings_status(base_path), [])
+        get_trash_collector().wait_until_empty()
+        self.assertEqual(os.listdir(os.path.join(base_path, TRASH_DIR_NAME)), [])
+
+
+    @async_test
+    async def test_waveform_peaks_built_during_assembly(self):
+        print("Running test: test_waveform_peaks_built_during_assembly()")
+        # 10) The waveform peaks are built from the chunks as they are written, and match peaks built from the file
+        from dictaphone.waveform_util import build_waveform, get_level_file_path, WAVEFORM_DIR_NAME, NUMBER_OF_LEVELS
+        for idx in [0, 2, 1, 4, 3]:
+            await self.manager.add_chunk(self.recording_id, idx, self.load_chunk(idx))
+        self.manager.finish_waveform(self.recording_id)
+        reference_waveform_path = os.path.join(self.output_dir, "reference_waveform")
+        build_waveform([self.reference_file.read_bytes()], reference_waveform_path)
+        for level in range(NUMBER_OF_LEVELS):
+            with open(get_level_file_path(os.path.join(self.output_dir, WAVEFORM_DIR_NAME), level), "rb") as f1, \
+                    open(get_level_file_path(reference_waveform_path, level), "rb") as f2:
+                self.assertEqual(f1.read(), f2.read())
+
+
+    @async_test
+    async def test_quality_summary_saved_to_metadata(self):
+        print("Running test: test_quality_summary_saved_to_metadata()")
+        # 11) Quality statistics are computed per chunk, sent as throttled events, and saved in the metadata file
+        from dictaphone.recording_metadata_util import read_metadata
+        for idx in range(5):
+            await self.manager.add_chunk(self.recording_id, idx, self.load_chunk(idx))
+        first_event = self.manager.pop_quality_event(self.recording_id)
+        self.assertIsNotNone(first_event)
+        # throttled, the next event is sent after QUALITY_EVENT_INTERVAL seconds
+        self.assertIsNone(self.manager.pop_quality_event(self.recording_id))
+        self.manager.save_quality_summary(self.recording_id)
+        quality = read_metadata(self.output_dir)['quality']
+        self.assertEqual(quality, first_event)
+        self.assertEqual(set(quality), {'rms_dbfs', 'peak_dbfs', 'clipped_samples', 'clip_ratio', 'silence_ratio', 'warnings'})
+
+
+    @async_test
+    async def test_search_transcriptions_follows_rename_and_delete(self):
+        print("Running test: test_search_transcriptions_follows_rename_and_delete()")
+        # 12) The transcription index is synced on the first search, and updated on rename and delete
+        from dictaphone.audio_data_consumer import RecordingStatus
+        base_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, base_path)
+        recording_path = os.path.join(base_path, "9_Meeting")
+        os.makedirs(os.path.join(recording_path, "TRANSCRIPTIONS"))
+        shutil.copy(self.reference_file, os.path.join(recording_path, "Meeting.wav"))
+        Path(recording_path, "TRANSCRIPTIONS", "Meeting.srt").write_text("1\n00:00:02,000 --> 00:00:03,000\nQuarterly figures\n")
+        self.manager.recording_base_path = base_path + "/"
+        self.manager.recordings[9] = {
+            'id': 9,
+            'title': "Meeting",
+            'status': RecordingStatus.VERIFIED,
+            'recording_path': recording_path,
+            'recording_file_path': os.path.join(recording_path, "Meeting.wav")
+        }
+
+        hits = (await self.manager.search_transcriptions("quarterly", 10))['hits']
+        self.assertEqual([(hit['recording_id'], hit['title'], hit['file_name'], hit['start']) for hit in hits],
+                         [(9, "Meeting", "Meeting.srt", 2.0)])
+        self.assertTrue(await self.manager.rename_title(9, "Review"))
+        await self.manager.index_transcriptions(9)
+        hits = (await self.manager.search_transcriptions("quarterly", 10))['hits']
+        self.assertEqual([(hit['title'], hit['file_name']) for hit in hits], [("Review", "Review.srt")])
+        self.assertTrue(await self.manager.delete_recording(9))
+        await self.manager.remove_transcriptions_from_index(9)
+        self.assertEqual(await self.manager.search_transcriptions("quarterly", 10), {'hits': [], 'truncated': False})
+
+
+    @async_test
+    async def test_recordings_pages_and_delta_sync(self):
+        print("Running test: test_recordings_pages_and_delta_sync()")
+        # 13) Recordings are paged newest first, and a client with a known version only gets the changes
+        from dictaphone.audio_data_consumer import AudioChunkManager, load_all_recordings_status, load_recording_status
+        from dictaphone.recording_library_util import RecordingLibrary
+        base_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, base_path)
+        for recording_id, title in [(1, "A"), (2, "B"), (3, "C")]:
+            recording_path = os.path.join(base_path, f"{recording_id}_{title}")
+            os.makedirs(recording_path)
+            shutil.copy(self.reference_file, os.path.join(recording_path, f"{title}.wav"))
+            Path(recording_path, "completion_log.txt").write_text(f"Recording ID: {recording_id}\nStatus: VERIFIED\n")
+        library = RecordingLibrary(base_path, load_all_recordings_status, load_recording_status)
+        manager = AudioChunkManager(self.consumer, load_data_from_server=False)
+        manager.library = library
+        statuses, manager.library_version = library.get_snapshot()
+        manager.initialize_recording_data(statuses, {'micBoostLevel': 1})
+
+        page = await manager.get_recordings_page(page_size=2)
+        self.assertEqual([recording['recording_id'] for recording in page['recordings']], [3, 2])
+        self.assertEqual((page['total'], page['next_cursor'], page['delta'], page['version']), (3, 2, False, 0))
+        page = await manager.get_recordings_page(cursor=page['next_cursor'], page_size=2)
+        self.assertEqual([recording['recording_id'] for recording in page['recordings']], [1])
+        self.assertIsNone(page['next_cursor'])
+
+        changes = []
+        library.add_listener(lambda *change: changes.append(change))
+        os.makedirs(os.path.join(base_path, "2_B", "TRANSCRIPTIONS"))
+        Path(base_path, "2_B", "TRANSCRIPTIONS", "B.txt").write_text("transcription")
+        shutil.rmtree(os.path.join(base_path, "3_C"))
+        library.refresh({"2_B", "3_C"})
+        await manager.apply_library_changes(*changes[0])
+        page = await manager.get_recordings_page(library.epoch, 0)
+        self.assertEqual([recording['recording_id'] for recording in page['recordings']], [2])
+        self.assertEqual(page['recordings'][0]['results'][0]['file_name'], "B.txt")
+        self.assertEqual((page['deleted'], page['delta'], page['version']), ([3], True, 1))
+        # nothing changed since the current version
+        page = await manager.get_recordings_page(library.epoch, 1)
+        self.assertEqual((page['recordings'], page['deleted'], page['total']), ([], [], 0))
+        # versions of another epoch, e.g. before a server restart, get all recordings
+        page = await manager.get_recordings_page("another epoch", 1)
+        self.assertEqual(([recording['recording_id'] for recording in page['recordings']], page['delta']), ([2, 1], False))
+
+
+    @async_test
+    async def test_slow_rename_does_not_stall_other_recordings(self):
+        print("Running test: test_slow_rename_does_not_stall_other_recordings()")
+        # 14) Chunks of many parallel recordings are added while a slow rename of another recording holds its lock
+        import threading
+        import time
+        from unittest import mock
+        import dictaphone.audio_data_consumer as audio_data_consumer
+        from dictaphone.audio_data_consumer import RecordingStatus
+        parallel_recordings = 16
+        for recording_id in range(2, parallel_recordings + 2):
+            self.manager.recordings[recording_id] = {
+                'id': recording_id,
+                'title': f"test_{recording_id}",
+                'status': 'active',
+                'flushed_index': None,
+                'chunks': {},
+                'recording_file_path': os.path.join(self.output_dir, f"output_{recording_id}.wav")
+            }
+        recording_path = os.path.join(self.output_dir, "100_Meeting")
+        os.makedirs(recording_path)
+        shutil.copy(self.reference_file, os.path.join(recording_path, "Meeting.wav"))
+        self.manager.recording_base_path = self.output_dir + "/"
+        self.manager.recordings[100] = {
+            'id': 100,
+            'title': "Meeting",
+            'status': RecordingStatus.VERIFIED,
+            'recording_path': recording_path,
+            'recording_file_path': os.path.join(recording_path, "Meeting.wav")
+        }
+        original_safe_rename = audio_data_consumer.safe_rename
+        rename_released = threading.Event()
+        def slow_safe_rename(source, target):
+            # e.g. a rename on a slow network file system, it is released when all chunks have been added
+            rename_released.wait(timeout=10)
+            original_safe_rename(source, target)
+
+        latencies = []
+        async def add_chunks(recording_id):
+            for idx in range(5):
+                start = time.perf_counter()
+                self.assertTrue(await self.manager.add_chunk(recording_id, idx, self.load_chunk(idx)))
+                latencies.append(time.perf_counter() - start)
+                await asyncio.sleep(0.01)
+
+        with mock.patch.object(audio_data_consumer, "safe_rename", slow_safe_rename):
+            rename_task = asyncio.create_task(self.manager.rename_title(100, "Review"))
+            await asyncio.sleep(0.05)
+            await asyncio.gather(*(add_chunks(recording_id) for recording_id in range(2, parallel_recordings + 2)))
+            self.assertFalse(rename_task.done(), "the rename finished before the chunks were added")
+            rename_released.set()
+            self.assertTrue(await rename_task)
+
+        self.assertEqual(len(latencies), parallel_recordings * 5)
+        self.assertLess(max(latencies), 0.25)
+        with open(self.reference_file, "rb") as f:
+            reference = f.read()
+        for recording_id in range(2, parallel_recordings + 2):
+            with open(self.manager.recordings[recording_id]['recording_file_path'], "rb") as f:
+                self.assertEqual(f.read(), reference)
+        self.assertEqual(self.manager.recordings[100]['title'], "Review")
+
+
+    @async_test
+    async def test_parallel_streams_throughput(self):
+        print("Running test: test_parallel_streams_throughput()")
+        # 15) K recordings are streamed at the same time, each with its own chunk order, flush index and finalization
+        import random
+        import time
+        from dictaphone.audio_data_consumer import RecordingStatus
+        parallel_streams = 8
+        chunks = [self.load_chunk(idx) for idx in range(5)]
+        recording_ids = list(range(2, parallel_streams + 2))
+        for recording_id in recording_ids:
+            self.manager.recordings[recording_id] = {
+                'id': recording_id,
+                'title': f"test_{recording_id}",
+                'status': 'active',
+                'flushed_index': None,
+                'chunks': {},
+                'recording_file_path': os.path.join(self.output_dir, f"output_{recording_id}.wav")
+            }
+        self.assertEqual(self.manager.get_active_recording_ids(), [self.recording_id] + recording_ids)
+        # the last stream holds back chunk 2 until the other streams are finalized
+        late_recording_id = recording_ids[-1]
+
+        async def stream(recording_id):
+            order = list(range(5))
+            random.Random(recording_id).shuffle(order)
+            if recording_id == late_recording_id:
+                order.remove(2)
+            for idx in order:
+                self.assertTrue(await self.manager.add_chunk(recording_id, idx, chunks[idx]))
+                await asyncio.sleep(0)
+            return await self.manager.finalize_recording(recording_id, 5)
+
+        start = time.perf_counter()
+        tasks = {recording_id: asyncio.create_task(stream(recording_id)) for recording_id in recording_ids}
+        # the streams are finalized independently, without waiting for the late chunk of another stream
+        self.assertTrue(all(await asyncio.gather(*(tasks[recording_id] for recording_id in recording_ids[:-1]))))
+        self.assertFalse(tasks[late_recording_id].done())
+        self.assertEqual(self.manager.get_active_recording_ids(), [self.recording_id, late_recording_id])
+        # out of order chunks are requested again from their own stream
+        self.assertIn({'message_type': 'request_chunk', 'recording_id': late_recording_id, 'chunk_index': 2}, self.consumer.sent_messages)
+        self.assertTrue(all(msg['recording_id'] in recording_ids for msg in self.consumer.sent_messages))
+        self.assertTrue(await self.manager.add_chunk(late_recording_id, 2, chunks[2]))
+        self.assertTrue(await tasks[late_recording_id])
+        elapsed = time.perf_counter() - start
+        print(f"{parallel_streams} parallel streams, {parallel_streams * 5 / elapsed:.0f} chunks/s")
+
+        with open(self.reference_file, "rb") as f:
+            reference = f.read()
+        for recording_id in recording_ids:
+            self.assertEqual(self.manager.get_recording_status(recording_id), RecordingStatus.VERIFIED)
+            with open(self.manager.recordings[recording_id]['recording_file_path'], "rb") as f:
+                self.assertEqual(f.read(), reference)
+        # the first recording is still active and unaffected by the other streams
+        self.assertEqual(self.manager.get_active_recording_ids(), [self.recording_id])
+        self.assertEqual(self.manager.get_active_recording_id(), self.recording_id)
+
+
+    @async_test
+    async def test_resume_after_server_crash(self):
+        print("Running test: test_resume_after_server_crash()")
+        # 16) The server crashes with chunk 2 missing, the received chunks are recovered from the chunk journal
+        from dictaphone.audio_data_consumer import (AudioChunkManager, load_recording_status, interrupted_recordings,
+                                                    RecordingStatus)
+        from dictaphone.chunk_journal_util import get_journal_path
+        recording_path = os.path.join(self.output_dir, "7_Crash")
+        os.makedirs(recording_path)
+        self.manager.recordings[7] = {
+            'id': 7,
+            'title': "Crash",
+            'status': 'active',
+            'flushed_index': None,
+            'chunks': {},
+            'recording_path': recording_path,
+            'recording_file_path': os.path.join(recording_path, "Crash.wav")
+        }
+        for idx in [0, 1, 3]:
+            await self.manager.add_chunk(7, idx, self.load_chunk(idx))
+        # a torn write of chunk 4 when the server crashes
+        with open(self.manager.recordings[7]['recording_file_path'], "ab") as f:
+            f.write(self.load_chunk(4)[:100])
+        with open(get_journal_path(recording_path), "ab") as f:
+            f.write(b"\x01\x00")
+        self.manager.recordings[7]['journal'].close()
+
+        # the startup scan after the restart recovers the recording
+        self.addCleanup(interrupted_recordings.pop, 7, None)
+        status = load_recording_status(self.output_dir, "7_Crash", clean_up=True)
+        self.assertEqual(status['status'], RecordingStatus.INTERRUPTED_NOT_VERIFIED)
+        self.assertEqual(status['file_size'], len(self.load_chunk(0)) + len(self.load_chunk(1)))
+        manager = AudioChunkManager(self.consumer, load_data_from_server=False)
+        manager.recordings[7] = interrupted_recordings[7].copy()
+        self.assertEqual(await manager.resume_recording(7), {'high_water_mark': 2, 'missing_chunks': [2]})
+        # only the missing chunks are sent again
+        for idx in [2, 4]:
+            self.assertTrue(await manager.add_chunk(7, idx, self.load_chunk(idx)))
+        self.assertTrue(await manager.finalize_recording(7, 5))
+        with open(manager.recordings[7]['recording_file_path'], "rb") as f1, open(self.reference_file, "rb") as f2:
+            self.assertEqual(f1.read(), f2.read())
+
+    @unittest.skipIf(importlib.util.find_spec("redislite") is None, "redislite is not installed")
+    @async_test
+    async def test_resume_in_another_server_process(self):
+        print("Running test: test_resume_in_another_server_process()")
+        # 17) Two server processes share the recording state through Redis, the recording is resumed in the other process
+        import redislite
+        from dictaphone.audio_data_consumer import AudioChunkManager, interrupted_recordings, RecordingStatus
+        from dictaphone.recording_state_util import RedisRecordingStateBackend
+        server = redislite.Redis()
+        self.addCleanup(server.shutdown)
+        url = f"unix://{server.socket_file}"
+        recording_path = os.path.join(self.output_dir, "9_Meeting")
+        os.makedirs(recording_path)
+        # the recording as loaded from the shared storage by each process
+        stored_recording = {
+            'id': 9,
+            'title': "Meeting",
+            'status': RecordingStatus.INTERRUPTED_VERIFIED,
+            'recording_path': recording_path,
+            'recording_file_path': os.path.join(recording_path, "Meeting.wav")
+        }
+        node_a = AudioChunkManager(self.consumer, load_data_from_server=False)
+        node_b = AudioChunkManager(DummyConsumer(), load_data_from_server=False)
+        node_a.state_backend = RedisRecordingStateBackend(url)
+        node_b.state_backend = RedisRecordingStateBackend(url)
+        self.assertEqual(await node_a.state_backend.allocate_recording_id(8), 9)
+        node_a.recordings[9] = {**stored_recording, 'status': 'active', 'flushed_index': None, 'chunks': {},
+                                'lease_token': await node_a.state_backend.acquire_lease(9, node_a.owner_id, 10)}
+        node_b.recordings[9] = stored_recording.copy()
+        for idx in [0, 1, 3]:
+            await node_a.add_chunk(9, idx, self.load_chunk(idx))
+        # the recording is owned by the connection in the first process
+        self.assertIsNone(await node_b.resume_recording(9))
+
+        # the client disconnects, and reconnects to the second process
+        self.addCleanup(interrupted_recordings.pop, 9, None)
+        self.assertFalse(await node_a.finalize_recording(9))
+        node_a.set_recording_status(9, RecordingStatus.DATA_LOSS)
+        node_a.detach_interrupted_recording(9)
+        await node_a.release_recording(9)
+        stale_state = interrupted_recordings.pop(9)
+        self.assertEqual(await node_b.resume_recording(9), {'high_water_mark': 2, 'missing_chunks': [2]})
+        self.assertTrue(await node_b.add_chunk(9, 2, self.load_chunk(2)))
+        self.assertTrue(await node_b.finalize_recording(9))
+        await node_b.release_recording(9)
+
+        # the client reconnects to the first process, its state of the recording is stale and rebuilt from the journal
+        interrupted_recordings[9] = stale_state
+        self.assertEqual(await node_a.resume_recording(9), {'high_water_mark': 4, 'missing_chunks': []})
+        self.assertTrue(await node_a.add_chunk(9, 4, self.load_chunk(4)))
+        self.assertTrue(await node_a.finalize_recording(9, 5))
+        with open(stored_recording['recording_file_path'], "rb") as f1, open(self.reference_file, "rb") as f2:
+            self.assertEqual(f1.read(), f2.read())
+        # the peaks written before each resume are rebuilt, and continued with the chunks after the resume
+        from dictaphone.waveform_util import build_waveform, get_level_file_path, WAVEFORM_DIR_NAME, NUMBER_OF_LEVELS
+        node_a.finish_waveform(9)
+        reference_waveform_path = os.path.join(self.output_dir, "reference_waveform")
+        build_waveform([self.reference_file.read_bytes()], reference_waveform_path)
+        for level in range(NUMBER_OF_LEVELS):
+            with open(get_level_file_path(os.path.join(recording_path, WAVEFORM_DIR_NAME), level), "rb") as f1, \
+                    open(get_level_file_path(reference_waveform_path, level), "rb") as f2:
+                self.assertEqual(f1.read(), f2.read())
+
+    @async_test
+    async def test_interrupted_recording_state_expires(self):
+        print("Running test: test_interrupted_recording_state_expires()")
+        # 18) The state of an interrupted recording that is not resumed is dropped when another recording is interrupted
+        import time
+        from django.conf import settings
+        from dictaphone.audio_data_consumer import interrupted_recordings
+        from dictaphone import metrics_util
+        for recording_id in [11, 12]:
+            self.manager.recordings[recording_id] = {**self.manager.recordings[self.recording_id], 'id': recording_id,
+                                                     'chunks': {},
+                                                     'recording_file_path': os.path.join(self.output_dir, f"{recording_id}.wav")}
+            self.addCleanup(interrupted_recordings.pop, recording_id, None)
+        buffered_bytes = metrics_util.BUFFERED_CHUNK_BYTES.children[()].value
+        # chunk 1 is buffered until chunk 0 is received
+        await self.manager.add_chunk(11, 1, self.load_chunk(1))
+        self.assertEqual(metrics_util.BUFFERED_CHUNK_BYTES.children[()].value, buffered_bytes + len(self.load_chunk(1)))
+        self.manager.detach_interrupted_recording(11)
+        interrupted_recordings[11]['interrupted_time'] = time.monotonic() - settings.INTERRUPTED_RECORDING_TTL_SECONDS
+        self.manager.detach_interrupted_recording(12)
+        self.assertNotIn(11, interrupted_recordings)
+        self.assertIn(12, interrupted_recordings)
+        self.assertEqual(metrics_util.BUFFERED_CHUNK_BYTES.children[()].value, buffered_bytes)
+
+    @async_test
+    async def test_interrupted_recording_closes_journal(self):
+        print("Running test: test_interrupted_recording_closes_journal()")
+        # 19) The chunk journal of an interrupted recording is closed, and opened again when the recording is resumed
+        from dictaphone.audio_data_consumer import AudioChunkManager, interrupted_recordings, release_chunk_data
+        from dictaphone.chunk_journal_util import get_journal_path, recover_journal
+        recording_path = os.path.join(self.output_dir, "13_Lecture")
+        os.makedirs(recording_path)
+        self.manager.recordings[13] = {**self.manager.recordings[self.recording_id], 'id': 13, 'chunks': {},
+                                       'recording_path': recording_path,
+                                       'recording_file_path': os.path.join(recording_path, "Lecture.wav")}
+        self.addCleanup(interrupted_recordings.pop, 13, None)
+        for idx in [0, 2]:
+            await self.manager.add_chunk(13, idx, self.load_chunk(idx))
+        journal = self.manager.recordings[13]['journal']
+        self.manager.detach_interrupted_recording(13)
+        self.assertIsNone(journal.fd)
+        self.assertNotIn('journal', interrupted_recordings[13])
+        self.assertTrue(os.path.isfile(get_journal_path(recording_path)))
+
+        manager = AudioChunkManager(self.consumer, load_data_from_server=False)
+        self.assertEqual(await manager.resume_recording(13), {'high_water_mark': 1, 'missing_chunks': [1]})
+        for idx in [1, 3, 4]:
+            self.assertTrue(await manager.add_chunk(13, idx, self.load_chunk(idx)))
+        self.assertIsNotNone(manager.recordings[13]['journal'].fd)
+        # the records after the resume continue the journal
+        self.assertEqual(recover_journal(manager.recordings[13]['recording_file_path'])['flushed_index'], 4)
+        self.assertTrue(await manager.finalize_recording(13, 5))
+        release_chunk_data(manager.recordings[13])
+        self.assertFalse(os.path.exists(get_journal_path(recording_path)))
+        with open(manager.recordings[13]['recording_file_path'], "rb") as f1, open(self.reference_file, "rb") as f2:
+            self.assertEqual(f1.read(), f2.read())
+
+    @async_test
+    async def test_archival_keeps_changed_recording(self):
+        print("Running test: test_archival_keeps_changed_recording()")
+        # 20) The WAV file of a recording is not removed by the archival if the recording was changed meanwhile
+        wav_path = str(self.output_file)
+        self.assertFalse(self.manager.can_remove_wav(self.recording_id, wav_path))
+        self.manager.recordings[self.recording_id]['status'] = 'finalized'
+        self.assertTrue(self.manager.can_remove_wav(self.recording_id, wav_path))
+        self.assertFalse(self.manager.can_remove_wav(self.recording_id, os.path.join(self.output_dir, "renamed.wav")))
+        self.manager.recordings.pop(self.recording_id)
+        self.assertFalse(self.manager.can_remove_wav(self.recording_id, wav_path))
+
+    @async_test
+    async def test_search_transcriptions_of_resumed_recording(self):
+        print("Running test: test_search_transcriptions_of_resumed_recording()")
+        # 21) The transcriptions of a recording that is receiving chunks stay in the index, and are indexed when finalized
+        from dictaphone.audio_data_consumer import RecordingStatus
+        from dictaphone.transcription_index_util import get_transcription_index
+        base_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, base_path)
+        self.manager.recording_base_path = base_path + "/"
+        for recording_id, title in [(9, "Meeting"), (10, "Lecture")]:
+            recording_path = os.path.join(base_path, f"{recording_id}_{title}")
+            os.makedirs(os.path.join(recording_path, "TRANSCRIPTIONS"))
+            Path(recording_path, "TRANSCRIPTIONS", f"{title}.srt").write_text(f"1\n00:00:02,000 --> 00:00:03,000\nQuarterly {title}\n")
+            self.manager.recordings[recording_id] = {'id': recording_id, 'title': title, 'status': 'active',
+                                                     'recording_path': recording_path,
+                                                     'recording_file_path': os.path.join(recording_path, f"{title}.wav")}
+        # the lecture was transcribed before it was resumed
+        await self.manager.index_transcriptions(10)
+        hits = (await self.manager.search_transcriptions("quarterly", 10))['hits']
+        self.assertTrue(get_transcription_index(self.manager.recording_base_path).synced)
+        self.assertEqual([hit['recording_id'] for hit in hits], [10])
+        # the meeting is indexed when it is finalized, not on a later search
+        self.manager.set_recording_status(9, RecordingStatus.VERIFIED)
+        await self.manager.index_transcriptions(9)
+        hits = (await self.manager.search_transcriptions("quarterly", 10))['hits']
+        self.assertEqual(sorted(hit['recording_id'] for hit in hits), [9, 10])
 
 if __name__ == "__main__":
-    unittest.main()
\ No newline at end of file
+    unittest.main()
@@ -4,7 +4,10 @@ import pytest
 from channels.testing import WebsocketCommunicator
 from backend.asgi import application
 from dictaphone.audio_data_consumer import AudioChunkManager, RecordingStatus
+from dictaphone.recording_events_util import read_recording_state
 import os
+import struct
+import zlib
 
 # --- Test Configuration ---
 # Integration test that tests the overall functionality of the AudioDataConsumer including correct handling of headers
@@ -31,6 +34,13 @@ def audio_chunks():
         chunks.append(file_path.read_bytes())
     return chunks
 
+def extended_header_chunk(chunk_data: bytes) -> bytes:
+    """Rewrites a chunk with a basic header into a chunk with an extended header (payload length and CRC32)."""
+    recording_id, chunk_index = struct.unpack(">II", chunk_data[:8])
+    payload = chunk_data[8:]
+    header = struct.pack(">IIII", recording_id | 0x80000000, chunk_index, len(payload), zlib.crc32(payload))
+    return header + payload
+
 @pytest.mark.asyncio
 async def test_audio_upload_and_finalize(audio_chunks, monkeypatch):
     """
@@ -204,3 +214,271 @@ async def test_disconnect_during_upload_finalize_recording_detect_data_loss(audi
     manager = manager_holder[0]
     final_status = manager.get_recording_status(recording_id)
     assert final_status == RecordingStatus.DATA_LOSS
+
+@pytest.mark.asyncio
+async def test_resume_interrupted_recording_after_reconnect(audio_chunks, monkeypatch):
+    """
+    Tests that a client can reconnect after a disconnect, resume the interrupted recording
+    from the reported high-water mark and finalize it as one verified recording.
+    """
+    manager_holder = []
+    original_init = AudioChunkManager.__init__
+
+    def mock_init(self, consumer, load_data_from_server=True):
+        original_init(self, consumer, load_data_from_server=False)
+        manager_holder.append(self)
+
+    monkeypatch.setattr(AudioChunkManager, "__init__", mock_init)
+
+    communicator = WebsocketCommunicator(application, "/ws/dictaphone/data/")
+    connected, _ = await communicator.connect()
+    assert connected, "Failed to connect to the WebSocket."
+
+    # 1. Start a new recording and send the first two chunks.
+    await communicator.send_json_to({
+        "type": "control_message",
+        "message": "start_recording",
+        "parameter": "Resumed Test Recording"
+    })
+    response = await communicator.receive_json_from()
+    recording_id = response.get("recording_id")
+    for i in range(2):
+        await communicator.send_to(bytes_data=audio_chunks[i])
+        ack = await communicator.receive_json_from()
+        assert ack.get("chunk_index") == i
+
+    # 2. Disconnect, the recording is finalized as interrupted.
+    await communicator.disconnect()
+    await asyncio.sleep(0.5)
+    assert manager_holder[0].get_recording_status(recording_id) == RecordingStatus.INTERRUPTED_VERIFIED
+
+    # 3. Reconnect and resume the recording.
+    communicator = WebsocketCommunicator(application, "/ws/dictaphone/data/")
+    connected, _ = await communicator.connect()
+    assert connected, "Failed to reconnect to the WebSocket."
+    await communicator.send_json_to({
+        "type": "control_message",
+        "message": "resume_recording",
+        "parameter": {"recordingId": recording_id}
+    })
+    response = await communicator.receive_json_from()
+    assert response.get("message_type") == "ack_resume_recording"
+    assert response.get("success") is True
+    assert response.get("high_water_mark") == 2
+    assert response.get("missing_chunks") == []
+
+    # 4. Send the remaining chunks and stop the recording.
+    for i in range(2, NUM_CHUNKS):
+        await communicator.send_to(bytes_data=audio_chunks[i])
+        ack = await communicator.receive_json_from()
+        assert ack.get("chunk_index") == i
+    await communicator.send_json_to({
+        "type": "control_message",
+        "message": "stop_recording",
+        "parameter": NUM_CHUNKS
+    })
+    final_response = await communicator.receive_json_from(timeout=15)
+    assert final_response.get("message_type") == "recording_complete"
+    assert final_response['recording_id'] == recording_id
+    assert final_response['completion_status'] == RecordingStatus.VERIFIED.value
+    assert Path(final_response['path']).read_bytes() == (TEST_DATA_DIR / "recording.wav").read_bytes()
+
+    # 5. The recording can only be resumed once.
+    await communicator.send_json_to({
+        "type": "control_message",
+        "message": "resume_recording",
+        "parameter": {"recordingId": recording_id}
+    })
+    response = await communicator.receive_json_from()
+    assert response.get("success") is False
+
+    await communicator.disconnect()
+
+@pytest.mark.asyncio
+async def test_audio_upload_with_crc32_header(audio_chunks, monkeypatch):
+    """
+    Tests that chunks with an extended header are verified, that a corrupted chunk is requested again
+    instead of being written, and that the whole-file checksum is recorded in the completion log.
+    """
+    original_init = AudioChunkManager.__init__
+
+    def mock_init(self, consumer, load_data_from_server=True):
+        original_init(self, consumer, load_data_from_server=False)
+
+    monkeypatch.setattr(AudioChunkManager, "__init__", mock_init)
+
+    communicator = WebsocketCommunicator(application, "/ws/dictaphone/data/")
+    connected, _ = await communicator.connect()
+    assert connected, "Failed to connect to the WebSocket."
+
+    await communicator.send_json_to({
+        "type": "control_message",
+        "message": "start_recording",
+        "parameter": "CRC32 test recording"
+    })
+    response = await communicator.receive_json_from()
+    assert response.get("message_type") == "ack_start_recording"
+
+    for i, chunk_data in enumerate(audio_chunks):
+        chunk = extended_header_chunk(chunk_data)
+        if i == 1:
+            # flip a bit in the payload, the server must request the chunk again
+            corrupted = bytearray(chunk)
+            corrupted[100] ^= 0x01
+            await communicator.send_to(bytes_data=bytes(corrupted))
+            request = await communicator.receive_json_from()
+            assert request.get("message_type") == "request_chunk"
+            assert request.get("chunk_index") == 1
+            # a truncated chunk must also be requested again
+            await communicator.send_to(bytes_data=chunk[:-10])
+            request = await communicator.receive_json_from()
+            assert request.get("message_type") == "request_chunk"
+            assert request.get("chunk_index") == 1
+        await communicator.send_to(bytes_data=chunk)
+        response = await communicator.receive_json_from()
+        assert response.get("message_type") == "ack_chunk"
+        assert response.get("chunk_index") == i
+
+    await communicator.send_json_to({
+        "type": "control_message",
+        "message": "stop_recording",
+        "parameter": NUM_CHUNKS
+    })
+    final_response = await communicator.receive_json_from(timeout=15)
+    assert final_response['completion_status'] == RecordingStatus.VERIFIED.value
+    reference = (TEST_DATA_DIR / "recording.wav").read_bytes()
+    assert Path(final_response['path']).read_bytes() == reference
+    recording_state = read_recording_state(str(Path(final_response['path']).parent))
+    assert recording_state['file_crc32'] == zlib.crc32(reference)
+    assert recording_state['status'] == RecordingStatus.VERIFIED.name
+
+    await communicator.disconnect()
+
+@pytest.mark.asyncio
+async def test_concurrent_recorders_with_faults(monkeypatch):
+    """
+    Tests that recordings streamed by concurrent recorders that reorder and lose chunks and reconnect, see the
+    load test in benchmarks/bench_ingest_load.py, are verified and equal to the recorded chunks.
+    """
+    from benchmarks.bench_ingest_load import run_load, CommunicatorTransport
+    from dictaphone.recording_state_util import InMemoryRecordingStateBackend
+    # the connections share the recording IDs, like the connections of a server process
+    state_backend = InMemoryRecordingStateBackend()
+    original_init = AudioChunkManager.__init__
+
+    def mock_init(self, consumer, load_data_from_server=True):
+        original_init(self, consumer, load_data_from_server=False)
+        self.state_backend = state_backend
+
+    monkeypatch.setattr(AudioChunkManager, "__init__", mock_init)
+
+    stats = await run_load(CommunicatorTransport.connect, clients=4, chunks=8, speed=100,
+                           reorder=0.2, loss=0.1, reconnect=0.1, seed=7)
+    assert stats.errors == []
+    assert stats.reconnects > 0 and stats.resent_chunks > 0
+    assert stats.verified == 4
+    assert stats.integrity_ok == 4
+    assert stats.recorded_chunks == 4 * 8
+    assert stats.ack_latencies
+
+@pytest.mark.asyncio
+async def test_bad_control_message_parameters(monkeypatch):
+    """
+    Tests that control messages with parameters that are not numbers are answered, and do not close the connection.
+    """
+    original_init = AudioChunkManager.__init__
+
+    def mock_init(self, consumer, load_data_from_server=True):
+        original_init(self, consumer, load_data_from_server=False)
+
+    monkeypatch.setattr(AudioChunkManager, "__init__", mock_init)
+
+    communicator = WebsocketCommunicator(application, "/ws/dictaphone/data/")
+    connected, _ = await communicator.connect()
+    assert connected, "Failed to connect to the WebSocket."
+
+    for limit, success in [("ten", False), ({}, False), (None, True), ("5", True), (-1, True)]:
+        await communicator.send_json_to({
+            "type": "control_message",
+            "message": "search_transcriptions",
+            "parameter": {"query": "budget", "limit": limit}
+        })
+        response = await communicator.receive_json_from()
+        assert response.get("message_type") == "search_results"
+        assert response.get("success") is success
+        assert response.get("truncated") is False
+
+    for page_size in [None, "all", [], 1]:
+        await communicator.send_json_to({
+            "type": "control_message",
+            "message": "get_recordings_page",
+            "parameter": {"pageSize": page_size}
+        })
+        response = await communicator.receive_json_from()
+        assert response.get("message_type") == "recordings_page"
+        assert "next_cursor" in response
+
+    await communicator.disconnect()
+
+@pytest.mark.asyncio
+async def test_resume_waits_for_finalization_after_disconnect(audio_chunks, monkeypatch):
+    """
+    Tests that a recording resumed right after a disconnect, while it is still finalized in the background,
+    is resumed when the finalization is done instead of failing.
+    """
+    import time
+    original_init = AudioChunkManager.__init__
+    original_save_quality_summary = AudioChunkManager.save_quality_summary
+
+    def mock_init(self, consumer, load_data_from_server=True):
+        original_init(self, consumer, load_data_from_server=False)
+
+    def slow_save_quality_summary(self, recording_id):
+        time.sleep(0.5)
+        return original_save_quality_summary(self, recording_id)
+
+    monkeypatch.setattr(AudioChunkManager, "__init__", mock_init)
+    monkeypatch.setattr(AudioChunkManager, "save_quality_summary", slow_save_quality_summary)
+
+    communicator = WebsocketCommunicator(application, "/ws/dictaphone/data/")
+    connected, _ = await communicator.connect()
+    assert connected, "Failed to connect to the WebSocket."
+    await communicator.send_json_to({
+        "type": "control_message",
+        "message": "start_recording",
+        "parameter": "Resumed Test Recording"
+    })
+    recording_id = (await communicator.receive_json_from()).get("recording_id")
+    for i in range(2):
+        await communicator.send_to(bytes_data=audio_chunks[i])
+        assert (await communicator.receive_json_from()).get("chunk_index") == i
+    await communicator.disconnect()
+
+    # reconnect and resume without waiting for the finalization
+    communicator = WebsocketCommunicator(application, "/ws/dictaphone/data/")
+    connected, _ = await communicator.connect()
+    assert connected, "Failed to reconnect to the WebSocket."
+    await communicator.send_json_to({
+        "type": "control_message",
+        "message": "resume_recording",
+        "parameter": {"recordingId": recording_id}
+    })
+    response = await communicator.receive_json_from(timeout=15)
+    assert response.get("message_type") == "ack_resume_recording"
+    assert response.get("success") is True
+    assert response.get("high_water_mark") == 2
+
+    for i in range(2, NUM_CHUNKS):
+        await communicator.send_to(bytes_data=audio_chunks[i])
+        assert (await communicator.receive_json_from()).get("chunk_index") == i
+    await communicator.send_json_to({
+        "type": "control_message",
+        "message": "stop_recording",
+        "parameter": NUM_CHUNKS
+    })
+    final_response = await communicator.receive_json_from(timeout=15)
+    assert final_response.get("message_type") == "recording_complete"
+    assert final_response['completion_status'] == RecordingStatus.VERIFIED.value
+    assert Path(final_response['path']).read_bytes() == (TEST_DATA_DIR / "recording.wav").read_bytes()
+
+    await communicator.disconnect()
@@ -0,0 +1,59 @@
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from .audio_quality_util import (compute_chunk_quality, get_audio_data_offset, new_quality_stats, add_quality_stats,
+                                 summarize_quality, SILENCE_WINDOW_SAMPLES, MIN_DBFS)
+
+REFERENCE_FILE = Path(__file__).parent / "resources" / "test_chunks" / "recording.wav"
+
+def pcm(samples) -> bytes:
+    return np.asarray(samples, dtype='<i2').tobytes()
+
+class TestAudioQualityUtil(unittest.TestCase):
+    def test_silent_chunk(self):
+        """Test that a chunk of digital silence is reported as silent."""
+        summary = summarize_quality(compute_chunk_quality(pcm(np.zeros(SILENCE_WINDOW_SAMPLES * 10))))
+        self.assertEqual(summary['rms_dbfs'], MIN_DBFS)
+        self.assertEqual(summary['silence_ratio'], 1.0)
+        self.assertEqual(summary['warnings'], ["silent"])
+
+    def test_full_scale_square_wave(self):
+        """Test the levels and clip count of a full scale square wave."""
+        samples = np.tile([32767, -32768], SILENCE_WINDOW_SAMPLES * 5)
+        stats = compute_chunk_quality(pcm(samples))
+        self.assertEqual(stats['clipped_samples'], len(samples))
+        self.assertEqual(stats['peak'], 32768)
+        summary = summarize_quality(stats)
+        self.assertEqual(summary['rms_dbfs'], 0.0)
+        self.assertEqual(summary['peak_dbfs'], 0.0)
+        self.assertEqual(summary['silence_ratio'], 0.0)
+        self.assertEqual(summary['warnings'], ["clipping"])
+
+    def test_quiet_chunk(self):
+        """Test that a low level signal is reported as quiet, and that the statistics of chunks are added up."""
+        samples = np.tile([300, -300], SILENCE_WINDOW_SAMPLES * 5)
+        total = new_quality_stats()
+        add_quality_stats(total, compute_chunk_quality(pcm(samples)))
+        add_quality_stats(total, compute_chunk_quality(pcm(np.zeros(len(samples)))))
+        summary = summarize_quality(total)
+        self.assertEqual(total['samples'], 2 * len(samples))
+        self.assertEqual(summary['silence_ratio'], 0.5)
+        self.assertEqual(summary['peak_dbfs'], -40.8)
+        self.assertEqual(summary['warnings'], ["quiet"])
+
+    def test_first_chunk_header_is_skipped(self):
+        """Test that the WAV header of the first chunk is not counted as audio."""
+        data = REFERENCE_FILE.read_bytes()
+        offset = get_audio_data_offset(data)
+        self.assertEqual(offset, 44)
+        self.assertEqual(get_audio_data_offset(data[offset:]), 0)
+        stats = compute_chunk_quality(data, offset)
+        self.assertEqual(stats['samples'], (len(data) - 44) // 2)
+        samples = np.frombuffer(data[44:], dtype='<i2').astype(np.int64)
+        self.assertEqual(stats['sum_squares'], int(np.sum(samples * samples)))
+
+
+if __name__ == "__main__":
+    unittest.main()
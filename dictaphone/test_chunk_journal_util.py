@@ -0,0 +1,100 @@
+import asyncio
+import os
+import tempfile
+import unittest
+import zlib
+
+from .chunk_journal_util import ChunkJournal, read_journal, recover_journal, get_journal_path, RECORD_SIZE, RECORD_CRC_SIZE
+
+class TestChunkJournalUtil(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.test_dir.cleanup)
+        self.wav_path = os.path.join(self.test_dir.name, "Meeting.wav")
+        self.journal_path = get_journal_path(self.test_dir.name)
+        self.chunks = [bytes([i]) * (100 + i) for i in range(4)]
+
+    def write_chunks(self, journal, indexes, file_crc32=0):
+        with open(self.wav_path, "ab") as f:
+            for index in indexes:
+                f.write(self.chunks[index])
+                file_crc32 = zlib.crc32(self.chunks[index], file_crc32)
+                journal.append_written(index, self.chunks[index], file_crc32)
+        return file_crc32
+
+    def test_recover_written_and_buffered_chunks(self):
+        """Test that the written chunks and the data of the chunks received out of order are recovered."""
+        journal = ChunkJournal(self.wav_path)
+        file_crc32 = self.write_chunks(journal, [0, 1])
+        journal.append_buffered(3, self.chunks[3])
+        asyncio.run(journal.commit())
+        self.assertEqual(journal.committed, 3)
+        journal.close()
+
+        recovered = recover_journal(self.wav_path)
+        self.assertEqual(recovered, {
+            'flushed_index': 1,
+            'file_size': len(self.chunks[0]) + len(self.chunks[1]),
+            'file_crc32': file_crc32,
+            'buffered': {3: self.chunks[3]}
+        })
+
+        # the recording continues after recovery, the buffered chunk is written when chunk 2 arrives
+        journal = ChunkJournal(self.wav_path, recovered['file_size'])
+        self.write_chunks(journal, [2, 3], recovered['file_crc32'])
+        journal.close()
+        recovered = recover_journal(self.wav_path)
+        self.assertEqual(recovered['flushed_index'], 3)
+        self.assertEqual(recovered['buffered'], {})
+        with open(self.wav_path, "rb") as f:
+            self.assertEqual(zlib.crc32(f.read()), recovered['file_crc32'])
+
+    def test_torn_tails_are_truncated(self):
+        """Test that a torn journal record and audio data without a journal record are truncated."""
+        journal = ChunkJournal(self.wav_path)
+        self.write_chunks(journal, [0, 1])
+        journal.append_buffered(3, self.chunks[3])
+        journal.close()
+        valid_length = os.path.getsize(self.journal_path)
+        # a crash while writing chunk 2: the audio data is written, the journal record is torn
+        with open(self.wav_path, "ab") as f:
+            f.write(self.chunks[2])
+        with open(self.journal_path, "ab") as f:
+            f.write(b"\x01\x00\x00")
+
+        recovered = recover_journal(self.wav_path)
+        self.assertEqual(recovered['flushed_index'], 1)
+        self.assertEqual(recovered['buffered'], {3: self.chunks[3]})
+        self.assertEqual(os.path.getsize(self.journal_path), valid_length)
+        self.assertEqual(os.path.getsize(self.wav_path), recovered['file_size'])
+
+    def test_corrupted_buffered_chunk_ends_journal(self):
+        """Test that the journal is read up to a buffered chunk with corrupted data."""
+        journal = ChunkJournal(self.wav_path)
+        self.write_chunks(journal, [0])
+        journal.append_buffered(2, self.chunks[2])
+        journal.close()
+        valid_length = os.path.getsize(self.journal_path) - len(self.chunks[2]) - RECORD_SIZE - RECORD_CRC_SIZE
+        with open(self.journal_path, "r+b") as f:
+            f.seek(-1, os.SEEK_END)
+            f.write(b"\xff")
+        written, buffered, length = read_journal(self.journal_path)
+        self.assertEqual([record[0] for record in written], [0])
+        self.assertEqual(buffered, {})
+        self.assertEqual(length, valid_length)
+
+    def test_no_journal(self):
+        """Test that a recording without a journal is not recovered."""
+        with open(self.wav_path, "wb") as f:
+            f.write(self.chunks[0])
+        self.assertIsNone(recover_journal(self.wav_path))
+
+    def test_remove(self):
+        journal = ChunkJournal(self.wav_path)
+        self.write_chunks(journal, [0])
+        journal.remove()
+        self.assertFalse(os.path.exists(self.journal_path))
+        journal.remove()
+
+if __name__ == "__main__":
+    unittest.main()
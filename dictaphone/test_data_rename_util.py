@@ -1,8 +1,10 @@
+import io
 import unittest
 import tempfile
 import logging
 import zipfile
 from pathlib import Path
+from unittest import mock
 from .data_rename_util import safe_rename, rename_files, rename_in_zip_file, replace_title_in_log
 
 class TestDataRenameUtil(unittest.TestCase):
@@ -102,6 +104,81 @@ class TestDataRenameUtil(unittest.TestCase):
             self.assertNotIn("old_title_doc.txt", names)
             self.assertEqual(zf.read("new_title_doc.txt").decode(), "content1")
 
+    def test_rename_in_zip_file_keeps_compressed_data(self):
+        """Test that members are renamed without recompression, keeping compression type and compressed bytes."""
+        zip_path = self.test_path / "test_archive.zip"
+        text = ("Speaker 1: this is a transcription line of old_title.\n" * 2000).encode()
+
+        with zipfile.ZipFile(zip_path, 'w') as zf:
+            zf.writestr("old_title.txt", text, compress_type=zipfile.ZIP_DEFLATED, compresslevel=1)
+            zf.writestr("old_title.wav", b"RIFF" + bytes(range(256)) * 100, compress_type=zipfile.ZIP_STORED)
+            zf.writestr("old_title_Møde.srt", "content", compress_type=zipfile.ZIP_DEFLATED)
+
+        with zipfile.ZipFile(zip_path, 'r') as zf:
+            old_infos = {info.filename: info for info in zf.infolist()}
+
+        rename_in_zip_file("old_title", "new_title", str(zip_path))
+
+        with zipfile.ZipFile(zip_path, 'r') as zf:
+            self.assertIsNone(zf.testzip())
+            self.assertEqual(zf.namelist(), ["new_title.txt", "new_title.wav", "new_title_Møde.srt"])
+            self.assertEqual(zf.read("new_title.txt"), text)
+            for old_name, new_name in [("old_title.txt", "new_title.txt"), ("old_title.wav", "new_title.wav")]:
+                new_info = zf.getinfo(new_name)
+                self.assertEqual(new_info.compress_type, old_infos[old_name].compress_type)
+                # level 1 deflate output is kept as is, recompression would use the default level
+                self.assertEqual(new_info.compress_size, old_infos[old_name].compress_size)
+                self.assertEqual(new_info.CRC, old_infos[old_name].CRC)
+
+    def test_rename_in_zip_file_data_descriptor(self):
+        """Test that members written with a data descriptor (streamed zip files) are renamed."""
+        zip_path = self.test_path / "streamed.zip"
+
+        class UnseekableStream(io.RawIOBase):
+            """A write-only stream without seek, which makes zipfile write data descriptors."""
+            def __init__(self, f):
+                self.f = f
+            def writable(self):
+                return True
+            def write(self, b):
+                return self.f.write(b)
+
+        with open(zip_path, 'wb') as f:
+            with zipfile.ZipFile(UnseekableStream(f), 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+                with zf.open("old_title.txt", 'w') as member:
+                    member.write(b"streamed content")
+
+        with zipfile.ZipFile(zip_path, 'r') as zf:
+            self.assertTrue(zf.getinfo("old_title.txt").flag_bits & 0x08)
+
+        rename_in_zip_file("old_title", "new_title", str(zip_path))
+
+        with zipfile.ZipFile(zip_path, 'r') as zf:
+            self.assertIsNone(zf.testzip())
+            self.assertEqual(zf.read("new_title.txt"), b"streamed content")
+
+    def test_rename_in_zip_file_zip64_records(self):
+        """Test that the zip64 fields and records written for large members and offsets are read by zipfile."""
+        zip_path = self.test_path / "large.zip"
+        with zipfile.ZipFile(zip_path, 'w') as zf:
+            zf.writestr("old_title.txt", "first" * 100, compress_type=zipfile.ZIP_DEFLATED)
+            zf.writestr("old_title.wav", b"RIFF" + bytes(1000), compress_type=zipfile.ZIP_STORED)
+            zf.comment = b"exported recordings"
+
+        # every size and offset from 100 bytes is stored in a zip64 field
+        with mock.patch("dictaphone.data_rename_util.ZIP64_LIMIT", 100):
+            rename_in_zip_file("old_title", "new_title", str(zip_path))
+
+        # the zip64 end of central directory record
+        self.assertIn(b"PK\x06\x06", zip_path.read_bytes())
+        with zipfile.ZipFile(zip_path, 'r') as zf:
+            self.assertIsNone(zf.testzip())
+            self.assertEqual(zf.namelist(), ["new_title.txt", "new_title.wav"])
+            self.assertEqual(zf.read("new_title.txt"), b"first" * 100)
+            self.assertEqual(zf.read("new_title.wav"), b"RIFF" + bytes(1000))
+            self.assertEqual(zf.comment, b"exported recordings")
+            self.assertEqual(zf.getinfo("new_title.wav").extract_version, 45)
+
     def test_rename_in_zip_file_bad_zip(self):
         """Test that the function handles corrupted zip files gracefully."""
         bad_zip_path = self.test_path / "corrupt.zip"
@@ -0,0 +1,71 @@
+import importlib.util
+import io
+import shutil
+import tempfile
+import unittest
+import zipfile
+from pathlib import Path
+
+from .export_util import iter_recordings_zip, EXPORT_BLOCK_SIZE
+from .recording_metadata_util import write_metadata
+
+REFERENCE_FILE = Path(__file__).parent / "resources" / "test_chunks" / "recording.wav"
+
+class TestExportUtil(unittest.TestCase):
+    def setUp(self):
+        # Create two temporary recordings, one with the title layout and one with the id layout
+        self.test_dir = tempfile.TemporaryDirectory()
+        self.meeting_path = Path(self.test_dir.name) / "1_Meeting"
+        (self.meeting_path / "TRANSCRIPTIONS").mkdir(parents=True)
+        shutil.copy(REFERENCE_FILE, self.meeting_path / "Meeting.wav")
+        (self.meeting_path / "TRANSCRIPTIONS" / "Meeting.txt").write_text("Welcome to the meeting. " * 1000)
+        with zipfile.ZipFile(self.meeting_path / "TRANSCRIPTIONS" / "files.zip", 'w') as zf:
+            zf.writestr("files/Meeting.txt", "Welcome to the meeting.")
+        self.review_path = Path(self.test_dir.name) / "2"
+        self.review_path.mkdir()
+        shutil.copy(REFERENCE_FILE, self.review_path / "2.wav")
+        write_metadata(str(self.review_path), {'title': "Review"})
+
+    def tearDown(self):
+        self.test_dir.cleanup()
+
+    def export(self, wav_paths) -> tuple[zipfile.ZipFile, list[bytes]]:
+        blocks = list(iter_recordings_zip([str(wav_path) for wav_path in wav_paths]))
+        return zipfile.ZipFile(io.BytesIO(b"".join(blocks))), blocks
+
+    def test_export_recordings(self):
+        """Test that the zip contains the audio and transcriptions, audio stored and text deflated."""
+        zf, blocks = self.export([self.meeting_path / "Meeting.wav", self.review_path / "2.wav"])
+        self.assertIsNone(zf.testzip())
+        self.assertEqual(sorted(zf.namelist()), [
+            "1_Meeting/Meeting.wav",
+            "1_Meeting/TRANSCRIPTIONS/Meeting.txt",
+            "1_Meeting/TRANSCRIPTIONS/files.zip",
+            "2_Review/Review.wav",
+        ])
+        self.assertEqual(zf.read("1_Meeting/Meeting.wav"), REFERENCE_FILE.read_bytes())
+        self.assertEqual(zf.read("2_Review/Review.wav"), REFERENCE_FILE.read_bytes())
+        self.assertEqual(zf.getinfo("1_Meeting/Meeting.wav").compress_type, zipfile.ZIP_STORED)
+        self.assertEqual(zf.getinfo("1_Meeting/TRANSCRIPTIONS/files.zip").compress_type, zipfile.ZIP_STORED)
+        text_info = zf.getinfo("1_Meeting/TRANSCRIPTIONS/Meeting.txt")
+        self.assertEqual(text_info.compress_type, zipfile.ZIP_DEFLATED)
+        self.assertLess(text_info.compress_size, text_info.file_size)
+        # the zip is streamed in blocks, not built in memory
+        self.assertLessEqual(max(len(block) for block in blocks), EXPORT_BLOCK_SIZE + 1024)
+
+    @unittest.skipUnless(importlib.util.find_spec("soundfile"), "soundfile is not installed")
+    def test_export_archived_recording(self):
+        """Test that an archived recording is exported as the original WAV file."""
+        from .archive_util import encode_wav_to_flac, ARCHIVE_MANIFEST_KEY
+        from .recording_metadata_util import update_metadata
+        wav_path = self.meeting_path / "Meeting.wav"
+        manifest = encode_wav_to_flac(str(wav_path), str(self.meeting_path / "Meeting.flac"))
+        update_metadata(str(self.meeting_path), **{ARCHIVE_MANIFEST_KEY: manifest})
+        wav_path.unlink()
+        zf, _ = self.export([wav_path])
+        self.assertEqual(zf.read("1_Meeting/Meeting.wav"), REFERENCE_FILE.read_bytes())
+        self.assertNotIn("1_Meeting/Meeting.flac", zf.namelist())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import json
+import os
+import subprocess
+import sys
+import unittest
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+# Runs in a server process with the local profile, the settings of the profile are read when Django is set up.
+# Two abortable tasks are submitted to the in-process worker with one thread, the first is cancelled while it runs.
+# A transcription task queued behind them is cancelled before the worker thread is free.
+LIFECYCLE_SCRIPT = """
+import asyncio, json, os, tempfile, time
+from celery.contrib.abortable import AbortableTask
+from backend.celery import app
+
+# the task is registered before the worker is started
+@app.task(bind=True, base=AbortableTask)
+def sleeping_task(self, seconds):
+    self.update_state(state='STARTED', meta={'start_time': time.time()})
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        if self.is_aborted():
+            return "TASK ABORTED"
+        time.sleep(0.05)
+    return "Task completed"
+
+import backend.asgi
+from channels.layers import get_channel_layer
+from backend.local_worker import stop_local_worker
+from dictaphone.tasks import transcription_task
+
+def wait_for(predicate, timeout=10):
+    deadline = time.time() + timeout
+    while not predicate() and time.time() < deadline:
+        time.sleep(0.02)
+
+states = {}
+recording_directory = tempfile.mkdtemp()
+first, second = sleeping_task.delay(30), sleeping_task.delay(0.2)
+queued = transcription_task.delay(recording_directory, os.path.join(recording_directory, 'recording.wav'), 'tiny', 'en')
+wait_for(lambda: first.state == 'STARTED')
+states['running'] = [first.state, second.state, queued.state]
+queued.abort()
+first.abort()
+states['aborted'] = [first.state, queued.state]
+wait_for(lambda: first.ready() and second.ready() and queued.ready())
+states['ready'] = [first.state, first.result, second.state, second.result, queued.result]
+states['transcribed'] = os.path.exists(os.path.join(recording_directory, 'TRANSCRIPTIONS'))
+
+async def group_message():
+    layer = get_channel_layer()
+    channel = await layer.new_channel()
+    await layer.group_add('group', channel)
+    await layer.group_send('group', {'type': 'test.message'})
+    return type(layer).__name__, (await layer.receive(channel))['type']
+states['channel_layer'] = list(asyncio.run(group_message()))
+stop_local_worker()
+print(json.dumps(states))
+"""
+
+class TestLocalProfile(unittest.TestCase):
+    def test_task_lifecycle_and_channel_layer(self):
+        env = {**os.environ, "DICTAPHONE_PROFILE": "local", "LOCAL_WORKER_CONCURRENCY": "1",
+               "DJANGO_SETTINGS_MODULE": "backend.settings"}
+        process = subprocess.run([sys.executable, "-c", LIFECYCLE_SCRIPT], cwd=BASE_DIR, env=env,
+                                 capture_output=True, text=True, timeout=60)
+        self.assertEqual(process.returncode, 0, process.stderr)
+        states = json.loads(process.stdout.strip().splitlines()[-1])
+        # the second task is queued until the worker thread is free
+        self.assertEqual(states['running'], ['STARTED', 'PENDING', 'PENDING'])
+        self.assertEqual(states['aborted'], ['ABORTED', 'ABORTED'])
+        # the queued transcription task is not started when the worker thread picks it up
+        self.assertEqual(states['ready'], ['SUCCESS', 'TASK ABORTED', 'SUCCESS', 'Task completed', 'TASK ABORTED'])
+        self.assertFalse(states['transcribed'])
+        self.assertEqual(states['channel_layer'], ['InMemoryChannelLayer', 'test.message'])
+
+if __name__ == "__main__":
+    unittest.main()
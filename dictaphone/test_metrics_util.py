@@ -0,0 +1,59 @@
+import asyncio
+import unittest
+
+from .metrics_util import Counter, Gauge, Histogram, InstrumentedLock, render_metrics
+
+class TestMetricsUtil(unittest.TestCase):
+    def setUp(self):
+        # the test metrics are not added to the metrics of the process
+        self.registry = []
+    def test_render_counter_and_gauge(self):
+        """Test the text format of counters with labels and gauges, with escaped label values."""
+        counter = Counter("test_requests_total", "Requests.", ("reason",), registry=self.registry)
+        counter.labels("integrity").inc()
+        counter.labels("integrity").inc(2)
+        counter.labels('say "hi"\n').inc()
+        gauge = Gauge("test_connections", "Connections.", registry=self.registry)
+        gauge.inc(3)
+        gauge.dec()
+        lines = render_metrics(self.registry).splitlines()
+        self.assertNotIn("test_requests_total", render_metrics())
+        self.assertIn("# TYPE test_requests_total counter", lines)
+        self.assertIn('test_requests_total{reason="integrity"} 3.0', lines)
+        self.assertIn('test_requests_total{reason="say \\"hi\\"\\n"} 1.0', lines)
+        self.assertIn("# TYPE test_connections gauge", lines)
+        self.assertIn("test_connections 2.0", lines)
+        with self.assertRaises(ValueError):
+            counter.labels("a", "b")
+
+    def test_render_histogram(self):
+        """Test that histogram buckets are cumulative and a value on a bucket bound is counted in that bucket."""
+        histogram = Histogram("test_latency_seconds", "Latency.", buckets=(0.1, 1.0), registry=self.registry)
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(value)
+        lines = render_metrics(self.registry).splitlines()
+        self.assertIn('test_latency_seconds_bucket{le="0.1"} 2', lines)
+        self.assertIn('test_latency_seconds_bucket{le="1.0"} 3', lines)
+        self.assertIn('test_latency_seconds_bucket{le="+Inf"} 4', lines)
+        self.assertIn("test_latency_seconds_sum 3.65", lines)
+        self.assertIn("test_latency_seconds_count 4", lines)
+
+    def test_instrumented_lock_records_wait_and_hold(self):
+        """Test that the lock records the time a second task waited while the first task held the lock."""
+        wait_histogram = Histogram("test_lock_wait_seconds", "Lock wait.", buckets=(0.01,), registry=self.registry)
+        hold_histogram = Histogram("test_lock_hold_seconds", "Lock hold.", buckets=(0.01,), registry=self.registry)
+
+        async def run():
+            lock = InstrumentedLock(wait_histogram, hold_histogram)
+            async def hold():
+                async with lock:
+                    await asyncio.sleep(0.05)
+            await asyncio.gather(hold(), hold())
+
+        asyncio.run(run())
+        wait_counts = wait_histogram.children[()].bucket_counts
+        hold_counts = hold_histogram.children[()].bucket_counts
+        # one task acquired the lock right away, the other waited for the first to release it
+        self.assertEqual(wait_counts, [1, 1])
+        self.assertEqual(hold_counts, [0, 2])
+        self.assertGreaterEqual(wait_histogram.children[()].sum, 0.04)
@@ -0,0 +1,54 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from . import model_memory_util
+from .model_memory_util import HardwareProbe, has_nvidia_gpu, get_machine_memory
+
+class TestModelMemoryUtil(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.test_dir.cleanup)
+        self.base_path = Path(self.test_dir.name)
+
+    def test_probe_is_cached_until_ttl(self):
+        """Test that the hardware is probed once per TTL."""
+        probes = []
+        probe = HardwareProbe(ttl=60, probe=lambda: probes.append(1) or 24.0)
+        self.assertEqual(probe.get_available_memory(), 24.0)
+        self.assertEqual(probe.get_available_memory(), 24.0)
+        self.assertEqual(len(probes), 1)
+        with mock.patch("time.monotonic", return_value=probe.probe_time + 60):
+            probe.get_available_memory()
+        self.assertEqual(len(probes), 2)
+
+    def test_nvidia_gpu_detected_from_driver(self):
+        """Test that a GPU is detected from the directories listed by the NVIDIA driver."""
+        gpus_path = self.base_path / "gpus"
+        with mock.patch.object(model_memory_util, "NVIDIA_GPUS_PATH", str(gpus_path)):
+            self.assertFalse(has_nvidia_gpu())
+            (gpus_path / "0000:01:00.0").mkdir(parents=True)
+            self.assertTrue(has_nvidia_gpu())
+
+    def test_machine_memory_limited_by_container(self):
+        """Test that the machine memory is read from meminfo and limited by the cgroup memory limit."""
+        meminfo_path = self.base_path / "meminfo"
+        meminfo_path.write_text("MemTotal:       67108864 kB\nMemFree:        1024 kB\n")
+        cgroup_path = self.base_path / "memory.max"
+        cgroup_path.write_text("max\n")
+        with mock.patch.object(model_memory_util, "MEMINFO_PATH", str(meminfo_path)), \
+                mock.patch.object(model_memory_util, "CGROUP_MEMORY_MAX_PATH", str(cgroup_path)):
+            self.assertEqual(get_machine_memory(), 64.0)
+            cgroup_path.write_text(f"{8 * 1024 ** 3}\n")
+            self.assertEqual(get_machine_memory(), 8.0)
+
+    def test_consumer_import_does_not_import_torch(self):
+        """Test that the WebSocket consumer can be imported without importing torch."""
+        result = subprocess.run(
+            [sys.executable, "-c", "import django; django.setup(); import sys, dictaphone.audio_data_consumer; print('torch' in sys.modules)"],
+            env={**os.environ, "DJANGO_SETTINGS_MODULE": "backend.settings"}, capture_output=True, text=True)
+        self.assertEqual(result.stdout.strip().splitlines()[-1], "False", result.stderr)
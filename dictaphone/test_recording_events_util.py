@@ -0,0 +1,99 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from . import recording_events_util
+from .recording_events_util import (append_event, read_recording_state, read_events, get_event_log_path,
+                                    LEGACY_COMPLETION_LOG_FILE_NAME, FINALIZED, TRANSCRIPTION_STARTED,
+                                    TRANSCRIPTION_ENDED, TRANSCRIPTION_CANCELLED, RENAMED)
+
+class TestRecordingEventsUtil(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.test_dir.cleanup)
+        self.recording_path = self.test_dir.name
+        self.log_path = get_event_log_path(self.recording_path)
+
+    def test_state_from_events(self):
+        """Test that the state is built from the last finalization and the last transcription event."""
+        self.assertIsNone(read_recording_state(self.recording_path))
+        append_event(self.recording_path, FINALIZED, recording_id=3, status="INTERRUPTED_VERIFIED", file_crc32=None)
+        append_event(self.recording_path, FINALIZED, recording_id=3, status="VERIFIED", file_crc32=1234)
+        state = read_recording_state(self.recording_path)
+        self.assertEqual((state['recording_id'], state['status'], state['file_crc32']), (3, "VERIFIED", 1234))
+        self.assertIsNone(state['transcription_start_time'])
+
+        append_event(self.recording_path, TRANSCRIPTION_STARTED)
+        state = read_recording_state(self.recording_path)
+        self.assertIsNotNone(state['transcription_start_time'])
+        append_event(self.recording_path, TRANSCRIPTION_CANCELLED)
+        self.assertIsNone(read_recording_state(self.recording_path)['transcription_start_time'])
+        append_event(self.recording_path, TRANSCRIPTION_STARTED)
+        append_event(self.recording_path, RENAMED, old_title="Meeting", new_title="Review")
+        append_event(self.recording_path, TRANSCRIPTION_ENDED)
+        state = read_recording_state(self.recording_path)
+        self.assertIsNone(state['transcription_start_time'])
+        self.assertIsNotNone(state['transcription_end_time'])
+        self.assertEqual(state['status'], "VERIFIED")
+
+    def test_state_is_read_from_the_tail(self):
+        """Test that a torn last line is skipped, and that the log is only read back to the current state."""
+        with open(self.log_path, "w") as f:
+            f.write("not an event\n" * 2000)
+        append_event(self.recording_path, FINALIZED, recording_id=1, status="DATA_LOSS", file_crc32=None)
+        append_event(self.recording_path, TRANSCRIPTION_STARTED)
+        with open(self.log_path, "a") as f:
+            f.write('{"event": "transcription_ended", "ti')
+        with mock.patch.object(recording_events_util, "parse_event", wraps=recording_events_util.parse_event) as parse_event:
+            state = read_recording_state(self.recording_path)
+        self.assertEqual(state['status'], "DATA_LOSS")
+        self.assertIsNotNone(state['transcription_start_time'])
+        self.assertLess(parse_event.call_count, 2000)
+
+    def test_compaction_keeps_state(self):
+        """Test that the log is replaced by the events of the current state when it grows too large."""
+        self.addCleanup(setattr, recording_events_util, "EVENT_LOG_COMPACTION_SIZE", recording_events_util.EVENT_LOG_COMPACTION_SIZE)
+        recording_events_util.EVENT_LOG_COMPACTION_SIZE = 2048
+        append_event(self.recording_path, FINALIZED, recording_id=5, status="VERIFIED", file_crc32=99)
+        for _ in range(20):
+            append_event(self.recording_path, TRANSCRIPTION_STARTED)
+            append_event(self.recording_path, TRANSCRIPTION_ENDED)
+        self.assertLessEqual(os.path.getsize(self.log_path), 2048)
+        self.assertLessEqual(len(read_events(self.log_path)), 20)
+        state = read_recording_state(self.recording_path)
+        self.assertEqual((state['recording_id'], state['status'], state['file_crc32']), (5, "VERIFIED", 99))
+        self.assertIsNotNone(state['transcription_end_time'])
+        self.assertEqual([name for name in os.listdir(self.recording_path)], ["events.jsonl"])
+
+    def test_legacy_completion_log(self):
+        """Test that a completion log of an older version is read, and migrated on the first event."""
+        legacy_path = os.path.join(self.recording_path, LEGACY_COMPLETION_LOG_FILE_NAME)
+        with open(legacy_path, "w") as f:
+            f.write("Recording ID: 2\nStatus: INTERRUPTED_VERIFIED\nCompletion time: 2025-01-01T10:00:00+00:00\n"
+                    "File CRC32: 0000abcd\nTranscription start time: 2025-01-01T11:00:00+00:00\n")
+        state = read_recording_state(self.recording_path)
+        self.assertEqual(state, {
+            'recording_id': 2,
+            'status': "INTERRUPTED_VERIFIED",
+            'completion_time': "2025-01-01T10:00:00+00:00",
+            'file_crc32': 0xabcd,
+            'transcription_start_time': "2025-01-01T11:00:00+00:00",
+            'transcription_end_time': None
+        })
+
+        append_event(self.recording_path, TRANSCRIPTION_ENDED)
+        self.assertFalse(os.path.exists(legacy_path))
+        with open(self.log_path) as f:
+            self.assertEqual([json.loads(line)['event'] for line in f], [FINALIZED, TRANSCRIPTION_STARTED, TRANSCRIPTION_ENDED])
+        state = read_recording_state(self.recording_path)
+        self.assertEqual((state['recording_id'], state['file_crc32'], state['transcription_start_time']), (2, 0xabcd, None))
+
+    def test_malformed_legacy_completion_log(self):
+        with open(os.path.join(self.recording_path, LEGACY_COMPLETION_LOG_FILE_NAME), "w") as f:
+            f.write("Recording ID: 2\n")
+        self.assertIsNone(read_recording_state(self.recording_path))
+
+if __name__ == "__main__":
+    unittest.main()
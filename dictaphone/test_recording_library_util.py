@@ -0,0 +1,136 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from .audio_data_consumer import load_all_recordings_status, load_recording_status, RecordingStatus
+from . import recording_library_util
+from .recording_library_util import RecordingLibrary, InotifyWatcher, PollingWatcher
+from .recording_state_util import get_recording_state_backend
+
+class TestRecordingLibraryUtil(unittest.TestCase):
+    def setUp(self):
+        # Create a temporary recordings base directory for each test
+        self.test_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.test_dir.cleanup)
+        self.base_path = Path(self.test_dir.name)
+        self.create_recording_dir(1, "Meeting")
+        self.library = RecordingLibrary(str(self.base_path), load_all_recordings_status, load_recording_status)
+        self.changes = []
+        self.changed_event = threading.Event()
+        self.library.add_listener(self.on_change)
+
+    def on_change(self, changed, deleted, version):
+        self.changes.append(({status['recording_id']: status for status in changed}, deleted))
+        self.changed_event.set()
+
+    def wait_for_change(self):
+        self.assertTrue(self.changed_event.wait(timeout=10), "no change was reported")
+        self.changed_event.clear()
+        return self.changes[-1]
+
+    def create_recording_dir(self, recording_id, title, status=RecordingStatus.VERIFIED):
+        recording_path = self.base_path / f"{recording_id}_{title}"
+        recording_path.mkdir()
+        (recording_path / f"{title}.wav").write_bytes(b"\0" * 1024)
+        (recording_path / "completion_log.txt").write_text(f"Recording ID: {recording_id}\nStatus: {status.name}\n")
+        return recording_path
+
+    def test_refresh_reports_added_renamed_and_deleted_recordings(self):
+        """Test that only the changes of the refreshed directories are reported, and that a rename is not a delete."""
+        self.assertEqual([status['recording_id'] for status in self.library.get_statuses()], [1])
+        self.create_recording_dir(2, "Interview")
+        self.library.refresh({"2_Interview"})
+        changed, deleted = self.changes[-1]
+        self.assertEqual(list(changed), [2])
+        self.assertEqual(deleted, [])
+
+        # an unchanged directory is not reported
+        self.library.refresh({"1_Meeting"})
+        self.assertEqual(len(self.changes), 1)
+
+        os.rename(self.base_path / "2_Interview", self.base_path / "2_Lecture")
+        (self.base_path / "2_Lecture" / "Interview.wav").rename(self.base_path / "2_Lecture" / "Lecture.wav")
+        self.library.refresh({"2_Interview", "2_Lecture"})
+        changed, deleted = self.changes[-1]
+        self.assertEqual(changed[2]['title'], "Lecture")
+        self.assertEqual(deleted, [])
+
+        shutil.rmtree(self.base_path / "1_Meeting")
+        self.library.refresh({"1_Meeting"})
+        self.assertEqual(self.changes[-1], ({}, [1]))
+        self.assertEqual([status['recording_id'] for status in self.library.get_statuses()], [2])
+
+    def test_refresh_keeps_just_started_recording_dir(self):
+        """Test that a recording directory without audio data yet is not reported and not cleaned up."""
+        (self.base_path / "3_New").mkdir()
+        self.library.refresh({"3_New"})
+        self.assertTrue((self.base_path / "3_New").is_dir())
+        self.assertEqual(self.changes, [])
+
+    def test_refresh_skips_recording_receiving_chunks(self):
+        """Test that a recording is not reported while it holds its lease, e.g. as interrupted without an event log."""
+        state_backend = get_recording_state_backend()
+        live_path = self.base_path / "2_Live"
+        live_path.mkdir()
+        (live_path / "Live.wav").write_bytes(b"\0" * 1024)
+        for recording_id in [1, 2]:
+            self.assertIsNotNone(asyncio.run(state_backend.acquire_lease(recording_id, "test-owner", 10)))
+            self.addCleanup(asyncio.run, state_backend.release_lease(recording_id, "test-owner"))
+        self.library.refresh({"1_Meeting", "2_Live"})
+        self.assertEqual(self.changes, [])
+        self.assertEqual([status['recording_id'] for status in self.library.get_statuses()], [1])
+
+        asyncio.run(state_backend.release_lease(2, "test-owner"))
+        self.library.refresh({"2_Live"})
+        changed, deleted = self.changes[-1]
+        self.assertEqual(changed[2]['status'], RecordingStatus.INTERRUPTED_NOT_VERIFIED)
+        self.assertEqual(deleted, [])
+
+    def test_changes_since_version(self):
+        """Test that changes are versioned, and that a full sync is needed when a deletion was forgotten."""
+        self.assertEqual(self.library.get_changes(self.library.epoch, 0), (0, set(), []))
+        self.create_recording_dir(2, "Interview")
+        self.library.refresh({"2_Interview"})
+        shutil.rmtree(self.base_path / "1_Meeting")
+        self.library.refresh({"1_Meeting"})
+        self.assertEqual(self.library.get_changes(self.library.epoch, 0), (2, {2}, [1]))
+        self.assertEqual(self.library.get_changes(self.library.epoch, 1), (2, set(), [1]))
+        self.assertEqual(self.library.get_changes("another epoch", 1), (2, None, []))
+        self.assertEqual(self.library.get_changes(self.library.epoch, 3), (2, None, []))
+
+        self.addCleanup(setattr, recording_library_util, "MAX_DELETIONS", recording_library_util.MAX_DELETIONS)
+        recording_library_util.MAX_DELETIONS = 0
+        shutil.rmtree(self.base_path / "2_Interview")
+        self.library.refresh({"2_Interview"})
+        self.assertEqual(self.library.get_changes(self.library.epoch, 2), (3, None, []))
+        self.assertEqual(self.library.get_changes(self.library.epoch, 3), (3, set(), []))
+
+    def test_polling_watcher_reports_changes(self):
+        """Test that the polling watcher reports a finished transcription and a deleted recording."""
+        self.addCleanup(PollingWatcher(self.library, 0.05).stop)
+        transcription_dir = self.base_path / "1_Meeting" / "TRANSCRIPTIONS"
+        transcription_dir.mkdir()
+        (transcription_dir / "Meeting.txt").write_text("transcription")
+        changed, deleted = self.wait_for_change()
+        self.assertEqual([result['file_name'] for result in changed[1]['results']], ["Meeting.txt"])
+        shutil.rmtree(self.base_path / "1_Meeting")
+        self.assertEqual(self.wait_for_change(), ({}, [1]))
+
+    def test_inotify_watcher_reports_changes(self):
+        """Test that the inotify watcher reports a new recording and a finished transcription in a new directory."""
+        try:
+            self.addCleanup(InotifyWatcher(self.library).stop)
+        except (OSError, AttributeError) as e:
+            self.skipTest(f"inotify is not available: {e}")
+        recording_path = self.create_recording_dir(4, "Lecture", RecordingStatus.DATA_LOSS)
+        changed, deleted = self.wait_for_change()
+        self.assertEqual(changed[4]['status'], RecordingStatus.DATA_LOSS)
+        (recording_path / "TRANSCRIPTIONS").mkdir()
+        (recording_path / "TRANSCRIPTIONS" / "Lecture.srt").write_text("1\n00:00:00,000 --> 00:00:01,000\nHello\n")
+        while not self.wait_for_change()[0].get(4, {}).get('results'):
+            pass
+        self.assertEqual([result['file_name'] for result in self.library.statuses[4]['results']], ["Lecture.srt"])
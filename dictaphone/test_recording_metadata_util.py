@@ -0,0 +1,58 @@
+import json
+import os
+import unittest
+import tempfile
+from pathlib import Path
+from .recording_metadata_util import read_metadata, write_metadata, update_metadata, is_id_layout_directory, get_download_name
+
+class TestRecordingMetadataUtil(unittest.TestCase):
+    def setUp(self):
+        # Create a temporary recording directory for each test
+        self.test_dir = tempfile.TemporaryDirectory()
+        self.recording_path = Path(self.test_dir.name) / "12"
+        (self.recording_path / "TRANSCRIPTIONS").mkdir(parents=True)
+
+    def tearDown(self):
+        self.test_dir.cleanup()
+
+    def test_read_missing_metadata(self):
+        """Test that a missing metadata file is read as empty metadata."""
+        self.assertEqual(read_metadata(str(self.recording_path)), {})
+
+    def test_read_corrupted_metadata(self):
+        """Test that a corrupted metadata file is read as empty metadata."""
+        (self.recording_path / "metadata.json").write_text("{not json")
+        self.assertEqual(read_metadata(str(self.recording_path)), {})
+
+    def test_write_and_update_metadata(self):
+        """Test that updates preserve other keys and leave no temporary files."""
+        write_metadata(str(self.recording_path), {'title': "Meeting", 'other': 1})
+        update_metadata(str(self.recording_path), title="Board meeting")
+        self.assertEqual(read_metadata(str(self.recording_path)), {'title': "Board meeting", 'other': 1})
+        self.assertEqual(sorted(os.listdir(self.recording_path)), ["TRANSCRIPTIONS", "metadata.json"])
+        with open(self.recording_path / "metadata.json") as f:
+            self.assertEqual(json.load(f)['title'], "Board meeting")
+
+    def test_is_id_layout_directory(self):
+        """Test that only directories named after the recording ID with a title in the metadata use the id layout."""
+        self.assertFalse(is_id_layout_directory(str(self.recording_path)))
+        write_metadata(str(self.recording_path), {'title': "Meeting"})
+        self.assertTrue(is_id_layout_directory(str(self.recording_path)))
+        title_path = Path(self.test_dir.name) / "12_Meeting"
+        title_path.mkdir()
+        write_metadata(str(title_path), {'title': "Meeting"})
+        self.assertFalse(is_id_layout_directory(str(title_path)))
+
+    def test_get_download_name(self):
+        """Test that the recording ID in file names is replaced by the title for downloads."""
+        write_metadata(str(self.recording_path), {'title': "Møde_i_dag"})
+        self.assertEqual(get_download_name(str(self.recording_path / "12.wav")), "Møde_i_dag.wav")
+        self.assertEqual(get_download_name(str(self.recording_path / "TRANSCRIPTIONS" / "12.srt")), "Møde_i_dag.srt")
+        self.assertEqual(get_download_name(str(self.recording_path / "TRANSCRIPTIONS" / "files.zip")), "files.zip")
+        self.assertEqual(get_download_name(str(self.recording_path / "TRANSCRIPTIONS" / "123.txt")), "123.txt")
+
+    def test_get_download_name_title_layout(self):
+        """Test that file names in title layout directories are not changed."""
+        title_path = Path(self.test_dir.name) / "3_Meeting"
+        title_path.mkdir()
+        self.assertEqual(get_download_name(str(title_path / "Meeting.wav")), "Meeting.wav")
@@ -0,0 +1,126 @@
+import asyncio
+import functools
+import unittest
+
+from .recording_state_util import InMemoryRecordingStateBackend, RedisRecordingStateBackend
+
+try:
+    import redislite
+except ImportError:
+    redislite = None
+
+def async_test(coro):
+    """A decorator to run async test methods with the standard unittest runner."""
+    @functools.wraps(coro)
+    def wrapper(*args, **kwargs):
+        return asyncio.run(coro(*args, **kwargs))
+    return wrapper
+
+class RecordingStateBackendTests:
+    """Tests run against every backend, the backend is created by create_backend."""
+    def create_backend(self):
+        raise NotImplementedError
+
+    @async_test
+    async def test_allocate_recording_id(self):
+        """Test that IDs are unique for concurrent allocations, and higher than the IDs in use."""
+        backend = self.create_backend()
+        ids = await asyncio.gather(*(backend.allocate_recording_id(0) for _ in range(20)))
+        self.assertEqual(sorted(ids), list(range(1, 21)))
+        self.assertEqual(await backend.allocate_recording_id(41), 42)
+        self.assertEqual(await backend.allocate_recording_id(5), 43)
+
+    @async_test
+    async def test_received_chunks(self):
+        backend = self.create_backend()
+        for index in [0, 1, 3, 1]:
+            await backend.add_received_chunk(7, index)
+        self.assertEqual(await backend.get_received_chunks(7), {0, 1, 3})
+        self.assertEqual(await backend.get_received_chunks(8), set())
+        await backend.delete_recording(7)
+        self.assertEqual(await backend.get_received_chunks(7), set())
+        await backend.add_received_chunk(7, 0)
+        await backend.clear_received_chunks(7)
+        self.assertEqual(await backend.get_received_chunks(7), set())
+
+    @async_test
+    async def test_lease(self):
+        """Test that a lease is held by one owner, and that every acquisition returns a higher fencing token."""
+        backend = self.create_backend()
+        self.assertFalse(backend.is_leased(7))
+        token = await backend.acquire_lease(7, "node-a", 10)
+        self.assertIsNotNone(token)
+        self.assertTrue(backend.is_leased(7))
+        self.assertIsNone(await backend.acquire_lease(7, "node-b", 10))
+        self.assertFalse(await backend.renew_lease(7, "node-b", 10))
+        self.assertTrue(await backend.renew_lease(7, "node-a", 10))
+        # releasing a lease of another owner has no effect
+        await backend.release_lease(7, "node-b")
+        self.assertIsNone(await backend.acquire_lease(7, "node-b", 10))
+        await backend.release_lease(7, "node-a")
+        self.assertEqual(await backend.acquire_lease(7, "node-b", 10), token + 1)
+        self.assertIsNotNone(await backend.acquire_lease(8, "node-a", 10))
+
+    @async_test
+    async def test_lease_expires(self):
+        backend = self.create_backend()
+        token = await backend.acquire_lease(7, "node-a", 0.05)
+        await asyncio.sleep(0.1)
+        self.assertFalse(backend.is_leased(7))
+        self.assertEqual(await backend.acquire_lease(7, "node-b", 10), token + 1)
+        self.assertFalse(await backend.renew_lease(7, "node-a", 10))
+
+class TestInMemoryRecordingStateBackend(RecordingStateBackendTests, unittest.TestCase):
+    def create_backend(self):
+        return InMemoryRecordingStateBackend()
+
+@unittest.skipIf(redislite is None, "redislite is not installed")
+class TestRedisRecordingStateBackend(RecordingStateBackendTests, unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # a local Redis server for the tests
+        cls.redis = redislite.Redis()
+        cls.url = f"unix://{cls.redis.socket_file}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.redis.shutdown()
+
+    def setUp(self):
+        self.redis.flushdb()
+
+    def create_backend(self):
+        return RedisRecordingStateBackend(self.url)
+
+    @async_test
+    async def test_state_is_shared(self):
+        """Test that backends of different processes, with the same Redis database and prefix, share the state."""
+        node_a = RedisRecordingStateBackend(self.url)
+        node_b = RedisRecordingStateBackend(self.url)
+        other = RedisRecordingStateBackend(self.url, prefix="other:")
+        self.assertEqual(await node_a.allocate_recording_id(0), 1)
+        self.assertEqual(await node_b.allocate_recording_id(0), 2)
+        self.assertEqual(await other.allocate_recording_id(0), 1)
+        await node_a.add_received_chunk(1, 0)
+        self.assertEqual(await node_b.get_received_chunks(1), {0})
+        self.assertIsNotNone(await node_a.acquire_lease(1, "node-a", 10))
+        self.assertIsNone(await node_b.acquire_lease(1, "node-b", 10))
+
+    @async_test
+    async def test_state_expires(self):
+        """Test that the received chunks and the fencing token expire after the state TTL, which the lease renews."""
+        backend = RedisRecordingStateBackend(self.url, state_ttl=0.5)
+        await backend.acquire_lease(1, "node-a", 0.4)
+        await backend.add_received_chunk(1, 0)
+        self.assertGreater(self.redis.pttl("dictaphone:fencing:1"), 0)
+        self.assertGreater(self.redis.pttl("dictaphone:chunks:1"), 0)
+        await asyncio.sleep(0.3)
+        self.assertTrue(await backend.renew_lease(1, "node-a", 0.4))
+        await asyncio.sleep(0.3)
+        self.assertEqual(await backend.get_received_chunks(1), {0})
+        await asyncio.sleep(0.4)
+        self.assertEqual(await backend.get_received_chunks(1), set())
+        self.assertFalse(self.redis.exists("dictaphone:fencing:1"))
+
+if __name__ == "__main__":
+    unittest.main()
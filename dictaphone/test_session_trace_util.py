@@ -0,0 +1,94 @@
+from pathlib import Path
+import os
+import pytest
+from channels.testing import WebsocketCommunicator
+from django.test import override_settings
+from backend.asgi import application
+from dictaphone.audio_data_consumer import AudioChunkManager, RecordingStatus
+from dictaphone.session_trace_util import (read_session_trace, replay_session, extract_chunks, set_capture_enabled,
+                                           CONNECT, RECEIVE_TEXT, RECEIVE_BYTES, SEND_TEXT, DISCONNECT)
+
+NUM_CHUNKS = 3
+TEST_DATA_DIR = Path(__file__).parent / "resources" / "test_chunks"
+
+@pytest.fixture
+def audio_chunks():
+    return [(TEST_DATA_DIR / f"chunk_1_{i}_header.raw").read_bytes() for i in range(NUM_CHUNKS)]
+
+@pytest.fixture
+def capture_dir(tmp_path, monkeypatch):
+    original_init = AudioChunkManager.__init__
+
+    def mock_init(self, consumer, load_data_from_server=True):
+        original_init(self, consumer, load_data_from_server=False)
+
+    monkeypatch.setattr(AudioChunkManager, "__init__", mock_init)
+    with override_settings(SESSION_CAPTURE_ENABLED=False, SESSION_CAPTURE_DIR=str(tmp_path)):
+        yield tmp_path
+
+async def record_session(audio_chunks, title):
+    """Streams a recording with the chunks out of order, returns the completion status."""
+    communicator = WebsocketCommunicator(application, "/ws/dictaphone/data/")
+    connected, _ = await communicator.connect()
+    assert connected
+    await communicator.send_json_to({"type": "control_message", "message": "start_recording", "parameter": title})
+    response = await communicator.receive_json_from()
+    assert response.get("message_type") == "ack_start_recording"
+    for index in (0, 2, 1):
+        await communicator.send_to(bytes_data=audio_chunks[index])
+    await communicator.send_json_to({"type": "control_message", "message": "stop_recording", "parameter": NUM_CHUNKS})
+    while True:
+        response = await communicator.receive_json_from(timeout=15)
+        if response.get("message_type") == "recording_complete":
+            break
+    await communicator.disconnect()
+    return response["completion_status"]
+
+@pytest.mark.asyncio
+async def test_capture_and_replay_session(audio_chunks, capture_dir):
+    # capture is off
+    assert await record_session(audio_chunks, "Not captured") == RecordingStatus.VERIFIED.value
+    assert os.listdir(capture_dir) == []
+
+    # switched on at runtime
+    set_capture_enabled(True)
+    assert await record_session(audio_chunks, "Captured") == RecordingStatus.VERIFIED.value
+    set_capture_enabled(False)
+    traces = os.listdir(capture_dir)
+    assert len(traces) == 1
+    trace_path = os.path.join(capture_dir, traces[0])
+
+    _, records = read_session_trace(trace_path)
+    kinds = [kind for kind, _, _ in records]
+    assert kinds[0] == CONNECT and kinds[-1] == DISCONNECT
+    assert kinds.count(RECEIVE_TEXT) == 2
+    assert kinds.count(RECEIVE_BYTES) == NUM_CHUNKS
+    # the ack of the recording, the acks of the chunks, the request for the skipped chunk and the completion
+    assert kinds.count(SEND_TEXT) == 3 + NUM_CHUNKS
+    times = [offset for _, offset, _ in records]
+    assert times == sorted(times)
+    assert records[[kind for kind, _, _ in records].index(RECEIVE_BYTES)][2] == audio_chunks[0]
+
+    result = await replay_session(trace_path, speed=0)
+    assert result.inbound_frames == 2 + NUM_CHUNKS
+    assert result.matches, result.get_differences()
+    assert len(result.replayed_messages) == 3 + NUM_CHUNKS
+    assert os.listdir(capture_dir) == traces
+
+    # a trace cut off by a crash of the server
+    with open(trace_path, "r+b") as f:
+        f.truncate(os.path.getsize(trace_path) - 3)
+    _, truncated_records = read_session_trace(trace_path)
+    assert len(truncated_records) == len(records) - 1
+
+@pytest.mark.asyncio
+async def test_extract_chunks(audio_chunks, capture_dir, tmp_path_factory):
+    set_capture_enabled(True)
+    await record_session(audio_chunks, "Extracted")
+    set_capture_enabled(False)
+    trace_path = os.path.join(capture_dir, os.listdir(capture_dir)[0])
+    directory = tmp_path_factory.mktemp("chunks")
+    assert extract_chunks(trace_path, str(directory)) == NUM_CHUNKS
+    for index in range(NUM_CHUNKS):
+        assert (directory / f"chunk_1_{index}_header.raw").read_bytes() == audio_chunks[index]
+        assert (directory / f"chunk_1_{index}.raw").read_bytes() == audio_chunks[index][8:]
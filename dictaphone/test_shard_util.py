@@ -0,0 +1,68 @@
+import asyncio
+import functools
+import unittest
+
+from channels.layers import InMemoryChannelLayer
+from django.test import override_settings
+
+from .recording_state_util import InMemoryRecordingStateBackend
+from .shard_util import (ConsistentHashRing, allocate_local_recording_id, get_recording_shard, request_handoff,
+                         run_shard_listener)
+
+def async_test(coro):
+    """A decorator to run async test methods with the standard unittest runner."""
+    @functools.wraps(coro)
+    def wrapper(*args, **kwargs):
+        return asyncio.run(coro(*args, **kwargs))
+    return wrapper
+
+class TestShardUtil(unittest.TestCase):
+    def setUp(self):
+        self.enterContext(override_settings(SHARD_COUNT=4, SHARD_INDEX=1))
+
+    def test_ring_spreads_recordings(self):
+        ring = ConsistentHashRing(4)
+        counts = [0] * 4
+        for recording_id in range(1, 10001):
+            counts[ring.get_shard(recording_id)] += 1
+        for count in counts:
+            self.assertGreater(count, 1500)
+
+    def test_adding_a_shard_only_moves_its_recordings(self):
+        ring, larger_ring = ConsistentHashRing(4), ConsistentHashRing(5)
+        moved = [recording_id for recording_id in range(1, 10001)
+                 if ring.get_shard(recording_id) != larger_ring.get_shard(recording_id)]
+        self.assertLess(len(moved), 3000)
+        self.assertTrue(all(larger_ring.get_shard(recording_id) == 4 for recording_id in moved))
+
+    @async_test
+    async def test_allocate_local_recording_id(self):
+        backend = InMemoryRecordingStateBackend()
+        ids = [await allocate_local_recording_id(backend, 0) for _ in range(20)]
+        self.assertEqual(ids, sorted(set(ids)))
+        self.assertTrue(all(get_recording_shard(recording_id) == 1 for recording_id in ids))
+        with override_settings(SHARD_COUNT=1, SHARD_INDEX=0):
+            self.assertEqual(await allocate_local_recording_id(backend, 0), ids[-1] + 1)
+
+    @async_test
+    async def test_handoff(self):
+        """Test that a handoff is answered by the listener of the shard of the recording."""
+        channel_layer = InMemoryChannelLayer()
+        recording_id = next(recording_id for recording_id in range(1, 100) if get_recording_shard(recording_id) == 2)
+        handed_off = []
+        def handoff_handler(recording_id):
+            handed_off.append(recording_id)
+            return len(handed_off) == 1
+        listener = asyncio.create_task(run_shard_listener(channel_layer, 2, handoff_handler))
+        try:
+            self.assertTrue(await request_handoff(channel_layer, recording_id, 1.0))
+            self.assertFalse(await request_handoff(channel_layer, recording_id, 1.0))
+            self.assertEqual(handed_off, [recording_id, recording_id])
+            # no listener for the shard of another recording
+            other_id = next(recording_id for recording_id in range(1, 100) if get_recording_shard(recording_id) == 3)
+            self.assertFalse(await request_handoff(channel_layer, other_id, 0.1))
+        finally:
+            listener.cancel()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+import wave
+from pathlib import Path
+
+from django.test import override_settings
+
+from backend.celery import app
+from .tasks import transcription_task
+from .transcriber_simulator import get_audio_duration
+from .transcriber_util import (AauWhisperTranscriberBackend, SimulatorTranscriberBackend, TranscriberBackend,
+                               create_transcriber_backend)
+from .transcription_index_util import parse_subtitles
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+class EchoTranscriberBackend(TranscriberBackend):
+    """A custom backend, selected by its dotted path."""
+    def build_command(self, recording_file_path, output_dir_path, model_size, language, threads=4):
+        return [sys.executable, "-c", "print('transcribed')"]
+
+def write_wav(path: str, seconds: float, sample_rate: int = 16000):
+    with wave.open(path, "wb") as wav_file:
+        wav_file.setnchannels(2)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(b"\x00\x00" * 2 * int(seconds * sample_rate))
+
+class TestTranscriberUtil(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.recording_dir = os.path.join(self.temp_dir.name, "1_Interview")
+        os.makedirs(self.recording_dir)
+        self.wav_path = os.path.join(self.recording_dir, "Interview.wav")
+        write_wav(self.wav_path, 65)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_select_backend(self):
+        self.assertIsInstance(create_transcriber_backend("aau-whisper"), AauWhisperTranscriberBackend)
+        self.assertIsInstance(create_transcriber_backend("simulator"), SimulatorTranscriberBackend)
+        self.assertIsInstance(create_transcriber_backend(f"{__name__}.EchoTranscriberBackend"), EchoTranscriberBackend)
+        self.assertIsInstance(create_transcriber_backend("no.such.Backend"), AauWhisperTranscriberBackend)
+
+    def test_aau_whisper_command(self):
+        backend = AauWhisperTranscriberBackend()
+        self.assertEqual(backend.build_command("in.wav", "out/", "large-v3", "auto"),
+                         ['python', 'dictaphone/aau-whisper/app.py', '--job_name', 'files', '-o', 'out/', '-m', 'large-v3',
+                          '--input', 'in.wav', '--merge_speakers', '--threads', '4', '--transcriber_gui'])
+        self.assertEqual(backend.build_command("in.wav", "out/", "base", "da")[7:10], ['base', '--language', 'da'])
+
+    def test_audio_duration(self):
+        self.assertAlmostEqual(get_audio_duration(self.wav_path), 65.0)
+        try:
+            import numpy
+            import soundfile
+        except ImportError:
+            self.skipTest("soundfile is not installed")
+        flac_path = os.path.join(self.recording_dir, "Interview.flac")
+        soundfile.write(flac_path, numpy.zeros((48000 * 3, 2), dtype=numpy.int16), 48000, format="FLAC", subtype="PCM_16")
+        self.assertAlmostEqual(get_audio_duration(flac_path), 3.0)
+
+    def test_simulated_transcription(self):
+        """Test that the task runs the simulator, which writes the transcriptions and the progress."""
+        with override_settings(TRANSCRIBER_BACKEND="simulator", TRANSCRIBER_SIMULATOR_MODE="sleep",
+                               TRANSCRIBER_SIMULATOR_REALTIME_FACTORS={"base": 0.01}):
+            # the task of the server's Celery app, the aborted state is read from its result backend
+            result = app.tasks[transcription_task.name].apply(args=(self.recording_dir, self.wav_path, "base", "auto"))
+        # with the local profile the in-process worker started by other tests marks the process as a worker
+        self.assertEqual(result.get(disable_sync_subtasks=False), "Task completed")
+        transcription_dir = Path(self.recording_dir, "TRANSCRIPTIONS")
+        self.assertEqual(sorted(os.listdir(transcription_dir)),
+                         ["Interview.json", "Interview.srt", "Interview.txt", "Interview.vtt", "transcriber_output.txt"])
+        segments = parse_subtitles((transcription_dir / "Interview.srt").read_text())
+        self.assertEqual(segments, parse_subtitles((transcription_dir / "Interview.vtt").read_text()))
+        self.assertEqual(segments[0][1], 0.0)
+        self.assertAlmostEqual(segments[-1][2], 65.0)
+        output = (transcription_dir / "transcriber_output.txt").read_text()
+        self.assertIn("Model: base", output)
+        self.assertIn("realtime factor 0.01", output)
+        self.assertIn("Transcribing: 100%", output)
+
+    def test_simulator_is_terminated(self):
+        """Test that the simulator keeping the CPU busy stops with its helper processes when it is terminated."""
+        with override_settings(TRANSCRIBER_SIMULATOR_MODE="cpu", TRANSCRIBER_SIMULATOR_REALTIME_FACTORS={}):
+            command = SimulatorTranscriberBackend().build_command(self.wav_path, self.recording_dir, "large-v3", "en", threads=2)
+        process = subprocess.Popen(command, cwd=BASE_DIR, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        try:
+            self.assertIn("Simulated transcription", process.stdout.readline())
+            time.sleep(0.5)
+            process.terminate()
+            self.assertEqual(process.wait(10), 128 + 15)
+        finally:
+            if process.poll() is None:
+                process.kill()
+        self.assertFalse(os.path.exists(os.path.join(self.recording_dir, "Interview.srt")))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+import os
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from .transcription_index_util import (TranscriptionIndex, parse_subtitles, parse_text, get_transcription_files,
+                                       build_match_query, INDEX_FILE_NAME)
+
+SRT_CONTENT = """1
+00:00:01,000 --> 00:00:04,500
+[SPEAKER_00]: Welcome to the budget meeting.
+
+2
+00:01:02,250 --> 00:01:05,000
+[SPEAKER_01]: The café renovation
+is delayed until March.
+"""
+
+class TestTranscriptionIndexUtil(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.TemporaryDirectory()
+        self.base_path = Path(self.test_dir.name)
+        self.transcription_dir = self.base_path / "1_Meeting" / "TRANSCRIPTIONS"
+        self.transcription_dir.mkdir(parents=True)
+        (self.transcription_dir / "Meeting.srt").write_text(SRT_CONTENT)
+        self.index = TranscriptionIndex(str(self.base_path / INDEX_FILE_NAME))
+
+    def tearDown(self):
+        self.test_dir.cleanup()
+
+    def test_parse_subtitles(self):
+        """Test that SRT cues are parsed with their timestamps, and multi-line cues are joined."""
+        self.assertEqual(parse_subtitles(SRT_CONTENT), [
+            ("[SPEAKER_00]: Welcome to the budget meeting.", 1.0, 4.5),
+            ("[SPEAKER_01]: The café renovation is delayed until March.", 62.25, 65.0),
+        ])
+        vtt_content = "WEBVTT\n\n01:00:00.500 --> 01:00:01.000\nHello\n"
+        self.assertEqual(parse_subtitles(vtt_content), [("Hello", 3600.5, 3601.0)])
+        self.assertEqual(parse_text("First  paragraph\nline two\n\nSecond\n"), [
+            ("First paragraph line two", None, None), ("Second", None, None)])
+
+    def test_get_transcription_files(self):
+        """Test that subtitles are preferred over plain text, and that log files are not indexed."""
+        (self.transcription_dir / "Meeting.txt").write_text("text")
+        (self.transcription_dir / "Other.txt").write_text("text")
+        (self.transcription_dir / "transcriber_output.txt").write_text("log")
+        (self.transcription_dir / "files.zip").write_bytes(b"")
+        files = [os.path.basename(path) for path in get_transcription_files(str(self.transcription_dir))]
+        self.assertEqual(files, ["Meeting.srt", "Other.txt"])
+
+    def test_index_and_search(self):
+        """Test that hits are returned with the recording, the file and the time of the segment."""
+        self.index.index_recording(1, "Meeting", str(self.transcription_dir))
+        hits = self.index.search("budget")
+        self.assertEqual(len(hits), 1)
+        self.assertEqual(hits[0]['recording_id'], 1)
+        self.assertEqual(hits[0]['title'], "Meeting")
+        self.assertEqual(hits[0]['file_name'], "Meeting.srt")
+        self.assertEqual((hits[0]['start'], hits[0]['end']), (1.0, 4.5))
+        self.assertIn("[budget]", hits[0]['snippet'])
+        # prefix search, diacritics are ignored and all words must match
+        self.assertEqual([hit['start'] for hit in self.index.search("cafe renov*")], [62.25])
+        self.assertEqual(self.index.search("cafe renov"), [])
+        self.assertEqual(self.index.search("budget march"), [])
+        # characters of the query syntax are searched for as text
+        self.assertEqual(self.index.search('"budget" OR NEAR( *'), [])
+        self.assertEqual(self.index.search("   "), [])
+
+    def test_search_results_truncated(self):
+        """Test that only the most recent matches are ranked, and that the results are then marked as truncated."""
+        (self.transcription_dir / "Meeting.srt").write_text("".join(
+            f"{number}\n00:00:{number:02d},000 --> 00:00:{number:02d},500\nBudget item {number}\n\n" for number in range(1, 6)))
+        self.index.index_recording(1, "Meeting", str(self.transcription_dir))
+        self.assertEqual(self.index.search_results("budget")['truncated'], False)
+        with mock.patch("dictaphone.transcription_index_util.RANKED_CANDIDATES", 3):
+            results = self.index.search_results("budget")
+            self.assertTrue(results['truncated'])
+            self.assertEqual(sorted(hit['start'] for hit in results['hits']), [3.0, 4.0, 5.0])
+            self.assertFalse(self.index.search_results("item 2")['truncated'])
+        self.assertEqual(self.index.search_results("   "), {'hits': [], 'truncated': False})
+
+    def test_reindex_and_remove(self):
+        """Test that indexing a recording again replaces its segments, and that removed recordings are not found."""
+        self.index.index_recording(1, "Meeting", str(self.transcription_dir))
+        self.index.index_recording(1, "Meeting", str(self.transcription_dir))
+        self.assertEqual(len(self.index.search("welcome")), 1)
+        self.index.remove_recording(1)
+        self.assertEqual(self.index.search("welcome"), [])
+
+    def test_sync(self):
+        """Test that sync indexes changed recordings and removes recordings that no longer exist."""
+        self.index.sync({1: ("Meeting", str(self.transcription_dir))})
+        self.assertEqual(len(self.index.search("welcome")), 1)
+        # a modified transcription is indexed again
+        time.sleep(0.01)
+        (self.transcription_dir / "Meeting.srt").write_text(SRT_CONTENT.replace("budget", "annual"))
+        self.index.sync({1: ("Meeting", str(self.transcription_dir))})
+        self.assertEqual(self.index.search("budget"), [])
+        self.assertEqual(len(self.index.search("annual")), 1)
+        self.index.sync({})
+        self.assertEqual(self.index.search("annual"), [])
+
+    def test_build_match_query(self):
+        self.assertEqual(build_match_query('budget "q3 renov*'), '"budget" """q3" "renov"*')
+        self.assertIsNone(build_match_query(" * "))
+        self.assertIsNone(build_match_query(""))
+
+
+if __name__ == "__main__":
+    unittest.main()
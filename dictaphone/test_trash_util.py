@@ -0,0 +1,77 @@
+import os
+import unittest
+import tempfile
+from pathlib import Path
+from .trash_util import move_to_trash, empty_leftover_trash, TrashCollector, TRASH_DIR_NAME
+
+class TestTrashUtil(unittest.TestCase):
+    def setUp(self):
+        # Create a temporary recordings base directory for each test
+        self.test_dir = tempfile.TemporaryDirectory()
+        self.base_path = Path(self.test_dir.name)
+        self.collector = TrashCollector(bytes_per_second=0)
+
+    def tearDown(self):
+        self.test_dir.cleanup()
+
+    def create_recording_dir(self, name):
+        recording_path = self.base_path / name
+        (recording_path / "TRANSCRIPTIONS").mkdir(parents=True)
+        (recording_path / "recording.wav").write_bytes(b"\0" * 1024)
+        (recording_path / "TRANSCRIPTIONS" / "recording.txt").write_text("transcription")
+        return recording_path
+
+    def test_move_to_trash(self):
+        """Test that a directory is moved to the trash, also when the same name is deleted twice."""
+        first_path = move_to_trash(str(self.create_recording_dir("1_Meeting")), str(self.base_path))
+        second_path = move_to_trash(str(self.create_recording_dir("1_Meeting")), str(self.base_path))
+        self.assertFalse((self.base_path / "1_Meeting").exists())
+        self.assertNotEqual(first_path, second_path)
+        self.assertEqual(len(os.listdir(self.base_path / TRASH_DIR_NAME)), 2)
+        self.assertTrue(os.path.isfile(os.path.join(second_path, "TRANSCRIPTIONS", "recording.txt")))
+
+    def test_schedule_reclaims_directory(self):
+        """Test that a scheduled trash directory is deleted by the background thread."""
+        trash_path = move_to_trash(str(self.create_recording_dir("2_Meeting")), str(self.base_path))
+        self.collector.schedule(trash_path)
+        self.collector.wait_until_empty()
+        self.assertFalse(os.path.exists(trash_path))
+
+    def test_empty_trash_reclaims_leftovers(self):
+        """Test that everything left in the trash, e.g. after a restart, is deleted."""
+        move_to_trash(str(self.create_recording_dir("3_Meeting")), str(self.base_path))
+        move_to_trash(str(self.create_recording_dir("4_Meeting")), str(self.base_path))
+        (self.base_path / TRASH_DIR_NAME / "stray_file").write_text("stray")
+        self.collector.empty_trash(str(self.base_path))
+        self.collector.wait_until_empty()
+        self.assertEqual(os.listdir(self.base_path / TRASH_DIR_NAME), [])
+
+    def test_leftover_trash_emptied_once(self):
+        """Test that the leftover trash of a base directory is only listed the first time, not for every connection."""
+        from unittest import mock
+        from . import trash_util
+        move_to_trash(str(self.create_recording_dir("6_Meeting")), str(self.base_path))
+        with mock.patch.object(trash_util, 'get_trash_collector', return_value=self.collector), \
+                mock.patch.object(self.collector, 'empty_trash', wraps=self.collector.empty_trash) as empty_trash:
+            empty_leftover_trash(str(self.base_path))
+            empty_leftover_trash(str(self.base_path))
+        self.assertEqual(empty_trash.call_count, 1)
+        self.collector.wait_until_empty()
+        self.assertEqual(os.listdir(self.base_path / TRASH_DIR_NAME), [])
+
+    def test_large_file_reclaimed_at_limited_rate(self):
+        """Test that large files are truncated in steps and that the rate limit is applied."""
+        import dictaphone.trash_util as trash_util
+        original_step = trash_util.TRUNCATE_STEP_BYTES
+        trash_util.TRUNCATE_STEP_BYTES = 1024
+        self.addCleanup(setattr, trash_util, "TRUNCATE_STEP_BYTES", original_step)
+        slept = []
+        collector = TrashCollector(bytes_per_second=1024 * 1024)
+        collector._throttle = lambda released_bytes: slept.append(released_bytes)
+        recording_path = self.create_recording_dir("5_Meeting")
+        (recording_path / "recording.wav").write_bytes(b"\1" * 10 * 1024)
+        collector.schedule(move_to_trash(str(recording_path), str(self.base_path)))
+        collector.wait_until_empty()
+        self.assertEqual(os.listdir(self.base_path / TRASH_DIR_NAME), [])
+        # ten truncate steps for the large file and one step for the transcription file
+        self.assertEqual(sorted(slept), sorted([1024] * 10 + [len("transcription")]))
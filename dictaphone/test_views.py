@@ -0,0 +1,104 @@
+import asyncio
+import importlib.util
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from django.core.asgi import get_asgi_application
+from django.http import Http404
+from django.test import RequestFactory
+
+from backend import settings
+from . import views
+from .export_util import EXPORT_BLOCK_SIZE
+
+REFERENCE_FILE = Path(__file__).parent / "resources" / "test_chunks" / "recording.wav"
+
+class TestStreamedViews(unittest.TestCase):
+    """Tests that files are sent while they are read when the views are served by the ASGI handler."""
+    def setUp(self):
+        self.test_dir = tempfile.TemporaryDirectory()
+        self.recording_path = Path(self.test_dir.name) / "RECORDINGS" / "1_Meeting"
+        self.recording_path.mkdir(parents=True)
+        self.wav_path = self.recording_path / "Meeting.wav"
+        self.media_root = mock.patch.object(settings, 'MEDIA_ROOT', self.test_dir.name)
+        self.media_root.start()
+        self.read_blocks = 0
+
+    def tearDown(self):
+        self.media_root.stop()
+        self.test_dir.cleanup()
+
+    def count_blocks(self, blocks):
+        for block in blocks:
+            self.read_blocks += 1
+            yield block
+
+    def get(self, path: str, query_string: bytes = b"") -> tuple[list[bytes], int]:
+        """
+        Sends a GET request to the ASGI handler.
+
+        Returns:
+            The parts of the response body, and the number of blocks read from the file when the first part was sent.
+        """
+        scope = {'type': 'http', 'method': 'GET', 'path': path, 'query_string': query_string,
+                 'headers': [(b'host', b'localhost')]}
+        parts = []
+        read_blocks_at_first_part = []
+        requests = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+
+        async def receive():
+            if requests:
+                return requests.pop()
+            # the client stays connected until the response is sent
+            await asyncio.Event().wait()
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                self.assertEqual(message['status'], 200)
+            elif message.get('body'):
+                if not parts:
+                    read_blocks_at_first_part.append(self.read_blocks)
+                parts.append(message['body'])
+
+        asyncio.run(get_asgi_application()(scope, receive, send))
+        return parts, read_blocks_at_first_part[0]
+
+    def test_export_is_streamed(self):
+        self.wav_path.write_bytes(bytes(8 * EXPORT_BLOCK_SIZE))
+        iter_recordings_zip = views.iter_recordings_zip
+        with mock.patch.object(views, 'iter_recordings_zip', lambda paths: self.count_blocks(iter_recordings_zip(paths))):
+            parts, read_blocks = self.get('/export/', b'path=media/RECORDINGS/1_Meeting/Meeting.wav')
+        self.assertGreater(len(b"".join(parts)), 8 * EXPORT_BLOCK_SIZE)
+        # the first part is sent before the zip file is written to the end
+        self.assertLess(read_blocks, self.read_blocks // 2)
+
+    @unittest.skipUnless(importlib.util.find_spec("soundfile"), "soundfile is not installed")
+    def test_archived_download_is_streamed(self):
+        from .archive_util import encode_wav_to_flac, ARCHIVE_MANIFEST_KEY
+        from .recording_metadata_util import update_metadata
+        shutil.copy(REFERENCE_FILE, self.wav_path)
+        manifest = encode_wav_to_flac(str(self.wav_path), str(self.recording_path / "Meeting.flac"))
+        update_metadata(str(self.recording_path), **{ARCHIVE_MANIFEST_KEY: manifest})
+        self.wav_path.unlink()
+        iter_restored_wav = views.iter_restored_wav
+        with mock.patch.object(views, 'iter_restored_wav',
+                               lambda *args: self.count_blocks(iter_restored_wav(*args))):
+            parts, read_blocks = self.get('/media/RECORDINGS/1_Meeting/Meeting.wav')
+        self.assertEqual(b"".join(parts), REFERENCE_FILE.read_bytes())
+        self.assertGreater(self.read_blocks, 2)
+        self.assertLess(read_blocks, self.read_blocks)
+
+    def test_waveform_path_stays_in_recordings(self):
+        self.wav_path.write_bytes(REFERENCE_FILE.read_bytes())
+        shutil.copy(REFERENCE_FILE, Path(self.test_dir.name) / "Outside.wav")
+        request = RequestFactory().get('/waveform/media/RECORDINGS/../Outside.wav')
+        with self.assertRaises(Http404):
+            views.serve_waveform(request, '../Outside.wav')
+        request = RequestFactory().get('/waveform/media/RECORDINGS/1_Meeting/Meeting.wav')
+        self.assertEqual(views.serve_waveform(request, '1_Meeting/Meeting.wav').status_code, 200)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from .waveform_util import (WaveformBuilder, build_waveform, build_recording_waveform, read_peaks, get_level_file_path,
+                            WAVEFORM_DIR_NAME, SAMPLES_PER_PEAK, LEVEL_FACTOR, NUMBER_OF_LEVELS, PEAK_DTYPE)
+
+REFERENCE_FILE = Path(__file__).parent / "resources" / "test_chunks" / "recording.wav"
+WAV_HEADER_SIZE = 44
+
+def expected_peaks(wav_bytes: bytes, level: int) -> np.ndarray:
+    """Computes the peaks of a level directly from the audio frames."""
+    frames = np.frombuffer(wav_bytes[WAV_HEADER_SIZE:], dtype='<i2').reshape(-1, 2)
+    frames_per_peak = SAMPLES_PER_PEAK * LEVEL_FACTOR ** level
+    peaks = []
+    for start in range(0, len(frames), frames_per_peak):
+        block = frames[start:start + frames_per_peak]
+        peaks.append((block.min(), block.max()))
+    return np.array(peaks, dtype=PEAK_DTYPE)
+
+def read_level(waveform_path: str, level: int) -> np.ndarray:
+    return np.fromfile(get_level_file_path(waveform_path, level), dtype=PEAK_DTYPE).reshape(-1, 2)
+
+class TestWaveformUtil(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.TemporaryDirectory()
+        self.waveform_path = os.path.join(self.test_dir.name, WAVEFORM_DIR_NAME)
+        self.wav_bytes = REFERENCE_FILE.read_bytes()
+
+    def tearDown(self):
+        self.test_dir.cleanup()
+
+    def test_incremental_peaks_match_audio(self):
+        """Test that peaks built from blocks that split frames match the peaks computed from the whole file."""
+        builder = WaveformBuilder(self.waveform_path)
+        for start in range(0, len(self.wav_bytes), 100003):
+            builder.append(self.wav_bytes[start:start + 100003])
+        builder.finish()
+        for level in range(NUMBER_OF_LEVELS):
+            np.testing.assert_array_equal(read_level(self.waveform_path, level), expected_peaks(self.wav_bytes, level))
+
+    def test_append_after_finish(self):
+        """Test that the partial peaks written when a recording is finished are replaced when the recording continues."""
+        builder = WaveformBuilder(self.waveform_path)
+        middle = len(self.wav_bytes) // 2 + 1
+        builder.append(self.wav_bytes[:middle])
+        builder.finish()
+        builder.append(self.wav_bytes[middle:])
+        builder.finish()
+        for level in range(NUMBER_OF_LEVELS):
+            np.testing.assert_array_equal(read_level(self.waveform_path, level), expected_peaks(self.wav_bytes, level))
+
+    def test_read_peaks_selects_level(self):
+        """Test that the finest level with at most the requested number of peaks in the time range is read."""
+        build_waveform([self.wav_bytes], self.waveform_path)
+        info, peaks = read_peaks(self.waveform_path, 0.0, None, 10**6)
+        self.assertEqual(info['level'], 0)
+        self.assertEqual(info['first_peak'], 0)
+        self.assertEqual(info['seconds_per_peak'], SAMPLES_PER_PEAK / 48000)
+        self.assertEqual(peaks, expected_peaks(self.wav_bytes, 0).tobytes())
+
+        number_of_level_1_peaks = len(expected_peaks(self.wav_bytes, 1))
+        info, peaks = read_peaks(self.waveform_path, 0.0, None, number_of_level_1_peaks)
+        self.assertEqual(info['level'], 1)
+        self.assertEqual(peaks, expected_peaks(self.wav_bytes, 1).tobytes())
+
+        # a time range of the finest level
+        start_seconds = 10 * SAMPLES_PER_PEAK / 48000
+        end_seconds = 20 * SAMPLES_PER_PEAK / 48000
+        info, peaks = read_peaks(self.waveform_path, start_seconds, end_seconds, 10)
+        self.assertEqual((info['level'], info['first_peak']), (0, 10))
+        self.assertEqual(peaks, expected_peaks(self.wav_bytes, 0)[10:20].tobytes())
+
+    def test_build_recording_waveform(self):
+        """Test that the peaks of an existing recording are built when they are first requested."""
+        wav_path = os.path.join(self.test_dir.name, "Meeting.wav")
+        Path(wav_path).write_bytes(self.wav_bytes)
+        self.assertEqual(build_recording_waveform(wav_path), self.waveform_path)
+        np.testing.assert_array_equal(read_level(self.waveform_path, 0), expected_peaks(self.wav_bytes, 0))
+        # the temporary build directory is renamed
+        self.assertEqual(sorted(os.listdir(self.test_dir.name)), ["Meeting.wav", WAVEFORM_DIR_NAME])
+        self.assertIsNone(build_recording_waveform(os.path.join(self.test_dir.name, "Missing.wav")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,181 @@
+"""
+Simulated transcriber, run by transcription_task with TRANSCRIBER_BACKEND=simulator, see dictaphone/transcriber_util.py.
+
+Takes the time a model would take to transcribe the recording: the duration of the audio times the realtime factor of
+the model, sleeping (--mode sleep) or keeping --threads CPU cores busy (--mode cpu). It processes the audio in windows
+of 30 seconds like Whisper, printing the segments of each window to stdout and a progress bar to stderr, and writes
+generated transcriptions in the output directory when it is done: .txt, .srt, .vtt and .json files named after the
+audio file. The transcriptions are generated from the name of the audio file, so they are the same for every run.
+
+Usage:
+    python -m dictaphone.transcriber_simulator -o TRANSCRIPTIONS/ -m large-v3 --input recording.wav --mode cpu
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import signal
+import sys
+import time
+import zlib
+
+from .archive_util import read_wav_layout
+
+# Seconds of processing per second of audio on a machine without a GPU, in proportion to the estimates of the client
+DEFAULT_REALTIME_FACTORS = {
+    "base": 0.1,
+    "small": 0.2,
+    "medium": 0.5,
+    "large-v3": 1.0,
+    "large-v3-turbo": 0.6,
+    "parakeet": 0.4,
+}
+UNKNOWN_MODEL_REALTIME_FACTOR = 1.0
+WINDOW_SECONDS = 30.0
+# magic, metadata block header and the STREAMINFO block
+FLAC_STREAMINFO_SIZE = 4 + 4 + 34
+
+WORDS = ("the", "meeting", "project", "we", "agreed", "to", "review", "budget", "next", "week", "data", "interview",
+         "recording", "question", "answer", "students", "research", "report", "deadline", "results", "and", "a",
+         "team", "discussed", "plan", "for", "analysis", "of", "new", "approach", "is", "important", "quarterly")
+
+def get_audio_duration(audio_path: str) -> float:
+    """Returns the duration in seconds of a WAV or FLAC file."""
+    with open(audio_path, "rb") as f:
+        magic = f.read(4)
+        f.seek(0)
+        if magic == b"fLaC":
+            # the first metadata block is the STREAMINFO, after the block and frame sizes are the sample rate (20 bits),
+            # channels (3 bits), bits per sample (5 bits) and total samples (36 bits)
+            header = f.read(FLAC_STREAMINFO_SIZE)
+            if len(header) < FLAC_STREAMINFO_SIZE:
+                raise ValueError("No STREAMINFO in FLAC file.")
+            value = int.from_bytes(header[18:26], "big")
+            sample_rate = value >> 44
+            total_samples = value & ((1 << 36) - 1)
+            return total_samples / sample_rate if sample_rate else 0.0
+        channels, sample_rate, bits_per_sample, data_offset = read_wav_layout(f)
+    frame_size = channels * bits_per_sample // 8
+    return (os.path.getsize(audio_path) - data_offset) / (frame_size * sample_rate)
+
+def generate_segments(name: str, duration: float) -> list[tuple[float, float, str]]:
+    """Generates segments of 3 to 8 seconds covering the duration, the same for the same name."""
+    rng = random.Random(zlib.crc32(name.encode("utf-8")))
+    segments = []
+    start = 0.0
+    while start < duration:
+        end = min(duration, start + rng.uniform(3.0, 8.0))
+        words = [rng.choice(WORDS) for _ in range(max(1, int((end - start) * 2.5)))]
+        segments.append((start, end, " ".join(words).capitalize() + "."))
+        start = end
+    return segments
+
+def format_timestamp(seconds: float, separator: str = ",", always_hours: bool = True) -> str:
+    milliseconds = round(seconds * 1000)
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    hours_part = f"{hours:02d}:" if always_hours or hours else ""
+    return f"{hours_part}{minutes:02d}:{seconds:02d}{separator}{milliseconds:03d}"
+
+def write_transcriptions(output_dir: str, name: str, segments: list, language: str):
+    os.makedirs(output_dir, exist_ok=True)
+    base_path = os.path.join(output_dir, name)
+    with open(base_path + ".txt", "w", encoding="utf-8") as f:
+        f.write("\n".join(text for _, _, text in segments) + "\n")
+    with open(base_path + ".srt", "w", encoding="utf-8") as f:
+        for number, (start, end, text) in enumerate(segments, start=1):
+            f.write(f"{number}\n{format_timestamp(start)} --> {format_timestamp(end)}\n{text}\n\n")
+    with open(base_path + ".vtt", "w", encoding="utf-8") as f:
+        f.write("WEBVTT\n\n")
+        for start, end, text in segments:
+            f.write(f"{format_timestamp(start, '.')} --> {format_timestamp(end, '.')}\n{text}\n\n")
+    with open(base_path + ".json", "w", encoding="utf-8") as f:
+        json.dump({
+            "text": " ".join(text for _, _, text in segments),
+            "language": language,
+            "segments": [{"id": index, "start": round(start, 3), "end": round(end, 3), "text": text}
+                         for index, (start, end, text) in enumerate(segments)],
+        }, f, ensure_ascii=False)
+
+def busy_wait(seconds: float):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+def keep_core_busy(stop_event):
+    while not stop_event.is_set():
+        busy_wait(0.05)
+
+def print_progress(done: float, total: float, elapsed: float):
+    fraction = done / total if total else 1.0
+    bar = ("#" * int(fraction * 20)).ljust(20)
+    remaining = elapsed / fraction - elapsed if fraction else 0.0
+    print(f"Transcribing: {fraction * 100:3.0f}%|{bar}| {done:.1f}/{total:.1f} s "
+          f"[{format_timestamp(elapsed, '.', False)}<{format_timestamp(remaining, '.', False)}]",
+          file=sys.stderr, flush=True)
+
+def terminate(signum, frame):
+    # terminated when the transcription task is aborted, the helper processes are stopped on exit
+    sys.exit(128 + signum)
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated transcriber for benchmarking the transcription queue.")
+    parser.add_argument("-o", "--output_dir", required=True, help="directory to write the transcriptions to")
+    parser.add_argument("-m", "--model", default="large-v3", help="model name, selects the default realtime factor")
+    parser.add_argument("--language", default="auto", help="language of the recording, 'auto' is reported as 'en'")
+    parser.add_argument("--input", required=True, help="the WAV or FLAC file to transcribe")
+    parser.add_argument("--threads", type=int, default=4, help="CPU cores kept busy in cpu mode")
+    parser.add_argument("--mode", choices=("sleep", "cpu"), default="sleep", help="sleep, or keep CPU cores busy")
+    parser.add_argument("--realtime-factor", type=float, help="seconds of processing per second of audio")
+    args = parser.parse_args()
+    signal.signal(signal.SIGTERM, terminate)
+
+    realtime_factor = args.realtime_factor
+    if realtime_factor is None:
+        realtime_factor = DEFAULT_REALTIME_FACTORS.get(args.model, UNKNOWN_MODEL_REALTIME_FACTOR)
+    duration = get_audio_duration(args.input)
+    name = os.path.splitext(os.path.basename(args.input))[0]
+    language = "en" if args.language == "auto" else args.language
+    segments = generate_segments(name, duration)
+    print(f"Simulated transcription of {args.input}: {duration:.1f} s of audio, model {args.model}, "
+          f"realtime factor {realtime_factor}, mode {args.mode}", flush=True)
+    if args.language == "auto":
+        print(f"Detected language: {language}", flush=True)
+
+    helpers = []
+    stop_event = multiprocessing.Event()
+    if args.mode == "cpu":
+        for _ in range(max(0, args.threads - 1)):
+            helper = multiprocessing.Process(target=keep_core_busy, args=(stop_event,), daemon=True)
+            helper.start()
+            helpers.append(helper)
+    try:
+        start_time = time.monotonic()
+        window_start = 0.0
+        segment_index = 0
+        while window_start < duration:
+            window_end = min(duration, window_start + WINDOW_SECONDS)
+            processing_seconds = (window_end - window_start) * realtime_factor
+            if args.mode == "cpu":
+                busy_wait(processing_seconds)
+            else:
+                time.sleep(processing_seconds)
+            while segment_index < len(segments) and segments[segment_index][0] < window_end:
+                start, end, text = segments[segment_index]
+                print(f"[{format_timestamp(start, '.', False)} --> {format_timestamp(end, '.', False)}] {text}", flush=True)
+                segment_index += 1
+            print_progress(window_end, duration, time.monotonic() - start_time)
+            window_start = window_end
+        write_transcriptions(args.output_dir, name, segments, language)
+        print(f"Transcription done in {time.monotonic() - start_time:.1f} s", flush=True)
+    finally:
+        stop_event.set()
+        for helper in helpers:
+            helper.join(1.0)
+            if helper.is_alive():
+                helper.terminate()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import logging
+import sys
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# The transcriber is a separate process run by transcription_task, the backend builds its command line.
+# The process writes the transcriptions to the output directory, its stdout and stderr are appended to
+# transcriber_output.txt, and it is terminated when the task is aborted.
+# 'aau-whisper' runs the transcriber application, see the README. 'simulator' runs dictaphone/transcriber_simulator.py,
+# which takes the time a model would take for the duration of the recording, for benchmarking the transcription
+# queue without the models. A custom backend is set by the dotted path of its class.
+AAU_WHISPER_BACKEND = "aau-whisper"
+SIMULATOR_BACKEND = "simulator"
+
+class TranscriberBackend:
+    """Builds the command of the transcriber process for a recording."""
+    def build_command(self, recording_file_path: str, output_dir_path: str, model_size: str, language: str,
+                      threads: int = 4) -> list[str]:
+        """
+        Args:
+            recording_file_path: The path to the audio file, WAV or FLAC if the recording is archived.
+            output_dir_path: The directory to write the transcriptions to.
+            model_size: The name of the model, e.g. 'large-v3', see clean_model_name.
+            language: The language of the recording, or 'auto' to detect it.
+            threads: The number of CPU threads the transcriber may use.
+
+        Returns:
+            The command line of the transcriber process.
+        """
+        raise NotImplementedError
+
+class AauWhisperTranscriberBackend(TranscriberBackend):
+    def build_command(self, recording_file_path: str, output_dir_path: str, model_size: str, language: str,
+                      threads: int = 4) -> list[str]:
+        command = ['python', 'dictaphone/aau-whisper/app.py', '--job_name', 'files',
+                   '-o', output_dir_path, '-m', model_size]
+        if language != 'auto':
+            command += ['--language', language]
+        return command + ['--input', recording_file_path, '--merge_speakers', '--threads', str(threads),
+                          '--transcriber_gui']
+
+class SimulatorTranscriberBackend(TranscriberBackend):
+    def build_command(self, recording_file_path: str, output_dir_path: str, model_size: str, language: str,
+                      threads: int = 4) -> list[str]:
+        command = [sys.executable, '-m', 'dictaphone.transcriber_simulator', '-o', output_dir_path, '-m', model_size,
+                   '--language', language, '--input', recording_file_path, '--threads', str(threads),
+                   '--mode', settings.TRANSCRIBER_SIMULATOR_MODE]
+        realtime_factor = settings.TRANSCRIBER_SIMULATOR_REALTIME_FACTORS.get(model_size)
+        if realtime_factor is not None:
+            command += ['--realtime-factor', str(realtime_factor)]
+        return command
+
+def create_transcriber_backend(name: str) -> TranscriberBackend:
+    if name == SIMULATOR_BACKEND:
+        return SimulatorTranscriberBackend()
+    if name != AAU_WHISPER_BACKEND:
+        try:
+            return import_string(name)()
+        except ImportError as e:
+            logger.error(f"Unknown transcriber backend '{name}', using {AAU_WHISPER_BACKEND}: {e}")
+    return AauWhisperTranscriberBackend()
+
+def get_transcriber_backend() -> TranscriberBackend:
+    """Returns the transcriber backend selected by the TRANSCRIBER_BACKEND setting."""
+    return create_transcriber_backend(settings.TRANSCRIBER_BACKEND)
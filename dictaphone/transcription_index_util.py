@@ -0,0 +1,284 @@
+import contextlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# The index is a SQLite database in the recordings base directory, hidden so it is not loaded as a recording
+INDEX_FILE_NAME = ".transcription_index.sqlite3"
+# Transcription files that are indexed, in order of preference when there are several files with the same name
+INDEXED_EXTENSIONS = (".srt", ".vtt", ".txt")
+# Files in the TRANSCRIPTIONS directory that are not transcriptions
+EXCLUDED_FILE_NAMES = {"transcriber_output.txt", "transcribe.log"}
+MAX_SEARCH_RESULTS = 200
+# Hits are ranked by relevance among the most recently indexed matching segments. Ranking every match costs time
+# proportional to the number of matches, which for common words grows with the hours of transcriptions indexed.
+# Older matches are not returned, the search results are then marked as truncated.
+RANKED_CANDIDATES = 1000
+
+# Subtitle cue timing, e.g. "00:01:02,500 --> 00:01:04,000" (SRT) or "00:01:02.500 --> 00:01:04.000" (VTT)
+CUE_TIMING_PATTERN = re.compile(r"(?:(\d+):)?(\d{1,2}):(\d{2})[,.](\d{1,3})\s*-->\s*(?:(\d+):)?(\d{1,2}):(\d{2})[,.](\d{1,3})")
+
+# The segments are stored in a regular table indexed by recording ID, and the FTS5 table indexes their text
+# (external content), so the segments of a recording are replaced without scanning the full-text index.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    recording_id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL,
+    signature TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS segment_data (
+    id INTEGER PRIMARY KEY,
+    recording_id INTEGER NOT NULL,
+    file_name TEXT NOT NULL,
+    start REAL,
+    end REAL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS segment_data_recording_id ON segment_data (recording_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS segments USING fts5(
+    text,
+    content = 'segment_data',
+    content_rowid = 'id',
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+def parse_timestamp(hours, minutes, seconds, milliseconds) -> float:
+    return int(hours or 0) * 3600 + int(minutes) * 60 + int(seconds) + int(milliseconds.ljust(3, "0")) / 1000
+
+def parse_subtitles(content: str) -> list[tuple[str, float | None, float | None]]:
+    """
+    Parses the cues of an SRT or VTT file.
+
+    Args:
+        content: The content of the subtitle file.
+
+    Returns:
+        A list with the text, start time and end time in seconds of each cue.
+    """
+    segments = []
+    for block in re.split(r"\n\s*\n", content.replace("\r\n", "\n").lstrip("\ufeff")):
+        lines = block.strip().split("\n")
+        for position, line in enumerate(lines):
+            timing = CUE_TIMING_PATTERN.search(line)
+            if timing is not None:
+                text = " ".join(text_line.strip() for text_line in lines[position + 1:] if text_line.strip())
+                if text:
+                    segments.append((text, parse_timestamp(*timing.groups()[:4]), parse_timestamp(*timing.groups()[4:])))
+                break
+    return segments
+
+def parse_text(content: str) -> list[tuple[str, float | None, float | None]]:
+    """Splits a plain text transcription into paragraphs, which have no timestamps."""
+    paragraphs = re.split(r"\n\s*\n", content.replace("\r\n", "\n").lstrip("\ufeff"))
+    return [(" ".join(paragraph.split()), None, None) for paragraph in paragraphs if paragraph.strip()]
+
+def get_transcription_files(transcription_dir: str) -> list[str]:
+    """
+    Returns the paths of the transcription files to index in a TRANSCRIPTIONS directory.
+    Of files with the same name and different extensions, only the file with the preferred extension is indexed.
+    """
+    if not os.path.isdir(transcription_dir):
+        return []
+    files_by_stem = {}
+    for file_name in os.listdir(transcription_dir):
+        stem, extension = os.path.splitext(file_name)
+        extension = extension.lower()
+        if extension not in INDEXED_EXTENSIONS or file_name in EXCLUDED_FILE_NAMES:
+            continue
+        preferred = files_by_stem.get(stem)
+        if preferred is None or INDEXED_EXTENSIONS.index(extension) < INDEXED_EXTENSIONS.index(os.path.splitext(preferred)[1].lower()):
+            files_by_stem[stem] = file_name
+    return [os.path.join(transcription_dir, file_name) for file_name in sorted(files_by_stem.values())]
+
+def get_signature(file_paths: list[str]) -> str:
+    """Returns a signature of the indexed files, which changes when a file is added, removed, renamed or modified."""
+    signature = []
+    for file_path in file_paths:
+        stat = os.stat(file_path)
+        signature.append([os.path.basename(file_path), stat.st_size, stat.st_mtime_ns])
+    return json.dumps(signature)
+
+def build_match_query(query: str) -> str | None:
+    """
+    Converts a user query to an FTS5 query that matches all words, a word ending with * as a prefix.
+    Every word is quoted, so other characters with a meaning in the FTS5 query syntax are searched for as text.
+    """
+    terms = []
+    for word in query.split():
+        prefix = word.endswith("*")
+        word = word.rstrip("*")
+        if word:
+            terms.append('"' + word.replace('"', '""') + '"' + ("*" if prefix else ""))
+    return " ".join(terms) if terms else None
+
+class TranscriptionIndex:
+    """
+    Full-text index over the transcriptions of all recordings, stored in an SQLite FTS5 database.
+
+    Every subtitle cue (or paragraph of a plain text transcription) is a row in the index, so search hits
+    are returned with the time of the cue in the recording. A recording is indexed again as a whole
+    when its transcriptions change.
+    """
+    def __init__(self, index_path: str):
+        self.index_path = index_path
+        self.lock = threading.Lock()  # serializes writes from the threads of this process
+        self.synced = False  # set when the index has been synced with the recordings on disk
+        with self._connect() as connection:
+            connection.executescript(SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """Opens a connection to the index, the transaction is committed and the connection closed on exit."""
+        connection = sqlite3.connect(self.index_path, timeout=30)
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def index_recording(self, recording_id: int, title: str, transcription_dir: str, file_paths: list[str] | None = None):
+        """
+        Indexes the transcriptions of a recording, replacing the previously indexed transcriptions.
+
+        Args:
+            recording_id: The recording ID.
+            title: The title of the recording.
+            transcription_dir: The path to the TRANSCRIPTIONS directory of the recording.
+            file_paths: The transcription files, if they were already listed.
+        """
+        if file_paths is None:
+            file_paths = get_transcription_files(transcription_dir)
+        rows = []
+        for file_path in file_paths:
+            try:
+                with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+                    content = f.read()
+            except OSError as e:
+                logger.error(f"Could not read transcription file '{file_path}' for indexing: {e}")
+                continue
+            parse = parse_text if file_path.lower().endswith(".txt") else parse_subtitles
+            file_name = os.path.basename(file_path)
+            rows.extend((text, recording_id, file_name, start, end) for text, start, end in parse(content))
+        signature = get_signature(file_paths)
+        with self.lock, self._connect() as connection:
+            self._delete_segments(connection, recording_id)
+            connection.executemany("INSERT INTO segment_data (text, recording_id, file_name, start, end) VALUES (?, ?, ?, ?, ?)", rows)
+            connection.execute("INSERT INTO segments (rowid, text) SELECT id, text FROM segment_data WHERE recording_id = ?", (recording_id,))
+            connection.execute("INSERT OR REPLACE INTO documents (recording_id, title, signature) VALUES (?, ?, ?)",
+                               (recording_id, title, signature))
+        logger.info(f"Indexed {len(rows)} transcription segments for recording {recording_id}.")
+
+    def remove_recording(self, recording_id: int):
+        """Removes the transcriptions of a recording from the index."""
+        with self.lock, self._connect() as connection:
+            self._delete_segments(connection, recording_id)
+            connection.execute("DELETE FROM documents WHERE recording_id = ?", (recording_id,))
+
+    @staticmethod
+    def _delete_segments(connection: sqlite3.Connection, recording_id: int):
+        # the full-text index is told which text to remove, before the segments are deleted
+        connection.execute("INSERT INTO segments (segments, rowid, text) SELECT 'delete', id, text FROM segment_data WHERE recording_id = ?", (recording_id,))
+        connection.execute("DELETE FROM segment_data WHERE recording_id = ?", (recording_id,))
+
+    def sync(self, recordings: dict[int, tuple[str, str]], active_recording_ids: set[int] = frozenset()):
+        """
+        Brings the index up to date with the recordings on disk, e.g. after a server restart.
+        Only recordings whose transcription files changed since they were indexed are indexed again.
+
+        Args:
+            recordings: The title and the TRANSCRIPTIONS directory of every recording, keyed by recording ID.
+            active_recording_ids: Recordings that are receiving chunks, they are kept in the index as they are and
+                indexed when they are finalized.
+        """
+        with self._connect() as connection:
+            indexed = dict(connection.execute("SELECT recording_id, signature FROM documents").fetchall())
+        for recording_id in indexed.keys() - recordings.keys() - active_recording_ids:
+            self.remove_recording(recording_id)
+        for recording_id, (title, transcription_dir) in recordings.items():
+            try:
+                file_paths = get_transcription_files(transcription_dir)
+                if not file_paths and recording_id not in indexed:
+                    continue
+                if indexed.get(recording_id) != get_signature(file_paths):
+                    self.index_recording(recording_id, title, transcription_dir, file_paths)
+            except OSError as e:
+                logger.error(f"Could not index transcriptions of recording {recording_id}: {e}")
+
+    def search(self, query: str, limit: int = 50) -> list[dict]:
+        """
+        Searches the transcriptions for segments that contain all words of the query.
+
+        Args:
+            query: The words to search for, a word ending with * is searched for as a prefix.
+            limit: The maximum number of hits.
+
+        Returns:
+            The hits, see search_results.
+        """
+        return self.search_results(query, limit)['hits']
+
+    def search_results(self, query: str, limit: int = 50) -> dict:
+        """
+        Searches the transcriptions for segments that contain all words of the query.
+
+        Args:
+            query: The words to search for, a word ending with * is searched for as a prefix.
+            limit: The maximum number of hits.
+
+        Returns:
+            'hits': the hits ordered by relevance among the RANKED_CANDIDATES most recently indexed matches, with the
+            recording ID and title, the transcription file name, the start and end time of the segment in seconds
+            (None for plain text transcriptions) and a snippet with the matches marked by square brackets.
+            'truncated': true if more than RANKED_CANDIDATES segments match, the older matches are not ranked.
+        """
+        match_query = build_match_query(query)
+        if match_query is None:
+            return {'hits': [], 'truncated': False}
+        start = time.perf_counter()
+        with self._connect() as connection:
+            # the oldest ranked match, and the next older match if there are more matches than are ranked
+            thresholds = connection.execute(
+                "SELECT rowid FROM segments WHERE segments MATCH ? ORDER BY rowid DESC LIMIT 2 OFFSET ?",
+                (match_query, RANKED_CANDIDATES - 1)).fetchall()
+            rows = connection.execute(
+                "SELECT segment_data.recording_id, documents.title, segment_data.file_name, segment_data.start, segment_data.end, "
+                "snippet(segments, 0, '[', ']', '...', 16) "
+                "FROM segments "
+                "JOIN segment_data ON segment_data.id = segments.rowid "
+                "JOIN documents ON documents.recording_id = segment_data.recording_id "
+                "WHERE segments MATCH ? AND segments.rowid >= ? "
+                "ORDER BY rank LIMIT ?",
+                (match_query, thresholds[0][0] if thresholds else 0, max(1, min(limit, MAX_SEARCH_RESULTS)))).fetchall()
+        truncated = len(thresholds) > 1
+        logger.info(f"Transcription search for '{query}' returned {len(rows)} hits{' (truncated)' if truncated else ''} "
+                    f"in {(time.perf_counter() - start) * 1000:.1f} ms.")
+        return {
+            'hits': [{
+                'recording_id': recording_id,
+                'title': title,
+                'file_name': file_name,
+                'start': segment_start,
+                'end': segment_end,
+                'snippet': snippet
+            } for recording_id, title, file_name, segment_start, segment_end, snippet in rows],
+            'truncated': truncated
+        }
+
+_transcription_indexes = {}
+_transcription_indexes_lock = threading.Lock()
+
+def get_transcription_index(base_path: str) -> TranscriptionIndex:
+    """Returns the transcription index of a recordings base directory, it is opened the first time it is used."""
+    index_path = os.path.join(base_path, INDEX_FILE_NAME)
+    with _transcription_indexes_lock:
+        if index_path not in _transcription_indexes:
+            _transcription_indexes[index_path] = TranscriptionIndex(index_path)
+        return _transcription_indexes[index_path]
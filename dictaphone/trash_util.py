@@ -0,0 +1,148 @@
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Deleted recording directories are moved to this directory in the recordings base directory
+TRASH_DIR_NAME = ".trash"
+# Large files are truncated in steps of this size before they are unlinked
+TRUNCATE_STEP_BYTES = 64 * 1024 * 1024
+
+def move_to_trash(path: str, base_path: str) -> str:
+    """
+    Moves a directory to the trash directory in the recordings base directory.
+
+    The move is a rename within the same file system, so it is atomic and takes constant time
+    regardless of the size of the directory.
+
+    Args:
+        path: The path to move to the trash.
+        base_path: The recordings base directory.
+
+    Returns:
+        The path of the directory in the trash.
+
+    Raises:
+        OSError: If the directory could not be moved.
+    """
+    trash_path = os.path.join(base_path, TRASH_DIR_NAME)
+    os.makedirs(trash_path, exist_ok=True)
+    # a unique name, the same recording directory name can be deleted more than once
+    target_path = os.path.join(trash_path, f"{os.path.basename(os.path.normpath(path))}_{uuid.uuid4().hex}")
+    os.rename(path, target_path)
+    logger.info(f"Moved '{path}' to trash '{target_path}'.")
+    return target_path
+
+class TrashCollector:
+    """
+    Reclaims the space of directories in the trash in a background thread.
+
+    File data is released at a limited rate, so emptying the trash does not saturate the storage
+    (e.g. a network mount) used for writing active recordings.
+    """
+    def __init__(self, bytes_per_second: int):
+        self.bytes_per_second = bytes_per_second
+        self.queue = queue.Queue()
+        self.scheduled = set()
+        self.scheduled_lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run, name="trash-collector", daemon=True)
+        self.thread.start()
+
+    def schedule(self, trash_path: str):
+        """Schedules a path in the trash for deletion, paths that are already scheduled are ignored."""
+        with self.scheduled_lock:
+            if trash_path in self.scheduled:
+                return
+            self.scheduled.add(trash_path)
+        self.queue.put(trash_path)
+
+    def empty_trash(self, base_path: str):
+        """Schedules everything left in the trash directory for deletion, e.g. after a server restart."""
+        trash_path = os.path.join(base_path, TRASH_DIR_NAME)
+        if not os.path.isdir(trash_path):
+            return
+        for item_name in os.listdir(trash_path):
+            logger.info(f"Scheduling deletion of leftover trash '{item_name}'.")
+            self.schedule(os.path.join(trash_path, item_name))
+
+    def wait_until_empty(self):
+        """Blocks until all scheduled paths have been deleted."""
+        self.queue.join()
+
+    def _run(self):
+        while True:
+            trash_path = self.queue.get()
+            try:
+                self._reclaim(trash_path)
+                logger.info(f"Deleted trash '{trash_path}'.")
+            except OSError as e:
+                logger.error(f"Error deleting trash '{trash_path}': {e}")
+            finally:
+                with self.scheduled_lock:
+                    self.scheduled.discard(trash_path)
+                self.queue.task_done()
+
+    def _reclaim(self, trash_path: str):
+        if not os.path.lexists(trash_path):
+            return
+        if not os.path.isdir(trash_path) or os.path.islink(trash_path):
+            self._remove_file(trash_path)
+            return
+        for root, dirs, files in os.walk(trash_path, topdown=False):
+            for name in files:
+                self._remove_file(os.path.join(root, name))
+            for name in dirs:
+                dir_path = os.path.join(root, name)
+                if os.path.islink(dir_path):
+                    os.unlink(dir_path)
+                else:
+                    os.rmdir(dir_path)
+        os.rmdir(trash_path)
+
+    def _remove_file(self, file_path: str):
+        size = os.lstat(file_path).st_size
+        if size > TRUNCATE_STEP_BYTES and not os.path.islink(file_path):
+            # release the data in steps, so the storage frees blocks at the limited rate
+            with open(file_path, 'r+b') as f:
+                while size > 0:
+                    step = min(size, TRUNCATE_STEP_BYTES)
+                    size -= step
+                    f.truncate(size)
+                    self._throttle(step)
+        else:
+            self._throttle(size)
+        os.unlink(file_path)
+
+    def _throttle(self, released_bytes: int):
+        if self.bytes_per_second > 0:
+            time.sleep(released_bytes / self.bytes_per_second)
+
+_trash_collector = None
+_trash_collector_lock = threading.Lock()
+# recordings base directories whose leftover trash has been scheduled for deletion by this process
+_emptied_base_paths = set()
+
+def get_trash_collector() -> TrashCollector:
+    """Returns the trash collector of this process, it is started the first time it is used."""
+    global _trash_collector
+    with _trash_collector_lock:
+        if _trash_collector is None:
+            _trash_collector = TrashCollector(settings.TRASH_RECLAIM_BYTES_PER_SECOND)
+        return _trash_collector
+
+def empty_leftover_trash(base_path: str):
+    """
+    Schedules the trash left in a recordings base directory, e.g. before a server restart, for deletion.
+    The trash directory is only listed the first time for each base directory in a process.
+    """
+    with _trash_collector_lock:
+        if base_path in _emptied_base_paths:
+            return
+        _emptied_base_paths.add(base_path)
+    get_trash_collector().empty_trash(base_path)
@@ -1,33 +1,124 @@
 import os
 from django.http import Http404
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseBadRequest, StreamingHttpResponse
+from django.utils.http import content_disposition_header
 import logging
 
 from django.shortcuts import render
 
 from backend import settings
+from .recording_metadata_util import get_download_name
+from .archive_util import get_archive_manifest, iter_restored_wav
+from .waveform_util import build_recording_waveform, read_peaks
+from .export_util import iter_recordings_zip, aiter_blocks
+from .metrics_util import render_metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
 
 logger = logging.getLogger(__name__)
 
+# Number of waveform peaks returned if the request does not specify it, and the maximum number of peaks
+DEFAULT_WAVEFORM_PEAKS = 2000
+MAX_WAVEFORM_PEAKS = 20000
+
 def index(request):
     return render(request, 'index.html')
 
-def serve_file(request, path):
+def get_base_dir(url_path):
     # Determine the base directory based on the URL prefix
-    if request.path.startswith('/work/'):
-        base_dir = '/work'  # the files are saved here on UCloud
-    elif 'media/RECORDINGS' in request.path:
-        base_dir = os.path.join(settings.MEDIA_ROOT, 'RECORDINGS/')
+    if url_path.startswith('/work/'):
+        return '/work'  # the files are saved here on UCloud
+    elif 'media/RECORDINGS' in url_path:
+        return os.path.join(settings.MEDIA_ROOT, 'RECORDINGS/')
+    raise Http404("File not found")
+
+def resolve_download_url(url_path):
+    """Returns the file path of a download URL path, e.g. the audio URL of a recording."""
+    base_dir = get_base_dir(url_path)
+    if base_dir == '/work':
+        relative_path = url_path[len('/work/'):]
     else:
+        relative_path = url_path.rsplit('media/RECORDINGS/', 1)[1]
+    file_path = os.path.normpath(os.path.join(base_dir, relative_path))
+    # the path comes from the query string, it must stay within the base directory
+    if not file_path.startswith(os.path.normpath(base_dir) + os.sep):
         raise Http404("File not found")
+    return file_path
+
+def serve_file(request, path):
     # Construct the full file path
-    file_path = os.path.join(base_dir, path)
+    file_path = os.path.join(get_base_dir(request.path), path)
     # Check if the file exists
     if not os.path.exists(file_path):
-        raise Http404("File not found")
+        # an archived recording is decoded to the original wav file while it is sent
+        manifest = get_archive_manifest(os.path.dirname(file_path))
+        if manifest is None or manifest['original_file'] != os.path.basename(file_path):
+            raise Http404("File not found")
+        flac_path = os.path.join(os.path.dirname(file_path), manifest['file'])
+        if not os.path.exists(flac_path):
+            raise Http404("File not found")
+        response = StreamingHttpResponse(aiter_blocks(iter_restored_wav(flac_path, manifest)),
+                                         content_type='application/octet-stream')
+        response['Content-Length'] = str(manifest['original_size'])
+        response['Content-Disposition'] = content_disposition_header(True, get_download_name(file_path))
+        return response
 
     # Open the file and create the response
     with open(file_path, 'rb') as f:
         response = HttpResponse(f.read(), content_type='application/octet-stream')
-        response['Content-Disposition'] = 'attachment; filename="{}"'.format(os.path.basename(file_path))
+        response['Content-Disposition'] = content_disposition_header(True, get_download_name(file_path))
         return response
+
+def serve_waveform(request, path):
+    """
+    Serves the waveform peaks of a recording for a time range.
+
+    The URL is the download URL of the recording's WAV file prefixed with /waveform. The query parameters start and end
+    select the time range in seconds, and peaks the maximum number of peaks. The body is the peaks as little-endian
+    int16 minimum and maximum pairs, the headers describe the level and the time of the first peak.
+    """
+    file_path = resolve_download_url(request.path.removeprefix('/waveform'))
+    try:
+        start_seconds = float(request.GET.get('start', 0))
+        end_seconds = float(request.GET['end']) if 'end' in request.GET else None
+        max_peaks = min(int(request.GET.get('peaks', DEFAULT_WAVEFORM_PEAKS)), MAX_WAVEFORM_PEAKS)
+    except ValueError:
+        return HttpResponseBadRequest("Invalid waveform range")
+    try:
+        waveform_path = build_recording_waveform(file_path)
+        if waveform_path is None:
+            raise Http404("File not found")
+        info, peaks = read_peaks(waveform_path, start_seconds, end_seconds, max_peaks)
+    except (OSError, ValueError) as e:
+        logger.error(f"Could not read waveform peaks for '{file_path}': {e}")
+        raise Http404("Waveform not found")
+    response = HttpResponse(peaks, content_type='application/octet-stream')
+    response['X-Waveform-Level'] = str(info['level'])
+    response['X-Waveform-First-Peak'] = str(info['first_peak'])
+    response['X-Waveform-Seconds-Per-Peak'] = repr(info['seconds_per_peak'])
+    response['X-Waveform-Sample-Rate'] = str(info['sample_rate'])
+    return response
+
+def export_recordings(request):
+    """
+    Streams a zip file with the audio and transcriptions of the selected recordings.
+
+    The recordings are selected by repeating the query parameter path with the audio URL of each recording.
+    The zip file is written while it is sent, so it is not held in memory or staged on disk.
+    """
+    url_paths = request.GET.getlist('path')
+    if not url_paths:
+        return HttpResponseBadRequest("No recordings selected")
+    wav_paths = []
+    for url_path in url_paths:
+        wav_path = resolve_download_url('/' + url_path.lstrip('/'))
+        if not os.path.isdir(os.path.dirname(wav_path)):
+            raise Http404("Recording not found")
+        wav_paths.append(wav_path)
+    logger.info(f"Exporting {len(wav_paths)} recordings as zip.")
+    # the zip file is written in a worker thread while it is sent, see aiter_blocks
+    response = StreamingHttpResponse(aiter_blocks(iter_recordings_zip(wav_paths)), content_type='application/zip')
+    response['Content-Disposition'] = content_disposition_header(True, "recordings.zip")
+    return response
+
+def metrics(request):
+    """Returns the ingest and transcription metrics of this server process in the Prometheus text format."""
+    return HttpResponse(render_metrics(), content_type=METRICS_CONTENT_TYPE)
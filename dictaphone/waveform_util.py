@@ -0,0 +1,253 @@
+import io
+import json
+import logging
+import os
+import shutil
+import uuid
+
+import numpy as np
+
+from .archive_util import read_wav_layout, get_archive_manifest, iter_restored_wav
+
+logger = logging.getLogger(__name__)
+
+# Name of the directory in the recording directory with the waveform peak files
+WAVEFORM_DIR_NAME = "WAVEFORM"
+WAVEFORM_INFO_FILE_NAME = "peaks.json"
+# Audio frames per peak at the finest level, each coarser level combines LEVEL_FACTOR peaks of the level below
+SAMPLES_PER_PEAK = 256
+LEVEL_FACTOR = 4
+NUMBER_OF_LEVELS = 8
+# A peak is the minimum and maximum sample value over all channels, stored as little-endian int16 pairs
+PEAK_DTYPE = np.dtype('<i2')
+PEAK_SIZE = 2 * PEAK_DTYPE.itemsize
+# Bytes read at a time when the peaks are built from an existing WAV file
+BUILD_BLOCK_SIZE = 4 * 1024 * 1024
+
+def get_level_file_path(waveform_path: str, level: int) -> str:
+    return os.path.join(waveform_path, f"level_{level}.bin")
+
+class WaveformBuilder:
+    """
+    Builds a multi-resolution min/max peak pyramid of a recording, while the audio data is appended to the WAV file.
+
+    Each level is stored in its own file, so completed peaks are appended to the files as the recording grows.
+    Peaks that are not complete are kept in memory, and written as partial peaks when the recording is finished.
+    """
+    def __init__(self, waveform_path: str):
+        self.waveform_path = waveform_path
+        self.channels = None
+        self.sample_rate = None
+        self.leftover = b""  # bytes of an incomplete audio frame
+        # incomplete peaks per level, as arrays of minimums and maximums
+        self.pending = [(np.empty(0, PEAK_DTYPE), np.empty(0, PEAK_DTYPE)) for _ in range(NUMBER_OF_LEVELS)]
+        self.partial_peak_levels = []  # levels where an incomplete peak was written by finish
+
+    def append(self, data: bytes):
+        """
+        Adds audio data appended to the WAV file. The first data must start with the WAV header.
+        """
+        if self.partial_peak_levels:
+            # the recording continues after it was finished, remove the partial peaks
+            self._truncate_partial_peaks()
+        if self.channels is None:
+            with io.BytesIO(data) as f:
+                self.channels, self.sample_rate, _, data_offset = read_wav_layout(f)
+            data = data[data_offset:]
+            self._write_info()
+        frame_size = self.channels * PEAK_DTYPE.itemsize
+        if self.leftover:
+            data = self.leftover + data
+        complete_length = len(data) - len(data) % frame_size
+        self.leftover = data[complete_length:]
+        if complete_length == 0:
+            return
+        frames = np.frombuffer(data, dtype=PEAK_DTYPE, count=complete_length // PEAK_DTYPE.itemsize).reshape(-1, self.channels)
+        # the finest level starts from one "peak" per frame, combined over the channels
+        self._add_peaks(0, frames.min(axis=1), frames.max(axis=1), SAMPLES_PER_PEAK)
+
+    def finish(self):
+        """Writes the incomplete peaks of every level, so the peak files cover the whole recording."""
+        partial_peak = None
+        for level in range(NUMBER_OF_LEVELS):
+            minimums, maximums = self.pending[level]
+            if partial_peak is not None:
+                # the incomplete peak of the level below is part of the incomplete peak of this level
+                minimums = np.append(minimums, partial_peak[0])
+                maximums = np.append(maximums, partial_peak[1])
+            if len(minimums) == 0:
+                break
+            partial_peak = (minimums.min(), maximums.max())
+            self._write_peaks(level, np.array([partial_peak[0]], PEAK_DTYPE), np.array([partial_peak[1]], PEAK_DTYPE))
+            self.partial_peak_levels.append(level)
+
+    def _add_peaks(self, level: int, minimums: np.ndarray, maximums: np.ndarray, factor: int):
+        pending_minimums, pending_maximums = self.pending[level]
+        if len(pending_minimums) > 0:
+            minimums = np.concatenate((pending_minimums, minimums))
+            maximums = np.concatenate((pending_maximums, maximums))
+        complete_peaks = len(minimums) // factor
+        self.pending[level] = (minimums[complete_peaks * factor:].copy(), maximums[complete_peaks * factor:].copy())
+        if complete_peaks == 0:
+            return
+        level_minimums = minimums[:complete_peaks * factor].reshape(complete_peaks, factor).min(axis=1)
+        level_maximums = maximums[:complete_peaks * factor].reshape(complete_peaks, factor).max(axis=1)
+        self._write_peaks(level, level_minimums, level_maximums)
+        if level + 1 < NUMBER_OF_LEVELS:
+            self._add_peaks(level + 1, level_minimums, level_maximums, LEVEL_FACTOR)
+
+    def _write_peaks(self, level: int, minimums: np.ndarray, maximums: np.ndarray):
+        peaks = np.empty((len(minimums), 2), PEAK_DTYPE)
+        peaks[:, 0] = minimums
+        peaks[:, 1] = maximums
+        with open(get_level_file_path(self.waveform_path, level), 'ab') as f:
+            f.write(peaks.tobytes())
+
+    def _truncate_partial_peaks(self):
+        for level in self.partial_peak_levels:
+            level_file_path = get_level_file_path(self.waveform_path, level)
+            os.truncate(level_file_path, os.path.getsize(level_file_path) - PEAK_SIZE)
+        self.partial_peak_levels = []
+
+    def _write_info(self):
+        os.makedirs(self.waveform_path, exist_ok=True)
+        for level in range(NUMBER_OF_LEVELS):
+            # start from empty peak files, e.g. if a recording directory is reused
+            open(get_level_file_path(self.waveform_path, level), 'wb').close()
+        with open(os.path.join(self.waveform_path, WAVEFORM_INFO_FILE_NAME), 'w') as f:
+            json.dump({
+                'sample_rate': self.sample_rate,
+                'channels': self.channels,
+                'samples_per_peak': SAMPLES_PER_PEAK,
+                'level_factor': LEVEL_FACTOR,
+                'levels': NUMBER_OF_LEVELS
+            }, f, indent=4)
+
+def build_waveform(audio_blocks, waveform_path: str):
+    """
+    Builds the peak files of a complete recording, e.g. a recording made before peaks were computed.
+
+    The peaks are built in a temporary directory that is renamed to the waveform directory when it is complete,
+    so concurrent builds of the same recording do not write to the same files.
+
+    Args:
+        audio_blocks: An iterable with consecutive blocks of the WAV file, starting with the header.
+        waveform_path: The path to the waveform directory.
+    """
+    temp_path = f"{waveform_path}.{uuid.uuid4().hex}.tmp"
+    builder = WaveformBuilder(temp_path)
+    try:
+        for block in audio_blocks:
+            builder.append(block)
+        builder.finish()
+        os.rename(temp_path, waveform_path)
+    except OSError:
+        if not os.path.isdir(waveform_path):
+            raise
+        # built by another request in the meantime
+    finally:
+        if os.path.isdir(temp_path):
+            shutil.rmtree(temp_path)
+
+def iter_wav_blocks(wav_path: str):
+    with open(wav_path, 'rb') as f:
+        while block := f.read(BUILD_BLOCK_SIZE):
+            yield block
+
+def resume_waveform(wav_path: str) -> WaveformBuilder:
+    """
+    Rebuilds the peak files of a recording that is resumed, e.g. in another server process, from its WAV file.
+
+    The peak files on disk can be behind the WAV file or include partial peaks, so they are built again.
+
+    Args:
+        wav_path: The path to the WAV file of the recording.
+
+    Returns:
+        A builder that continues the peaks when audio data is appended to the WAV file.
+
+    Raises:
+        OSError: If the WAV file cannot be read or the peak files cannot be written.
+        ValueError: If the WAV file has no valid header.
+    """
+    waveform_path = os.path.join(os.path.dirname(wav_path), WAVEFORM_DIR_NAME)
+    # the peaks of a recording without audio data are started again with the first chunk
+    shutil.rmtree(waveform_path, ignore_errors=True)
+    builder = WaveformBuilder(waveform_path)
+    try:
+        for block in iter_wav_blocks(wav_path):
+            builder.append(block)
+    except (OSError, ValueError):
+        # no peaks are left on disk, they are built from the audio file when they are requested
+        shutil.rmtree(waveform_path, ignore_errors=True)
+        raise
+    return builder
+
+def build_recording_waveform(wav_path: str) -> str | None:
+    """
+    Returns the waveform directory of a recording, the peaks are built from the audio file if they do not exist.
+
+    Args:
+        wav_path: The path to the WAV file of the recording, the recording may be archived.
+
+    Returns:
+        The path to the waveform directory, or None if the recording has no audio file.
+    """
+    recording_path = os.path.dirname(wav_path)
+    waveform_path = os.path.join(recording_path, WAVEFORM_DIR_NAME)
+    manifest = None
+    if not os.path.isfile(wav_path):
+        manifest = get_archive_manifest(recording_path)
+        if manifest is None or manifest['original_file'] != os.path.basename(wav_path):
+            return None
+    if os.path.isfile(os.path.join(waveform_path, WAVEFORM_INFO_FILE_NAME)):
+        return waveform_path
+    if manifest is None:
+        audio_blocks = iter_wav_blocks(wav_path)
+    else:
+        audio_blocks = iter_restored_wav(os.path.join(recording_path, manifest['file']), manifest)
+    logger.info(f"Building waveform peaks for '{wav_path}'.")
+    build_waveform(audio_blocks, waveform_path)
+    return waveform_path
+
+def read_peaks(waveform_path: str, start_seconds: float, end_seconds: float | None, max_peaks: int) -> tuple[dict, bytes]:
+    """
+    Reads the peaks for a time range from the finest level with at most max_peaks peaks in the range.
+
+    Args:
+        waveform_path: The path to the waveform directory.
+        start_seconds: The start of the time range.
+        end_seconds: The end of the time range, None for the end of the recording.
+        max_peaks: The maximum number of peaks to return.
+
+    Returns:
+        A tuple with a description of the returned peaks (level, index of the first peak, seconds per peak) and the
+        peaks as little-endian int16 minimum and maximum pairs.
+
+    Raises:
+        FileNotFoundError: If there are no peak files for the recording.
+    """
+    with open(os.path.join(waveform_path, WAVEFORM_INFO_FILE_NAME), 'r') as f:
+        info = json.load(f)
+    max_peaks = max(1, max_peaks)
+    # the time range in frames, rounded so peak boundaries given in seconds select whole peaks
+    start_frame = round(max(0.0, start_seconds) * info['sample_rate'])
+    end_frame = None if end_seconds is None else round(end_seconds * info['sample_rate'])
+    for level in range(info['levels']):
+        frames_per_peak = info['samples_per_peak'] * info['level_factor'] ** level
+        level_file_path = get_level_file_path(waveform_path, level)
+        number_of_peaks = os.path.getsize(level_file_path) // PEAK_SIZE
+        first_peak = min(start_frame // frames_per_peak, number_of_peaks)
+        last_peak = number_of_peaks if end_frame is None else min(number_of_peaks, -(-end_frame // frames_per_peak))
+        if last_peak - first_peak <= max_peaks or level == info['levels'] - 1:
+            break
+    last_peak = max(first_peak, min(last_peak, first_peak + max_peaks))
+    with open(level_file_path, 'rb') as f:
+        f.seek(first_peak * PEAK_SIZE)
+        peaks = f.read((last_peak - first_peak) * PEAK_SIZE)
+    return {
+        'level': level,
+        'first_peak': first_peak,
+        'seconds_per_peak': frames_per_peak / info['sample_rate'],
+        'sample_rate': info['sample_rate']
+    }, peaks